@@ -98,140 +98,28 @@ def log_search_results(commune, results):
 def fetch_georisques_risks(lat, lon):
     """
     Appelle l'API GeoRisques pour obtenir les risques naturels et technologiques pour un point.
-    Utilise tous les endpoints disponibles dans l'API v1.
+    Les endpoints de l'API v1 sont interrogés en parallèle sous une échéance globale ; les
+    catégories communales sont servies depuis le cache par code INSEE (utils/georisques.py).
     Voir doc: https://www.georisques.gouv.fr/doc-api
+
+    Returns:
+        tuple: (risques {catégorie: liste}, catégories indisponibles — en erreur ou hors délai,
+        à afficher « indisponible » et non « 0 risque »)
     """
     safe_print(f"🔍 [GEORISQUES] === DÉBUT APPEL GEORISQUES pour point {lat}, {lon} ===")
-    risques = {}
-    latlon = f"{lon},{lat}"  # Format longitude,latitude pour l'API
-    print(f"🔍 [GEORISQUES] Format latlon: {latlon}")
-    
-    # 1. Zonage sismique
-    try:
-        url = "https://www.georisques.gouv.fr/api/v1/zonage_sismique"
-        params = {"latlon": latlon}
-        resp = requests.get(url, params=params, timeout=10)
-        if resp.status_code == 200:
-            data = resp.json()
-            risques["sismique"] = data.get("data", [])
-        else:
-            print(f"[GeoRisques Sismique] Erreur: {resp.status_code}")
-            risques["sismique"] = []
-    except Exception as e:
-        print(f"[GeoRisques Sismique] Exception: {e}")
-                    # cleaned corrupted pasted text block removed
-
-    # 8. CATNAT - Catastrophes naturelles
-    try:
-        url = "https://www.georisques.gouv.fr/api/v1/gaspar/catnat"
-        params = {"latlon": latlon, "rayon": 1000}
-        resp = requests.get(url, params=params, timeout=10)
-        if resp.status_code == 200:
-            data = resp.json()
-            risques["catnat"] = data.get("data", [])
-        else:
-            print(f"[GeoRisques CATNAT] Erreur: {resp.status_code}")
-            risques["catnat"] = []
-    except Exception as e:
-        print(f"[GeoRisques CATNAT] Exception: {e}")
-        risques["catnat"] = []
-
-    # 9. Cavités souterraines
-    try:
-        url = "https://www.georisques.gouv.fr/api/v1/cavites"
-        params = {"latlon": latlon, "rayon": 1000}
-        resp = requests.get(url, params=params, timeout=10)
-        if resp.status_code == 200:
-            data = resp.json()
-            risques["cavites"] = data.get("data", [])
-        else:
-            print(f"[GeoRisques Cavités] Erreur: {resp.status_code}")
-            risques["cavites"] = []
-    except Exception as e:
-        print(f"[GeoRisques Cavités] Exception: {e}")
-        risques["cavites"] = []
-
-    # 10. MVT - Mouvements de terrains
-    try:
-        url = "https://www.georisques.gouv.fr/api/v1/mvt"
-        params = {"latlon": latlon, "rayon": 1000}
-        resp = requests.get(url, params=params, timeout=10)
-        if resp.status_code == 200:
-            data = resp.json()
-            risques["mvt"] = data.get("data", [])
-        else:
-            print(f"[GeoRisques MVT] Erreur: {resp.status_code}")
-            risques["mvt"] = []
-    except Exception as e:
-        print(f"[GeoRisques MVT] Exception: {e}")
-        risques["mvt"] = []
-
-    # 11. Retrait gonflement des argiles
-    try:
-        url = "https://www.georisques.gouv.fr/api/v1/argiles"
-        params = {"latlon": latlon}
-        resp = requests.get(url, params=params, timeout=10)
-        if resp.status_code == 200:
-            data = resp.json()
-            risques["argiles"] = data.get("data", [])
-        else:
-            print(f"[GeoRisques Argiles] Erreur: {resp.status_code}")
-            risques["argiles"] = []
-    except Exception as e:
-        print(f"[GeoRisques Argiles] Exception: {e}")
-        risques["argiles"] = []
-
-    # 12. Radon
-    try:
-        url = "https://www.georisques.gouv.fr/api/v1/radon"
-        params = {"latlon": latlon}
-        resp = requests.get(url, params=params, timeout=10)
-        if resp.status_code == 200:
-            data = resp.json()
-            risques["radon"] = data.get("data", [])
-        else:
-            print(f"[GeoRisques Radon] Erreur: {resp.status_code}")
-            risques["radon"] = []
-    except Exception as e:
-        print(f"[GeoRisques Radon] Exception: {e}")
-        risques["radon"] = []
-
-    # 13. Installations classées
-    try:
-        url = "https://www.georisques.gouv.fr/api/v1/installations"
-        params = {"latlon": latlon, "rayon": 2000}  # Rayon plus large pour les installations
-        resp = requests.get(url, params=params, timeout=10)
-        if resp.status_code == 200:
-            data = resp.json()
-            risques["installations"] = data.get("data", [])
-        else:
-            print(f"[GeoRisques Installations] Erreur: {resp.status_code}")
-            risques["installations"] = []
-    except Exception as e:
-        print(f"[GeoRisques Installations] Exception: {e}")
-        risques["installations"] = []
-
-    # 14. Installations nucléaires
-    try:
-        url = "https://www.georisques.gouv.fr/api/v1/installations_nucleaires"
-        params = {"latlon": latlon, "rayon": 5000}  # Rayon plus large pour le nucléaire
-        resp = requests.get(url, params=params, timeout=10)
-        if resp.status_code == 200:
-            data = resp.json()
-            risques["nucleaire"] = data.get("data", [])
-        else:
-            print(f"[GeoRisques Nucléaire] Erreur: {resp.status_code}")
-            risques["nucleaire"] = []
-    except Exception as e:
-        print(f"[GeoRisques Nucléaire] Exception: {e}")
-        risques["nucleaire"] = []
+    risques, meta = georisques_client.fetch(lat, lon)
+    indisponibles = meta["unavailable"]
+    print(f"🔍 [GEORISQUES] INSEE {meta.get('insee')}: {len(meta.get('cached', []))} catégories en cache, "
+          f"{meta.get('seconds')}s")
 
     print(f"🔍 [GEORISQUES] Risques récupérés pour {lat},{lon}: {len(risques)} catégories")
     
     # Comptons le nombre total de risques
     total_risks = 0
     for category, risks in risques.items():
-        if risks and isinstance(risks, list):
+        if category in indisponibles:
+            print(f"⚠️ [GEORISQUES] - {category}: indisponible")
+        elif risks and isinstance(risks, list):
             count = len(risks)
             total_risks += count
             print(f"🔍 [GEORISQUES] - {category}: {count} risque(s)")
@@ -239,7 +127,7 @@ def fetch_georisques_risks(lat, lon):
             print(f"🔍 [GEORISQUES] - {category}: 0 risque(s)")
     
     print(f"🔍 [GEORISQUES] === TOTAL: {total_risks} risques trouvés ===")
-    return risques
+    return risques, indisponibles
 import logging
 logging.basicConfig(filename='error.log', level=logging.ERROR, format='%(asctime)s %(levelname)s %(message)s')
 # --- Utility: always return a list of features from any WFS or API result ---
@@ -260,17 +148,18 @@ def ensure_feature_list(data):
 # ──────────────────────────────────────────────────────────────
 from flask import (
     Flask, request, render_template, jsonify, send_file,
-    make_response, Response, stream_with_context, redirect
+    make_response, Response, stream_with_context, stream_template, redirect
 )
 import folium
 from folium.plugins import Draw, MeasureControl, MarkerCluster, Search
+import shapely
 from shapely.geometry import shape, mapping, Point
 from shapely.ops import transform as shp_transform
 from shapely.errors import GEOSException
 from pyproj import Transformer
-from urllib.parse import quote, quote_plus
+from urllib.parse import quote, quote_plus, urlsplit
 import unicodedata, re
-from threading import Timer
+from threading import Lock, Timer
 from datetime import datetime
 import webbrowser
 import os
@@ -280,13 +169,39 @@ import csv
 import zipfile
 from io import BytesIO
 import pprint
-from functools import lru_cache
+from functools import lru_cache, wraps
+import hmac
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 from geopy.geocoders import Nominatim
 from branca.element import Element
 from docx import Document
+from utils.wfs_cache import WFSTileCache, format_bbox, read_layer_versions
+from utils.wfs_filter import (
+    as_geometry, build_geometry_filter, clip_features, describe_feature_type, project_properties, srid_of,
+)
+from utils.wfs_stream import FeatureList, WFSFeatureStream
+from utils.fetch_stage import FetchStage
+from utils.single_flight import SingleFlight
+from utils.layer_store import LayerStore
+from utils.map_lod import LODCache, MapLOD
+from utils.wfs_binary import FeatureTable, WFSBinaryReader, binary_decoding_available
+from utils.http_client import UpstreamClient, UpstreamPolicy
+from utils.distance_engine import DistanceEngine, NearestFeatureIndex
+from utils.projection import L93, WGS84, LayerMetrics, geometry_array, layer_metrics, project, transform_func
+from utils.building_index import BuildingIndex
+from utils.commune_clipper import CommuneClipper
+from utils.disk_cache import DiskCache
+from utils.cadastre_snapshot import CadastreSnapshot, CadastreSnapshotStore
+from utils.geometry_tiling import fan_out
+from utils.georisques import GeoRisquesClient
+from utils.dem import DEMStore
+from utils.pvgis_grid import PVGISYield
+from utils.gazetteer import LOCAL_FIELDS as GAZETTEER_FIELDS, Gazetteer, normalize_name
+from utils.parallel_stream import stream_unordered
+from utils.dept_context import DepartmentContext
+from utils.jobs import ACTIVE as JOB_ACTIVE, JobRunner, JobStore
+from utils.commune_bundle import BundleCache, CommuneBundle, DistanceRule
+from utils.dept_aggregate import DeptAggregate
 
 # Import du module de rapport complet
 try:
@@ -333,19 +248,6 @@ def handle_500_error(e):
 
 os.makedirs("cartes", exist_ok=True)
 
-# Session HTTP avec retry exponentiel
-http_session = requests.Session()
-http_session.mount(
-    "https://",
-    HTTPAdapter(
-        max_retries=Retry(
-            total=3,
-            backoff_factor=1,               # 1 s, 2 s, 4 s
-            status_forcelist=[429, 500, 502, 503, 504],
-            respect_retry_after_header=True
-        )
-    )
-)
 # Vérification de la licence
 # statut = check_access()
 # if statut == "LICENSED":
@@ -378,6 +280,236 @@ PPRI_LAYER = "gpu:ppri"  # <-- Vérifiez le nom exact dans votre GeoServer
 # Configuration Elevation API
 ELEVATION_API_URL = "https://api.elevationapi.com/api/Elevation"
 
+# === Client HTTP amont unique (pools keep-alive, timeout par défaut, retries et métriques par hôte) ===
+# Tous les appels sortants passent par http_session ; métriques sur /debug_stats.
+UPSTREAM_POLICIES = {
+    urlsplit(GEOSERVER_URL).netloc: UpstreamPolicy(pool_size=32, timeout=(5, 30), retries=2, backoff=0.5, retry_post=True,
+                                                   max_concurrent=24),
+    "apicarto.ign.fr": UpstreamPolicy(pool_size=16, timeout=(5, 30), max_concurrent=12),
+    "geo.api.gouv.fr": UpstreamPolicy(pool_size=8, timeout=(5, 15), max_concurrent=8),
+    "api-adresse.data.gouv.fr": UpstreamPolicy(pool_size=8, timeout=(3, 10), retries=1, backoff=0.2),
+    "www.georisques.gouv.fr": UpstreamPolicy(pool_size=16, timeout=(5, 20)),
+    "re.jrc.ec.europa.eu": UpstreamPolicy(pool_size=4, timeout=(5, 60), retries=2, max_concurrent=4),  # PVGIS
+    "overpass-api.de": UpstreamPolicy(pool_size=2, timeout=(5, 60), retries=2, backoff=2.0, retry_post=True,
+                                      max_concurrent=2),
+    "api.open-elevation.com": UpstreamPolicy(pool_size=4, timeout=(5, 15), retries=1),
+    "api.elevationapi.com": UpstreamPolicy(pool_size=4, timeout=(5, 15), retries=1),
+}
+http_session = UpstreamClient(UPSTREAM_POLICIES, default=UpstreamPolicy(pool_size=4, timeout=(5, 20)))
+
+# === Cache disque des requêtes WFS (tuiles alignées sur une grille) ===
+# TTL par couche (s) : seules ces couches passent par le cache de tuiles
+WFS_CACHE_LAYER_TTLS = {
+    POSTE_LAYER: 7 * 86400,
+    HT_POSTE_LAYER: 7 * 86400,
+    CAPACITES_RESEAU_LAYER: 86400,        # Capacités publiées plus souvent
+    ELEVEURS_LAYER: 7 * 86400,
+    ZAER_LAYER: 30 * 86400,
+    PARCELLES_GRAPHIQUES_LAYER: 30 * 86400,
+    PARKINGS_LAYER: 30 * 86400,
+    FRICHES_LAYER: 30 * 86400,
+    POTENTIEL_SOLAIRE_LAYER: 30 * 86400,
+    PLU_LAYER: 7 * 86400,
+    SIRENE_LAYER: 7 * 86400,
+    CADASTRE_LAYER: 30 * 86400,
+}
+# Pas de grille par couche (défaut : 0.05° / 5 km) — plus fin pour les couches denses
+WFS_CACHE_TILE_SIZES = {
+    HT_POSTE_LAYER: {"EPSG:4326": 0.25},
+    CAPACITES_RESEAU_LAYER: {"EPSG:4326": 0.25},
+    PARCELLES_GRAPHIQUES_LAYER: {"EPSG:4326": 0.02},
+    SIRENE_LAYER: {"EPSG:4326": 0.02},
+    CADASTRE_LAYER: {"EPSG:4326": 0.01},
+}
+WFS_CACHE_PATH = os.environ.get("AGRIWEB_WFS_CACHE_PATH", os.path.join("cache", "wfs_tiles.sqlite"))
+WFS_CACHE_MAX_TILES = int(os.environ.get("AGRIWEB_WFS_CACHE_MAX_TILES", 20000))
+WFS_CACHE_ENABLED = os.environ.get("AGRIWEB_WFS_CACHE", "1") != "0"
+# Plafond de features par réponse GeoServer (maxFeatures du service, 0 = aucun) : une réponse
+# qui l'atteint est tronquée et n'est pas mise en cache
+WFS_MAX_FEATURES = int(os.environ.get("AGRIWEB_WFS_MAX_FEATURES", 0)) or None
+# Relecture des versions de couches (GetCapabilities), en secondes
+WFS_VERSION_CHECK_INTERVAL = 300.0
+
+# === Actions d'administration (purges, file de travaux) ===
+# Jeton attendu dans l'en-tête X-Admin-Token ; non défini = actions d'administration désactivées
+ADMIN_TOKEN = os.environ.get("AGRIWEB_ADMIN_TOKEN", "")
+
+# === Lecture WFS paginée ===
+WFS_PAGE_SIZE = 1000
+# Couches volumineuses lues page par page (mémoire bornée) dans les recherches par polygone
+WFS_STREAMED_LAYERS = {PARCELLES_GRAPHIQUES_LAYER, SIRENE_LAYER}
+# Attributs identifiants candidats pour trier les pages (sortBy) : le premier présent dans la couche
+WFS_SORT_ATTRIBUTES = ("ID_PARCEL", "id", "gid", "fid", "ogc_fid", "objectid", "siret")
+# Transport binaire (FlatGeobuf décodé en colonnes) pour fetch_wfs_table ; pyogrio est une
+# dépendance optionnelle (pip install pyogrio==0.7.2). GeoJSON sinon, ou si GeoServer ne
+# propose pas le format
+WFS_BINARY_TRANSPORT = os.environ.get("AGRIWEB_WFS_BINARY", "0") == "1"
+
+# Filtre géométrique côté serveur (CQL INTERSECTS) : budgets de longueur du filtre
+WFS_FILTER_MAX_URL_CHARS = int(os.environ.get("AGRIWEB_WFS_FILTER_MAX_URL", 6000))
+WFS_FILTER_MAX_BODY_CHARS = 200_000
+# Schéma par couche (DescribeFeatureType), résolu une fois par processus
+_wfs_feature_types = {}
+
+# Mutualisation des appels amont identiques simultanés (compteurs sur /debug_stats)
+upstream_flight = SingleFlight()
+
+# === Collecte concurrente (search_by_commune) ===
+FETCH_STAGE_WORKERS = int(os.environ.get("AGRIWEB_FETCH_WORKERS", 8))
+FETCH_STAGE_TIMEOUT = 30.0
+
+
+_layer_versions = {"checked": 0.0, "versions": {}}
+_layer_versions_lock = Lock()
+
+
+def geoserver_layer_versions(max_age=WFS_VERSION_CHECK_INTERVAL):
+    """
+    Versions des couches GeoServer {couche: empreinte}, relues au plus toutes les `max_age` s
+    (un seul GetCapabilities pour toutes les couches). En cas d'échec, les versions
+    précédentes sont conservées ({} au démarrage : versions inconnues, rien n'est invalidé).
+    """
+    import time
+    with _layer_versions_lock:
+        now = time.time()
+        if now - _layer_versions["checked"] >= max_age:
+            _layer_versions["checked"] = now
+            try:
+                _layer_versions["versions"] = read_layer_versions(http_session, GEOSERVER_WFS_URL)
+            except Exception as e:
+                print(f"⚠️ [WFS_CACHE] GetCapabilities illisible, versions précédentes conservées: {e}")
+        return _layer_versions["versions"]
+
+
+def geoserver_layer_version(layer_name):
+    """Version d'une couche : seule la modification de cette couche invalide ses tuiles en cache."""
+    return geoserver_layer_versions().get(layer_name)
+
+
+def require_admin(view):
+    """Réserve une route aux administrateurs (en-tête X-Admin-Token = AGRIWEB_ADMIN_TOKEN)."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = request.headers.get("X-Admin-Token", "")
+        if not ADMIN_TOKEN:
+            return jsonify({"error": "Actions d'administration désactivées (AGRIWEB_ADMIN_TOKEN)"}), 403
+        if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({"error": "Jeton d'administration invalide"}), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
+wfs_tile_cache = None
+if WFS_CACHE_ENABLED:
+    try:
+        wfs_tile_cache = WFSTileCache(
+            WFS_CACHE_PATH,
+            layer_ttls=WFS_CACHE_LAYER_TTLS,
+            tile_sizes=WFS_CACHE_TILE_SIZES,
+            max_tiles=WFS_CACHE_MAX_TILES,
+            version_provider=geoserver_layer_version,
+            version_check_interval=WFS_VERSION_CHECK_INTERVAL,
+            feature_limit=WFS_MAX_FEATURES,
+        )
+        print(f"🗄️ [WFS_CACHE] Cache de tuiles actif: {WFS_CACHE_PATH}")
+    except Exception as e:
+        print(f"⚠️ [WFS_CACHE] Cache désactivé: {e}")
+
+# === Cache disque générique (tuiles cadastre, ...) ===
+DISK_CACHE_PATH = os.environ.get("AGRIWEB_DISK_CACHE_PATH", os.path.join("cache", "agriweb_cache.sqlite"))
+disk_cache = None
+try:
+    disk_cache = DiskCache(DISK_CACHE_PATH)
+except Exception as e:
+    print(f"⚠️ [DISK_CACHE] Cache disque désactivé: {e}")
+
+# GeoRisques : échéance globale d'un rapport, catégories communales en cache 30 jours
+GEORISQUES_DEADLINE = float(os.environ.get("AGRIWEB_GEORISQUES_DEADLINE", 12.0))
+GEORISQUES_COMMUNE_TTL = 30 * 86400
+
+# Instantanés cadastre : tuiles API Carto de 0.01° conservées 30 jours
+CADASTRE_SNAPSHOT_TILE_SIZE = 0.01
+CADASTRE_SNAPSHOT_TTL = 30 * 86400
+CADASTRE_API_PAGE_SIZE = 1000
+
+# === MNT local (altitudes) ===
+# Dalles .npy produites par tools/build_dem_tiles.py ; les API d'altitude distantes
+# ne sont interrogées que hors couverture locale.
+DEM_DIR = os.environ.get("AGRIWEB_DEM_DIR", os.path.join("data", "dem"))
+dem_store = DEMStore(DEM_DIR)
+if len(dem_store):
+    print(f"⛰️ [DEM] {len(dem_store)} dalles locales ({dem_store.crs}): {DEM_DIR}")
+
+# === Productible PV ===
+# Grille nationale précalculée (tools/build_pvgis_grid.py) ; appels PVGIS restants en cache disque
+PVGIS_GRID_PATH = os.environ.get("AGRIWEB_PVGIS_GRID", os.path.join("data", "pvgis_grid.npz"))
+pvgis_yield = PVGISYield(PVGIS_GRID_PATH, http_session, disk_cache)
+if pvgis_yield.grid is not None:
+    print(f"☀️ [PVGIS_GRID] Grille {pvgis_yield.grid.shape} chargée: {PVGIS_GRID_PATH}")
+
+# === Répertoire local des communes (tools/build_gazetteer.py) ===
+# Résolution nom / code INSEE / point -> commune sans appel geo.api.gouv.fr
+GAZETTEER_PATH = os.environ.get("AGRIWEB_GAZETTEER_PATH", os.path.join("data", "communes.sqlite"))
+gazetteer = Gazetteer(GAZETTEER_PATH)
+
+# === Rapports par département : communes traitées en parallèle ===
+# Le débit vers chaque amont reste plafonné par UPSTREAM_POLICIES (max_concurrent)
+DEPT_REPORT_WORKERS = int(os.environ.get("AGRIWEB_DEPT_REPORT_WORKERS", 6))
+DEPT_REPORT_MAX_WORKERS = 16
+DEPT_REPORT_RETRIES = int(os.environ.get("AGRIWEB_DEPT_REPORT_RETRIES", 2))
+# Préchargement des couches du département : grille de tuiles (degrés)
+DEPT_PREFETCH_TILE_SIZE = 0.1
+
+# === Travaux longs (rapports département, rapports communaux complets) ===
+# File SQLite partagée : les routes déposent et suivent les travaux, l'exécution se fait
+# hors des workers web (job_worker.py, ou threads du serveur local lancé par main()).
+JOBS_DB_PATH = os.environ.get("AGRIWEB_JOBS_DB", os.path.join("data", "jobs.sqlite"))
+JOB_LEASE = float(os.environ.get("AGRIWEB_JOB_LEASE", 60))
+JOB_INPROCESS_WORKERS = int(os.environ.get("AGRIWEB_JOB_INPROCESS_WORKERS", 1))
+job_store = JobStore(JOBS_DB_PATH, lease=JOB_LEASE)
+
+# === Couches brutes par commune (re-filtrage des curseurs sans re-téléchargement) ===
+# Lot indépendant des seuils, clé code INSEE ; /refilter_commune n'applique que les seuils.
+COMMUNE_BUNDLE_CACHE_SIZE = int(os.environ.get("AGRIWEB_COMMUNE_BUNDLE_CACHE_SIZE", 8))
+COMMUNE_BUNDLE_TTL = float(os.environ.get("AGRIWEB_COMMUNE_BUNDLE_TTL", 1800))
+commune_bundles = BundleCache(COMMUNE_BUNDLE_CACHE_SIZE, COMMUNE_BUNDLE_TTL)
+# Délai (s) avant de retenter l'index des bâtiments d'un lot quand Overpass a échoué
+BUILDING_INDEX_RETRY = float(os.environ.get("AGRIWEB_BUILDING_INDEX_RETRY", 60))
+
+# === Magasin local des couches (alternative au GeoServer distant) ===
+# AGRIWEB_LAYER_BACKEND=local : fetch_wfs_data répond depuis le magasin SQLite/R-tree
+# pour les couches importées (tools/import_layer_store.py), GeoServer sinon.
+LAYER_BACKEND = os.environ.get("AGRIWEB_LAYER_BACKEND", "geoserver").lower()
+LAYER_STORE_PATH = os.environ.get("AGRIWEB_LAYER_STORE_PATH", os.path.join("data", "layers.sqlite"))
+STORE_LAYERS = [
+    CADASTRE_LAYER, POSTE_LAYER, PLU_LAYER, PARCELLE_LAYER, HT_POSTE_LAYER, CAPACITES_RESEAU_LAYER,
+    PARKINGS_LAYER, FRICHES_LAYER, POTENTIEL_SOLAIRE_LAYER, ZAER_LAYER, PARCELLES_GRAPHIQUES_LAYER,
+    SIRENE_LAYER, ELEVEURS_LAYER, PPRI_LAYER,
+]
+
+layer_store = None
+if LAYER_BACKEND == "local":
+    try:
+        layer_store = LayerStore(LAYER_STORE_PATH)
+        print(f"🗃️ [LAYER_STORE] Couches locales: {', '.join(layer_store.layers()) or 'aucune'}")
+    except Exception as e:
+        print(f"⚠️ [LAYER_STORE] Magasin local indisponible, retour à GeoServer: {e}")
+
+wfs_binary_reader = None
+if WFS_BINARY_TRANSPORT:
+    if binary_decoding_available():
+        wfs_binary_reader = WFSBinaryReader(http_session, GEOSERVER_WFS_URL, page_size=WFS_PAGE_SIZE, timeout=10)
+    else:
+        print("⚠️ [WFS_BINARY] pyogrio/FlatGeobuf indisponible, lecture GeoJSON")
+
+# Niveaux de détail des polygones des cartes générées (servis au zoom par /map_lod).
+# Les cartes sont enregistrées en HTML permanent (static/cartes) : leurs géométries d'origine
+# sont écrites à côté (static/cartes/lod/<id>.json), lues par tout worker après expiration
+# du cache mémoire et chargées directement par le navigateur si la route ne répond pas.
+MAP_LOD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "cartes", "lod")
+MAP_LOD_STATIC_URL = "/static/cartes/lod"
+map_lod_cache = LODCache(directory=MAP_LOD_DIR)
+
 # === Dictionnaires de mapping ===
 rpg_culture_mapping = {
     "BTH": "Blé tendre d’hiver",
@@ -724,6 +856,14 @@ hta_mapping = {
     "GRDHTB - 1": "GRDHTB -_1"
 }
 
+# === Attributs WFS lus par chaque usage (propertyName) ===
+# La géométrie est toujours incluse ; les noms absents d'une couche sont ignorés,
+# ce qui permet de lister des variantes de casse. () = géométrie seule.
+ELEVEUR_PROPERTIES = tuple(ELEVEUR_FIELDS_TO_SHOW) + ("prenomUsue", "telephone", "email", "site_web")
+CAPACITES_PROPERTIES = tuple(hta_mapping.values())
+POSTE_LABEL_PROPERTIES = ("Nom", "nom", "NOM", "id", "identifiant", "code", "libelle")
+GEOMETRY_ONLY = ()
+
 def on_import_license():
     filename = filedialog.askopenfilename(
         title="Sélectionnez votre fichier licence",
@@ -746,15 +886,24 @@ def main_license():
 def get_communes_for_dept(dept):
     """
     Retourne une liste de features (GeoJSON) représentant les communes
-    du département donné, avec leur nom, leur centre et leur contour.
+    du département donné, avec leur nom, leur code INSEE, leur centre et leur contour.
     """
+    if gazetteer.available:
+        features = [
+            {"type": "Feature", "properties": {"nom": c["nom"], "code": c.get("code"), "centre": c["centre"]},
+             "geometry": c["contour"] or c["centre"]}
+            for c in gazetteer.in_departement(dept, "nom,code,centre,contour")
+            if c.get("contour") or c.get("centre")
+        ]
+        if features:
+            return features
     # On demande au service Geo API Gouv le nom, le centre et le contour
     url = (
         f"https://geo.api.gouv.fr/departements/{dept}/communes"
-        "?fields=nom,centre,contour"
+        "?fields=nom,code,centre,contour"
     )
     try:
-        resp = requests.get(url, timeout=10)
+        resp = http_session.get(url, timeout=10)
         resp.raise_for_status()
         communes = resp.json()
         features = []
@@ -768,6 +917,7 @@ def get_communes_for_dept(dept):
                     "type": "Feature",
                     "properties": {
                         "nom": c.get("nom"),
+                        "code": c.get("code"),
                         "centre": centre
                     },
                     "geometry": geom
@@ -777,6 +927,7 @@ def get_communes_for_dept(dept):
         print(f"[get_communes_for_dept] Erreur : {e}")
         return []
     
+@upstream_flight.wrap("gpu")
 def fetch_gpu_data(endpoint, geom, partition=None, categorie=None, limit=1000):
     base_url = "https://apicarto.ign.fr/api/gpu"
     url = f"{base_url}/{endpoint}"
@@ -786,7 +937,7 @@ def fetch_gpu_data(endpoint, geom, partition=None, categorie=None, limit=1000):
     if categorie:
         params["categorie"] = categorie
     try:
-        resp = requests.get(url, params=params, timeout=10)
+        resp = http_session.get(url, params=params, timeout=10)
         if resp.status_code == 200:
             return resp.json()
         else:
@@ -795,48 +946,69 @@ def fetch_gpu_data(endpoint, geom, partition=None, categorie=None, limit=1000):
     except Exception as e:
         print(f"[fetch_gpu_data] Exception lors de l'appel à {endpoint}: {e}")
         return None
+GPU_ENDPOINTS = [
+    "municipality",
+    "document",
+    "zone-urba",
+    "secteur-cc",
+    "prescription-surf",
+    "prescription-lin",
+    "prescription-pct",
+    "info-surf",
+    "info-lin",
+    "info-pct",
+    "acte-sup",
+    "assiette-sup-s",
+    "assiette-sup-l",
+    "assiette-sup-p",
+    "generateur-sup-s",
+    "generateur-sup-l",
+    "generateur-sup-p"
+]
+
+# Requêtes API Carto simultanées d'un même fan-out (endpoints × tuiles)
+API_FANOUT_WORKERS = int(os.environ.get("AGRIWEB_API_FANOUT_WORKERS", 6))
+# Longueur maximale du JSON de géométrie en URL (au-delà : 414), sinon découpage en tuiles
+API_GEOM_MAX_CHARS = 4000
+# Plafond de requêtes (endpoints × tuiles) d'un fan-out : découpage moins fin au-delà
+API_FANOUT_MAX_REQUESTS = int(os.environ.get("AGRIWEB_API_FANOUT_MAX_REQUESTS", 128))
+
 def get_all_gpu_data(geom):
-    endpoints = [
-        "municipality",
-        "document",
-        "zone-urba",
-        "secteur-cc",
-        "prescription-surf",
-        "prescription-lin",
-        "prescription-pct",
-        "info-surf",
-        "info-lin",
-        "info-pct",
-        "acte-sup",
-        "assiette-sup-s",
-        "assiette-sup-l",
-        "assiette-sup-p",
-        "generateur-sup-s",
-        "generateur-sup-l",
-        "generateur-sup-p"
-    ]
-    results = {}
-    for ep in endpoints:
-        data = fetch_gpu_data(ep, geom)
-        results[ep] = data
+    """
+    Interroge les endpoints GPU en parallèle. Un polygone trop long pour l'URL est
+    découpé en tuiles (voir utils/geometry_tiling.py), résultats fusionnés et redécoupés au contour.
+
+    Returns:
+        dict: {endpoint: FeatureCollection ou None} ; une collection incomplète (tuiles en
+        échec) porte "failed_tiles"
+    """
+    results, n_tiles, failed = fan_out(fetch_gpu_data, GPU_ENDPOINTS, geom, max_workers=API_FANOUT_WORKERS,
+                                       budget=API_GEOM_MAX_CHARS, max_requests=API_FANOUT_MAX_REQUESTS)
+    if n_tiles > 1:
+        print(f"🧩 [GPU] Polygone découpé en {n_tiles} tuiles")
+    for endpoint, n in failed.items():
+        print(f"⚠️ [GPU] {endpoint}: {n}/{n_tiles} tuiles sans réponse, résultat incomplet")
     return results
 
 # Fonction supprimée - conservé seulement main() à la fin du fichier
 def get_api_cadastre_data(point_geojson):
+    try:
+        return get_api_cadastre_data_or_raise(point_geojson)
+    except Exception as e:
+        print("Erreur API cadastre IGN:", e)
+        return None  # ou {} selon ton code
+
+def get_api_cadastre_data_or_raise(point_geojson):
+    """Comme get_api_cadastre_data, mais une erreur HTTP ou réseau lève une exception au lieu de rendre None."""
     url = "https://apicarto.ign.fr/api/cadastre/parcelle"
     params = {
         "geom": json.dumps(point_geojson),
         "_limit": 1000,
         "source_ign": "PCI"
     }
-    try:
-        response = requests.get(url, params=params, timeout=10)
-        if response.ok:
-            return response.json()
-        return None
-    except Exception as e:
-        print("Erreur API cadastre IGN:", e)
-        return None  # ou {} selon ton code
+    response = http_session.get(url, params=params, timeout=10)
+    response.raise_for_status()
+    return response.json()
 
 def build_report_data(lat, lon, address=None, ht_radius_km=1.0, sirene_radius_km=0.05):
     if address is None:
@@ -859,10 +1031,10 @@ def build_report_data(lat, lon, address=None, ht_radius_km=1.0, sirene_radius_km
     rpg_data = get_rpg_info(lat, lon, radius=0.0027)
 
     from shapely.geometry import shape
-    for feat in rpg_data:
-        feat = decode_rpg_feature(feat)
-        centroid = shape(feat["geometry"]).centroid.coords[0]
-        min_bt = calculate_min_distance((centroid[0], centroid[1]), postes)
+    rpg_data = [decode_rpg_feature(feat) for feat in rpg_data]
+    # Distances au poste BT le plus proche, un appel vectorisé pour toutes les parcelles
+    nearest_bt = DistanceEngine(bt=postes).query([shape(f["geometry"]).centroid for f in rpg_data])["bt"]
+    for feat, min_bt in zip(rpg_data, nearest_bt["distance_m"]):
         feat["properties"]["distance_au_poste"] = round(min_bt, 2) if min_bt is not None else "N/A"
 
     sirene_data = get_sirene_info(lat, lon, radius=sirene_radius_deg)
@@ -899,7 +1071,7 @@ def build_report_data(lat, lon, address=None, ht_radius_km=1.0, sirene_radius_km
     kwh_an = get_pvgis_production(float(lat), float(lon), default_tilt, default_azimuth, peakpower=1.0)
 
     # Récupérer les données GeoRisques
-    georisques_risks = fetch_georisques_risks(lat, lon)
+    georisques_risks, georisques_indisponibles = fetch_georisques_risks(lat, lon)
     print(f"🔍 [BUILD_REPORT] GeoRisques reçues: {type(georisques_risks)} avec {len(georisques_risks) if georisques_risks else 0} catégories")
 
     return {
@@ -927,7 +1099,8 @@ def build_report_data(lat, lon, address=None, ht_radius_km=1.0, sirene_radius_km
         "ht_radius_km": ht_radius_km,
         "sirene_radius_km": sirene_radius_km,
         "search_radius": search_radius,
-        "georisques_risks": georisques_risks
+        "georisques_risks": georisques_risks,
+        "georisques_indisponibles": georisques_indisponibles
     }
 
 
@@ -1050,8 +1223,7 @@ def get_parcelle_info(lat, lon):
     return None
 
 def get_all_parcelles(lat, lon, radius=0.03):
-    transformer = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True)
-    x, y = transformer.transform(lon, lat)
+    x, y = transform_func(WGS84, L93)(lon, lat)
     bbox = f"{x - radius * 111000},{y - radius * 111000},{x + radius * 111000},{y + radius * 111000},EPSG:2154"
     url = f"{GEOSERVER_URL}/wfs"
     params = {
@@ -1063,7 +1235,7 @@ def get_all_parcelles(lat, lon, radius=0.03):
         "bbox": bbox
     }
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = http_session.get(url, params=params, timeout=10)
         response.raise_for_status()
         return response.json()
     except Exception as e:
@@ -1072,16 +1244,11 @@ def get_all_parcelles(lat, lon, radius=0.03):
         return {"type": "FeatureCollection", "features": []}
 
 
-def get_all_postes(lat, lon, radius_deg=0.1):
-    bbox = f"{lon-radius_deg},{lat-radius_deg},{lon+radius_deg},{lat+radius_deg},EPSG:4326"
-    features = fetch_wfs_data(POSTE_LAYER, bbox)
-    if not features:
-        print(f"[DEBUG] Aucun poste trouvé dans le bbox {bbox}")
-        return []
-    
+def postes_with_distance(features, lat, lon):
+    """Postes (properties, distance approximative en m au point, geometry) depuis des features WFS."""
     point = Point(lon, lat)
     postes = []
-    for feature in features:
+    for feature in features or []:
         geom_shp = shape(feature["geometry"])
         dist = geom_shp.distance(point) * 111000  # Conversion en mètres
         postes.append({
@@ -1089,52 +1256,57 @@ def get_all_postes(lat, lon, radius_deg=0.1):
             "distance": round(dist, 2),
             "geometry": mapping(geom_shp)
         })
+    return postes
+
+def get_all_postes(lat, lon, radius_deg=0.1):
+    bbox = f"{lon-radius_deg},{lat-radius_deg},{lon+radius_deg},{lat+radius_deg},EPSG:4326"
+    features = fetch_wfs_data(POSTE_LAYER, bbox)
+    if not features:
+        print(f"[DEBUG] Aucun poste trouvé dans le bbox {bbox}")
+        return []
+    
+    postes = postes_with_distance(features, lat, lon)
     print(f"[DEBUG] {len(postes)} postes trouvés, distances: {[p['distance'] for p in postes[:3]]}")
     return postes  # Pas de slicing ici
 
 def get_all_ht_postes(lat, lon, radius_deg=0.5):
     bbox = f"{lon-radius_deg},{lat-radius_deg},{lon+radius_deg},{lat+radius_deg},EPSG:4326"
     features = fetch_wfs_data(HT_POSTE_LAYER, bbox)
-    point = Point(lon, lat)
-    postes = []
-    for feature in features:
-        geom = shape(feature["geometry"])
-        distance = geom.distance(point) * 111000
-        postes.append({
-            "properties": feature["properties"],
-            "distance": round(distance, 2),
-            "geometry": mapping(geom)
-        })
-    return postes  # Pas de slicing ici])[:3]
+    return postes_with_distance(features, lat, lon)  # Pas de slicing ici])[:3]
 
-def get_all_capacites_reseau(lat, lon, radius_deg=0.1):
+def get_all_capacites_reseau(lat, lon, radius_deg=0.1, count=None):
+    """
+    Capacités d'accueil du réseau autour du point, de la plus proche à la plus éloignée
+    (distance en m, Lambert-93) ; seulement les `count` plus proches si demandé.
+    """
     bbox = f"{lon-radius_deg},{lat-radius_deg},{lon+radius_deg},{lat+radius_deg},EPSG:4326"
     print(f"[DEBUG CAPACITES] bbox: {bbox}")
     print(f"[DEBUG CAPACITES] layer: {CAPACITES_RESEAU_LAYER}")
     
-    features = fetch_wfs_data(CAPACITES_RESEAU_LAYER, bbox)
+    features = fetch_wfs_data(CAPACITES_RESEAU_LAYER, bbox, property_names=CAPACITES_PROPERTIES)
     print(f"[DEBUG CAPACITES] features brutes trouvées: {len(features) if features else 0}")
     
     if features and len(features) > 0:
         print(f"[DEBUG CAPACITES] Premier exemple: {list(features[0].get('properties', {}).keys())[:10]}")
     
-    capacites = []
-    point = Point(lon, lat)
-    for feature in features:
-        try:
-            geom = shape(feature["geometry"])
-            distance = geom.distance(point) * 111000
-            capacites.append({
-                "properties": feature["properties"],
-                "distance": round(distance, 2),
-                "geometry": mapping(geom)
-            })
-        except Exception as e:
-            print(f"[DEBUG CAPACITES] Erreur traitement feature: {e}")
-            continue
-    
+    # Distances vectorisées sur l'index de la couche, sélection des plus proches sans tri complet
+    try:
+        index = NearestFeatureIndex(features or [])
+        distances, order = index.ranked((lon, lat), count)
+    except Exception as e:
+        print(f"[DEBUG CAPACITES] Erreur traitement features: {e}")
+        return []
+    capacites = [
+        {
+            "properties": index.features[i]["properties"],
+            "distance": round(float(d), 2),
+            "geometry": index.features[i]["geometry"]
+        }
+        for d, i in zip(distances, order)
+    ]
+
     print(f"[DEBUG CAPACITES] capacités finales: {len(capacites)}")
-    return sorted(capacites, key=lambda x: x["distance"])
+    return capacites
 
 
 def get_plu_info(lat, lon, radius=0.03):
@@ -1188,64 +1360,71 @@ def get_zaer_info(lat, lon, radius=0.03):
 def get_data_by_commune_polygon(geom_geojson, api_endpoint, layer_name=None):
     """
     Récupère des données en utilisant directement le polygone de la commune
-    via l'API Carto selon la documentation officielle
+    via l'API Carto selon la documentation officielle ([] en cas d'erreur)
     """
-    import json
-    import requests
-    
     try:
-        if layer_name:
-            # Pour les données WFS (parkings, friches, etc.)
-            # On utilise une approche hybride : bbox + filtrage géométrique
-            if isinstance(geom_geojson, dict):
-                from shapely.geometry import shape
-                commune_poly = shape(geom_geojson)
-                minx, miny, maxx, maxy = commune_poly.bounds
-                bbox = f"{minx},{miny},{maxx},{maxy},EPSG:4326"
-                
-                print(f"🔍 [POLYGON_SEARCH] {layer_name}: bbox {bbox}")
-                features = fetch_wfs_data(layer_name, bbox)
-                
-                # Filtrage géométrique précis
-                if features:
-                    filtered = []
-                    for f in features:
-                        if "geometry" not in f:
-                            continue
-                        try:
-                            geom = shape(f["geometry"])
-                            if not geom.is_valid:
-                                geom = geom.buffer(0)
-                            if geom.intersects(commune_poly):
-                                filtered.append(f)
-                        except Exception as e:
-                            continue
-                    print(f"✅ [POLYGON_SEARCH] {layer_name}: {len(filtered)}/{len(features)} features dans la commune")
-                    return filtered
-                return features
-        else:
-            # Pour l'API Carto directe (cadastre, etc.)
-            params = {
-                "geom": json.dumps(geom_geojson) if isinstance(geom_geojson, dict) else geom_geojson,
-                "_limit": 1000
-            }
-            
-            print(f"🔍 [API_CARTO] {api_endpoint} avec géométrie commune")
-            resp = requests.get(api_endpoint, params=params, timeout=30)
-            
-            if resp.status_code == 200:
-                data = resp.json()
-                features = data.get('features', [])
-                print(f"✅ [API_CARTO] {api_endpoint}: {len(features)} features trouvées")
-                return features
-            else:
-                print(f"⚠️ [API_CARTO] {api_endpoint}: erreur {resp.status_code}")
-                return []
-                
+        return get_data_by_commune_polygon_or_raise(geom_geojson, api_endpoint, layer_name)
     except Exception as e:
-        print(f"❌ [POLYGON_SEARCH] Erreur {api_endpoint}: {e}")
+        print(f"❌ [POLYGON_SEARCH] Erreur {layer_name or api_endpoint}: {e}")
         return []
 
+def get_data_by_commune_polygon_or_raise(geom_geojson, api_endpoint, layer_name=None):
+    """
+    Comme get_data_by_commune_polygon, mais une erreur (timeout, 5xx, tunnel) lève une exception
+    au lieu de rendre [] : pour les appelants qui mettent le résultat en cache (lot communal).
+    Un flux de pages interrompu rend les pages lues, marquées incomplètes (truncated).
+    """
+    import json
+
+    if layer_name:
+        # Pour les données WFS (parkings, friches, etc.)
+        # Découpage au polygone exact : côté GeoServer, ou sur les tuiles du cache
+        if isinstance(geom_geojson, dict):
+            from shapely.geometry import shape
+            commune_poly = shape(geom_geojson)
+            minx, miny, maxx, maxy = commune_poly.bounds
+            bbox = f"{minx},{miny},{maxx},{maxy},EPSG:4326"
+            
+            print(f"🔍 [POLYGON_SEARCH] {layer_name}: bbox {bbox}")
+
+            if layer_name in WFS_STREAMED_LAYERS and not (layer_store and layer_store.has_layer(layer_name)):
+                # Couche volumineuse : polygone envoyé à GeoServer, lecture page par page
+                gf = wfs_geometry_filter(layer_name, commune_poly)
+                stream = iter_wfs_features(layer_name, None, method=gf.method, **gf.params())
+                filtered = FeatureList()
+                try:
+                    for page in stream.pages():
+                        filtered.extend(gf.refine(page))
+                except Exception as e:
+                    # Flux interrompu : pages déjà lues rendues, mais marquées incomplètes
+                    print(f"⚠️ [POLYGON_SEARCH] {layer_name}: lecture interrompue après {stream.number_returned} features ({e})")
+                    filtered.truncated = True
+                filtered.truncated = filtered.truncated or stream.truncated
+                print(f"✅ [POLYGON_SEARCH] {layer_name}: {len(filtered)}/{stream.number_returned} features dans la commune "
+                      f"(numberMatched={stream.number_matched}, {stream.pages_fetched} pages"
+                      f"{', incomplet' if filtered.truncated else ''})")
+                return filtered
+
+            features = fetch_wfs_data_or_raise(layer_name, bbox, geometry=commune_poly)
+            print(f"✅ [POLYGON_SEARCH] {layer_name}: {len(features)} features dans la commune")
+            return features
+    else:
+        # Pour l'API Carto directe (cadastre, etc.)
+        params = {
+            "geom": json.dumps(geom_geojson) if isinstance(geom_geojson, dict) else geom_geojson,
+            "_limit": 1000
+        }
+        
+        print(f"🔍 [API_CARTO] {api_endpoint} avec géométrie commune")
+        resp = http_session.get(api_endpoint, params=params, timeout=30)
+        
+        if resp.status_code != 200:
+            print(f"⚠️ [API_CARTO] {api_endpoint}: erreur {resp.status_code}")
+        resp.raise_for_status()
+        features = resp.json().get('features', [])
+        print(f"✅ [API_CARTO] {api_endpoint}: {len(features)} features trouvées")
+        return features
+
 def get_rpg_info_by_polygon(commune_geom):
     """Récupère les données RPG en utilisant le polygone exact de la commune"""
     return get_data_by_commune_polygon(commune_geom, "https://apicarto.ign.fr/api/rpg/parcelles", PARCELLES_GRAPHIQUES_LAYER)
@@ -1326,7 +1505,7 @@ def get_batiments_info_by_polygon(commune_geom):
         
         print(f"🌐 [BATIMENTS] Envoi requête Overpass...")
         
-        response = requests.post(
+        response = http_session.post(
             "https://overpass-api.de/api/interpreter",
             data=overpass_query,
             timeout=120  # Timeout plus long pour les grandes communes
@@ -1389,16 +1568,8 @@ def get_batiments_info_by_polygon(commune_geom):
         print(f"✅ [BATIMENTS_OSM] {len(all_features)} bâtiments filtrés dans la commune")
         
         # Calcul des surfaces pour statistiques
-        to_l93 = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True).transform
-        surfaces = []
-        
-        for feat in all_features[:100]:  # Échantillon pour stats
-            try:
-                geom = shape(feat["geometry"])
-                surface_m2 = shp_transform(to_l93, geom).area
-                surfaces.append(surface_m2)
-            except:
-                continue
+        sample_areas = layer_metrics(all_features[:100]).area_m2  # Échantillon pour stats
+        surfaces = [float(a) for a in sample_areas if a == a]
         
         if surfaces:
             avg_surface = sum(surfaces) / len(surfaces)
@@ -1435,11 +1606,27 @@ def decode_rpg_feature(feature):
     return feature
 
 def calculate_min_distance(centroid, postes):
-    distances = [
-        shape(poste["geometry"]).distance(Point(centroid)) * 111000
-        for poste in postes
-    ]
-    return min(distances) if distances else None
+    """
+    Distance minimale (m, Lambert-93) entre un point (lon, lat) et des postes : liste de
+    features (index construit pour l'appel) ou NearestFeatureIndex déjà construit. Pour un
+    lot de centroïdes, préférer DistanceEngine.query (un seul appel vectorisé).
+    """
+    if not postes:
+        return None
+    index = postes if isinstance(postes, NearestFeatureIndex) else NearestFeatureIndex(postes)
+    return index.min_distance(centroid)
+
+def building_metrics(features, area_geom):
+    """
+    Pré-calcul vectorisé du filtrage des toitures : géométries réparées (buffer(0) si invalides),
+    surfaces et centroïdes (LayerMetrics) et masque des bâtiments intersectant `area_geom`.
+
+    Returns:
+        tuple: (LayerMetrics, masque booléen des bâtiments valides dans la zone)
+    """
+    inside, geoms = CommuneClipper(area_geom).mask(features)
+    return LayerMetrics(geoms), inside
+
 def flatten_gpu_dict_to_featurecollection(gpu_dict):
     features = []
     for key, value in gpu_dict.items():
@@ -1451,10 +1638,11 @@ def flatten_gpu_dict_to_featurecollection(gpu_dict):
 ########################################
 # Appels API (cadastre, nature, GPU)
 ########################################
+@upstream_flight.wrap("apicarto_cadastre")
 def get_api_cadastre_data(geom, endpoint="/cadastre/parcelle", source_ign="PCI"):
     url = f"https://apicarto.ign.fr/api{endpoint}"
     params = {"geom": json.dumps(geom), "_limit": 1000, "source_ign": source_ign}
-    response = requests.get(url, params=params)
+    response = http_session.get(url, params=params)
     if response.status_code == 200:
         return response.json()
     elif response.status_code == 414:
@@ -1463,6 +1651,50 @@ def get_api_cadastre_data(geom, endpoint="/cadastre/parcelle", source_ign="PCI")
         print(f"⚠️ API Cadastre: {response.status_code} - {response.text}")
     return None
 
+def fetch_cadastre_tile(bounds):
+    """
+    Parcelles PCI d'une tuile (API Carto), pagination comprise.
+    Lève une exception en cas d'erreur pour que la tuile ne soit pas mise en cache.
+    """
+    minx, miny, maxx, maxy = bounds
+    geom = {"type": "Polygon", "coordinates": [[[minx, miny], [maxx, miny], [maxx, maxy], [minx, maxy], [minx, miny]]]}
+    url = "https://apicarto.ign.fr/api/cadastre/parcelle"
+    features, start = [], 0
+    while True:
+        params = {"geom": json.dumps(geom), "_limit": CADASTRE_API_PAGE_SIZE, "_start": start, "source_ign": "PCI"}
+        response = http_session.get(url, params=params, timeout=30)
+        response.raise_for_status()
+        page = response.json().get("features", [])
+        features.extend(page)
+        if len(page) < CADASTRE_API_PAGE_SIZE:
+            return features
+        start += CADASTRE_API_PAGE_SIZE
+
+@lru_cache(maxsize=4096)
+def _insee_at(lat_r, lon_r):
+    if gazetteer.available:
+        commune = gazetteer.locate(lon_r, lat_r)
+        if commune:
+            return commune["code"]
+    resp = http_session.get("https://geo.api.gouv.fr/communes",
+                            params={"lat": lat_r, "lon": lon_r, "fields": "code", "format": "json"}, timeout=5)
+    resp.raise_for_status()
+    communes = resp.json()
+    return communes[0]["code"] if communes else None
+
+def get_insee_for_point(lat, lon):
+    """Code INSEE de la commune contenant le point (mémorisé au 1/10 000 de degré, ~10 m)."""
+    return _insee_at(round(float(lat), 4), round(float(lon), 4))
+
+georisques_client = GeoRisquesClient(
+    http_session, disk_cache, insee_resolver=get_insee_for_point,
+    deadline=GEORISQUES_DEADLINE, commune_ttl=GEORISQUES_COMMUNE_TTL,
+)
+
+cadastre_snapshots = CadastreSnapshotStore(
+    fetch_cadastre_tile, disk_cache, tile_size=CADASTRE_SNAPSHOT_TILE_SIZE, ttl=CADASTRE_SNAPSHOT_TTL,
+)
+
 def get_batiments_data(geom):
     """
     Récupère les empreintes de bâtiments via OpenStreetMap Overpass API.
@@ -1556,7 +1788,7 @@ def get_batiments_data(geom):
                     return None
         
         overpass_url = "https://overpass-api.de/api/interpreter"
-        response = requests.post(overpass_url, data=overpass_query, timeout=30)
+        response = http_session.post(overpass_url, data=overpass_query, timeout=30)
         
         if response.status_code == 200:
             osm_data = response.json()
@@ -1584,9 +1816,9 @@ def get_batiments_data(geom):
                         }
                         features.append(feature)
             
-            if features:
-                print(f"✅ [BATIMENTS] {len(features)} bâtiments trouvés via OpenStreetMap")
-                return {"type": "FeatureCollection", "features": features}
+            # Réponse valide sans bâtiment : collection vide (None est réservé aux échecs)
+            print(f"✅ [BATIMENTS] {len(features)} bâtiments trouvés via OpenStreetMap")
+            return {"type": "FeatureCollection", "features": features}
         else:
             print(f"⚠️ [BATIMENTS] Overpass API: {response.status_code}")
     except Exception as e:
@@ -1607,52 +1839,9 @@ def calculate_surface_libre_parcelle(parcelle_geom, batiments_data):
         dict: {"surface_totale_m2": float, "surface_batie_m2": float, "surface_libre_m2": float, "surface_libre_pct": float}
     """
     try:
-        from shapely.geometry import shape
-        from shapely.ops import transform as shp_transform
-        from pyproj import Transformer
-        
-        # Transformer vers Lambert 93 pour calculs de surface précis
-        to_l93 = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True).transform
-        
-        # Géométrie de la parcelle en Lambert 93
-        parcelle_shp = shape(parcelle_geom)
-        parcelle_l93 = shp_transform(to_l93, parcelle_shp)
-        surface_totale_m2 = parcelle_l93.area
-        
-        # Calculer la surface bâtie
-        surface_batie_m2 = 0.0
-        batiments_count = 0
-        
-        if batiments_data and batiments_data.get("features"):
-            for batiment in batiments_data["features"]:
-                batiment_geom = batiment.get("geometry")
-                if not batiment_geom:
-                    continue
-                
-                try:
-                    batiment_shp = shape(batiment_geom)
-                    batiment_l93 = shp_transform(to_l93, batiment_shp)
-                    
-                    # Intersection entre la parcelle et le bâtiment
-                    intersection = parcelle_l93.intersection(batiment_l93)
-                    if intersection.area > 0:
-                        surface_batie_m2 += intersection.area
-                        batiments_count += 1
-                except Exception as e:
-                    print(f"⚠️ [SURFACE_LIBRE] Erreur intersection bâtiment: {e}")
-                    continue
-        
-        # Calculs finaux
-        surface_libre_m2 = max(0, surface_totale_m2 - surface_batie_m2)
-        surface_libre_pct = (surface_libre_m2 / surface_totale_m2 * 100) if surface_totale_m2 > 0 else 0
-        
-        result = {
-            "surface_totale_m2": round(surface_totale_m2, 2),
-            "surface_batie_m2": round(surface_batie_m2, 2),
-            "surface_libre_m2": round(surface_libre_m2, 2),
-            "surface_libre_pct": round(surface_libre_pct, 1),
-            "batiments_count": batiments_count
-        }
+        # Surface bâtie : union des bâtiments découpés à la parcelle (voir utils/building_index.py)
+        result = BuildingIndex(batiments_data).surface_libre([parcelle_geom])[0]
+        batiments_count = result["batiments_count"]
         
         print(f"📊 [SURFACE_LIBRE] Parcelle: {result['surface_totale_m2']}m² total, {result['surface_batie_m2']}m² bâti ({batiments_count} bât.), {result['surface_libre_m2']}m² libre ({result['surface_libre_pct']}%)")
         
@@ -1669,10 +1858,75 @@ def calculate_surface_libre_parcelle(parcelle_geom, batiments_data):
             "error": str(e)
         }
 
+def get_batiments_index_commune(contour):
+    """
+    Bâtiments de toute la commune en une seule requête Overpass, indexés en Lambert-93.
+    La requête porte sur l'emprise (bbox) du contour : le polygone simplifié à 50 points
+    utilisé par get_batiments_data pourrait couper une partie de la commune.
+
+    Args:
+        contour: Contour GeoJSON de la commune
+
+    Returns:
+        BuildingIndex: index des bâtiments, None si Overpass n'a pas répondu
+    """
+    import time
+    from shapely.geometry import box, mapping, shape
+
+    t0 = time.time()
+    emprise = mapping(box(*shape(contour).bounds))
+    batiments = get_batiments_data(emprise)
+    if batiments is None:
+        print(f"⚠️ [SURFACE_LIBRE] Index des bâtiments indisponible ({time.time() - t0:.1f}s)")
+        return None
+    index = BuildingIndex(batiments)
+    print(f"🏠 [SURFACE_LIBRE] {len(index)} bâtiments indexés pour la commune en {time.time() - t0:.1f}s")
+    return index
+
+def annotate_surface_libre(features, building_index, detailed=False):
+    """
+    Ajoute surface bâtie / libre aux propriétés de features retenues, par une jointure
+    spatiale groupée sur l'index des bâtiments de la commune.
+
+    Args:
+        features: Features GeoJSON à enrichir (modifiées en place)
+        building_index: BuildingIndex de la commune ; None si les bâtiments n'ont pas pu être
+            récupérés (surface_libre_error posé plutôt qu'une surface 100 % libre)
+        detailed: ajoute aussi surface_totale_calculee_m2 et surface_libre_calculee (parcelles en zones)
+    """
+    if not features:
+        return
+    try:
+        if building_index is None:
+            raise RuntimeError("bâtiments de la commune indisponibles (Overpass)")
+        results = building_index.surface_libre([f["geometry"] for f in features])
+    except Exception as e:
+        print(f"❌ [SURFACE_LIBRE] Erreur jointure bâtiments: {e}")
+        for feat in features:
+            feat["properties"]["surface_libre_error"] = str(e)
+            if detailed:
+                feat["properties"]["surface_libre_calculee"] = False
+        return
+    for feat, result in zip(features, results):
+        props = feat["properties"]
+        props.pop("surface_libre_error", None)
+        if detailed:
+            props["surface_totale_calculee_m2"] = result["surface_totale_m2"]
+        props.update({
+            'surface_batie_m2': result['surface_batie_m2'],
+            'surface_libre_m2': result['surface_libre_m2'],
+            'surface_libre_pct': result['surface_libre_pct'],
+            'batiments_count': result['batiments_count']
+        })
+        if detailed:
+            props["surface_libre_calculee"] = True
+    print(f"📊 [SURFACE_LIBRE] {len(features)} parcelles, {sum(r['batiments_count'] for r in results)} bâtiments intersectés")
+
+@upstream_flight.wrap("apicarto_nature")
 def get_api_nature_data(geom, endpoint="/nature/natura-habitat"):
     url = f"https://apicarto.ign.fr/api{endpoint}"
     params = {"geom": json.dumps(geom), "_limit": 1000}
-    response = requests.get(url, params=params)
+    response = http_session.get(url, params=params)
     if response.status_code == 200:
         return response.json()
     print(f"Erreur API Nature: {response.status_code} - {response.text}")
@@ -1703,34 +1957,40 @@ def get_all_api_nature_data(geom):
         ("/nature/rncf", "Réserves Nationales de Chasse et Faune Sauvage")
     ]
     
+    type_names = dict(endpoints)
+    results, n_tiles, failed = fan_out(lambda endpoint, tile: get_api_nature_data(tile, endpoint), list(type_names),
+                                       geom, max_workers=API_FANOUT_WORKERS, budget=API_GEOM_MAX_CHARS,
+                                       max_requests=API_FANOUT_MAX_REQUESTS)
+    if n_tiles > 1:
+        print(f"🧩 [API NATURE] Polygone découpé en {n_tiles} tuiles")
+    for endpoint, n in failed.items():
+        print(f"⚠️ [API NATURE] {type_names[endpoint]}: {n}/{n_tiles} tuiles sans réponse, résultat incomplet")
+    
     all_features = []
     
     for endpoint, type_name in endpoints:
-        try:
-            data = get_api_nature_data(geom, endpoint)
-            if data and data.get("features"):
-                # Ajouter le type de protection aux propriétés
-                for feature in data["features"]:
-                    if "properties" not in feature:
-                        feature["properties"] = {}
-                    feature["properties"]["TYPE_PROTECTION"] = type_name
-                
-                all_features.extend(data["features"])
-                print(f"🌿 [API NATURE] {type_name}: {len(data['features'])} zones trouvées")
-            else:
-                print(f"🌿 [API NATURE] {type_name}: 0 zones trouvées")
-        except Exception as e:
-            print(f"🌿 [API NATURE] Erreur {endpoint}: {e}")
+        data = results.get(endpoint)
+        if data and data.get("features"):
+            # Ajouter le type de protection aux propriétés
+            for feature in data["features"]:
+                if "properties" not in feature:
+                    feature["properties"] = {}
+                feature["properties"]["TYPE_PROTECTION"] = type_name
+            
+            all_features.extend(data["features"])
+            print(f"🌿 [API NATURE] {type_name}: {len(data['features'])} zones trouvées")
+        else:
+            print(f"🌿 [API NATURE] {type_name}: 0 zones trouvées")
     
+    result = {"type": "FeatureCollection", "features": all_features}
+    if failed:
+        # Endpoints incomplets : {type de protection: tuiles sans réponse}
+        result["failed_tiles"] = {type_names[endpoint]: n for endpoint, n in failed.items()}
     if all_features:
         print(f"🌿 [API NATURE] Total: {len(all_features)} zones naturelles protégées")
-        return {
-            "type": "FeatureCollection",
-            "features": all_features
-        }
     else:
         print(f"🌿 [API NATURE] Aucune zone naturelle trouvée")
-        return {"type": "FeatureCollection", "features": []}
+    return result
 
 def flatten_feature_collections(fc):
     """
@@ -1749,21 +2009,220 @@ def flatten_feature_collections(fc):
         # Optionnel : tu peux logger ou ignorer les cas non dict/geojson
     return {"type": "FeatureCollection", "features": out}
 
-def fetch_wfs_data(layer_name, bbox, srsname="EPSG:4326"):
-    layer_q = quote(layer_name, safe=':')
-    url = f"{GEOSERVER_WFS_URL}?service=WFS&version=2.0.0&request=GetFeature&typeName={layer_q}&outputFormat=application/json&bbox={bbox}&srsname={srsname}"
+def iter_wfs_features(layer_name, bbox, srsname="EPSG:4326", page_size=WFS_PAGE_SIZE, method="GET", **extra_params):
+    """
+    Lecture paginée (startIndex/count) et décodée au fil de l'eau d'une couche WFS.
+    Retourne un WFSFeatureStream : itérer dessus produit les features une à une,
+    stream.pages() des listes bornées, et stream.number_matched le total réel.
+    """
+    return WFSFeatureStream(
+        http_session, GEOSERVER_WFS_URL, layer_name, bbox,
+        srsname=srsname, page_size=page_size, timeout=10, extra_params=extra_params, method=method,
+        sort_by=wfs_sort_by(layer_name),
+    )
+
+def wfs_sort_by(layer_name):
+    """Attribut de tri stable des pages (WFS_SORT_ATTRIBUTES), None si la couche n'en a pas ou schéma inconnu."""
+    schema = wfs_feature_type(layer_name)
+    attributes = set((schema or {}).get("attributes") or ())
+    return next((name for name in WFS_SORT_ATTRIBUTES if name in attributes), None)
+
+def wfs_feature_type(layer_name):
+    """Schéma de la couche {"geometry", "attributes"} (None si DescribeFeatureType échoue)."""
+    schema = _wfs_feature_types.get(layer_name)
+    if schema is None:
+        try:
+            schema = describe_feature_type(http_session, GEOSERVER_WFS_URL, layer_name)
+        except Exception as e:
+            print(f"⚠️ [WFS] DescribeFeatureType {layer_name}: {e}")
+            return None
+        _wfs_feature_types[layer_name] = schema
+    return schema
+
+def wfs_geometry_column(layer_name):
+    """Nom de l'attribut géométrique de la couche ('the_geom' si DescribeFeatureType échoue)."""
+    schema = wfs_feature_type(layer_name)
+    return (schema or {}).get("geometry") or "the_geom"
+
+def wfs_property_names(layer_name, wanted):
+    """
+    Liste propertyName à envoyer pour ne lire que `wanted` (+ la géométrie, toujours incluse).
+    Les noms absents de la couche sont ignorés (GeoServer rejette un attribut inconnu), ce qui
+    permet de déclarer des variantes (ex. "Nom", "nom", "NOM"). None = pas de projection
+    (schéma inconnu : on lit tous les attributs plutôt que de risquer une erreur).
+    """
+    schema = wfs_feature_type(layer_name)
+    if not schema or not schema.get("geometry"):
+        return None
+    attributes = set(schema["attributes"])
+    return [schema["geometry"]] + sorted({n for n in wanted if n in attributes})
+
+def wfs_geometry_filter(layer_name, geometry, srsname="EPSG:4326"):
+    """Filtre INTERSECTS (CQL) de `geometry` sur la couche, simplifié si besoin pour tenir dans l'URL."""
+    gf = build_geometry_filter(
+        geometry, wfs_geometry_column(layer_name), srid=srid_of(srsname),
+        get_budget=WFS_FILTER_MAX_URL_CHARS, post_budget=WFS_FILTER_MAX_BODY_CHARS,
+    )
+    if gf.simplified:
+        print(f"🔧 [WFS_FILTER] {layer_name}: polygone simplifié (tolérance {gf.tolerance:.6f}, {gf.method})")
+    return gf
+
+def _fetch_wfs_features(layer_name, bbox, srsname="EPSG:4326", geometry_filter=None, property_names=None):
+    """GetFeature brut sur GeoServer. Lève une exception en cas d'erreur (jamais mise en cache)."""
+    extra = {"propertyName": ",".join(property_names)} if property_names else {}
+    if geometry_filter is not None:
+        # bbox et CQL_FILTER sont exclusifs : l'INTERSECTS suffit à l'index spatial
+        extra.update(geometry_filter.params())
+        stream = iter_wfs_features(layer_name, None, srsname, method=geometry_filter.method, **extra)
+    else:
+        stream = iter_wfs_features(layer_name, bbox, srsname, **extra)
+    features = list(stream)
+    if stream.pages_fetched > 1:
+        print(f"[fetch_wfs_data] {layer_name}: {len(features)}/{stream.number_matched} features en {stream.pages_fetched} pages")
+    if stream.truncated:
+        print(f"⚠️ [fetch_wfs_data] {layer_name}: réponse plafonnée ({len(features)}/{stream.number_matched})")
+    if geometry_filter is not None:
+        features = geometry_filter.refine(features)
+    # Réponse plafonnée marquée : le cache de tuiles ne la conserve pas
+    return FeatureList(features, truncated=stream.truncated)
+
+def fetch_wfs_data(layer_name, bbox=None, srsname="EPSG:4326", geometry=None, property_names=None):
+    """
+    Features d'une couche GeoServer dans une bbox, ou intersectant `geometry`.
+
+    Args:
+        layer_name (str): Couche GeoServer.
+        bbox (str): 'minx,miny,maxx,maxy,CRS' (déduite de `geometry` si absente).
+        srsname (str): CRS de sortie (et de `geometry`).
+        geometry: Polygone (shapely ou GeoJSON) de découpage, ex. le contour d'une commune.
+            Si les tuiles du cache couvrent la zone, le découpage est fait localement ;
+            sinon le polygone est envoyé à GeoServer (CQL INTERSECTS).
+            Avec AGRIWEB_LAYER_BACKEND=local, les couches importées sont lues dans le magasin local.
+        property_names (iterable): Attributs réellement utilisés par l'appelant (propertyName) ;
+            () = géométrie seule. None = tous les attributs. Le détail complet d'une feature
+            reste accessible via fetch_wfs_feature_by_id.
+
+    Returns:
+        list: Features GeoJSON ([] en cas d'erreur).
+    """
     try:
-        resp = http_session.get(url, timeout=10)
-        resp.raise_for_status()
-        if 'xml' in resp.headers.get('Content-Type', ''):
-            print(f"[fetch_wfs_data] GeoServer error XML for {layer_name}:\n{resp.text[:200]}")
-            return []
-        return resp.json().get('features', [])
+        return fetch_wfs_data_or_raise(layer_name, bbox, srsname, geometry, property_names)
     except Exception as e:
         print(f"[fetch_wfs_data] Erreur {layer_name}: {e}")
         return []
 
+@upstream_flight.wrap("wfs")
+def fetch_wfs_data_or_raise(layer_name, bbox=None, srsname="EPSG:4326", geometry=None, property_names=None):
+    """
+    Comme fetch_wfs_data, mais une erreur (timeout, 5xx, réponse illisible) lève une exception
+    au lieu de rendre [] : pour les appelants qui doivent distinguer « zone vide » et « échec ».
+    """
+    if layer_store is not None and layer_store.has_layer(layer_name, srsname):
+        features = layer_store.query(layer_name, bbox, geometry=geometry)
+        return project_properties(features, property_names) if property_names is not None else features
+    props = wfs_property_names(layer_name, property_names) if property_names is not None else None
+    clip = None
+    if geometry is not None:
+        clip = as_geometry(geometry)
+        if bbox is None:
+            bbox = format_bbox(clip.bounds, srsname)
+        if wfs_tile_cache is None or not wfs_tile_cache.covers(layer_name, bbox, srsname):
+            return _fetch_wfs_features(layer_name, None, srsname,
+                                       wfs_geometry_filter(layer_name, clip, srsname), props)
+    if wfs_tile_cache is not None and wfs_tile_cache.is_cached_layer(layer_name):
+        features = wfs_tile_cache.get_features(
+            layer_name, bbox, srsname,
+            lambda tile_bbox: _fetch_wfs_features(layer_name, tile_bbox, srsname, property_names=props),
+            variant=",".join(props) if props else "",
+        )
+    else:
+        features = _fetch_wfs_features(layer_name, bbox, srsname, property_names=props)
+    if clip is not None:
+        features = clip_features(features, clip)
+    return features
+
+def fetch_wfs_table(layer_name, bbox, srsname="EPSG:4326", property_names=None):
+    """
+    Variante colonnaire de fetch_wfs_data : FeatureTable (géométries shapely + un tableau par attribut).
+
+    Avec AGRIWEB_WFS_BINARY=1, les lectures qui partiraient directement vers GeoServer sont
+    demandées en FlatGeobuf et décodées sans dict intermédiaire. Magasin local, cache de
+    tuiles et repli GeoJSON (format refusé, pyogrio absent) passent par fetch_wfs_data.
+    """
+    if (wfs_binary_reader is not None and wfs_binary_reader.supported is not False
+            and not (layer_store is not None and layer_store.has_layer(layer_name, srsname))
+            and not (wfs_tile_cache is not None and wfs_tile_cache.covers(layer_name, bbox, srsname))):
+        props = wfs_property_names(layer_name, property_names) if property_names is not None else None
+        extra = {"propertyName": ",".join(props)} if props else {}
+        sort_by = wfs_sort_by(layer_name)
+        if sort_by:
+            extra["sortBy"] = sort_by
+        try:
+            return wfs_binary_reader.read(layer_name, bbox, srsname, extra_params=extra or None)
+        except Exception as e:
+            print(f"⚠️ [WFS_BINARY] {layer_name}: {e} — repli GeoJSON")
+    features = fetch_wfs_data(layer_name, bbox, srsname, property_names=property_names)
+    return FeatureTable.from_features(features, crs=srsname)
+
+def fetch_wfs_feature_by_id(layer_name, feature_id):
+    """Feature complète (tous les attributs) par identifiant GeoServer, pour l'affichage détaillé."""
+    if layer_store is not None and layer_store.has_layer(layer_name):
+        return layer_store.get_feature(layer_name, feature_id)
+    stream = iter_wfs_features(layer_name, None, featureID=feature_id)
+    for feature in stream:
+        return feature
+    return None
+
+def get_commune_infos(nom, fields="centre,contour", timeout=15, level="full"):
+    """
+    Recherche d'une commune par nom (ou code INSEE) : répertoire local, puis geo.api.gouv.fr
+    si la commune ou un des champs demandés n'y figure pas.
+
+    Args:
+        level (str): Simplification du contour local ("full", "100m", "1km").
+    Returns:
+        list: Communes correspondantes (dicts avec les champs demandés).
+    Raises:
+        requests.HTTPError: si l'API répond autrement que 200.
+    """
+    requested = {f.strip() for f in fields.split(",") if f.strip()}
+    if gazetteer.available and requested <= GAZETTEER_FIELDS:
+        communes = gazetteer.search(nom, fields, level)
+        if communes:
+            return communes
+    return _get_commune_infos_api(nom, fields, timeout)
+
+@upstream_flight.wrap("geo_communes")
+def _get_commune_infos_api(nom, fields, timeout):
+    key = "code" if re.fullmatch(r"\d[\dAB]\d{3}", (nom or "").strip().upper()) else "nom"
+    resp = http_session.get(
+        f"https://geo.api.gouv.fr/communes?{key}={quote_plus(nom.strip())}&fields={fields}", timeout=timeout
+    )
+    resp.raise_for_status()
+    return resp.json() or []
+
 def get_elevation_profile(points):
+    """
+    Profil altimétrique des points [(lat, lon), ...].
+
+    Le MNT local est échantillonné en un seul appel vectorisé ; l'API Elevation
+    distante n'est interrogée que si un point sort de la couverture locale.
+
+    Returns:
+        dict: {"geoPoints": [{"latitude", "longitude", "elevation"}, ...], ...} ou None.
+    """
+    if points and len(dem_store):
+        import math
+        elevations = dem_store.sample([(lon, lat) for lat, lon in points])
+        if all(math.isfinite(z) for z in elevations):
+            return {
+                "geoPoints": [
+                    {"latitude": lat, "longitude": lon, "elevation": round(float(z), 2)}
+                    for (lat, lon), z in zip(points, elevations)
+                ],
+                "dataSet": {"name": "DEM local", "directory": DEM_DIR},
+                "resultCount": len(points),
+            }
     geojson = {
         "type": "MultiPoint",
         "coordinates": [[lon, lat] for lat, lon in points]
@@ -1772,7 +2231,7 @@ def get_elevation_profile(points):
     url = f"{ELEVATION_API_URL}/points"
     headers = {"Content-Type": "application/json"}
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
+        response = http_session.post(url, json=payload, headers=headers, timeout=10)
         if response.status_code == 200:
             return response.json()
     except Exception as e:
@@ -1781,9 +2240,7 @@ def get_elevation_profile(points):
 
 def get_commune_report(commune_name, culture="", min_area_ha=0, max_area_ha=1e9, ht_max_km=5.0, bt_max_km=5.0, sirene_km=5.0):
     # 1) Récupère infos de la commune (nom, insee, centre, contour, population)
-    commune_infos = requests.get(
-        f"https://geo.api.gouv.fr/communes?nom={quote_plus(commune_name)}&fields=centre,contour,code,population,surface"
-    ).json()
+    commune_infos = get_commune_infos(commune_name, "centre,contour,code,population,surface")
     if not commune_infos or not commune_infos[0].get("contour"):
         return None
     info = commune_infos[0]
@@ -1800,31 +2257,27 @@ def get_commune_report(commune_name, culture="", min_area_ha=0, max_area_ha=1e9,
     minx, miny, maxx, maxy = commune_poly.bounds
     bbox = f"{minx},{miny},{maxx},{maxy},EPSG:4326"
 
-    # 3) Récupère toutes les entités dans le bbox puis filtre par intersection
+    # 3) Couches GeoServer découpées au polygone ; les sources par rayon sont filtrées localement
+    commune_clipper = CommuneClipper(commune_poly)
+
     def filter_in_commune(features):
-        return [
-            f for f in features
-            if "geometry" in f and shape(f["geometry"]).intersects(commune_poly)
-        ]
+        return commune_clipper.clip(features)
 
     rpg_raw         = filter_in_commune(get_rpg_info(centroid[0], centroid[1], radius=0.1))
-    postes_bt_data  = filter_in_commune(fetch_wfs_data(POSTE_LAYER, bbox))
-    postes_hta_data = filter_in_commune(fetch_wfs_data(HT_POSTE_LAYER, bbox))
-    eleveurs_data   = filter_in_commune(fetch_wfs_data(ELEVEURS_LAYER, bbox))
+    postes_bt_data  = fetch_wfs_data(POSTE_LAYER, bbox, geometry=commune_poly, property_names=POSTE_LABEL_PROPERTIES)
+    postes_hta_data = fetch_wfs_data(HT_POSTE_LAYER, bbox, geometry=commune_poly, property_names=POSTE_LABEL_PROPERTIES)
+    eleveurs_data   = fetch_wfs_data(ELEVEURS_LAYER, bbox, geometry=commune_poly, property_names=ELEVEUR_PROPERTIES)
     sirene_data     = filter_in_commune(get_sirene_info(centroid[0], centroid[1], radius=sirene_km / 111.0))
-    hta_capacites   = filter_in_commune(fetch_wfs_data(CAPACITES_RESEAU_LAYER, bbox))
+    hta_capacites   = fetch_wfs_data(CAPACITES_RESEAU_LAYER, bbox, geometry=commune_poly,
+                                     property_names=CAPACITES_PROPERTIES)
     api_nature      = get_api_nature_data(contour)
     api_cadastre    = get_api_cadastre_data(contour)
 
     # 4) RPG filtré (culture, surface, distances)
-    from shapely.ops import transform as shp_transform
-    from pyproj import Transformer
-    to_l93 = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True).transform
-
-    rpg_parcelles = []
-    for feat in (rpg_raw or []):
-        dec   = decode_rpg_feature(feat)
-        poly  = shape(dec["geometry"])
+    rpg_decoded = [decode_rpg_feature(feat) for feat in (rpg_raw or [])]
+    rpg_metrics = layer_metrics(rpg_decoded)  # surfaces et centroïdes de toute la couche en un passage
+    candidates = []
+    for i, dec in enumerate(rpg_decoded):
         props = dec["properties"]
 
         # a) culture
@@ -1832,20 +2285,24 @@ def get_commune_report(commune_name, culture="", min_area_ha=0, max_area_ha=1e9,
             continue
 
         # b) surface (ha)
-        ha = shp_transform(to_l93, poly).area / 10_000.0
-        if ha < min_area_ha or ha > max_area_ha:
+        ha = rpg_metrics.area_m2[i] / 10_000.0
+        if not (min_area_ha <= ha <= max_area_ha):
             continue
+        candidates.append((props, float(ha), rpg_metrics.centroid(i)))
 
-        # c) distances réseaux (m)
-        cent   = poly.centroid.coords[0]
-        d_bt   = calculate_min_distance(cent, postes_bt_data)
-        d_hta  = calculate_min_distance(cent, postes_hta_data)
-
+    # c) distances réseaux (m) : un appel vectorisé pour toutes les parcelles retenues
+    nearest = DistanceEngine(bt=postes_bt_data, hta=postes_hta_data).query([c[2] for c in candidates])
+    rpg_parcelles = []
+    for i, (props, ha, cent) in enumerate(candidates):
+        d_bt  = nearest["bt"]["distance_m"][i]
+        d_hta = nearest["hta"]["distance_m"][i]
         props.update({
             "surface": round(ha, 3),
             "coords": [cent[1], cent[0]],
             "distance_bt": round(d_bt, 2) if d_bt is not None else None,
             "distance_hta": round(d_hta, 2) if d_hta is not None else None,
+            "poste_bt_id": nearest["bt"]["id"][i],
+            "poste_hta_id": nearest["hta"]["id"][i],
             "lien_geoportail": f"https://www.geoportail.gouv.fr/carte?c={cent[0]},{cent[1]}&z=18"
         })
         rpg_parcelles.append(props)
@@ -1892,38 +2349,45 @@ def get_commune_report(commune_name, culture="", min_area_ha=0, max_area_ha=1e9,
 # Production PV simplifiée
 ##############################
 def get_pvgis_production(lat, lon, tilt, azimuth, peakpower=1.0):
-    url = "https://re.jrc.ec.europa.eu/api/v5_2/PVcalc"
-    aspect_pvgis = 180.0 - azimuth
-    params = {
-        "lat": lat,
-        "lon": lon,
-        "peakpower": peakpower,
-        "loss": 14,
-        "angle": tilt,
-        "aspect": aspect_pvgis,
-        "outputformat": "json"
-    }
+    """
+    Production annuelle (kWh) de `peakpower` kWc : grille PVGIS interpolée si le
+    point et la configuration y figurent, sinon API PVGIS (réponses en cache disque).
+    """
+    kwh_per_kwc = pvgis_yield.at(lat, lon, tilt, azimuth)
+    if kwh_per_kwc is None:
+        return None
+    return kwh_per_kwc * peakpower
+
+def annotate_productible(features, tilt=30, azimuth=180):
+    """
+    Ajoute `productible_kwh_kwc` (grille PVGIS interpolée au centroïde) aux features,
+    en un appel vectorisé ; sans grille chargée, aucun appel PVGIS par feature.
+    """
+    if not features or pvgis_yield.grid is None:
+        return
     try:
-        resp = requests.get(url, params=params, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
-        production_annual = data["outputs"]["totals"]["fixed"]["E_y"]
-        return production_annual
+        n = pvgis_yield.annotate(features, tilt, azimuth)
+        print(f"☀️ [PVGIS_GRID] Productible interpolé pour {n}/{len(features)} features")
     except Exception as e:
-        print("Erreur PVGIS:", e)
-        return None
+        print(f"⚠️ [PVGIS_GRID] Annotation impossible: {e}")
 def get_elevation_at_point(lat, lon):
     """
-    Récupère l'altitude d'un point en utilisant l'API Open-Elevation (gratuite).
-    Fallback sur l'API IGN si disponible.
+    Récupère l'altitude d'un point depuis le MNT local (tools/build_dem_tiles.py).
+    Hors couverture locale : API Open-Elevation (gratuite), puis IGN, puis USGS.
     """
+    # Méthode 0: MNT local (interpolation bilinéaire, sans réseau)
+    import math
+    elevation = dem_store.sample([(lon, lat)])[0]
+    if math.isfinite(elevation):
+        return round(float(elevation), 2)
+
     # Méthode 1: Open-Elevation (API gratuite et fiable)
     try:
         url = "https://api.open-elevation.com/api/v1/lookup"
         params = {
             "locations": f"{lat},{lon}"
         }
-        response = requests.get(url, params=params, timeout=15)
+        response = http_session.get(url, params=params, timeout=15)
         if response.status_code == 200:
             data = response.json()
             results = data.get("results", [])
@@ -1944,7 +2408,7 @@ def get_elevation_at_point(lat, lon):
                 "lat": lat,
                 "zonly": True
             }
-            response = requests.get(url, params=params, timeout=10)
+            response = http_session.get(url, params=params, timeout=10)
             if response.status_code == 200:
                 data = response.json()
                 elevations = data.get("elevations", [])
@@ -1965,7 +2429,7 @@ def get_elevation_at_point(lat, lon):
             "units": "Meters",
             "output": "json"
         }
-        response = requests.get(url, params=params, timeout=10)
+        response = http_session.get(url, params=params, timeout=10)
         if response.status_code == 200:
             data = response.json()
             result = data.get("USGS_Elevation_Point_Query_Service", {})
@@ -2004,8 +2468,7 @@ def get_nearest_ht_postes(lat, lon, count=3, radius_deg=0.5):
     return sorted(postes, key=lambda x: x["distance"])[:count]
 
 def get_nearest_capacites_reseau(lat, lon, count=3, radius_deg=0.1):
-    capacites = get_all_capacites_reseau(lat, lon, radius_deg=radius_deg)
-    return sorted(capacites, key=lambda x: x["distance"])[:count]
+    return get_all_capacites_reseau(lat, lon, radius_deg=radius_deg, count=count)
 def to_geojson_feature(obj, layer_name=None):
     if not obj:
         return None
@@ -2032,124 +2495,150 @@ def to_geojson_feature(obj, layer_name=None):
     return None
 def enrich_rpg_with_cadastre_num(rpg_features):
     """
-    Pour chaque parcelle RPG (Feature), récupère le numéro cadastral via l'API Cadastre IGN.
+    Pour chaque parcelle RPG (Feature), récupère le numéro cadastral par jointure sur
+    l'instantané cadastre couvrant ces parcelles (tuiles en cache disque).
     Ajoute le numéro à properties["numero_parcelle"].
     """
+    with_geom = [feat for feat in rpg_features if feat.get("geometry")]
+    refs = cadastre_snapshots.snapshot(with_geom).references(with_geom, max_match=1) if with_geom else []
+    numeros = {id(feat): (r[0]["numero"] if r else None) for feat, r in zip(with_geom, refs)}
     enriched = []
     for feat in rpg_features:
-        # Utilise le centroïde pour l'API, ou la géométrie entière
-        geom = feat.get("geometry")
-        if not geom:
+        if not feat.get("geometry"):
             enriched.append(feat)
             continue
         props = feat.get("properties", {})
-        # Préfère un polygone précis
-        api_resp = get_api_cadastre_data(geom)
-        num_parcelle = None
-        # L’API IGN retourne une FeatureCollection, va chercher le numéro
-        if api_resp and "features" in api_resp and len(api_resp["features"]) > 0:
-            # On prend le premier, mais tu peux faire mieux si plusieurs results
-            num_parcelle = api_resp["features"][0]["properties"].get("numero", None)
-        props["numero_parcelle"] = num_parcelle or "N/A"
+        props["numero_parcelle"] = numeros.get(id(feat)) or "N/A"
         feat["properties"] = props
         enriched.append(feat)
     return enriched
-def synthese_departement(reports):
+def synthese_departement(reports, k=50):
     """
-    Synthèse départementale corrigée pour agréger correctement les données
+    Synthèse départementale : parcelles RPG distinctes, éleveurs et TOP des parcelles
+    les plus proches d'un poste.
+
+    Args:
+        reports (iterable | DeptAggregate): Rapports communaux (liste ou générateur, consommés
+            un par un), ou agrégat déjà alimenté.
+        k (int): Taille du TOP.
     """
-    print(f"[SYNTHESE_DEPT] Traitement de {len(reports)} rapports communaux")
-    
-    # Fusionne toutes les parcelles rpg et éleveurs
-    all_rpg = []
-    all_eleveurs = []
-    
-    for i, rpt in enumerate(reports):
-        print(f"[SYNTHESE_DEPT] Rapport {i+1}: {rpt.get('commune', 'N/A')}")
-        
-        # Traitement RPG
-        fc_rpg = rpt.get("rpg_parcelles", {})
-        if fc_rpg and isinstance(fc_rpg, dict) and "features" in fc_rpg:
-            features_rpg = fc_rpg.get("features", [])
-            all_rpg.extend(features_rpg)
-            print(f"[SYNTHESE_DEPT]   - Ajout {len(features_rpg)} parcelles RPG")
+    if isinstance(reports, DeptAggregate):
+        agg = reports
+    else:
+        agg = DeptAggregate(k).add_reports(reports)
+    stats = agg.stats()
+    print(f"[SYNTHESE_DEPT] {stats['communes']} rapports: {stats['parcelles']} parcelles uniques "
+          f"({stats['doublons']} doublons), {stats['eleveurs']} éleveurs")
+
+    top50 = agg.top()
+    # Enrichissement cadastre avec gestion d'erreur
+    try:
+        top50 = enrich_rpg_with_cadastre_num(top50)
+        print(f"[SYNTHESE_DEPT] Enrichissement cadastre terminé")
+    except Exception as e:
+        print(f"[SYNTHESE_DEPT] Erreur enrichissement cadastre: {e}")
+
+    return {
+        "nb_agriculteurs": agg.eleveurs,   # Correspond au template
+        "nb_parcelles": agg.parcelles,     # Correspond au template
+        "total_eleveurs": agg.eleveurs,    # Backup pour la compatibilité
+        "total_parcelles": agg.parcelles,  # Backup pour la compatibilité
+        "top50_parcelles": top50,          # Backup pour la compatibilité
+        "top50": top50,                    # Correspond au template
+    }
+
+
+def enrich_eleveurs_with_siret(eleveurs_features):
+    """Enrichit les éleveurs avec les données SIRET"""
+    enriched = []
+    for feat in eleveurs_features:
+        props = feat.get("properties", {})
+
+        # Tentative d'enrichissement SIRET
+        siret = props.get("siret") or props.get("SIRET")
+        if siret:
+            try:
+                sirene_info = fetch_sirene_info(siret)
+                if sirene_info:
+                    props.update(sirene_info)
+                    props["siret_enriched"] = True
+                else:
+                    props["siret_enriched"] = False
+            except Exception as e:
+                print(f"[RAPPORT_DEPT] Erreur enrichissement SIRET {siret}: {e}")
+                props["siret_enriched"] = False
         else:
-            print(f"[SYNTHESE_DEPT]   - Aucune parcelle RPG")
-            
-        # Traitement éleveurs  
-        fc_e = rpt.get("eleveurs", {})
-        if fc_e and isinstance(fc_e, dict) and "features" in fc_e:
-            features_eleveurs = fc_e.get("features", [])
-            all_eleveurs.extend(features_eleveurs)
-            print(f"[SYNTHESE_DEPT]   - Ajout {len(features_eleveurs)} éleveurs")
+            props["siret_enriched"] = False
+
+        enriched.append(feat)
+    return enriched
+
+
+def fix_distances_in_top50(top50_features):
+    """Corrige les distances affichées comme 'N/A m'"""
+    fixed = []
+    for feat in top50_features:
+        props = feat.get("properties", {})
+
+        # Calcul de la distance minimale
+        min_distance = None
+        distance_sources = ["distance_bt", "distance_au_poste", "distance_hta", "min_bt_distance_m", "min_ht_distance_m"]
+
+        for key in distance_sources:
+            val = props.get(key)
+            if val is not None and isinstance(val, (int, float)) and val > 0:
+                if min_distance is None or val < min_distance:
+                    min_distance = val
+
+        # Mise à jour des propriétés de distance
+        if min_distance is not None:
+            props["distance_formatted"] = f"{int(min_distance)} m"
+            props["distance_valid"] = True
         else:
-            print(f"[SYNTHESE_DEPT]   - Aucun éleveur")
+            props["distance_formatted"] = "Distance non calculée"
+            props["distance_valid"] = False
+
+        fixed.append(feat)
+    return fixed
 
-    print(f"[SYNTHESE_DEPT] Total agrégé: {len(all_rpg)} parcelles RPG, {len(all_eleveurs)} éleveurs")
 
-    # Fonction de tri par distance améliorée
-    def get_dist(feat):
+def fix_cadastre_links(top50_features):
+    """Corrige les liens vers le cadastre"""
+    for feat in top50_features:
         props = feat.get("properties", {})
-        # Cherche dans tous les champs de distance possibles
-        for key in ["distance_bt", "distance_au_poste", "distance_hta", "min_bt_distance_m", "min_ht_distance_m"]:
-            v = props.get(key)
-            if v is not None and isinstance(v, (int, float)) and v > 0:
-                return v
-        return 999999
-
-    # Déduplication des parcelles RPG (évite les doublons entre communes)
-    def deduplicate_parcelles(features):
-        seen = set()
-        unique = []
-        for p in features:
-            props = p.get("properties", {})
-            # Clé unique basée sur plusieurs identifiants
-            key = (
-                props.get("ID_PARCEL") or props.get("id"),
-                props.get("code_com"),
-                props.get("com_abs"),
-                props.get("section") or props.get("cadastre_section"),
-                props.get("numero") or props.get("cadastre_numero")
-            )
-            if key not in seen:
-                seen.add(key)
-                unique.append(p)
-        return unique
 
-    # Déduplication et tri
-    all_rpg_unique = deduplicate_parcelles(all_rpg)
-    all_rpg_sorted = sorted(all_rpg_unique, key=get_dist)
-    top50 = all_rpg_sorted[:50]
+        # Construction du lien cadastre
+        code_commune = props.get("code_com") or props.get("com_abs")
+        section = props.get("section") or props.get("cadastre_section")
+        numero = props.get("numero") or props.get("cadastre_numero") or props.get("numero_parcelle")
 
-    print(f"[SYNTHESE_DEPT] Après déduplication: {len(all_rpg_unique)} parcelles uniques")
-    print(f"[SYNTHESE_DEPT] TOP 50 sélectionné")
+        if code_commune and section and numero and numero != "N/A":
+            cadastre_url = f"https://www.cadastre.gouv.fr/scpc/accueil.do#c={code_commune}&sec={section}&n={numero}"
+            props["cadastre_link"] = cadastre_url
+            props["cadastre_link_valid"] = True
+        else:
+            props["cadastre_link"] = None
+            props["cadastre_link_valid"] = False
 
-    # Enrichissement cadastre avec gestion d'erreur
+    return top50_features
+
+
+def commune_insee(nom_commune):
+    """Code INSEE de la commune (première homonyme, comme les rapports par nom), le nom à défaut."""
     try:
-        top50 = enrich_rpg_with_cadastre_num(top50)
-        print(f"[SYNTHESE_DEPT] Enrichissement cadastre terminé")
-    except Exception as e:
-        print(f"[SYNTHESE_DEPT] Erreur enrichissement cadastre: {e}")
+        info = get_commune_infos(nom_commune, "code", timeout=10)
+    except Exception:
+        return nom_commune
+    return (info[0].get("code") if info else None) or nom_commune
+
 
-    synthese_result = {
-        "nb_agriculteurs": len(all_eleveurs),  # Correspond au template
-        "nb_parcelles": len(all_rpg_unique),   # Correspond au template
-        "total_eleveurs": len(all_eleveurs),   # Backup pour la compatibilité
-        "total_parcelles": len(all_rpg_unique), # Backup pour la compatibilité
-        "top50_parcelles": top50,             # Backup pour la compatibilité
-        "top50": top50                        # Correspond au template
-    }
-    
-    print(f"[SYNTHESE_DEPT] Synthèse finale: {synthese_result['total_eleveurs']} éleveurs, {synthese_result['total_parcelles']} parcelles")
-    
-    return synthese_result
 def get_commune_mairie(nom_commune):
-    url = f"https://geo.api.gouv.fr/communes?nom={quote_plus(nom_commune)}&fields=mairie"
-    resp = requests.get(url, timeout=10)
-    if resp.status_code == 200:
-        info = resp.json()
-        if info and "mairie" in info[0]:
-            return info[0]["mairie"]  # Peut contenir adresse, nom, etc.
+    try:
+        info = get_commune_infos(nom_commune, "mairie", timeout=10)
+    except Exception:
+        return None
+    if info and info[0].get("mairie"):
+        return info[0]["mairie"]  # Peut contenir adresse, nom, etc.
     return None
 
 ##############################
@@ -2449,6 +2938,15 @@ def build_map(
     
     # === CRÉATION DE LA CARTE (doit être fait avant toute utilisation) ===
     map_obj = folium.Map(location=[lat, lon], zoom_start=13, tiles=None)
+
+    # Polygones embarqués simplifiés ; niveaux plus fins servis au zoom par /map_lod
+    lod = MapLOD()
+
+    def lod_geojson(geom, **kwargs):
+        shown = lod.initial(geom)
+        gj = folium.GeoJson(shown, **kwargs)
+        lod.register(gj.get_name(), geom, shown)
+        return gj
     
     # Ajouter les couches de base
     folium.TileLayer(
@@ -2473,7 +2971,7 @@ def build_map(
                         valid_geom = True
             if valid_geom:
                 try:
-                    folium.GeoJson(
+                    lod_geojson(
                         geom,
                         style_function=lambda _: {"color": "#FF00FF", "weight": 2, "fillColor": "#FFB6FF", "fillOpacity": 0.3},
                         tooltip="<br>".join(f"{k}: {v}" for k, v in feat.get("properties", {}).items())
@@ -2506,19 +3004,19 @@ def build_map(
                     valid_geom = True
         if valid_geom:
             try:
-                folium.GeoJson(geom, style_function=lambda _: {"color": "blue", "weight": 2}, tooltip=tooltip).add_to(cadastre_group)
+                lod_geojson(geom, style_function=lambda _: {"color": "blue", "weight": 2}, tooltip=tooltip).add_to(cadastre_group)
             except Exception as e:
                 print(f"[ERROR] Exception while adding Cadastre geometry: {e}\nGeom: {geom}")
         else:
             print(f"[DEBUG] Invalid Cadastre geometry: type={geom.get('type') if geom else None}, coords={geom.get('coordinates') if geom else None}")
     if parcelles_data.get("features"):
-        to_wgs84 = Transformer.from_crs("EPSG:2154", "EPSG:4326", always_xy=True).transform
+        to_wgs84 = transform_func(L93, WGS84)
         for feat in parcelles_data["features"]:
             try:
                 geom_wgs = shp_transform(to_wgs84, shape(feat["geometry"]))
                 props = feat.get("properties", {})
                 tooltip = "<br>".join(f"{k}: {v}" for k, v in props.items())
-                folium.GeoJson(mapping(geom_wgs), style_function=lambda _: {"color": "purple", "weight": 2}, tooltip=tooltip).add_to(cadastre_group)
+                lod_geojson(mapping(geom_wgs), style_function=lambda _: {"color": "purple", "weight": 2}, tooltip=tooltip).add_to(cadastre_group)
             except Exception as e:
                 print(f"[ERROR] Exception while adding Cadastre feature: {e}\nFeature: {feat}")
     map_obj.add_child(cadastre_group)
@@ -2536,7 +3034,7 @@ def build_map(
                         valid_geom = True
             if valid_geom:
                 try:
-                    folium.GeoJson(geom, style_function=lambda _: {"color": "#FF6600", "weight": 2, "fillColor": "#FFFF00", "fillOpacity": 0.4}, tooltip="<br>".join(f"{k}: {v}" for k, v in feat.get("properties", {}).items())).add_to(cad_api_group)
+                    lod_geojson(geom, style_function=lambda _: {"color": "#FF6600", "weight": 2, "fillColor": "#FFFF00", "fillOpacity": 0.4}, tooltip="<br>".join(f"{k}: {v}" for k, v in feat.get("properties", {}).items())).add_to(cad_api_group)
                 except Exception as e:
                     print(f"[ERROR] Exception while adding API Cadastre geometry: {e}\nGeom: {geom}")
             else:
@@ -2612,7 +3110,7 @@ def build_map(
     plu_group = folium.FeatureGroup(name="PLU", show=True)
     for item in plu_info:
         if item.get("geometry"):
-            folium.GeoJson(item.get("geometry"), style_function=lambda _: {"color": "red", "weight": 2}, tooltip="<br>".join(f"{k}: {v}" for k, v in item.items())).add_to(plu_group)
+            lod_geojson(item.get("geometry"), style_function=lambda _: {"color": "red", "weight": 2}, tooltip="<br>".join(f"{k}: {v}" for k, v in item.items())).add_to(plu_group)
     map_obj.add_child(plu_group)
 
     # Autres couches simples
@@ -2772,7 +3270,7 @@ def build_map(
                             "opacity": 0.8
                         }
                     
-                    folium.GeoJson(
+                    lod_geojson(
                         geom, 
                         style_function=style_func,
                         tooltip=tooltip_text,
@@ -2881,7 +3379,7 @@ def build_map(
                         valid_geom = True
             if valid_geom:
                 try:
-                    folium.GeoJson(
+                    lod_geojson(
                         geom,
                         style_function=lambda _: {"color": "darkblue", "weight": 2, "fillOpacity": 0.3},
                         tooltip=folium.Tooltip(popup_html)
@@ -2964,7 +3462,7 @@ def build_map(
                         valid_geom = True
             if valid_geom:
                 try:
-                    folium.GeoJson(
+                    lod_geojson(
                         geom,
                         style_function=make_style(color),
                         tooltip=props.get("libelle", layer_label) or layer_label,
@@ -2989,7 +3487,7 @@ def build_map(
             try:
                 coords = shape(feat['geometry']).coords[0]
                 if abs(coords[0]) > 180 or abs(coords[1]) > 90:
-                    to_wgs = Transformer.from_crs("EPSG:2154","EPSG:4326",always_xy=True).transform
+                    to_wgs = transform_func(L93, WGS84)
                     lon_e, lat_e = to_wgs(*coords)
                 else:
                     lon_e, lat_e = coords
@@ -3025,10 +3523,15 @@ def build_map(
                 "lien_entreprise": f"https://annuaire-entreprises.data.gouv.fr/etablissement/{siret}" if siret else "",
                 "lien_pages_blanches": f"https://www.pagesjaunes.fr/pagesblanches/recherche?quoiqui={nom}+{prenom}&ou={props.get('libelleCom','')}"
             }
+            details = ""
+            if feat.get("id"):
+                # Attributs complets chargés à la demande (la recherche n'en lit qu'une partie)
+                details = (f"<br><a href='/feature_details?layer={quote_plus(ELEVEURS_LAYER)}"
+                           f"&id={quote_plus(str(feat['id']))}&format=html' target='_blank'>Toutes les informations</a>")
             folium.Marker(
                 [lat_e, lon_e],
                 popup=folium.Popup(
-                    f"<b>{nom} {prenom}</b><br>{adresse}<br>SIRET: {siret}",
+                    f"<b>{nom} {prenom}</b><br>{adresse}<br>SIRET: {siret}{details}",
                     max_width=300
                 ),
                 icon=folium.Icon(color="cadetblue", icon="paw", prefix="fa")
@@ -3043,7 +3546,7 @@ def build_map(
     cad_grp = folium.FeatureGroup(name="API Cadastre IGN (5km)", show=False)
     for f in cad5.get('features', []):
         if f.get('geometry'):
-            folium.GeoJson(
+            lod_geojson(
                 f['geometry'], 
                 style_function=lambda _: {"color": "#FF5500", "weight": 2, "fillOpacity": 0.3}, 
                 tooltip="<br>".join(f"{k}: {v}" for k, v in f.get('properties', {}).items())
@@ -3083,7 +3586,7 @@ def build_map(
                         popup_content += f"<b>{k}:</b> {v}<br>"
                 popup_content += "</div>"
                 
-                folium.GeoJson(
+                lod_geojson(
                     f['geometry'], 
                     style_function=lambda _, c=color: {
                         "color": c, 
@@ -3150,6 +3653,20 @@ def build_map(
     """
     map_obj.get_root().html.add_child(Element(helper_js))
 
+    if len(lod):
+        try:
+            map_lod_cache.put(lod)
+            fallback_url = f"{MAP_LOD_STATIC_URL}/{lod.id}.json"
+        except OSError as e:
+            print(f"⚠️ [MAP_LOD] Niveaux non persistés (mémoire seule): {e}")
+            fallback_url = None
+        map_obj.get_root().html.add_child(Element(lod.zoom_script("/map_lod", fallback_url)))
+        lod_stats = lod.stats()
+        map_lod_cache.last_stats = lod_stats
+        print(f"📦 [MAP_LOD] {lod_stats['layers']} couches : {lod_stats['vertices_full']} → {lod_stats['vertices_initial']} sommets, "
+              f"{lod_stats['geojson_bytes_full']} → {lod_stats['geojson_bytes_initial']} octets GeoJSON "
+              f"({lod_stats['simplify_seconds']}s)")
+
     map_obj.fit_bounds(bounds)
     if not mode_light:
         folium.Marker([lat, lon], popup="Test marker").add_to(map_obj)
@@ -3164,6 +3681,7 @@ def build_map(
     return map_obj
 # Endpoint d'administration pour purger toutes les cartes
 @app.route("/purge_cartes", methods=["POST"])
+@require_admin
 def purge_cartes():
     import os
     cartes_dir = os.path.join(app.root_path, "static", "cartes")
@@ -3176,6 +3694,14 @@ def purge_cartes():
                     count += 1
                 except Exception as e:
                     print(f"Erreur suppression {f}: {e}")
+    # Géométries persistées des cartes (niveaux de détail)
+    if os.path.exists(MAP_LOD_DIR):
+        for f in os.listdir(MAP_LOD_DIR):
+            if f.endswith('.json'):
+                try:
+                    os.remove(os.path.join(MAP_LOD_DIR, f))
+                except Exception as e:
+                    print(f"Erreur suppression {f}: {e}")
     return {"purged": count}
 
 def save_map_to_cache(map_obj, search_data=None):
@@ -3393,14 +3919,11 @@ def commune_search_sse():
             yield sse_format(None, "⏳ Récupération du contour de la commune…")
 
             # Vérifie accès au contour pour feedback utilisateur
-            resp = requests.get(
-                f"https://geo.api.gouv.fr/communes?nom={quote_plus(commune)}&fields=centre,contour",
-                timeout=12
-            )
-            if resp.status_code != 200:
-                yield sse_format("error", f"Erreur Geo API Gouv: {resp.status_code}")
+            try:
+                infos = get_commune_infos(commune, "centre,contour", timeout=12)
+            except requests.HTTPError as e:
+                yield sse_format("error", f"Erreur Geo API Gouv: {e.response.status_code}")
                 return
-            infos = resp.json() or []
             if not infos or not infos[0].get("contour"):
                 yield sse_format("error", "Contour de la commune introuvable.")
                 return
@@ -3440,6 +3963,220 @@ def commune_search_sse():
     }
     return Response(event_stream(), headers=headers)
 
+def search_thresholds(values):
+    """Seuils des curseurs de la recherche par commune (sans effet sur les couches téléchargées)."""
+    distance_logic = values.get("distance_logic", "OR").upper()
+    return {
+        "culture": values.get("culture", ""),
+        "ht_max_km": float(values.get("ht_max_distance", 1.0)),
+        "bt_max_km": float(values.get("bt_max_distance", 1.0)),
+        "min_ha": float(values.get("min_area_ha", 0)),
+        "max_ha": float(values.get("max_area_ha", 1e9)),
+        "filter_rpg": values.get("filter_rpg", "false").lower() == "true",
+        "filter_parkings": values.get("filter_parkings", "false").lower() == "true",
+        "parking_min_area": float(values.get("parking_min_area", 1500.0)),
+        "filter_friches": values.get("filter_friches", "false").lower() == "true",
+        "friches_min_area": float(values.get("friches_min_area", 1000.0)),
+        "filter_toitures": values.get("filter_toitures", "false").lower() == "true",
+        "toitures_min_surface": float(values.get("toitures_min_surface", 100.0)),
+        "filter_by_distance": values.get("filter_by_distance", "false").lower() == "true",
+        "max_distance_bt": float(values.get("max_distance_bt", 500.0)),
+        "max_distance_hta": float(values.get("max_distance_hta", 2000.0)),
+        "distance_logic": "AND" if distance_logic in ("ET", "AND") else "OR",
+        "poste_type_filter": values.get("poste_type_filter", "ALL").upper(),
+        "calculate_surface_libre": values.get("calculate_surface_libre", "false").lower() == "true",
+    }
+
+
+def filter_commune_bundle(bundle, t):
+    """
+    Applique les seuils `t` (search_thresholds) aux couches brutes d'une commune, sans appel réseau.
+
+    Returns:
+        tuple: ({couche: features retenues}, {couche: indices dans la couche brute},
+                {couche: {"analysed", "surface", "distance"}} compteurs de rejets)
+    """
+    kept, indices, rejected = {}, {}, {}
+    # Parkings, friches, toitures : distance aux postes selon le type sélectionné (Tous/BT/HTA)
+    rule = DistanceRule(t["max_distance_bt"], t["max_distance_hta"], t["poste_type_filter"]) \
+        if t["filter_by_distance"] else None
+
+    def run(key, min_area, max_area=float("inf"), distance=None, where=None):
+        cols = bundle.columns(key)
+        by_surface = cols.select(min_area, max_area, where=where)
+        idx = cols.select(min_area, max_area, distance, where) if distance is not None else by_surface
+        indices[key] = idx
+        rejected[key] = {
+            "analysed": int(cols.inside.sum()),
+            "surface": int(cols.inside.sum()) - len(by_surface),
+            "distance": len(by_surface) - len(idx),
+        }
+        return cols, idx
+
+    if t["filter_rpg"] and bundle.has("rpg"):
+        # a) culture, b) surface (ha), c) distance minimale dans CHAQUE liste (BT ou HTA suffit)
+        cols = bundle.columns("rpg")
+        culture = t["culture"].lower()
+        where = [culture in (f["properties"].get("Culture") or "").lower() for f in cols.features] if culture else None
+        cols, idx = run("rpg", t["min_ha"] * 10_000.0, t["max_ha"] * 10_000.0,
+                        DistanceRule(t["bt_max_km"] * 1000.0, t["ht_max_km"] * 1000.0), where)
+        kept["rpg"] = bundle.present("rpg", idx, lambda c, i: {
+            **c.features[i]["properties"],
+            "SURF_HA":            round(float(c.area_m2[i]) / 10_000.0, 3),
+            "min_bt_distance_m":  c.rounded(c.d_bt[i]),
+            "min_ht_distance_m":  c.rounded(c.d_hta[i]),
+            "poste_bt_id":        c.bt_id[i],
+            "poste_hta_id":       c.hta_id[i],
+        })
+
+    for key, flag, min_area in (("parkings", "filter_parkings", "parking_min_area"),
+                                ("friches", "filter_friches", "friches_min_area")):
+        if t[flag] and bundle.has(key):
+            cols, idx = run(key, t[min_area], distance=rule)
+            kept[key] = bundle.present(key, idx, lambda c, i: {
+                **(c.features[i].get("properties") or {}),
+                "surface_m2": round(float(c.area_m2[i]), 2),
+                "min_distance_bt_m": c.rounded(c.d_bt[i]),
+                "min_distance_hta_m": c.rounded(c.d_hta[i]),
+            })
+
+    if t["filter_toitures"] and bundle.has("batiments"):
+        cols, idx = run("batiments", t["toitures_min_surface"], distance=rule)
+
+        def toiture_props(c, i):
+            lon, lat = c.metrics.centroid(i)
+            props = c.features[i].get("properties") or {}
+            return {
+                "surface_toiture_m2": round(float(c.area_m2[i]), 2),
+                "min_distance_bt_m": c.rounded(c.d_bt[i]),
+                "min_distance_hta_m": c.rounded(c.d_hta[i]),
+                "commune": bundle.nom,
+                "search_method": "polygon_commune",
+                "source": "OpenStreetMap",
+                "building": props.get("building", "yes"),
+                "osm_id": props.get("osm_id"),
+                # Liens utiles
+                "lien_streetview": f"https://www.google.com/maps/@?api=1&map_action=pano&viewpoint={lat},{lon}",
+                "lien_annuaire": f"https://www.pagesjaunes.fr/annuaire/chercherlespros?quoiqui=&ou={quote_plus(bundle.nom)}&univers=pagesjaunes&idOu="
+            }
+
+        kept["batiments"] = bundle.present("batiments", idx, toiture_props)
+        annotate_productible([f for f in kept["batiments"] if "productible_kwh_kwc" not in f["properties"]])
+    return kept, indices, rejected
+
+
+# Propriétés posées par annotate_surface_libre
+SURFACE_LIBRE_KEYS = ("surface_batie_m2", "surface_libre_m2", "surface_libre_pct", "batiments_count",
+                      "surface_libre_error")
+
+
+def bundle_building_index(bundle):
+    """
+    Index des bâtiments de la commune du lot (une requête Overpass, conservé dans le lot).
+    Un échec n'est pas conservé : nouvel essai après BUILDING_INDEX_RETRY secondes, None d'ici là.
+    """
+    import time
+
+    if bundle.building_index is None:
+        failed_at = bundle.building_index_failed_at
+        if failed_at is not None and time.time() - failed_at < BUILDING_INDEX_RETRY:
+            return None
+        bundle.building_index = get_batiments_index_commune(bundle.contour)
+        bundle.building_index_failed_at = None if bundle.building_index is not None else time.time()
+    return bundle.building_index
+
+
+def bundle_cadastre(bundle):
+    """Instantané cadastral de la commune du lot."""
+    return cadastre_snapshots.snapshot([bundle.contour], key=f"commune:{bundle.code}")
+
+
+def geocode_toitures(features, commune_name):
+    """
+    Adresse IGN (géocodage inverse du centroïde) des toitures qui n'en ont pas encore, et lien
+    annuaire de leur ville. Une toiture en « Erreur géocodage » est retentée.
+    """
+    from shapely.geometry import shape
+
+    for i, toiture in enumerate(features):
+        props = toiture["properties"]
+        geom = toiture.get("geometry", {})
+        if props.get("adresse") not in (None, "Erreur géocodage"):
+            continue
+        if not geom or geom.get("type") not in ["Polygon", "MultiPolygon"]:
+            continue
+        try:
+            centroid = shape(geom).centroid
+            adresse_info = get_address_from_coordinates(centroid.y, centroid.x)
+            if adresse_info and adresse_info.get('address'):
+                props["adresse"] = adresse_info['address']
+                props["adresse_distance"] = adresse_info.get('distance', 0)
+                props["adresse_score"] = adresse_info.get('score', 0)
+                props["code_postal"] = adresse_info.get('postcode', '')
+                props["ville"] = adresse_info.get('city', '')
+                props["code_commune"] = adresse_info.get('citycode', '')
+                # Lien annuaire sur la ville de l'adresse si disponible
+                ville = adresse_info.get('city', '') or commune_name
+                props["lien_annuaire"] = f"https://www.pagesjaunes.fr/annuaire/chercherlespros?quoiqui=&ou={quote_plus(ville)}&univers=pagesjaunes&idOu="
+            else:
+                props["adresse"] = "Adresse non trouvée"
+                props["adresse_distance"] = None
+                props["adresse_score"] = 0
+        except Exception as e:
+            safe_print(f"🔴 [ADRESSE] Erreur enrichissement toiture {i}: {e}")
+            props["adresse"] = "Erreur géocodage"
+
+
+def enrich_kept_features(bundle, key, features, indices, surface_libre=False, require_refs=False, geocode=False):
+    """
+    Complète les features retenues qui ne l'ont pas encore été (références cadastrales, surface
+    libre, adresse) puis les mémorise dans le lot. Une feature admise plus tard par un curseur
+    élargi (/refilter_commune) reçoit ainsi les mêmes propriétés que celles enrichies à la recherche.
+
+    Args:
+        surface_libre (bool): Surface bâtie / libre demandée ; sinon ces propriétés sont retirées.
+        require_refs (bool): Ne garder que les références avec section et numéro (toitures).
+        geocode (bool): Adresse et lien annuaire par géocodage inverse (toitures, geocode_toitures).
+    """
+    if not features:
+        return
+    todo = [f for f in features if "parcelles_cadastrales" not in f["properties"]]
+    if todo:
+        refs = bundle_cadastre(bundle).references([f["geometry"] for f in todo])
+        for feat, found in zip(todo, refs):
+            if require_refs:
+                found = [r for r in found if r["section"] and r["numero"]]
+            feat["properties"]["parcelles_cadastrales"] = found
+            feat["properties"]["nb_parcelles_cadastrales"] = len(found)
+    if geocode:
+        geocode_toitures(features, bundle.nom)
+    if surface_libre:
+        # Les features en erreur (bâtiments indisponibles...) sont retentées
+        annotate_surface_libre([f for f in features if "surface_libre_m2" not in f["properties"]],
+                               bundle_building_index(bundle))
+    bundle.remember(key, indices, features)
+    if not surface_libre:
+        for feat in features:
+            for name in SURFACE_LIBRE_KEYS:
+                feat["properties"].pop(name, None)
+
+
+def bundle_cacheable(key, value):
+    """
+    Vrai si une source téléchargée peut entrer dans le lot communal : ni lecture plafonnée
+    (truncated), ni tuiles Nature / GPU sans réponse (failed_tiles), ni GPU muet sur tous
+    ses endpoints (un endpoint isolé à None peut refuser durablement la géométrie).
+    """
+    if getattr(value, "truncated", False):
+        return False
+    if key == "api_nature":
+        return isinstance(value, dict) and not value.get("failed_tiles")
+    if key == "api_urbanisme":
+        answered = [fc for fc in (value or {}).values() if isinstance(fc, dict)]
+        return bool(answered) and not any(fc.get("failed_tiles") for fc in answered)
+    return True
+
+
 @app.route("/search_by_commune", methods=["GET", "POST"])
 def search_by_commune():
     import requests
@@ -3563,104 +4300,22 @@ def search_by_commune():
         pass
 
     # 2) Récupère le contour de la commune via Geo API Gouv
-    commune_infos = requests.get(
-        f"https://geo.api.gouv.fr/communes?nom={quote_plus(commune)}&fields=centre,contour"
-    ).json()
+    commune_infos = get_commune_infos(commune, "centre,contour,code")
     if not commune_infos or not commune_infos[0].get("contour"):
         return jsonify({"error": "Contour de la commune introuvable."}), 404
     contour = commune_infos[0]["contour"]
+    code_insee = commune_infos[0].get("code") or normalize_name(commune)
     centre = commune_infos[0]["centre"]
     lat, lon = centre["coordinates"][1], centre["coordinates"][0]
 
-    # 3) Emprise bbox englobant le polygone (pour limiter la requête WFS)
-    commune_poly = shape(contour)
-    minx, miny, maxx, maxy = commune_poly.bounds
-    bbox = f"{minx},{miny},{maxx},{maxy},EPSG:4326"
-
-    # 4) Récupère toutes les features dans le bbox puis filtre par intersection avec le polygone
-    def filter_in_commune(features):
-        filtered = []
-        for f in features:
-            if "geometry" not in f:
-                continue
-            try:
-                # Créer la géométrie et la valider
-                geom = shape(f["geometry"])
-                if not geom.is_valid:
-                    # Tenter de corriger la géométrie invalide
-                    geom = geom.buffer(0)
-                    if not geom.is_valid:
-                        continue
-                
-                # Vérifier l'intersection
-                if geom.intersects(commune_poly):
-                    filtered.append(f)
-            except Exception as e:
-                # Ignorer les géométries qui causent des erreurs
-                print(f"⚠️ Géométrie ignorée à cause d'une erreur: {e}")
-                continue
-        return filtered
-
-    # NOUVELLE APPROCHE: Utilisation du polygone exact de la commune selon la doc API Carto
-    print(f"🆕 [NOUVELLE_APPROCHE] Utilisation du polygone exact de la commune (API Carto)")
-    print(f"🆕 [COMMUNE_POLYGON] Récupération exhaustive sur toute la commune: {commune}")
-    
-    # Utilisation des nouvelles fonctions qui exploitent le polygone complet de la commune
-    log_data_collection("DÉBUT", "Collecte des données géographiques")
-    
-    rpg_raw = []
-    if filter_rpg:
-        log_data_collection("RPG", f"Récupération parcelles RPG (surface {rpg_min_area}-{rpg_max_area} ha)")
-        rpg_raw = get_rpg_info_by_polygon(contour)
-        log_data_collection("RPG", f"✅ {len(rpg_raw)} parcelles RPG récupérées")
-    else:
-        log_data_collection("RPG", "❌ Récupération RPG désactivée")
-    
-    log_data_collection("POSTES", "Récupération des postes électriques")
-    postes_bt_data = filter_in_commune(fetch_wfs_data(POSTE_LAYER, bbox))
-    postes_hta_data = filter_in_commune(fetch_wfs_data(HT_POSTE_LAYER, bbox))
-    log_data_collection("POSTES", f"✅ {len(postes_bt_data)} postes BT, {len(postes_hta_data)} postes HTA")
-    
-    log_data_collection("ÉLEVEURS", "Récupération des données éleveurs")
-    eleveurs_data = filter_in_commune(fetch_wfs_data(ELEVEURS_LAYER, bbox, srsname="EPSG:4326"))
-    log_data_collection("ÉLEVEURS", f"✅ {len(eleveurs_data)} exploitants trouvés")
-    
-    # plu_info sera remplacé par filtered_zones après l'optimisation des zones
-    log_data_collection("PLU", "Récupération des zones d'urbanisme")
-    plu_info_temp = get_plu_info_by_polygon(contour)
-    log_data_collection("PLU", f"✅ {len(plu_info_temp)} zones PLU récupérées")
-    
-    log_data_collection("ZAER", "Récupération des zones ZAER")
-    zaer_data = get_zaer_info_by_polygon(contour)
-    log_data_collection("ZAER", f"✅ {len(zaer_data)} zones ZAER trouvées")
-    
-    # Récupération conditionnelle des données avec filtrage - NOUVELLE MÉTHODE POLYGONE
-    parkings_data = []
-    if filter_parkings:
-        log_data_collection("PARKINGS", f"Récupération parkings (surface min {parking_min_area} m²)")
-        parkings_data = get_parkings_info_by_polygon(contour)
-        log_data_collection("PARKINGS", f"✅ {len(parkings_data)} parkings récupérés")
-    else:
-        log_data_collection("PARKINGS", "❌ Récupération parkings désactivée")
-    
-    friches_data = []
-    if filter_friches:
-        log_data_collection("FRICHES", f"Récupération friches (surface min {friches_min_area} m²)")
-        friches_data = get_friches_info_by_polygon(contour)
-        log_data_collection("FRICHES", f"✅ {len(friches_data)} friches récupérées")
-    else:
-        log_data_collection("FRICHES", "❌ Récupération friches désactivée")
-    
-    # Données toujours récupérées pour les calculs de distance - NOUVELLE MÉTHODE POLYGONE
-    log_data_collection("SOLAIRE", "Récupération du potentiel solaire")
-    solaire_data = get_solaire_info_by_polygon(contour)
-    log_data_collection("SOLAIRE", f"✅ {len(solaire_data)} données solaires récupérées")
-    
-    log_data_collection("SIRENE", f"Récupération entreprises SIRENE (rayon {sir_km} km)")
-    sirene_data = get_sirene_info_by_polygon(contour)
-    log_data_collection("SIRENE", f"✅ {len(sirene_data)} entreprises trouvées")
+    # 3) Emprise bbox englobant le polygone (pour limiter la requête WFS)
+    commune_poly = shape(contour)
+    minx, miny, maxx, maxy = commune_poly.bounds
+    bbox = f"{minx},{miny},{maxx},{maxy},EPSG:4326"
 
-    point = {"type": "Point", "coordinates": [lon, lat]}
+    # NOUVELLE APPROCHE: Utilisation du polygone exact de la commune selon la doc API Carto
+    print(f"🆕 [NOUVELLE_APPROCHE] Utilisation du polygone exact de la commune (API Carto)")
+    print(f"🆕 [COMMUNE_POLYGON] Récupération exhaustive sur toute la commune: {commune}")
     
     # Fonction d'optimisation pour éviter les erreurs 414 "Request-URI Too Large"
     def optimize_geometry_for_api(geom):
@@ -3694,10 +4349,112 @@ def search_by_commune():
     # Récupération enrichie des données API avec optimisation géométrique
     print(f"🔍 [COMMUNE] Utilisation du polygone pour les APIs avec optimisation anti-414")
     contour_optimise = optimize_geometry_for_api(contour)
-    
-    api_cadastre   = get_api_cadastre_data(contour_optimise)  # Utilise le polygone optimisé
-    api_nature     = get_all_api_nature_data(contour_optimise)  # Utilise le polygone optimisé
-    api_urbanisme  = get_all_gpu_data(contour_optimise)  # Utilise le polygone optimisé
+
+    # Utilisation des nouvelles fonctions qui exploitent le polygone complet de la commune
+    log_data_collection("DÉBUT", "Collecte des données géographiques")
+
+    # Toutes les sources ne dépendent que du contour : collecte concurrente.
+    # Les couches déjà téléchargées pour cette commune (lot en cache, indépendant des
+    # curseurs) ne sont pas redemandées ; seules les sources manquantes partent.
+    # Variantes qui lèvent en cas d'échec amont : la source passe en erreur (valeur par
+    # défaut pour cette réponse seulement) au lieu de mettre une couche vide en cache.
+    def polygon_layer(layer, endpoint=None):
+        return (get_data_by_commune_polygon_or_raise, (contour, endpoint, layer), {"default": []})
+
+    sources = {
+        "rpg": polygon_layer(PARCELLES_GRAPHIQUES_LAYER, "https://apicarto.ign.fr/api/rpg/parcelles"),
+        "postes_bt": (fetch_wfs_data_or_raise, (POSTE_LAYER, bbox), {"geometry": commune_poly, "default": []}),
+        "postes_hta": (fetch_wfs_data_or_raise, (HT_POSTE_LAYER, bbox), {"geometry": commune_poly, "default": []}),
+        "eleveurs": (fetch_wfs_data_or_raise, (ELEVEURS_LAYER, bbox), {"srsname": "EPSG:4326", "geometry": commune_poly,
+                                                                     "property_names": ELEVEUR_PROPERTIES,
+                                                                     "default": []}),
+        "plu": polygon_layer(PLU_LAYER),
+        "zaer": polygon_layer(ZAER_LAYER),
+        "parkings": polygon_layer(PARKINGS_LAYER),
+        "friches": polygon_layer(FRICHES_LAYER),
+        "solaire": polygon_layer(POTENTIEL_SOLAIRE_LAYER),
+        "sirene": polygon_layer(SIRENE_LAYER),
+        "api_cadastre": (get_api_cadastre_data_or_raise, (contour_optimise,), {"default": None}),
+        # Nature et GPU : contour exact, découpé en tuiles s'il est trop long pour l'URL
+        "api_nature": (get_all_api_nature_data, (contour,), {"timeout": 60,
+                       "default": {"type": "FeatureCollection", "features": []}}),
+        "api_urbanisme": (get_all_gpu_data, (contour,), {"timeout": 60,
+                          "default": {ep: None for ep in GPU_ENDPOINTS}}),
+    }
+    optional = {"rpg": filter_rpg, "parkings": filter_parkings, "friches": filter_friches}
+    wanted = [key for key in sources if optional.get(key, True)]
+
+    bundle = commune_bundles.get(code_insee)
+    if bundle is None or bundle.contour != contour:
+        bundle = CommuneBundle(code_insee, commune, contour)
+    missing = bundle.missing(wanted)
+    if missing:
+        stage = FetchStage(max_workers=FETCH_STAGE_WORKERS, default_timeout=FETCH_STAGE_TIMEOUT, label="COLLECTE")
+        for key in missing:
+            fn, args, kwargs = sources[key]
+            stage.add(key, fn, *args, **kwargs)
+        fetched = stage.run()
+        fetch_timings = stage.timings
+        for key in missing:
+            # Source en échec (timeout, erreur) ou lecture incomplète : valeur pour cette réponse seulement,
+            # pas de mise en cache
+            if stage.timings.get(key, {}).get("status") == "ok" and bundle_cacheable(key, fetched[key]):
+                bundle.add(key, [decode_rpg_feature(f) for f in (fetched[key] or [])] if key == "rpg" else fetched[key])
+        commune_bundles.put(bundle)
+    else:
+        fetched, fetch_timings = {}, {}
+        print(f"♻️ [BUNDLE] {commune} ({code_insee}): couches brutes en cache ({bundle.age:.0f}s), aucun téléchargement")
+    collected = {key: bundle.layers[key] if bundle.has(key) else fetched.get(key) for key in wanted}
+    truncated_layers = sorted(key for key, value in collected.items() if getattr(value, "truncated", False))
+    if truncated_layers:
+        print(f"⚠️ [COLLECTE] {commune}: couches incomplètes {truncated_layers}")
+    if "rpg" in collected and not bundle.has("rpg"):
+        collected["rpg"] = [decode_rpg_feature(f) for f in (collected["rpg"] or [])]
+
+    rpg_raw = collected.get("rpg", [])
+    if filter_rpg:
+        log_data_collection("RPG", f"✅ {len(rpg_raw)} parcelles RPG récupérées (surface {rpg_min_area}-{rpg_max_area} ha)")
+    else:
+        log_data_collection("RPG", "❌ Récupération RPG désactivée")
+
+    postes_bt_data = collected["postes_bt"]
+    postes_hta_data = collected["postes_hta"]
+    log_data_collection("POSTES", f"✅ {len(postes_bt_data)} postes BT, {len(postes_hta_data)} postes HTA")
+
+    eleveurs_data = collected["eleveurs"]
+    log_data_collection("ÉLEVEURS", f"✅ {len(eleveurs_data)} exploitants trouvés")
+
+    # plu_info sera remplacé par filtered_zones après l'optimisation des zones
+    plu_info_temp = collected["plu"]
+    log_data_collection("PLU", f"✅ {len(plu_info_temp)} zones PLU récupérées")
+
+    zaer_data = collected["zaer"]
+    log_data_collection("ZAER", f"✅ {len(zaer_data)} zones ZAER trouvées")
+
+    parkings_data = collected.get("parkings", [])
+    if filter_parkings:
+        log_data_collection("PARKINGS", f"✅ {len(parkings_data)} parkings récupérés (surface min {parking_min_area} m²)")
+    else:
+        log_data_collection("PARKINGS", "❌ Récupération parkings désactivée")
+
+    friches_data = collected.get("friches", [])
+    if filter_friches:
+        log_data_collection("FRICHES", f"✅ {len(friches_data)} friches récupérées (surface min {friches_min_area} m²)")
+    else:
+        log_data_collection("FRICHES", "❌ Récupération friches désactivée")
+
+    # Données toujours récupérées pour les calculs de distance - NOUVELLE MÉTHODE POLYGONE
+    solaire_data = collected["solaire"]
+    log_data_collection("SOLAIRE", f"✅ {len(solaire_data)} données solaires récupérées")
+
+    sirene_data = collected["sirene"]
+    log_data_collection("SIRENE", f"✅ {len(sirene_data)} entreprises trouvées (rayon {sir_km} km)")
+
+    point = {"type": "Point", "coordinates": [lon, lat]}
+
+    api_cadastre   = collected["api_cadastre"]  # Utilise le polygone optimisé
+    api_nature     = collected["api_nature"]  # Contour exact (tuiles si trop long)
+    api_urbanisme  = collected["api_urbanisme"]
     
     # Enrichissement des données si l'option zones est activée
     if filter_zones and api_urbanisme.get("success"):
@@ -3714,43 +4471,21 @@ def search_by_commune():
                     }
         api_urbanisme["zones_summary"] = zones_summary
 
-    # 5) Filtrage RPG (culture, surface, distances)
-    to_l93 = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True).transform
-
-    final_rpg = []
-    for feat in (rpg_raw or []):
-        dec   = decode_rpg_feature(feat)
-        poly  = shape(dec["geometry"])
-        props = dec["properties"]
-
-        # a) culture
-        if culture and culture.lower() not in props.get("Culture", "").lower():
-            continue
-
-        # b) surface (ha)
-        ha = shp_transform(to_l93, poly).area / 10_000.0
-        if ha < min_ha or ha > max_ha:
-            continue
-
-        # c) distances réseaux (m) : on cherche le **minimum** dans CHAQUE liste
-        cent   = poly.centroid.coords[0]
-        d_bt   = calculate_min_distance(cent, postes_bt_data)
-        d_hta  = calculate_min_distance(cent, postes_hta_data)
-
-        if ((d_bt  or 1e12) / 1000.0) > bt_max_km \
-        and ((d_hta or 1e12) / 1000.0) > ht_max_km:
-            continue
-
-        props.update({
-            "SURF_HA":            round(ha, 3),
-            "min_bt_distance_m":  round(d_bt,  2) if d_bt  is not None else None,
-            "min_ht_distance_m":  round(d_hta, 2) if d_hta is not None else None,
-        })
-        final_rpg.append({
-            "type":       "Feature",
-            "geometry":   dec["geometry"],
-            "properties": props
-        })
+    # 5) Filtrage RPG (culture, surface, distances), parkings, friches et toitures :
+    # seuils appliqués aux mesures du lot (surfaces, centroïdes, distances aux postes)
+    to_l93 = transform_func(WGS84, L93)
+    distance_engine = bundle.engine
+
+    thresholds = {
+        "culture": culture, "ht_max_km": ht_max_km, "bt_max_km": bt_max_km, "min_ha": min_ha, "max_ha": max_ha,
+        "filter_rpg": filter_rpg, "filter_parkings": filter_parkings, "parking_min_area": parking_min_area,
+        "filter_friches": filter_friches, "friches_min_area": friches_min_area,
+        "filter_toitures": False, "toitures_min_surface": toitures_min_surface,
+        "filter_by_distance": filter_by_distance, "max_distance_bt": max_distance_bt,
+        "max_distance_hta": max_distance_hta, "distance_logic": distance_logic, "poste_type_filter": poste_type_filter,
+    }
+    kept, kept_idx, rejected = filter_commune_bundle(bundle, thresholds)
+    final_rpg = kept.get("rpg", [])
 
     # Filtrage avancé pour les nouvelles couches
     
@@ -3759,6 +4494,12 @@ def search_by_commune():
     filtered_friches = []
     filtered_zones = []
     filtered_parcelles_in_zones = []
+
+    # Bâtiments de la commune : une requête Overpass et un index (conservé dans le lot) pour toutes
+    # les parcelles retenues
+    def commune_building_index():
+        return bundle_building_index(bundle)
+
     
     # 5b) Filtrage des parkings selon les critères (utilise les sliders unifiés)
     if filter_parkings and parkings_data:
@@ -3766,76 +4507,10 @@ def search_by_commune():
         print(f"🔍 [PARKINGS] Filtrage: >{parking_min_area}m², BT<{max_distance_bt}m, HTA<{max_distance_hta}m")
         print(f"🔍 [PARKINGS] Parkings bruts récupérés: {len(parkings_data)}")
         
-        surfaces_rejetees = 0
-        distances_rejetees = 0
-        
-        for feat in parkings_data:
-            if "geometry" not in feat:
-                continue
-            try:
-                poly = shape(feat["geometry"])
-                props = feat.get("properties", {})
-
-                # Calcul de la surface en m²
-                area_m2 = shp_transform(to_l93, poly).area
-                if area_m2 < parking_min_area:
-                    surfaces_rejetees += 1
-                    continue
-
-                # Calcul de la distance aux postes BT/HTA
-                cent = poly.centroid.coords[0]
-                d_bt = calculate_min_distance(cent, postes_bt_data)
-                d_hta = calculate_min_distance(cent, postes_hta_data)
-
-                # Logique de filtrage portée par le type de poste sélectionné (Tous/BT/HTA)
-                bt_ok = (d_bt is not None and d_bt <= max_distance_bt) if d_bt is not None else False
-                hta_ok = (d_hta is not None and d_hta <= max_distance_hta) if d_hta is not None else False
-                if filter_by_distance:
-                    if poste_type_filter == "BT":
-                        distance_ok = bt_ok
-                    elif poste_type_filter == "HTA":
-                        distance_ok = hta_ok
-                    else:  # ALL
-                        distance_ok = bt_ok or hta_ok
-                else:
-                    # Pas de filtrage par distance lorsque l'option n'est pas cochée
-                    distance_ok = True
-                if not distance_ok:
-                    distances_rejetees += 1
-                    continue
-
-                # Enrichissement des propriétés
-                props.update({
-                    "surface_m2": round(area_m2, 2),
-                    "min_distance_bt_m": round(d_bt, 2) if d_bt is not None else None,
-                    "min_distance_hta_m": round(d_hta, 2) if d_hta is not None else None
-                })
-
-                # Calcul de la surface libre si demandé
-                if calculate_surface_libre:
-                    try:
-                        print(f"🏠 [SURFACE_LIBRE] Calcul pour parking...")
-                        batiments_data = get_batiments_data(feat["geometry"])
-                        surface_libre_result = calculate_surface_libre_parcelle(feat["geometry"], batiments_data)
-                        props.update({
-                            'surface_batie_m2': surface_libre_result.get('surface_batie_m2', 0),
-                            'surface_libre_m2': surface_libre_result.get('surface_libre_m2', 0),
-                            'surface_libre_pct': surface_libre_result.get('surface_libre_pct', 0),
-                            'batiments_count': surface_libre_result.get('batiments_count', 0)
-                        })
-                    except Exception as e:
-                        print(f"❌ [SURFACE_LIBRE] Erreur parking: {e}")
-                        props['surface_libre_error'] = str(e)
+        filtered_parkings = kept.get("parkings", [])
+        surfaces_rejetees = rejected.get("parkings", {}).get("surface", 0)
+        distances_rejetees = rejected.get("parkings", {}).get("distance", 0)
 
-                filtered_parkings.append({
-                    "type": "Feature",
-                    "geometry": feat["geometry"],
-                    "properties": props
-                })
-            except Exception as e:
-                print(f"⚠️ Erreur filtrage parking: {e}")
-                continue
-        
         # Log détaillé des résultats de filtrage
         total_rejets = surfaces_rejetees + distances_rejetees
         log_data_collection("FILTRAGE PARKINGS", 
@@ -3848,66 +4523,8 @@ def search_by_commune():
         if filtered_parkings:
             print(f"🏛️ [CADASTRE-PARKINGS] Récupération des références cadastrales pour {len(filtered_parkings)} parkings...")
             
-            def get_parcelles_for_parking(parking_geometry):
-                """Récupère les parcelles cadastrales intersectant un parking spécifique"""
-                try:
-                    api_url = "https://apicarto.ign.fr/api/cadastre/parcelle"
-                    params = {
-                        "geom": json.dumps(parking_geometry),
-                        "_limit": 50  # Limite raisonnable pour un parking
-                    }
-                    
-                    resp = requests.get(api_url, params=params, timeout=10)
-                    if resp.status_code == 200:
-                        data = resp.json()
-                        return data.get('features', [])
-                    else:
-                        print(f"    ⚠️ Erreur API cadastre: {resp.status_code}")
-                        return []
-                except Exception as e:
-                    print(f"    ⚠️ Exception cadastre parking: {e}")
-                    return []
-            
-            # Enrichir chaque parking avec ses références cadastrales
-            for i, parking in enumerate(filtered_parkings):
-                print(f"    📍 Parking {i+1}/{len(filtered_parkings)}: recherche cadastre...")
-                parcelles_parking = get_parcelles_for_parking(parking["geometry"])
-                
-                if parcelles_parking:
-                    print(f"      🔍 [DEBUG] Structure API cadastre - première parcelle: {parcelles_parking[0] if parcelles_parking else 'Aucune'}")
-                    
-                    # Extraire les références cadastrales
-                    refs_cadastrales = []
-                    for parcelle in parcelles_parking:
-                        props = parcelle.get('properties', {})
-                        print(f"      🔍 [DEBUG] Propriétés parcelle: {props}")
-                        
-                        # Tester différents noms d'attributs possibles selon l'API
-                        numero = props.get('numero') or props.get('numero_parcelle') or props.get('num_parc') or ''
-                        section = props.get('section') or props.get('code_section') or ''
-                        commune = props.get('commune') or props.get('code_commune') or props.get('insee') or ''
-                        prefixe = props.get('prefixe') or props.get('code_arr') or ''
-                        
-                        ref = {
-                            'numero': numero,
-                            'section': section,
-                            'commune': commune,
-                            'prefixe': prefixe,
-                            'reference_complete': f"{commune}{prefixe}{section}{numero}".strip()
-                        }
-                        
-                        print(f"      🏛️ [DEBUG] Référence créée: {ref}")
-                        refs_cadastrales.append(ref)
-                    
-                    # Ajouter aux propriétés du parking
-                    parking["properties"]["parcelles_cadastrales"] = refs_cadastrales
-                    parking["properties"]["nb_parcelles_cadastrales"] = len(refs_cadastrales)
-                    print(f"      ✅ {len(refs_cadastrales)} parcelles cadastrales trouvées")
-                else:
-                    parking["properties"]["parcelles_cadastrales"] = []
-                    parking["properties"]["nb_parcelles_cadastrales"] = 0
-                    print(f"      ❌ Aucune parcelle cadastrale trouvée")
-            
+            # Références cadastrales et surface libre, mémorisées dans le lot pour /refilter_commune
+            enrich_kept_features(bundle, "parkings", filtered_parkings, kept_idx["parkings"], calculate_surface_libre)
             print(f"✅ [CADASTRE-PARKINGS] Enrichissement terminé pour tous les parkings")
     else:
         print(f"⚠️ [PARKINGS] Filtre parkings non activé ou aucune donnée: filter_parkings={filter_parkings}, parkings_data={len(parkings_data) if parkings_data else 0}")
@@ -3917,77 +4534,10 @@ def search_by_commune():
         log_data_collection("FRICHES", f"🎯 Début filtrage: {len(friches_data)} friches à analyser")
         print(f"🔍 [FRICHES] Filtrage: >{friches_min_area}m², BT<{max_distance_bt}m, HTA<{max_distance_hta}m")
         
-        # Compteurs de rejet
-        surfaces_rejetees = 0
-        distances_rejetees = 0
-        
-        for feat in friches_data:
-            if "geometry" not in feat:
-                continue
-            try:
-                poly = shape(feat["geometry"])
-                props = feat.get("properties", {})
-
-                # Calcul de la surface en m²
-                area_m2 = shp_transform(to_l93, poly).area
-                if area_m2 < friches_min_area:
-                    surfaces_rejetees += 1
-                    continue
+        filtered_friches = kept.get("friches", [])
+        surfaces_rejetees = rejected.get("friches", {}).get("surface", 0)
+        distances_rejetees = rejected.get("friches", {}).get("distance", 0)
 
-                # Calcul de la distance aux postes BT/HTA
-                cent = poly.centroid.coords[0]
-                d_bt = calculate_min_distance(cent, postes_bt_data)
-                d_hta = calculate_min_distance(cent, postes_hta_data)
-
-                # Logique de filtrage portée par le type de poste sélectionné (Tous/BT/HTA)
-                bt_ok = (d_bt is not None and d_bt <= max_distance_bt) if d_bt is not None else False
-                hta_ok = (d_hta is not None and d_hta <= max_distance_hta) if d_hta is not None else False
-                if filter_by_distance:
-                    if poste_type_filter == "BT":
-                        distance_ok = bt_ok
-                    elif poste_type_filter == "HTA":
-                        distance_ok = hta_ok
-                    else:  # ALL
-                        distance_ok = bt_ok or hta_ok
-                else:
-                    # Pas de filtrage par distance lorsque l'option n'est pas cochée
-                    distance_ok = True
-                if not distance_ok:
-                    distances_rejetees += 1
-                    continue
-
-                # Enrichissement des propriétés
-                props.update({
-                    "surface_m2": round(area_m2, 2),
-                    "min_distance_bt_m": round(d_bt, 2) if d_bt is not None else None,
-                    "min_distance_hta_m": round(d_hta, 2) if d_hta is not None else None
-                })
-
-                # Calcul de la surface libre si demandé
-                if calculate_surface_libre:
-                    try:
-                        print(f"🏠 [SURFACE_LIBRE] Calcul pour friche...")
-                        batiments_data = get_batiments_data(feat["geometry"])
-                        surface_libre_result = calculate_surface_libre_parcelle(feat["geometry"], batiments_data)
-                        props.update({
-                            'surface_batie_m2': surface_libre_result.get('surface_batie_m2', 0),
-                            'surface_libre_m2': surface_libre_result.get('surface_libre_m2', 0),
-                            'surface_libre_pct': surface_libre_result.get('surface_libre_pct', 0),
-                            'batiments_count': surface_libre_result.get('batiments_count', 0)
-                        })
-                    except Exception as e:
-                        print(f"❌ [SURFACE_LIBRE] Erreur friche: {e}")
-                        props['surface_libre_error'] = str(e)
-
-                filtered_friches.append({
-                    "type": "Feature",
-                    "geometry": feat["geometry"],
-                    "properties": props
-                })
-            except Exception as e:
-                print(f"⚠️ Erreur filtrage friche: {e}")
-                continue
-        
         # Log détaillé des résultats de filtrage
         log_data_collection("FILTRAGE FRICHES", 
                           f"✅ {len(filtered_friches)} retenues / {len(friches_data)} analysées")
@@ -3999,54 +4549,7 @@ def search_by_commune():
         if filtered_friches:
             print(f"🏛️ [CADASTRE-FRICHES] Récupération des références cadastrales pour {len(filtered_friches)} friches...")
             
-            def get_parcelles_for_friche(friche_geometry):
-                """Récupère les parcelles cadastrales intersectant une friche spécifique"""
-                try:
-                    api_url = "https://apicarto.ign.fr/api/cadastre/parcelle"
-                    params = {
-                        "geom": json.dumps(friche_geometry),
-                        "_limit": 100  # Limite raisonnable pour une friche
-                    }
-                    
-                    resp = requests.get(api_url, params=params, timeout=10)
-                    if resp.status_code == 200:
-                        data = resp.json()
-                        return data.get('features', [])
-                    else:
-                        print(f"    ⚠️ Erreur API cadastre: {resp.status_code}")
-                        return []
-                except Exception as e:
-                    print(f"    ⚠️ Exception cadastre friche: {e}")
-                    return []
-            
-            # Enrichir chaque friche avec ses références cadastrales
-            for i, friche in enumerate(filtered_friches):
-                print(f"    📍 Friche {i+1}/{len(filtered_friches)}: recherche cadastre...")
-                parcelles_friche = get_parcelles_for_friche(friche["geometry"])
-                
-                if parcelles_friche:
-                    # Extraire les références cadastrales
-                    refs_cadastrales = []
-                    for parcelle in parcelles_friche:
-                        props = parcelle.get('properties', {})
-                        ref = {
-                            'numero': props.get('numero', ''),
-                            'section': props.get('section', ''),
-                            'commune': props.get('commune', ''),
-                            'prefixe': props.get('prefixe', ''),
-                            'reference_complete': f"{props.get('commune', '')}{props.get('prefixe', '')}{props.get('section', '')}{props.get('numero', '')}"
-                        }
-                        refs_cadastrales.append(ref)
-                    
-                    # Ajouter aux propriétés de la friche
-                    friche["properties"]["parcelles_cadastrales"] = refs_cadastrales
-                    friche["properties"]["nb_parcelles_cadastrales"] = len(refs_cadastrales)
-                    print(f"      ✅ {len(refs_cadastrales)} parcelles cadastrales trouvées")
-                else:
-                    friche["properties"]["parcelles_cadastrales"] = []
-                    friche["properties"]["nb_parcelles_cadastrales"] = 0
-                    print(f"      ❌ Aucune parcelle cadastrale trouvée")
-            
+            enrich_kept_features(bundle, "friches", filtered_friches, kept_idx["friches"], calculate_surface_libre)
             print(f"✅ [CADASTRE-FRICHES] Enrichissement terminé pour toutes les friches")
     
     # 5d) Filtrage optimisé des zones avec croisement parcelles
@@ -4080,7 +4583,7 @@ def search_by_commune():
             }
             
             try:
-                resp = requests.get(api_url, params=params, timeout=30)
+                resp = http_session.get(api_url, params=params, timeout=30)
                 if resp.status_code == 200:
                     data = resp.json()
                     return data.get('features', [])
@@ -4105,7 +4608,7 @@ def search_by_commune():
             }
             
             try:
-                resp = requests.get(api_url, params=params, timeout=60)  # Timeout augmenté pour traitement complet
+                resp = http_session.get(api_url, params=params, timeout=60)  # Timeout augmenté pour traitement complet
                 if resp.status_code == 200:
                     data = resp.json()
                     return data.get('features', [])
@@ -4181,8 +4684,8 @@ def search_by_commune():
                         centroid = shape(geometry).centroid.coords[0]
                         
                         # Calculer les distances minimales aux postes
-                        min_distance_bt = calculate_min_distance(centroid, postes_bt_data)
-                        min_distance_hta = calculate_min_distance(centroid, postes_hta_data)
+                        min_distance_bt = distance_engine.min_distance("bt", centroid)
+                        min_distance_hta = distance_engine.min_distance("hta", centroid)
                         
                         # Distance minimale globale (le poste le plus proche, qu'il soit BT ou HTA)
                         distances = [d for d in [min_distance_bt, min_distance_hta] if d is not None]
@@ -4231,37 +4734,6 @@ def search_by_commune():
                         'min_distance_total_m': round(min_distance_total, 2) if min_distance_total is not None else None
                     })
                     
-                    # Calcul de la surface libre si demandé
-                    if calculate_surface_libre:
-                        try:
-                            print(f"🏠 [SURFACE_LIBRE] Calcul pour parcelle {parcelle_props.get('numero', 'N/A')}...")
-                            
-                            # Récupérer les bâtiments sur cette parcelle
-                            batiments_data = get_batiments_data(geometry)
-                            
-                            # Calculer la surface libre
-                            surface_libre_result = calculate_surface_libre_parcelle(geometry, batiments_data)
-                            
-                            # Ajouter les résultats aux propriétés
-                            parcelle_props.update({
-                                'surface_totale_calculee_m2': surface_libre_result.get('surface_totale_m2', 0),
-                                'surface_batie_m2': surface_libre_result.get('surface_batie_m2', 0),
-                                'surface_libre_m2': surface_libre_result.get('surface_libre_m2', 0),
-                                'surface_libre_pct': surface_libre_result.get('surface_libre_pct', 0),
-                                'batiments_count': surface_libre_result.get('batiments_count', 0),
-                                'surface_libre_calculee': True
-                            })
-                            
-                            if surface_libre_result.get('error'):
-                                parcelle_props['surface_libre_error'] = surface_libre_result['error']
-                                
-                        except Exception as e:
-                            print(f"❌ [SURFACE_LIBRE] Erreur calcul pour parcelle: {e}")
-                            parcelle_props.update({
-                                'surface_libre_calculee': False,
-                                'surface_libre_error': str(e)
-                            })
-                    
                     # Ajouter les distances si calculées
                     if filter_by_distance:
                         distance_filter_desc = f"Type: {poste_type_filter}"
@@ -4312,6 +4784,10 @@ def search_by_commune():
                 })
             except Exception:
                 pass
+
+        if calculate_surface_libre and filtered_parcelles_in_zones:
+            annotate_surface_libre(filtered_parcelles_in_zones, commune_building_index(), detailed=True)
+        annotate_productible(filtered_parcelles_in_zones)
         
         log_data_collection("FILTRAGE ZONES", f"✅ {len(target_zones)} zones analysées")
         log_data_collection("FILTRAGE ZONES", f"✅ {total_parcelles_trouvees} parcelles retenues (>{zones_min_area}m²)")
@@ -4344,188 +4820,44 @@ def search_by_commune():
         print(f"🏠 [TOITURES] Postes disponibles - BT: {len(postes_bt_data)}, HTA: {len(postes_hta_data)}")
         try:
             from shapely.geometry import mapping, Point
-            from shapely.ops import transform as shp_transform
-            from pyproj import Transformer
-
-            # Définir la transformation vers Lambert 93 pour le calcul des surfaces
-            to_l93 = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True).transform
-
-            # Utiliser le contour exact de la commune au lieu d'un rayon
-            search_geom_geojson = contour
-
-            # Utiliser la fonction existante get_batiments_data avec le polygone de la commune
-            batiments_features = get_batiments_data(search_geom_geojson)
-            batiments_data = batiments_features.get("features", []) if batiments_features else []
-            print(f"🏠 [TOITURES] {len(batiments_data)} bâtiments récupérés dans la commune")
 
-            # ANALYSE COMPLÈTE: Traitement de tous les bâtiments de la commune
+            # Bâtiments de toute la commune (lot en cache si déjà téléchargés)
+            if bundle.has("batiments"):
+                batiments_data = bundle.layers["batiments"]
+                print(f"♻️ [TOITURES] {len(batiments_data)} bâtiments en cache pour la commune")
+            else:
+                # Utiliser la fonction existante get_batiments_data avec le polygone de la commune
+                batiments_features = get_batiments_data(contour)
+                batiments_data = batiments_features.get("features", []) if batiments_features else []
+                print(f"🏠 [TOITURES] {len(batiments_data)} bâtiments récupérés dans la commune")
+                if batiments_features:
+                    bundle.add("batiments", batiments_data)
+                    commune_bundles.put(bundle)
+
+            # Appartenance à la commune (double filtrage), surfaces et distances aux postes
+            # mesurées une fois par lot ; seuls les seuils sont appliqués ici
             print(f"🔍 [TOITURES] Analyse complète de tous les {len(batiments_data)} bâtiments")
-            print(f"💡 [TOITURES] Traitement complet activé pour une analyse exhaustive")
-
-            # Filtrer et enrichir les toitures avec intersection géométrique précise
-            for idx, batiment in enumerate(batiments_data):
-                try:
-                    geom = shape(batiment["geometry"])
-                    if not geom.is_valid:
-                        geom = geom.buffer(0)
-                        if not geom.is_valid:
-                            continue
-
-                    # Vérifier que le bâtiment est bien dans la commune (double filtrage)
-                    if not (commune_poly.contains(geom) or commune_poly.intersects(geom)):
-                        continue
-
-                    # Calculer la surface
-                    surface_m2 = shp_transform(to_l93, geom).area
-                    if surface_m2 < toitures_min_surface:
-                        continue
-
-                    # Calculer les distances aux postes
-                    centroid = geom.centroid.coords[0]
-                    d_bt = calculate_min_distance(centroid, postes_bt_data) if postes_bt_data else None
-                    d_hta = calculate_min_distance(centroid, postes_hta_data) if postes_hta_data else None
-
-                    # Logique de filtrage portée par le type de poste sélectionné (Tous/BT/HTA)
-                    bt_ok = (d_bt is not None and d_bt <= max_distance_bt) if d_bt is not None else False
-                    hta_ok = (d_hta is not None and d_hta <= max_distance_hta) if d_hta is not None else False
-                    if filter_by_distance:
-                        if poste_type_filter == "BT":
-                            distance_ok = bt_ok
-                        elif poste_type_filter == "HTA":
-                            distance_ok = hta_ok
-                        else:  # ALL
-                            distance_ok = bt_ok or hta_ok
-                    else:
-                        # Pas de filtrage par distance lorsque l'option n'est pas cochée
-                        distance_ok = True
-                    if not distance_ok:
-                        continue
-
-                    # Ajouter à la liste filtrée (enrichissement cadastral sera fait après)
-                    toitures_data.append({
-                        "type": "Feature",
-                        "geometry": batiment["geometry"],
-                        "properties": {
-                            "surface_toiture_m2": round(surface_m2, 2),
-                            "min_distance_bt_m": round(d_bt, 2) if d_bt else None,
-                            "min_distance_hta_m": round(d_hta, 2) if d_hta else None,
-                            "commune": commune,
-                            "search_method": "polygon_commune",
-                            "source": "OpenStreetMap",
-                            "building": batiment.get("properties", {}).get("building", "yes"),
-                            "osm_id": batiment.get("properties", {}).get("osm_id"),
-                            # Liens utiles
-                            "lien_streetview": f"https://www.google.com/maps/@?api=1&map_action=pano&viewpoint={centroid[1]},{centroid[0]}",
-                            "lien_annuaire": f"https://www.pagesjaunes.fr/annuaire/chercherlespros?quoiqui=&ou={quote_plus(commune)}&univers=pagesjaunes&idOu="
-                        }
-                    })
-
-                except Exception as e:
-                    print(f"⚠️ [TOITURES] Erreur traitement bâtiment {idx}: {e}")
-                    continue
+            toits, toits_idx = {}, {}
+            if bundle.has("batiments"):
+                toits, toits_idx, _ = filter_commune_bundle(bundle, {
+                    **thresholds, "filter_rpg": False, "filter_parkings": False, "filter_friches": False,
+                    "filter_toitures": True,
+                })
+            toitures_data = toits.get("batiments", [])
+            kept_idx["batiments"] = toits_idx.get("batiments", [])
 
             print(f"✅ [TOITURES] {len(toitures_data)} toitures filtrées trouvées (méthode polygone)")
             
             # Enrichissement cadastral OPTIMISÉ avec limite
             if toitures_data:
-                # ENRICHISSEMENT COMPLET: Traitement de toutes les toitures de la commune
-                toitures_a_enrichir = toitures_data  # Traitement complet sans limitation
-                
-                print(f"🏛️ [CADASTRE-TOITURES] Enrichissement complet : {len(toitures_a_enrichir)} toitures")
-                print(f"🔍 [CADASTRE-TOITURES] Traitement individuel optimisé avec limite 1000")
-                
-                def get_parcelles_for_toiture(toiture_geometry):
-                    """Récupère les parcelles cadastrales intersectant une toiture spécifique avec limite optimisée"""
-                    try:
-                        api_url = "https://apicarto.ign.fr/api/cadastre/parcelle"
-                        params = {
-                            "geom": json.dumps(toiture_geometry),
-                            "_limit": 1000  # Limite maximale au lieu de 3
-                        }
-                        
-                        resp = requests.get(api_url, params=params, timeout=10)
-                        if resp.status_code == 200:
-                            data = resp.json()
-                            return data.get('features', [])
-                        else:
-                            return []
-                    except Exception:
-                        return []
-                
-                # Traitement individuel mais optimisé
-                total_enrichies = 0
-                total_erreurs = 0
-                
-                for i, toiture in enumerate(toitures_a_enrichir):
-                    # Log de progression moins verbeux
-                    if (i + 1) % 50 == 0 or i == 0:
-                        print(f"    📍 Progression: {i+1}/{len(toitures_a_enrichir)} toitures traitées...")
-                    
-                    # 1. Enrichissement cadastral
-                    parcelles_toiture = get_parcelles_for_toiture(toiture["geometry"])
-                    
-                    if parcelles_toiture:
-                        # Extraire les références cadastrales
-                        refs_cadastrales = []
-                        for parcelle in parcelles_toiture:
-                            props = parcelle.get('properties', {})
-                            
-                            numero = props.get('numero', '')
-                            section = props.get('section', '')
-                            commune_code = props.get('commune', '')
-                            prefixe = props.get('prefixe', '')
-                            
-                            if section and numero:
-                                ref = {
-                                    'numero': numero,
-                                    'section': section,
-                                    'commune': commune_code,
-                                    'prefixe': prefixe,
-                                    'reference_complete': f"{commune_code}{prefixe}{section}{numero}".strip()
-                                }
-                                refs_cadastrales.append(ref)
-                        
-                        toiture["properties"]["parcelles_cadastrales"] = refs_cadastrales
-                        toiture["properties"]["nb_parcelles_cadastrales"] = len(refs_cadastrales)
-                        total_enrichies += 1
-                    else:
-                        toiture["properties"]["parcelles_cadastrales"] = []
-                        toiture["properties"]["nb_parcelles_cadastrales"] = 0
-                        total_erreurs += 1
-                    
-                    # 2. Enrichissement avec l'adresse IGN (géocodage inverse)
-                    geom = toiture.get("geometry", {})
-                    if geom and geom.get("type") in ["Polygon", "MultiPolygon"]:
-                        try:
-                            # Calculer le centroïde de la toiture pour obtenir lat/lon
-                            from shapely.geometry import shape
-                            shp_geom = shape(geom)
-                            centroid = shp_geom.centroid
-                            
-                            # Géocodage inverse IGN
-                            adresse_info = get_address_from_coordinates(centroid.y, centroid.x)
-                            
-                            if adresse_info and adresse_info.get('address'):
-                                toiture["properties"]["adresse"] = adresse_info['address']
-                                toiture["properties"]["adresse_distance"] = adresse_info.get('distance', 0)
-                                toiture["properties"]["adresse_score"] = adresse_info.get('score', 0)
-                                toiture["properties"]["code_postal"] = adresse_info.get('postcode', '')
-                                toiture["properties"]["ville"] = adresse_info.get('city', '')
-                                toiture["properties"]["code_commune"] = adresse_info.get('citycode', '')
-                                # Mettre à jour le lien annuaire avec la ville si disponible
-                                try:
-                                    ville = adresse_info.get('city', '') or commune
-                                    toiture["properties"]["lien_annuaire"] = f"https://www.pagesjaunes.fr/annuaire/chercherlespros?quoiqui=&ou={quote_plus(ville)}&univers=pagesjaunes&idOu="
-                                except Exception:
-                                    pass
-                            else:
-                                toiture["properties"]["adresse"] = "Adresse non trouvée"
-                                toiture["properties"]["adresse_distance"] = None
-                                toiture["properties"]["adresse_score"] = 0
-                        except Exception as e:
-                            safe_print(f"🔴 [ADRESSE] Erreur enrichissement toiture {i}: {e}")
-                            toiture["properties"]["adresse"] = "Erreur géocodage"
-                
+                # ENRICHISSEMENT COMPLET: références cadastrales et adresse des toitures pas encore
+                # enrichies (mêmes propriétés pour les toitures admises ensuite par /refilter_commune)
+                print(f"🏛️ [CADASTRE-TOITURES] Enrichissement complet : {len(toitures_data)} toitures")
+                enrich_kept_features(bundle, "batiments", toitures_data, kept_idx["batiments"],
+                                     require_refs=True, geocode=True)
+                total_enrichies = sum(1 for t in toitures_data if t["properties"]["parcelles_cadastrales"])
+                total_erreurs = len(toitures_data) - total_enrichies
+
                 print(f"✅ [CADASTRE-TOITURES] Enrichissement individuel optimisé terminé:")
                 print(f"    📊 {total_enrichies} toitures enrichies avec succès")
                 print(f"    ⚠️ {total_erreurs} toitures sans données cadastrales")
@@ -4573,6 +4905,9 @@ def search_by_commune():
     # 7) Réponse JSON avec données filtrées
     response_data = {
         "lat": lat, "lon": lon,
+        "code_insee": code_insee,  # clé du lot de couches pour /refilter_commune
+        "fetch_timings": fetch_timings,  # durées par source de cette collecte ({} : couches en cache)
+        "truncated_layers": truncated_layers,  # couches lues partiellement (flux interrompu, plafond serveur)
         "rpg": final_rpg if filter_rpg else [],
         "eleveurs": eleveurs_with_layer,
         "postes_bt": postes_bt_data,
@@ -4615,6 +4950,67 @@ def search_by_commune():
     
     return jsonify(response_data)
 
+@app.route("/refilter_commune", methods=["GET", "POST"])
+def refilter_commune():
+    """
+    Ré-applique les curseurs (surfaces, distances, type de poste, culture) aux couches brutes
+    d'une commune déjà recherchée, sans téléchargement. Paramètres : code (code_insee rendu par
+    /search_by_commune) ou commune, puis les mêmes seuils que /search_by_commune.
+    Les couches jamais téléchargées pour ce lot sont listées dans "missing" (recherche complète).
+    Les features retenues reçoivent les références cadastrales (et la surface libre si
+    calculate_surface_libre=true) comme dans /search_by_commune.
+    """
+    import time
+    started = time.perf_counter()
+    values = request.values
+    code = values.get("code", "").strip()
+    commune = values.get("commune", "").strip()
+    if not code and commune:
+        infos = get_commune_infos(commune, "code")
+        code = (infos[0].get("code") if infos else None) or normalize_name(commune)
+    bundle = commune_bundles.get(code) if code else None
+    if bundle is None:
+        return jsonify({"error": "Aucune donnée en cache pour cette commune, lancer /search_by_commune"}), 404
+
+    t = search_thresholds(values)
+    needed = [key for key, flag in (("rpg", "filter_rpg"), ("parkings", "filter_parkings"),
+                                    ("friches", "filter_friches"), ("batiments", "filter_toitures")) if t[flag]]
+    kept, kept_idx, rejected = filter_commune_bundle(bundle, t)
+    # Features admises par un curseur élargi : mêmes enrichissements que lors de la recherche
+    for key in ("parkings", "friches", "batiments"):
+        if kept.get(key):
+            enrich_kept_features(bundle, key, kept[key], kept_idx[key],
+                                 surface_libre=t["calculate_surface_libre"] and key != "batiments",
+                                 require_refs=key == "batiments", geocode=key == "batiments")
+    fc = lambda features: {"type": "FeatureCollection", "features": features}
+    response = {
+        "code_insee": bundle.code,
+        "commune": bundle.nom,
+        "cache_age_s": round(bundle.age),
+        "missing": bundle.missing(needed),
+        "rpg": kept.get("rpg", []),
+        "parkings": fc(kept.get("parkings", [])),
+        "friches": fc(kept.get("friches", [])),
+        "toitures": fc(kept.get("batiments", [])),
+        "filters_applied": {
+            "rpg": {"active": t["filter_rpg"], "count": len(kept.get("rpg", []))},
+            "parkings": {"active": t["filter_parkings"], "count": len(kept.get("parkings", []))},
+            "friches": {"active": t["filter_friches"], "count": len(kept.get("friches", []))},
+            "toitures": {"active": t["filter_toitures"], "count": len(kept.get("batiments", []))},
+            "distance_filter": {
+                "active": t["filter_by_distance"],
+                "max_distance_bt": t["max_distance_bt"] if t["filter_by_distance"] else None,
+                "max_distance_hta": t["max_distance_hta"] if t["filter_by_distance"] else None,
+                "poste_type": t["poste_type_filter"] if t["filter_by_distance"] else None
+            }
+        },
+        "rejected": {("toitures" if k == "batiments" else k): v for k, v in rejected.items()},
+    }
+    response["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    counts = ", ".join(f"{k}={v['count']}" for k, v in response["filters_applied"].items() if k != "distance_filter")
+    print(f"🎚️ [REFILTER] {bundle.nom} ({bundle.code}): {counts} en {response['elapsed_ms']} ms")
+    return jsonify(response)
+
 @app.route("/search_toitures_commune_polygon", methods=["GET", "POST"])
 def search_toitures_commune_polygon():
     """
@@ -4644,10 +5040,7 @@ def search_toitures_commune_polygon():
 
     try:
         # 2) Récupération du contour exact de la commune
-        commune_infos = requests.get(
-            f"https://geo.api.gouv.fr/communes?nom={quote_plus(commune)}&fields=centre,contour,code,surface",
-            timeout=15
-        ).json()
+        commune_infos = get_commune_infos(commune, "centre,contour,code,surface")
         
         if not commune_infos or not commune_infos[0].get("contour"):
             return jsonify({"error": "Commune introuvable ou contour non disponible."}), 404
@@ -4680,20 +5073,9 @@ def search_toitures_commune_polygon():
             postes_hta_raw = fetch_wfs_data(HT_POSTE_LAYER, bbox)
             
             # Filtrer les postes qui sont réellement dans la commune
-            postes_bt_data = []
-            postes_hta_data = []
-            
-            for poste in postes_bt_raw:
-                if poste.get("geometry"):
-                    poste_point = shape(poste["geometry"])
-                    if commune_shape.contains(poste_point) or commune_shape.intersects(poste_point):
-                        postes_bt_data.append(poste)
-            
-            for poste in postes_hta_raw:
-                if poste.get("geometry"):
-                    poste_point = shape(poste["geometry"])
-                    if commune_shape.contains(poste_point) or commune_shape.intersects(poste_point):
-                        postes_hta_data.append(poste)
+            commune_clipper = CommuneClipper(commune_shape)
+            postes_bt_data = commune_clipper.clip(postes_bt_raw)
+            postes_hta_data = commune_clipper.clip(postes_hta_raw)
             
             print(f"    📍 {len(postes_bt_data)} postes BT, {len(postes_hta_data)} postes HTA dans la commune")
         except Exception as e:
@@ -4718,36 +5100,30 @@ def search_toitures_commune_polygon():
         print(f"📍 [TOITURES POLYGON] {len(batiments_data['features'])} bâtiments trouvés")
 
         # 6) Filtrage et enrichissement des toitures avec intersection commune
-        to_l93 = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True).transform
         toitures_filtrees = []
+        # Géométries réparées, appartenance à la commune, surfaces et distances en un passage
+        bat_metrics, bat_inside = building_metrics(batiments_data["features"], commune_shape)
+        bat_nearest = DistanceEngine(bt=postes_bt_data, hta=postes_hta_data).query(bat_metrics.centroid_wgs84)
         
         for i, batiment in enumerate(batiments_data["features"]):
             if "geometry" not in batiment:
                 continue
                 
             try:
-                # Vérifier que le bâtiment est bien dans la commune
-                bat_geom = shape(batiment["geometry"])
-                if not bat_geom.is_valid:
-                    bat_geom = bat_geom.buffer(0)
-                    if not bat_geom.is_valid:
-                        continue
-                
-                # Filtrage géographique : le bâtiment doit être dans la commune
-                if not (commune_shape.contains(bat_geom) or commune_shape.intersects(bat_geom)):
+                # Filtrage géographique : le bâtiment (valide) doit être dans la commune
+                if not bat_inside[i]:
                     continue
                 
                 # Surface en m²
-                surface_m2 = shp_transform(to_l93, bat_geom).area
+                surface_m2 = float(bat_metrics.area_m2[i])
                 
                 # Filtrage par surface minimale
                 if surface_m2 < min_surface_toiture:
                     continue
                 
-                # Calcul des distances aux postes
-                centroid = bat_geom.centroid.coords[0]
-                min_distance_bt = calculate_min_distance(centroid, postes_bt_data) if postes_bt_data else None
-                min_distance_hta = calculate_min_distance(centroid, postes_hta_data) if postes_hta_data else None
+                # Distances aux postes
+                min_distance_bt = bat_nearest["bt"]["distance_m"][i]
+                min_distance_hta = bat_nearest["hta"]["distance_m"][i]
                 
                 # Filtrage par distance (optionnel, car on a déjà le filtrage par commune)
                 if min_distance_bt is not None and min_distance_bt > max_distance_bt and \
@@ -4779,6 +5155,7 @@ def search_toitures_commune_polygon():
                 continue
 
         print(f"✅ [TOITURES POLYGON] {len(toitures_filtrees)} toitures filtrées dans la commune")
+        annotate_productible(toitures_filtrees)
 
         # Ajouter liens hypertextes utiles aux toitures (Street View et Annuaire)
         try:
@@ -5078,10 +5455,7 @@ def search_toitures_commune():
 
     # 2) Récupération du contour de la commune
     try:
-        commune_infos = requests.get(
-            f"https://geo.api.gouv.fr/communes?nom={quote_plus(commune)}&fields=centre,contour",
-            timeout=15
-        ).json()
+        commune_infos = get_commune_infos(commune, "centre,contour")
         
         if not commune_infos or not commune_infos[0].get("contour"):
             return jsonify({"error": "Contour de la commune introuvable."}), 404
@@ -5102,29 +5476,10 @@ def search_toitures_commune():
     
     print(f"🏠 [TOITURES] Bbox commune: {bbox}")
 
-    # 4) Récupération des postes pour calculs de distance
-    def filter_in_commune(features):
-        """Filtre les features qui intersectent avec la commune"""
-        filtered = []
-        for f in features:
-            if "geometry" not in f:
-                continue
-            try:
-                geom = shape(f["geometry"])
-                if not geom.is_valid:
-                    geom = geom.buffer(0)
-                    if not geom.is_valid:
-                        continue
-                if geom.intersects(commune_poly):
-                    filtered.append(f)
-            except Exception as e:
-                print(f"⚠️ [TOITURES] Géométrie ignorée: {e}")
-                continue
-        return filtered
-
+    # 4) Récupération des postes pour calculs de distance (découpés au polygone de la commune)
     print(f"🏠 [TOITURES] Récupération des postes...")
-    postes_bt_data = filter_in_commune(fetch_wfs_data(POSTE_LAYER, bbox))
-    postes_hta_data = filter_in_commune(fetch_wfs_data(HT_POSTE_LAYER, bbox))
+    postes_bt_data = fetch_wfs_data(POSTE_LAYER, bbox, geometry=commune_poly)
+    postes_hta_data = fetch_wfs_data(HT_POSTE_LAYER, bbox, geometry=commune_poly)
     
     print(f"    📍 {len(postes_bt_data)} postes BT trouvés")
     print(f"    📍 {len(postes_hta_data)} postes HTA trouvés")
@@ -5148,36 +5503,31 @@ def search_toitures_commune():
     print(f"📍 [TOITURES] {len(batiments_data['features'])} bâtiments trouvés via méthode chunk optimisée")
 
     # 6) Filtrage et enrichissement des toitures avec intersection géométrique précise
-    to_l93 = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True).transform
     toitures_filtrees = []
+    # Géométries réparées, appartenance à la commune, surfaces et distances en un passage
+    bat_metrics, bat_inside = building_metrics(batiments_data["features"], commune_poly)
+    bat_nearest = DistanceEngine(bt=postes_bt_data, hta=postes_hta_data).query(bat_metrics.centroid_wgs84)
     
     for i, batiment in enumerate(batiments_data["features"]):
         if "geometry" not in batiment:
             continue
             
         try:
-            # Vérifier que le bâtiment est bien dans la commune (filtrage géométrique précis)
-            bat_geom = shape(batiment["geometry"])
-            if not bat_geom.is_valid:
-                bat_geom = bat_geom.buffer(0)
-                if not bat_geom.is_valid:
-                    continue
-            
-            # Filtrage géographique : le bâtiment doit être dans la commune
-            if not (commune_poly.contains(bat_geom) or commune_poly.intersects(bat_geom)):
+            # Filtrage géographique : le bâtiment (valide) doit être dans la commune
+            if not bat_inside[i]:
                 continue
             
-            # Calculer la surface de la toiture (= surface du bâtiment)
-            surface_m2 = shp_transform(to_l93, bat_geom).area
+            # Surface de la toiture (= surface du bâtiment)
+            surface_m2 = float(bat_metrics.area_m2[i])
             
             # Filtrage par surface minimale
             if surface_m2 < min_surface_toiture:
                 continue
             
-            # Calcul des distances aux postes
-            centroid = bat_geom.centroid.coords[0]
-            min_distance_bt = calculate_min_distance(centroid, postes_bt_data)
-            min_distance_hta = calculate_min_distance(centroid, postes_hta_data)
+            # Distances aux postes
+            centroid = bat_metrics.centroid(i)
+            min_distance_bt = bat_nearest["bt"]["distance_m"][i]
+            min_distance_hta = bat_nearest["hta"]["distance_m"][i]
             
             # Application du filtre de distance
             distance_ok = True
@@ -5414,23 +5764,32 @@ def rapport_map_point():
         
         # === PARCELLES RPG ===
         try:
-            rpg_candidates = get_rpg_info(lat_float, lon_float, radius=0.01) or []
+            if wfs_binary_reader is not None:
+                # Lecture colonnaire : test d'intersection vectorisé, seules les parcelles retenues passent en GeoJSON
+                rpg_bbox = f"{lon_float - 0.01},{lat_float - 0.01},{lon_float + 0.01},{lat_float + 0.01},EPSG:4326"
+                rpg_table = fetch_wfs_table(PARCELLES_GRAPHIQUES_LAYER, rpg_bbox)
+                rpg_candidates = rpg_table.take(shapely.intersects(rpg_table.geometries, search_point)).to_features()
+                prefiltered = True
+            else:
+                # Transport GeoJSON : les dicts reçus sont testés directement (pas de table intermédiaire)
+                rpg_candidates = get_rpg_info(lat_float, lon_float, radius=0.01) or []
+                prefiltered = False
             for rpg_feat in rpg_candidates:
                 try:
                     rpg_decoded = decode_rpg_feature(rpg_feat)
-                    rpg_geom = shape(rpg_decoded["geometry"])
-                    if rpg_geom.contains(search_point) or rpg_geom.intersects(search_point):
-                        parcelle_data = {
-                            "id_parcel": rpg_decoded["properties"].get("ID_PARCEL", "N/A"),
-                            "surface_ha": rpg_decoded["properties"].get("SURF_PARC", "N/A"),
-                            "code_culture": rpg_decoded["properties"].get("CODE_CULTU", "N/A"), 
-                            "culture": rpg_decoded["properties"].get("Culture", "N/A"),
-                            "commune": rpg_decoded["properties"].get("commune", "N/A"),
-                            "properties": rpg_decoded["properties"],
-                            "geometry": rpg_decoded["geometry"]
-                        }
-                        intersecting_data["rpg_parcelles"].append(parcelle_data)
-                        log_step("POINT", f"✅ Parcelle RPG trouvée: {parcelle_data['id_parcel']}")
+                    if not prefiltered and not shape(rpg_decoded["geometry"]).intersects(search_point):
+                        continue
+                    parcelle_data = {
+                        "id_parcel": rpg_decoded["properties"].get("ID_PARCEL", "N/A"),
+                        "surface_ha": rpg_decoded["properties"].get("SURF_PARC", "N/A"),
+                        "code_culture": rpg_decoded["properties"].get("CODE_CULTU", "N/A"), 
+                        "culture": rpg_decoded["properties"].get("Culture", "N/A"),
+                        "commune": rpg_decoded["properties"].get("commune", "N/A"),
+                        "properties": rpg_decoded["properties"],
+                        "geometry": rpg_decoded["geometry"]
+                    }
+                    intersecting_data["rpg_parcelles"].append(parcelle_data)
+                    log_step("POINT", f"✅ Parcelle RPG trouvée: {parcelle_data['id_parcel']}")
                 except Exception as e:
                     log_step("POINT", f"Erreur traitement parcelle RPG: {e}", "WARNING")
                     
@@ -5580,7 +5939,7 @@ def rapport_map_point():
                     "format": "geojson"
                 }
                 try:
-                    resp = requests.get(url, params=params, timeout=10)
+                    resp = http_session.get(url, params=params, timeout=10)
                     if resp.status_code == 200:
                         return resp.json()
                     else:
@@ -5641,7 +6000,7 @@ def rapport_map_point():
             if not capacites_reseau:
                 log_step("CONTEXT", "Test direct de la couche CAPACITES_RESEAU_LAYER...")
                 bbox_large = f"{lon_float-1},{lat_float-1},{lon_float+1},{lat_float+1},EPSG:4326"
-                capacites_raw = fetch_wfs_data(CAPACITES_RESEAU_LAYER, bbox_large) or []
+                capacites_raw = fetch_wfs_data(CAPACITES_RESEAU_LAYER, bbox_large, property_names=GEOMETRY_ONLY) or []
                 log_step("CONTEXT", f"Test couche directe: {len(capacites_raw)} features trouvées", "INFO")
             
             if capacites_reseau:
@@ -5915,7 +6274,7 @@ def rapport_map_point():
                         }
                         log_step("CONTEXT", f"Recherche services publics par nom commune: {commune_name}", "INFO")
                     
-                    admin_response = requests.get(admin_url, params=admin_params, timeout=15)
+                    admin_response = http_session.get(admin_url, params=admin_params, timeout=15)
                     
                     if admin_response.status_code == 200:
                         admin_json = admin_response.json()
@@ -6109,7 +6468,7 @@ def rapport_map_point():
                 # Fallback avec géocodage inverse
                 try:
                     reverse_url = f"https://api-adresse.data.gouv.fr/reverse/?lon={lon_float}&lat={lat_float}"
-                    response = requests.get(reverse_url, timeout=10)
+                    response = http_session.get(reverse_url, timeout=10)
                     if response.status_code == 200:
                         data = response.json()
                         if data.get('features'):
@@ -6159,7 +6518,7 @@ def rapport_map_point():
                     "format": "geojson"
                 }
                 try:
-                    resp = requests.get(url, params=params, timeout=10)
+                    resp = http_session.get(url, params=params, timeout=10)
                     if resp.status_code == 200:
                         return resp.json()
                     else:
@@ -6272,7 +6631,7 @@ def rapport_map_point():
         # === AJOUT DONNÉES GEORISQUES ===
         log_step("GEORISQUES", "Récupération des données GeoRisques...")
         try:
-            georisques_risks = fetch_georisques_risks(lat_float, lon_float)
+            georisques_risks, report_data["georisques_indisponibles"] = fetch_georisques_risks(lat_float, lon_float)
             if georisques_risks:
                 report_data["georisques_risks"] = georisques_risks
                 log_step("TEMPLATE", f"✅ report_data.georisques_risks: {len(georisques_risks)} catégories")
@@ -6285,6 +6644,7 @@ def rapport_map_point():
         except Exception as geo_e:
             log_step("GEORISQUES", f"❌ Erreur récupération GeoRisques: {geo_e}", "ERROR")
             report_data["georisques_risks"] = {}
+            report_data["georisques_indisponibles"] = [e.key for e in georisques_client.endpoints]
         
         # 🎯 CRUCIAL: Return du template avec les données
         return render_template("rapport_point.html", report=report_data)
@@ -6370,13 +6730,10 @@ import requests
 from urllib.parse import quote_plus
 
 def get_commune_mairie(nom_commune):
-    url = f"https://geo.api.gouv.fr/communes?nom={quote_plus(nom_commune)}&fields=mairie"
     try:
-        resp = requests.get(url, timeout=10)
-        if resp.status_code == 200:
-            info = resp.json()
-            if info and "mairie" in info[0]:
-                return info[0]["mairie"]  # Peut contenir adresse, nom, téléphone, etc.
+        info = get_commune_infos(nom_commune, "mairie", timeout=10)
+        if info and info[0].get("mairie"):
+            return info[0]["mairie"]  # Peut contenir adresse, nom, téléphone, etc.
     except Exception:
         pass
     return None
@@ -6390,10 +6747,36 @@ def compute_commune_report(
     bt_max_km: float = 5.0,
     sirene_km: float = 5.0,
     want_eleveurs: bool = False,
-    reseau_types: list = ["HTA", "BT"]
+    reseau_types: list = ["HTA", "BT"],
+    dept_context=None,
+    code_insee: str = None
 ) -> dict:
-    # 1) Géocodage de la commune
-    coords = geocode_address(commune_name)
+    """
+    Rapport d'une commune (RPG filtrées, postes, éleveurs, carte).
+
+    Args:
+        dept_context: DepartmentContext préchargé (mode département) : RPG, postes et éleveurs
+            sont lus dans ses index au lieu d'être téléchargés pour chaque commune.
+        code_insee (str): Code de la commune, s'il est connu ; distingue les homonymes.
+    """
+    ref = code_insee or commune_name
+    if dept_context is not None and dept_context.commune(ref) is None:
+        dept_context = None
+    if dept_context is not None:
+        partial = dept_context.incomplete(ref)
+        if partial:
+            # Tuiles du préchargement en échec sur cette commune : requêtes directes
+            print(f"⚠️ [DEPT_CONTEXT] {commune_name}: préchargement incomplet ({', '.join(partial)}), requêtes par commune")
+            dept_context = None
+
+    # 1) Géocodage de la commune (contexte département, répertoire local, Nominatim en dernier recours)
+    coords = dept_context.centre(ref) if dept_context is not None else None
+    if coords is None and gazetteer.available:
+        found = gazetteer.search(ref, "centre")
+        if found and found[0].get("centre"):
+            lon_c, lat_c = found[0]["centre"]["coordinates"]
+            coords = (lat_c, lon_c)
+    coords = coords or geocode_address(commune_name)
     if not coords:
         return {}
 
@@ -6402,14 +6785,21 @@ def compute_commune_report(
     r_deg = 5.0 / 111.0
 
     # 2) Chargement des données brutes
-    raw_rpg     = get_rpg_info(lat, lon, radius=r_deg) or []
-    postes_bt   = get_all_postes(lat, lon, radius_deg=r_deg) if "BT" in reseau_types else []
-    postes_hta  = get_all_ht_postes(lat, lon, radius_deg=r_deg) if "HTA" in reseau_types else []
-    parcelles   = get_all_parcelles(lat, lon, radius=sirene_km/111.0)
+    if dept_context is not None:
+        # Mode département : parcelles RPG rattachées à la commune, postes de la même fenêtre qu'en direct
+        window = (lon - r_deg, lat - r_deg, lon + r_deg, lat + r_deg)
+        raw_rpg    = [{**f, "properties": dict(f.get("properties") or {})}
+                      for f in dept_context.assigned("rpg", ref)]
+        postes_bt  = postes_with_distance(dept_context.in_bbox("bt", window), lat, lon) if "BT" in reseau_types else []
+        postes_hta = postes_with_distance(dept_context.in_bbox("hta", window), lat, lon) if "HTA" in reseau_types else []
+    else:
+        raw_rpg     = get_rpg_info(lat, lon, radius=r_deg) or []
+        postes_bt   = get_all_postes(lat, lon, radius_deg=r_deg) if "BT" in reseau_types else []
+        postes_hta  = get_all_ht_postes(lat, lon, radius_deg=r_deg) if "HTA" in reseau_types else []
 
     # 3) Parcelles RPG filtrées
-    proj_metric = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True).transform
-    rpg_features = []
+    proj_metric = transform_func(WGS84, L93)
+    candidates = []
     for feat in raw_rpg:
         dec   = decode_rpg_feature(feat)
         poly  = shape(dec["geometry"])
@@ -6420,11 +6810,14 @@ def compute_commune_report(
         ha = shp_transform(proj_metric, poly).area / 10_000.0
         if ha < min_area_ha or ha > max_area_ha:
             continue
-        cent = poly.centroid.coords[0]
+        candidates.append((poly, props, ha, poly.centroid.coords[0]))
 
-        # Distance aux réseaux
-        d_bt  = calculate_min_distance(cent, postes_bt) if "BT" in reseau_types else None
-        d_hta = calculate_min_distance(cent, postes_hta) if "HTA" in reseau_types else None
+    # Distance aux réseaux : un appel vectorisé par couche pour toutes les parcelles candidates
+    nearest = DistanceEngine(bt=postes_bt, hta=postes_hta).query([c[3] for c in candidates])
+    rpg_kept = []
+    for (poly, props, ha, cent), d_bt, d_hta in zip(candidates, nearest["bt"]["distance_m"], nearest["hta"]["distance_m"]):
+        d_bt  = d_bt if "BT" in reseau_types else None
+        d_hta = d_hta if "HTA" in reseau_types else None
 
         # Filtrage selon le(s) type(s) de réseau sélectionné(s)
         ok = False
@@ -6439,16 +6832,20 @@ def compute_commune_report(
                 ok = True
         if not reseau_types or not ok:
             continue
+        rpg_kept.append((poly, props, ha, cent, d_bt, d_hta))
 
-        # Croisement API Cadastre
-        centroid = poly.centroid
-        geom_query = {
-            "type": "Point",
-            "coordinates": [centroid.x, centroid.y]
-        }
-        cadastre_data = get_api_cadastre_data(geom_query)
-        if cadastre_data and "features" in cadastre_data and cadastre_data["features"]:
-            cad = cadastre_data["features"][0]["properties"]
+    # Croisement cadastre : parcelle sous le centroïde de chaque RPG retenue, en une jointure locale
+    centroids = [poly.centroid for poly, *_ in rpg_kept]
+    try:
+        cadastre_hits = cadastre_snapshots.snapshot(centroids).parcels(centroids, max_match=1) if centroids else []
+    except Exception as e:
+        print(f"⚠️ [RAPPORT_COMMUNE] Instantané cadastre indisponible: {e}")
+        cadastre_hits = [[] for _ in centroids]
+
+    rpg_features = []
+    for (poly, props, ha, cent, d_bt, d_hta), hits in zip(rpg_kept, cadastre_hits):
+        if hits:
+            cad = hits[0].get("properties") or {}
             code_com = cad.get("code_com", "")
             com_abs = cad.get("com_abs", "000")
             section = cad.get("section", "")
@@ -6493,22 +6890,13 @@ def compute_commune_report(
 
     # Infos générales (surface, population, etc.)
     try:
-        resp = requests.get(
-            f"https://geo.api.gouv.fr/communes?nom={quote_plus(commune_name)}&fields=centre,contour,code,population,surface"
-        )
-        if resp.status_code == 200:
-            commune_infos = resp.json()
-            if commune_infos and commune_infos[0].get("centre"):
-                info = commune_infos[0]
-                result["insee"] = info.get("code", "")
-                result["surface"] = round(info.get("surface", 0) / 100, 2)
-                result["population"] = info.get("population", "")
-                result["centroid"] = [info["centre"]["coordinates"][1], info["centre"]["coordinates"][0]]
-            else:
-                result["insee"] = ""
-                result["surface"] = ""
-                result["population"] = ""
-                result["centroid"] = [lat, lon]
+        commune_infos = get_commune_infos(ref, "centre,contour,code,population,surface")
+        if commune_infos and commune_infos[0].get("centre"):
+            info = commune_infos[0]
+            result["insee"] = info.get("code", "")
+            result["surface"] = round(info.get("surface", 0) / 100, 2)
+            result["population"] = info.get("population", "")
+            result["centroid"] = [info["centre"]["coordinates"][1], info["centre"]["coordinates"][0]]
         else:
             result["insee"] = ""
             result["surface"] = ""
@@ -6521,7 +6909,7 @@ def compute_commune_report(
         result["centroid"] = [lat, lon]
 
     # Ajout mairie
-    result["mairie"] = get_commune_mairie(commune_name)
+    result["mairie"] = get_commune_mairie(ref)
 
     # Ajoute les couches réseau SEULEMENT si demandées
     if "BT" in reseau_types:
@@ -6539,7 +6927,11 @@ def compute_commune_report(
     eleveurs_fc = {"type": "FeatureCollection", "features": []}
     if want_eleveurs:
         bbox = f"{lon-0.05},{lat-0.05},{lon+0.05},{lat+0.05},EPSG:4326"
-        for e in fetch_wfs_data(ELEVEURS_LAYER, bbox, srsname="EPSG:4326") or []:
+        if dept_context is not None and dept_context.has_layer("eleveurs"):
+            raw_eleveurs = dept_context.in_bbox("eleveurs", (lon - 0.05, lat - 0.05, lon + 0.05, lat + 0.05))
+        else:
+            raw_eleveurs = fetch_wfs_data(ELEVEURS_LAYER, bbox, srsname="EPSG:4326", property_names=ELEVEUR_PROPERTIES)
+        for e in raw_eleveurs or []:
             props = e.get("properties", {})
             geom = e.get("geometry")
             nom = props.get("nomUniteLe") or props.get("denominati") or ""
@@ -6577,7 +6969,7 @@ def compute_commune_report(
     try:
         folium.GeoJson(result["hta_capacites"], name="Capacités HTA").add_to(m)
         bbox = f"{lon-0.05},{lat-0.05},{lon+0.05},{lat+0.05},EPSG:4326"
-        capa_fc = fetch_wfs_data(CAPACITES_RESEAU_LAYER, bbox, srsname="EPSG:4326")
+        capa_fc = fetch_wfs_data(CAPACITES_RESEAU_LAYER, bbox, srsname="EPSG:4326", property_names=CAPACITES_PROPERTIES)
         result["hta_capacites"] = capa_fc or {"type": "FeatureCollection", "features": []}
     except Exception:
         result["hta_capacites"] = {"type": "FeatureCollection", "features": []}
@@ -6618,66 +7010,188 @@ def compute_commune_report(
     return result
     
 
-@app.route("/generate_reports_by_dept_sse")
-def generate_reports_by_dept_sse():
-    def event_stream():
-        department = request.args.get("department")
-        if not department:
-            yield "event: error\ndata: " + json.dumps({"error": "Paramètre 'department' manquant"}) + "\n\n"
-            return
+def dept_report_params(args):
+    """Paramètres d'un travail dept_report lus dans la requête (valeurs normalisées)."""
+    try:
+        workers = int(args.get("workers", DEPT_REPORT_WORKERS))
+    except ValueError:
+        workers = DEPT_REPORT_WORKERS
+    # Nouveau : lecture de la liste des types de réseau
+    reseau_types_str = args.get("reseau_types", "HTA,BT")
+    return {
+        "department": args.get("department"),
+        "culture": args.get("culture", ""),
+        "min_area_ha": float(args.get("min_area_ha", 0)),
+        "max_area_ha": float(args.get("max_area_ha", 99999)),
+        "ht_max_km": float(args.get("ht_max_distance", 10)),
+        "bt_max_km": float(args.get("bt_max_distance", 10)),
+        "sirene_km": float(args.get("sirene_radius", 5)),
+        "want_eleveurs": args.get("want_eleveurs", "false").lower() == "true",
+        "reseau_types": [t.strip().upper() for t in reseau_types_str.split(",") if t.strip()],
+        "workers": max(1, min(workers, DEPT_REPORT_MAX_WORKERS)),
+    }
 
-        # Lecture des paramètres
-        culture     = request.args.get("culture", "")
-        min_area    = float(request.args.get("min_area_ha", 0))
-        max_area    = float(request.args.get("max_area_ha", 99999))
-        ht_max_km   = float(request.args.get("ht_max_distance", 10))
-        bt_max_km   = float(request.args.get("bt_max_distance", 10))
-        sirene_km   = float(request.args.get("sirene_radius", 5))
-        want_elev   = request.args.get("want_eleveurs", "false").lower() == "true"
-        # Nouveau : lecture de la liste des types de réseau
-        reseau_types_str = request.args.get("reseau_types", "HTA,BT")
-        reseau_types = [t.strip().upper() for t in reseau_types_str.split(",") if t.strip()]
-
-        communes = get_communes_for_dept(department)
-        total = len(communes)
-
-        # CUMULATEURS pour toutes les couches (FeatureCollection pour chaques)
-        def fc_init(): return {"type": "FeatureCollection", "features": []}
-        all_rpg = fc_init()
-        all_postes_bt = fc_init()
-        all_postes_hta = fc_init()
-        all_eleveurs = fc_init()
-
-
-        for idx, feat in enumerate(communes, start=1):
-            nom = feat["properties"]["nom"]
-            rpt = compute_commune_report(
-                commune_name=nom,
-                culture=culture,
-                min_area_ha=min_area,
-                max_area_ha=max_area,
-                ht_max_km=ht_max_km,
-                bt_max_km=bt_max_km,
-                sirene_km=sirene_km,
-                want_eleveurs=want_elev,
-                reseau_types=reseau_types   # <-- Le nouveau paramètre
-            )
-            # CUMULER les couches
-            for fc_key, fc_var in [
-                ("rpg_parcelles", all_rpg),
-                ("postes_bt", all_postes_bt),
-                ("postes_hta", all_postes_hta),
-                ("eleveurs", all_eleveurs),
 
-            ]:
-                layer = rpt.get(fc_key)
-                if layer and isinstance(layer, dict) and layer.get("features"):
-                    fc_var["features"].extend(layer["features"])
+def dept_commune_key(feat):
+    """Clé de point de reprise d'une commune : code INSEE, nom à défaut."""
+    props = feat["properties"]
+    return props.get("code") or props["nom"]
 
-            yield f"event: progress\ndata: [{idx}/{total}] {nom}\n\n"
-            yield f"event: result\ndata: {json.dumps(rpt, ensure_ascii=False)}\n\n"
 
-    return Response(stream_with_context(event_stream()), mimetype="text/event-stream")
+def run_dept_report_job(job):
+    """
+    Travail dept_report : un rapport par commune du département, chacun enregistré
+    comme point de reprise. Une reprise (worker redémarré) saute les communes déjà faites.
+    """
+    p = job.params
+    department = p["department"]
+    reseau_types = p["reseau_types"]
+    workers = p["workers"]
+
+    communes = get_communes_for_dept(department)
+    total = len(communes)
+    job.set_total(total)
+    # Points de reprise par code INSEE : deux communes homonymes restent distinctes
+    names = {dept_commune_key(feat): feat["properties"]["nom"] for feat in communes}
+    already = job.done_keys()
+    pending = [feat for feat in communes if dept_commune_key(feat) not in already]
+    if already:
+        print(f"🔁 [DEPT_JOB] {department}: reprise, {len(already)}/{total} communes déjà traitées")
+    if not pending:
+        return
+
+    # Couches lues une fois pour tout le département, puis réparties par commune
+    wgs84_bbox = lambda bounds: format_bbox(bounds, "EPSG:4326")
+    # Lectures qui lèvent en cas d'échec : une tuile perdue n'est pas une tuile vide
+    layers = {"rpg": lambda b: fetch_wfs_data_or_raise(PARCELLES_GRAPHIQUES_LAYER, wgs84_bbox(b))}
+    if "BT" in reseau_types:
+        layers["bt"] = lambda b: fetch_wfs_data_or_raise(POSTE_LAYER, wgs84_bbox(b))
+    if "HTA" in reseau_types:
+        layers["hta"] = lambda b: fetch_wfs_data_or_raise(HT_POSTE_LAYER, wgs84_bbox(b))
+    if p["want_eleveurs"]:
+        layers["eleveurs"] = lambda b: fetch_wfs_data_or_raise(ELEVEURS_LAYER, wgs84_bbox(b),
+                                                               property_names=ELEVEUR_PROPERTIES)
+    job.message(f"📦 Préchargement des couches du département {department}...")
+    dept_context = DepartmentContext(pending, layers, tile_size=DEPT_PREFETCH_TILE_SIZE, workers=workers)
+    try:
+        counts = dept_context.load()
+        job.message(f"📦 {', '.join(f'{k}: {n}' for k, n in counts.items())}")
+    except Exception as e:
+        print(f"⚠️ [DEPT_JOB] Préchargement impossible, requêtes par commune: {e}")
+        dept_context = None
+
+    def report_for(key):
+        rpt = compute_commune_report(
+            commune_name=names[key],
+            culture=p["culture"],
+            min_area_ha=p["min_area_ha"],
+            max_area_ha=p["max_area_ha"],
+            ht_max_km=p["ht_max_km"],
+            bt_max_km=p["bt_max_km"],
+            sirene_km=p["sirene_km"],
+            want_eleveurs=p["want_eleveurs"],
+            reseau_types=reseau_types,   # <-- Le nouveau paramètre
+            dept_context=dept_context,
+            code_insee=key if key != names[key] else None
+        )
+        if not rpt:
+            # Commune non localisée : échec retenté puis signalé, pas un rapport vide réussi
+            raise LookupError(f"commune {names[key]} introuvable (géocodage)")
+        return rpt
+
+    def on_retry(key, error, attempt):
+        print(f"🔁 [DEPT_JOB] {names[key]}: {error} — tentative {attempt}/{DEPT_REPORT_RETRIES + 1}")
+
+    print(f"🚀 [DEPT_JOB] {department}: {len(pending)}/{total} communes, {workers} en parallèle")
+    # Communes traitées en parallèle ; chaque rapport est enregistré dès qu'il est prêt
+    outcomes = stream_unordered(
+        report_for, [dept_commune_key(feat) for feat in pending],
+        max_workers=workers, retries=DEPT_REPORT_RETRIES, on_retry=on_retry,
+    )
+    try:
+        for outcome in outcomes:
+            if outcome.ok:
+                job.checkpoint(outcome.item, outcome.result)
+            else:
+                print(f"❌ [DEPT_JOB] {names[outcome.item]}: {outcome.error}")
+                job.checkpoint(outcome.item, {"nom": names[outcome.item]}, error=str(outcome.error))
+    finally:
+        outcomes.close()   # travail annulé : communes non démarrées abandonnées
+
+
+def job_event_stream(job_id, after=0):
+    """
+    Flux SSE d'un travail : progress / result par élément, puis end.
+    Chaque result porte l'id "<job>:<seq>" : un EventSource qui se reconnecte
+    (Last-Event-ID) reprend le flux là où il s'était arrêté.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        yield "event: error\ndata: " + json.dumps({"error": "Travail inconnu"}) + "\n\n"
+        return
+    n = sum(1 for item in job_store.items(job_id, 0, with_results=False) if item["seq"] <= after)
+    yield f"id: {job_id}:{after}\nevent: job\ndata: {json.dumps({'id': job_id, 'status': job['status']})}\n\n"
+    waiting_notified = False
+    for event in job_store.follow(job_id, after):
+        kind = event["type"]
+        if kind == "message":
+            if event["job"]["message"]:
+                yield f"event: progress\ndata: {event['job']['message']}\n\n"
+        elif kind == "item":
+            n += 1
+            total = (job_store.get(job_id) or job)["progress"]["total"] or n
+            label = (event["result"] or {}).get("nom") or event["key"]
+            if event["status"] == "failed":
+                yield f"id: {job_id}:{event['seq']}\nevent: progress\ndata: [{n}/{total}] {label} ❌ {event['error']}\n\n"
+                continue
+            yield f"event: progress\ndata: [{n}/{total}] {label}\n\n"
+            yield f"id: {job_id}:{event['seq']}\nevent: result\ndata: {json.dumps(event['result'], ensure_ascii=False)}\n\n"
+        elif kind == "idle":
+            if event["job"]["status"] == "queued" and not waiting_notified:
+                waiting_notified = True
+                yield "event: progress\ndata: ⏳ En attente d'un worker disponible...\n\n"
+            else:
+                yield ": keepalive\n\n"
+        elif kind == "end":
+            job = event["job"]
+            progress = job["progress"]
+            if job["status"] == "done":
+                elapsed = (job["finished"] or 0) - (job["started"] or job["created"])
+                ok = progress["done"]
+                total = progress["total"] if progress["total"] is not None else ok + progress["failed"]
+                failed = progress["failed"]
+                yield f"event: end\ndata: ✅ {ok}/{total} communes traitées en {elapsed:.0f}s" \
+                      f"{f' ({failed} en échec)' if failed else ''}\n\n"
+            elif job["status"] == "cancelled":
+                yield "event: end\ndata: ⏹️ Travail annulé\n\n"
+            else:
+                yield f"event: end\ndata: ❌ Travail en échec: {job['error']}\n\n"
+
+
+def _job_cursor(last_event_id):
+    """(job, seq) d'un Last-Event-ID "<job>:<seq>", (None, 0) sinon."""
+    try:
+        job_id, seq = (last_event_id or "").split(":")
+        return job_id, int(seq)
+    except ValueError:
+        return None, 0
+
+
+@app.route("/generate_reports_by_dept_sse")
+def generate_reports_by_dept_sse():
+    """
+    Vue SSE d'un travail dept_report : le soumet (ou rejoint le travail identique en cours),
+    puis relaie son avancement. ?job=<id> ou Last-Event-ID : suit un travail existant.
+    """
+    job_id, after = _job_cursor(request.headers.get("Last-Event-ID"))
+    job_id = request.args.get("job") or job_id
+    if not job_id:
+        if not request.args.get("department"):
+            def missing():
+                yield "event: error\ndata: " + json.dumps({"error": "Paramètre 'department' manquant"}) + "\n\n"
+            return Response(missing(), mimetype="text/event-stream")
+        job_id = job_store.submit("dept_report", dept_report_params(request.args))
+    return Response(stream_with_context(job_event_stream(job_id, after)), mimetype="text/event-stream")
 
 """ CORRUPTED BLOCK START — IGNORE BELOW UNTIL CORRUPTED BLOCK END
 18	162	N/A	BT
@@ -9364,14 +9878,60 @@ IGN, OSM, Cadastre, RPG, GeoRisques, SIRENEmmune_name=nom,
 
 CORRUPTED BLOCK END """
 
+def job_dept_reports(job_id):
+    """Rapports communaux réussis d'un travail dept_report, relus par lots depuis la base des travaux."""
+    for item in job_store.iter_items(job_id, status="done"):
+        if item["result"]:
+            yield item["result"]
+
+
+def rapport_departement_job(job_id):
+    """
+    Rapport départemental d'un travail dept_report terminé, sans repasser par le navigateur.
+
+    Deux lectures en flux des rapports : la première alimente la synthèse (TOP borné,
+    compteurs), la seconde est consommée par le template au fil du rendu. Seul le lot
+    de rapports en cours de lecture est en mémoire.
+    """
+    job = job_store.get(job_id)
+    if job is None or job["kind"] != "dept_report":
+        return "Travail inconnu", 404
+    if job["status"] in JOB_ACTIVE:
+        return jsonify(job), 202
+
+    synthese = synthese_departement(job_dept_reports(job_id))
+    synthese["top50_parcelles"] = fix_cadastre_links(fix_distances_in_top50(synthese["top50_parcelles"]))
+
+    def reports():
+        for rpt in job_dept_reports(job_id):
+            fc_e = rpt.get("eleveurs")
+            if fc_e and isinstance(fc_e, dict):
+                enrich_eleveurs_with_siret(fc_e.get("features") or [])
+            yield rpt
+
+    print(f"📦 [RAPPORT_DEPT] Travail {job_id}: rendu en flux ({synthese['total_parcelles']} parcelles)")
+    return Response(stream_template(
+        "rapport_departement_complet.html",
+        reports=reports(),
+        dept=job["params"].get("department"),
+        synthese=synthese,
+    ), mimetype="text/html")
+
+
 @app.route("/rapport_departement")
 def rapport_departement():
+    # Rapport d'un travail dept_report terminé (?job=<id>)
+    job_id = request.args.get("job")
+    if job_id:
+        return rapport_departement_job(job_id)
+
     dept = request.args.get("dept")
     if not dept:
         return "Département requis", 400
 
     communes = get_communes_for_dept(dept)
     all_reports = []
+    agg = DeptAggregate(50)
     for feat in communes:
         nom = feat["properties"]["nom"]
         rpt = compute_commune_report(
@@ -9384,11 +9944,11 @@ def rapport_departement():
             sirene_km=float(request.args.get("sirene_radius", 5.0)),
             want_eleveurs=True
         )
-        # Structure des données complète pour la synthèse
         all_reports.append(rpt)
+        agg.add_report(rpt)
 
-    # Calcul de la synthèse départementale
-    synthese = synthese_departement(all_reports)
+    # Calcul de la synthèse départementale (agrégat alimenté commune par commune)
+    synthese = synthese_departement(agg)
     
     print(f"[RAPPORT_DEPT_GET] Synthèse calculée: {synthese['total_eleveurs']} éleveurs, {synthese['total_parcelles']} parcelles")
 
@@ -9754,7 +10314,7 @@ def search_by_address_route():
     print("[DEBUG build_map args] capacites_reseau:", type(capacites_reseau), ensure_feature_list(capacites_reseau)[:1])
 
     # 8. GeoRisques: fetch risks for this point
-    georisques_risks = fetch_georisques_risks(lat, lon)
+    georisques_risks, georisques_indisponibles = fetch_georisques_risks(lat, lon)
 
     # 9. Réponse complète
     info_response = {
@@ -9781,6 +10341,8 @@ def search_by_address_route():
         "api_nature": flatten_feature_collections(api_nature),
         "api_urbanisme": api_urbanisme,   # dict {nom: FeatureCollection}
         "georisques_risks": georisques_risks,
+        # Catégories en erreur ou hors délai : listes vides ci-dessus, mais non « sans risque »
+        "georisques_indisponibles": georisques_indisponibles,
     }
 
     # 9. Remplissage du résumé
@@ -9876,132 +10438,65 @@ def search_by_address_route():
 def rapport_departement_post():
     """
     Route POST corrigée pour le rapport départemental
+
+    Corps NDJSON (un rapport par ligne) : la synthèse se calcule à la lecture du corps,
+    recopié dans un fichier temporaire que le template relit au fil du rendu. Seul le
+    rapport en cours est en mémoire, comme pour le rendu d'un travail dept_report.
     """
-    import time
-    
+    import tempfile
+
     try:
-        data = request.get_json()
-        reports = data.get("data", [])
-        
-        print(f"[RAPPORT_DEPT] Traitement de {len(reports)} rapports communaux")
-        
-        # Détection du département
+        # Corps NDJSON (un rapport par ligne, lu au fil de l'eau) ou JSON {"data": [...]}
+        agg = DeptAggregate(50)
         dept = None
-        for rpt in reports:
-            if "dept" in rpt and rpt["dept"]:
-                dept = rpt["dept"]
-                break
-        
+        if request.mimetype == "application/x-ndjson":
+            spool = tempfile.TemporaryFile("w+b")
+            for line in request.stream:
+                if line.strip():
+                    rpt = json.loads(line)
+                    agg.add_report(rpt)
+                    dept = dept or rpt.get("dept")
+                    spool.write(line.rstrip(b"\r\n") + b"\n")
+            spool.seek(0)
+
+            def read_reports():
+                with spool:
+                    for line in spool:
+                        yield json.loads(line)
+        else:
+            data = request.get_json()
+            reports = data.get("data", [])
+            agg.add_reports(reports)
+            dept = next((rpt["dept"] for rpt in reports if rpt.get("dept")), None)
+
+            def read_reports():
+                return iter(reports)
+
+        print(f"[RAPPORT_DEPT] Traitement de {agg.communes} rapports communaux")
         print(f"[RAPPORT_DEPT] Département détecté: {dept}")
-        
-        # Utilisation de la fonction synthese_departement corrigée
-        synthese = synthese_departement(reports)
-        
-        # Enrichissement SIRET pour les éleveurs dans le TOP 50
-        def enrich_eleveurs_with_siret(eleveurs_features):
-            """Enrichit les éleveurs avec les données SIRET"""
-            enriched = []
-            for feat in eleveurs_features:
-                props = feat.get("properties", {})
-                
-                # Tentative d'enrichissement SIRET
-                siret = props.get("siret") or props.get("SIRET")
-                if siret:
-                    try:
-                        sirene_info = fetch_sirene_info(siret)
-                        if sirene_info:
-                            props.update(sirene_info)
-                            props["siret_enriched"] = True
-                        else:
-                            props["siret_enriched"] = False
-                    except Exception as e:
-                        print(f"[RAPPORT_DEPT] Erreur enrichissement SIRET {siret}: {e}")
-                        props["siret_enriched"] = False
-                else:
-                    props["siret_enriched"] = False
-                    
-                enriched.append(feat)
-            return enriched
-        
-        # Correction des distances "N/A m" dans le TOP 50
-        def fix_distances_in_top50(top50_features):
-            """Corrige les distances affichées comme 'N/A m'"""
-            fixed = []
-            for feat in top50_features:
-                props = feat.get("properties", {})
-                
-                # Calcul de la distance minimale
-                min_distance = None
-                distance_sources = ["distance_bt", "distance_au_poste", "distance_hta", "min_bt_distance_m", "min_ht_distance_m"]
-                
-                for key in distance_sources:
-                    val = props.get(key)
-                    if val is not None and isinstance(val, (int, float)) and val > 0:
-                        if min_distance is None or val < min_distance:
-                            min_distance = val
-                
-                # Mise à jour des propriétés de distance
-                if min_distance is not None:
-                    props["distance_formatted"] = f"{int(min_distance)} m"
-                    props["distance_valid"] = True
-                else:
-                    props["distance_formatted"] = "Distance non calculée"
-                    props["distance_valid"] = False
-                
-                fixed.append(feat)
-            return fixed
-        
+
+        synthese = synthese_departement(agg)
         # Application des corrections
-        top50_corrected = fix_distances_in_top50(synthese["top50_parcelles"])
-        synthese["top50_parcelles"] = top50_corrected
-        
-        # Enrichissement des éleveurs du département
-        all_eleveurs = []
-        for rpt in reports:
-            fc_e = rpt.get("eleveurs", {})
-            if fc_e and isinstance(fc_e, dict) and "features" in fc_e:
-                all_eleveurs.extend(fc_e.get("features", []))
-        
-        all_eleveurs_enriched = enrich_eleveurs_with_siret(all_eleveurs)
-        
-        # Correction des liens cadastre dans le TOP 50
-        def fix_cadastre_links(top50_features):
-            """Corrige les liens vers le cadastre"""
-            for feat in top50_features:
-                props = feat.get("properties", {})
-                
-                # Construction du lien cadastre
-                code_commune = props.get("code_com") or props.get("com_abs")
-                section = props.get("section") or props.get("cadastre_section")
-                numero = props.get("numero") or props.get("cadastre_numero") or props.get("numero_parcelle")
-                
-                if code_commune and section and numero and numero != "N/A":
-                    cadastre_url = f"https://www.cadastre.gouv.fr/scpc/accueil.do#c={code_commune}&sec={section}&n={numero}"
-                    props["cadastre_link"] = cadastre_url
-                    props["cadastre_link_valid"] = True
-                else:
-                    props["cadastre_link"] = None
-                    props["cadastre_link_valid"] = False
-            
-            return top50_features
-        
-        synthese["top50_parcelles"] = fix_cadastre_links(synthese["top50_parcelles"])
-        
+        synthese["top50_parcelles"] = fix_cadastre_links(fix_distances_in_top50(synthese["top50_parcelles"]))
+
         print(f"[RAPPORT_DEPT] Synthèse finale: {synthese['total_eleveurs']} éleveurs, {synthese['total_parcelles']} parcelles")
         print(f"[RAPPORT_DEPT] TOP 50 avec {len(synthese['top50_parcelles'])} parcelles")
-        print(f"[RAPPORT_DEPT] Clés synthèse: {list(synthese.keys())}")
-        print(f"[RAPPORT_DEPT] nb_agriculteurs: {synthese.get('nb_agriculteurs')}")
-        print(f"[RAPPORT_DEPT] nb_parcelles: {synthese.get('nb_parcelles')}")
-        print(f"[RAPPORT_DEPT] Transmission au template: synthese={bool(synthese)}, dept={dept}")
-        
-        return render_template(
+
+        def reports_enriched():
+            # Éleveurs enrichis (SIRET) rapport par rapport, au moment du rendu
+            for rpt in read_reports():
+                fc_e = rpt.get("eleveurs")
+                if fc_e and isinstance(fc_e, dict):
+                    enrich_eleveurs_with_siret(fc_e.get("features") or [])
+                yield rpt
+
+        return Response(stream_template(
             "rapport_departement_complet.html",
-            reports=reports,
+            reports=reports_enriched(),
             dept=dept,
             synthese=synthese,
-            eleveurs_enriched=all_eleveurs_enriched
-        )
-        
+        ), mimetype="text/html")
+
     except Exception as e:
         print(f"[RAPPORT_DEPT] Erreur: {e}")
         import traceback
@@ -10026,7 +10521,7 @@ def carte_risques():
     
     try:
         # Récupérer les risques GeoRisques
-        georisques_risks = fetch_georisques_risks(lat, lon)
+        georisques_risks, georisques_indisponibles = fetch_georisques_risks(lat, lon)
         
         # Couleurs par catégorie de risque
         risk_colors = {
@@ -10136,6 +10631,8 @@ def carte_risques():
         <p><i class="fa fa-circle" style="color:purple"></i> Risque sismique</p>
         <p><i class="fa fa-circle" style="color:green"></i> Autres risques</p>
         <small>Total: ''' + str(risks_added) + ''' risques géolocalisés</small>
+        ''' + ('<p style="color:#c60"><small>Indisponibles (API GeoRisques) : ' + ", ".join(georisques_indisponibles)
+               + '</small></p>' if georisques_indisponibles else "") + '''
         </div>
         '''
         carte.get_root().html.add_child(folium.Element(legend_html))
@@ -10289,7 +10786,7 @@ def debug_api_nature():
                 params = {"geom": json.dumps(geom), "_limit": 100}
                 
                 import requests
-                response = requests.get(url, params=params, timeout=10)
+                response = http_session.get(url, params=params, timeout=10)
                 
                 if response.status_code == 200:
                     data = response.json()
@@ -10452,6 +10949,76 @@ def debug_cout_hta():
         print(f"💰 [DEBUG COUT] Erreur: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/debug_stats")
+def debug_stats():
+    """Compteurs de performance (cache WFS : hits/misses, occupation) pour dimensionner les caches."""
+    return jsonify({
+        "wfs_cache": wfs_tile_cache.stats() if wfs_tile_cache is not None else {"enabled": False},
+        "single_flight": upstream_flight.stats(),
+        "layer_store": {"backend": LAYER_BACKEND, "layers": layer_store.layers()} if layer_store else {"backend": LAYER_BACKEND},
+        "map_lod": {"maps": len(map_lod_cache), "last_map": map_lod_cache.last_stats},
+        "upstream_http": http_session.stats(),
+        "disk_cache": disk_cache.stats() if disk_cache is not None else {"enabled": False},
+        "cadastre_snapshots": cadastre_snapshots.stats(),
+        "georisques": georisques_client.stats(),
+        "dem": dem_store.stats(),
+        "pvgis": pvgis_yield.stats(),
+        "gazetteer": gazetteer.stats(),
+        "jobs": job_store.stats(),
+        "commune_bundles": commune_bundles.stats(),
+    })
+
+@app.route("/purge_wfs_cache", methods=["POST"])
+@require_admin
+def purge_wfs_cache():
+    """Vide le cache de tuiles WFS (toutes les couches ou ?layer=...)."""
+    if wfs_tile_cache is None:
+        return {"purged": 0}
+    layer = request.args.get("layer")
+    purged = wfs_tile_cache.invalidate_layer(layer) if layer else wfs_tile_cache.clear()
+    return {"purged": purged}
+
+@app.route("/feature_details")
+def feature_details():
+    """
+    Attributs complets d'une feature (chargés à l'ouverture d'un popup, les recherches
+    ne lisant que les attributs utiles). Paramètres: layer, id, format=json|html.
+    """
+    from markupsafe import escape
+    layer = request.args.get("layer", "")
+    feature_id = request.args.get("id", "")
+    if layer not in STORE_LAYERS or not feature_id:
+        return jsonify({"error": "Paramètres layer/id invalides"}), 400
+    try:
+        feature = fetch_wfs_feature_by_id(layer, feature_id)
+    except Exception as e:
+        print(f"⚠️ [FEATURE_DETAILS] {layer} {feature_id}: {e}")
+        return jsonify({"error": "GeoServer indisponible"}), 502
+    if feature is None:
+        return jsonify({"error": "Feature introuvable"}), 404
+    if request.args.get("format") == "html":
+        rows = "".join(
+            f"<tr><th>{escape(k)}</th><td>{escape(v)}</td></tr>"
+            for k, v in (feature.get("properties") or {}).items()
+        )
+        return f"<table border='1' cellpadding='4'>{rows}</table>"
+    return jsonify(feature)
+
+@app.route("/map_lod/<map_id>/<level>")
+def map_lod(map_id, level):
+    """Géométries d'une carte générée au niveau de détail demandé ({couche JS: géométrie})."""
+    try:
+        lod = map_lod_cache.get(map_id)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ [MAP_LOD] Carte {map_id} illisible: {e}")
+        lod = None
+    if lod is None:
+        return jsonify({"error": "Carte inconnue ou expirée"}), 404
+    try:
+        return jsonify(lod.level(level))
+    except KeyError:
+        return jsonify({"error": f"Niveau inconnu: {level}"}), 400
+
 def open_browser():
     # Protection contre l'ouverture multiple de navigateurs
     if hasattr(open_browser, '_opened'):
@@ -10464,6 +11031,8 @@ def main():
         print("Routes disponibles:")
         pprint.pprint(list(app.url_map.iter_rules()))
         Timer(1, open_browser).start()
+        # Serveur local : pas de job_worker.py séparé, les travaux tournent dans ce processus
+        start_job_runner(max(1, JOB_INPROCESS_WORKERS))
         app.run(host="127.0.0.1", port=5000, debug=False)  # Debug False pour éviter les reloads multiples
     except Exception as e:
         import traceback
@@ -10524,9 +11093,7 @@ def generate_integrated_commune_report(commune_name, filters=None):
     try:
         start_ts = time.time()
         # 1. Récupération des informations de base de la commune
-        commune_infos = requests.get(
-            f"https://geo.api.gouv.fr/communes?nom={quote_plus(commune_name)}&fields=centre,contour,population,codesPostaux,departement"
-        ).json()
+        commune_infos = get_commune_infos(commune_name, "code,centre,contour,population,codesPostaux,departement")
         
         if not commune_infos:
             return {"error": f"Commune '{commune_name}' introuvable"}
@@ -10542,7 +11109,7 @@ def generate_integrated_commune_report(commune_name, filters=None):
         commune_poly = shape(contour)
         
         # Transformer pour calculer la superficie
-        to_l93 = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True).transform
+        to_l93 = transform_func(WGS84, L93)
         superficie_ha = shp_transform(to_l93, commune_poly).area / 10000.0
         
         # 2. Optimisation géométrique pour éviter les erreurs 414
@@ -10569,32 +11136,40 @@ def generate_integrated_commune_report(commune_name, filters=None):
         minx, miny, maxx, maxy = commune_poly.bounds
         bbox = f"{minx},{miny},{maxx},{maxy},EPSG:4326"
         
-        def filter_in_commune(features):
-            filtered = []
-            for f in features:
-                if "geometry" not in f:
-                    continue
-                try:
-                    geom = shape(f["geometry"])
-                    if not geom.is_valid:
-                        geom = geom.buffer(0)
-                    if geom.intersects(commune_poly):
-                        filtered.append(f)
-                except Exception:
-                    continue
-            return filtered
-        
         # Récupération des données
         rpg_data = get_rpg_info_by_polygon(contour) if filters.get("filter_rpg", True) else []
-        postes_bt_data = filter_in_commune(fetch_wfs_data(POSTE_LAYER, bbox))
-        postes_hta_data = filter_in_commune(fetch_wfs_data(HT_POSTE_LAYER, bbox))
+        postes_bt_data = fetch_wfs_data(POSTE_LAYER, bbox, geometry=commune_poly, property_names=POSTE_LABEL_PROPERTIES)
+        postes_hta_data = fetch_wfs_data(HT_POSTE_LAYER, bbox, geometry=commune_poly, property_names=POSTE_LABEL_PROPERTIES)
+        # Index des postes construits une fois pour toutes les couches du rapport
+        distance_engine = DistanceEngine(bt=postes_bt_data, hta=postes_hta_data)
+
+        def _poste_distances(centroids):
+            """[(distance BT, distance HTA)] en mètres par centroïde (lon, lat) ; (None, None) si centroïde None."""
+            known = [i for i, c in enumerate(centroids) if c is not None]
+            nearest = distance_engine.query([tuple(centroids[i]) for i in known])
+            out = [(None, None)] * len(centroids)
+            for j, i in enumerate(known):
+                out[i] = (nearest["bt"]["distance_m"][j], nearest["hta"]["distance_m"][j])
+            return out
+
+        def _feature_centroids(features):
+            """Centroïdes (lon, lat) des features, None si la géométrie est absente ou illisible."""
+            out = []
+            for feat in features:
+                try:
+                    c = shape(feat["geometry"]).centroid
+                    out.append((c.x, c.y))
+                except Exception:
+                    out.append(None)
+            return out
+
         parkings_data = get_parkings_info_by_polygon(contour) if filters.get("filter_parkings", True) else []
         friches_data = get_friches_info_by_polygon(contour) if filters.get("filter_friches", True) else []
         
         # Éleveurs sur la commune
         eleveurs_data = []
         try:
-            eleveurs_raw = filter_in_commune(fetch_wfs_data(ELEVEURS_LAYER, bbox))
+            eleveurs_raw = fetch_wfs_data(ELEVEURS_LAYER, bbox, geometry=commune_poly, property_names=ELEVEUR_PROPERTIES)
             for e in eleveurs_raw:
                 props = e.get("properties", {})
                 geom = e.get("geometry")
@@ -10664,26 +11239,22 @@ def generate_integrated_commune_report(commune_name, filters=None):
                 batiments = batiments_fc.get("features", [])
                 print(f"    🏠 Bâtiments OSM bruts: {len(batiments)}")
 
-                for b in batiments:
+                # Géométries réparées, double garde commune, surfaces et centroïdes en un passage
+                bat_metrics, bat_inside = building_metrics(batiments, commune_poly)
+                bat_distances = _poste_distances(bat_metrics.centroid_wgs84)
+
+                for i, b in enumerate(batiments):
                     try:
-                        geom = shape(b.get("geometry"))
-                        if not geom.is_valid:
-                            geom = geom.buffer(0)
-                            if not geom.is_valid:
-                                continue
-                        # Double garde: doit intersecter la commune
-                        if not (commune_poly.contains(geom) or commune_poly.intersects(geom)):
+                        if not bat_inside[i]:
                             continue
 
                         # Surface en m²
-                        surface_m2 = shp_transform(to_l93, geom).area
-                        if surface_m2 < min_surface:
+                        surface_m2 = float(bat_metrics.area_m2[i])
+                        if not surface_m2 >= min_surface:
                             continue
 
                         # Distances aux postes
-                        centroid = geom.centroid.coords[0]
-                        d_bt = calculate_min_distance(centroid, postes_bt_data) if postes_bt_data else None
-                        d_hta = calculate_min_distance(centroid, postes_hta_data) if postes_hta_data else None
+                        d_bt, d_hta = bat_distances[i]
 
                         # Filtrage distance suivant le type de poste sélectionné
                         if filter_by_distance:
@@ -10741,7 +11312,7 @@ def generate_integrated_commune_report(commune_name, filters=None):
         # Parkings: surface minimale et distance
         if parkings_data:
             parking_min_area = float(filters.get("parking_min_area", 1500.0))
-            filtered_pk = []
+            candidates_pk = []
             for feat in parkings_data:
                 try:
                     geom = feat.get("geometry")
@@ -10756,9 +11327,13 @@ def generate_integrated_commune_report(commune_name, filters=None):
                     if area_m2 < parking_min_area:
                         continue
                     c = shp.centroid
-                    lat_c, lon_c = c.y, c.x
-                    d_bt = calculate_min_distance((lon_c, lat_c), postes_bt_data) if postes_bt_data else None
-                    d_hta = calculate_min_distance((lon_c, lat_c), postes_hta_data) if postes_hta_data else None
+                    candidates_pk.append((feat, area_m2, (c.x, c.y)))
+                except Exception:
+                    continue
+            filtered_pk = []
+            pk_distances = _poste_distances([c for _, _, c in candidates_pk])
+            for (feat, area_m2, _), (d_bt, d_hta) in zip(candidates_pk, pk_distances):
+                try:
                     if not _distance_ok(d_bt, d_hta):
                         continue
                     # Annoter pour réutiliser ensuite
@@ -10777,7 +11352,7 @@ def generate_integrated_commune_report(commune_name, filters=None):
         # Friches: surface minimale et distance
         if friches_data:
             friches_min_area = float(filters.get("friches_min_area", 1000.0))
-            filtered_fr = []
+            candidates_fr = []
             for feat in friches_data:
                 try:
                     geom = feat.get("geometry")
@@ -10793,9 +11368,13 @@ def generate_integrated_commune_report(commune_name, filters=None):
                     if area_m2 < friches_min_area:
                         continue
                     c = shp.centroid
-                    lat_c, lon_c = c.y, c.x
-                    d_bt = calculate_min_distance((lon_c, lat_c), postes_bt_data) if postes_bt_data else None
-                    d_hta = calculate_min_distance((lon_c, lat_c), postes_hta_data) if postes_hta_data else None
+                    candidates_fr.append((feat, area_m2, (c.x, c.y)))
+                except Exception:
+                    continue
+            filtered_fr = []
+            fr_distances = _poste_distances([c for _, _, c in candidates_fr])
+            for (feat, area_m2, _), (d_bt, d_hta) in zip(candidates_fr, fr_distances):
+                try:
                     if not _distance_ok(d_bt, d_hta):
                         continue
                     props = (feat.get('properties') or {}).copy()
@@ -10821,8 +11400,18 @@ def generate_integrated_commune_report(commune_name, filters=None):
         
         # APIs enrichies
         api_cadastre = get_api_cadastre_data(contour_optimise)
-        api_nature = get_all_api_nature_data(contour_optimise)
-        api_urbanisme = get_all_gpu_data(contour_optimise)
+        # Parcelles complètes de la commune (l'appel ci-dessus est plafonné à 1000) pour les références
+        try:
+            # Clé par code INSEE : deux communes homonymes ne partagent pas leur instantané
+            code_insee = commune_info.get("code")
+            cadastre_snapshot = cadastre_snapshots.snapshot(
+                [contour], key=f"commune:{code_insee}" if code_insee else None
+            )
+        except Exception as e:
+            print(f"⚠️ [RAPPORT_INTÉGRÉ] Instantané cadastre indisponible: {e}")
+            cadastre_snapshot = CadastreSnapshot((api_cadastre or {}).get("features", []) if isinstance(api_cadastre, dict) else [])
+        api_nature = get_all_api_nature_data(contour)
+        api_urbanisme = get_all_gpu_data(contour)
 
         # Collecte et analyse des zones d'urbanisme (PLU/GPU)
         # Utiliser la logique d'optimisation des zones directement
@@ -10852,7 +11441,7 @@ def generate_integrated_commune_report(commune_name, filters=None):
                     params = {"geom": json.dumps(bbox_geojson), "_limit": 1000}
                     
                     try:
-                        resp = requests.get(api_url, params=params, timeout=30)
+                        resp = http_session.get(api_url, params=params, timeout=30)
                         if resp.status_code == 200:
                             return resp.json().get('features', [])
                         return []
@@ -10875,53 +11464,43 @@ def generate_integrated_commune_report(commune_name, filters=None):
                 if zones_type_filter:
                     print(f"    🎯 {len(target_zones)} zones de type '{zones_type_filter}' sélectionnées")
                 
+                # Intersection avec la commune (géométries réparées en lot), surfaces et centroïdes
+                zones_inside, zones_geoms = CommuneClipper(commune_poly).mask(target_zones)
+                zones_metrics = LayerMetrics(zones_geoms)
+                zones_distances = _poste_distances(zones_metrics.centroid_wgs84)
+
                 # Traiter chaque zone pour enrichir avec les données
                 for i, zone_feat in enumerate(target_zones):
                     try:
                         geom = zone_feat.get("geometry")
-                        if not geom:
+                        if not geom or not zones_inside[i]:
                             continue
                         props = zone_feat.get("properties", {})
                         
-                        # Calcul de la surface de la zone
-                        shp_zone = shape(geom)
-                        if not shp_zone.is_valid:
-                            shp_zone = shp_zone.buffer(0)
-                            if not shp_zone.is_valid:
-                                continue
-                        
-                        # Intersection avec la commune
-                        if not (commune_poly.contains(shp_zone) or commune_poly.intersects(shp_zone)):
-                            continue
-                        
                         # Surface en m²
-                        surface_m2 = shp_transform(to_l93, shp_zone).area
-                        if surface_m2 < zones_min_area:
+                        surface_m2 = float(zones_metrics.area_m2[i])
+                        if not surface_m2 >= zones_min_area:
                             continue
                         
                         # Distances aux postes
-                        centroid = shp_zone.centroid
-                        lat_c, lon_c = centroid.y, centroid.x
-                        d_bt = calculate_min_distance((lon_c, lat_c), postes_bt_data) if postes_bt_data else None
-                        d_hta = calculate_min_distance((lon_c, lat_c), postes_hta_data) if postes_hta_data else None
+                        lon_c, lat_c = zones_metrics.centroid(i)
+                        d_bt, d_hta = zones_distances[i]
                         
                         # Récupération des parcelles cadastrales pour cette zone
                         parcelles_cadastrales = []
                         try:
-                            cadastre_data = get_api_cadastre_data(geom)
-                            if cadastre_data and cadastre_data.get("features"):
-                                for parcelle_feat in cadastre_data["features"]:
-                                    parcelle_props = parcelle_feat.get("properties", {})
-                                    ref_cadastrale = f"{parcelle_props.get('section', '')}{parcelle_props.get('numero', '')}"
-                                    if ref_cadastrale.strip():
-                                        parcelles_cadastrales.append({
-                                            "id": parcelle_props.get("id", ""),
-                                            "section": parcelle_props.get("section", ""),
-                                            "numero": parcelle_props.get("numero", ""),
-                                            "ref": ref_cadastrale,
-                                            "commune": parcelle_props.get("commune", ""),
-                                            "prefixe": parcelle_props.get("prefixe", "")
-                                        })
+                            for parcelle_feat in cadastre_snapshot.parcels([geom])[0]:
+                                parcelle_props = parcelle_feat.get("properties", {})
+                                ref_cadastrale = f"{parcelle_props.get('section', '')}{parcelle_props.get('numero', '')}"
+                                if ref_cadastrale.strip():
+                                    parcelles_cadastrales.append({
+                                        "id": parcelle_props.get("id", ""),
+                                        "section": parcelle_props.get("section", ""),
+                                        "numero": parcelle_props.get("numero", ""),
+                                        "ref": ref_cadastrale,
+                                        "commune": parcelle_props.get("commune", ""),
+                                        "prefixe": parcelle_props.get("prefixe", "")
+                                    })
                             print(f"      🏛️ {len(parcelles_cadastrales)} parcelles cadastrales trouvées pour la zone")
                         except Exception as e:
                             print(f"      ⚠️ Erreur récupération parcelles cadastrales: {e}")
@@ -10965,40 +11544,14 @@ def generate_integrated_commune_report(commune_name, filters=None):
             zones_data = []
 
         # Préparation des listes de détails par rubrique (position, surface, parcelles, postes proches, liens)
-        def _format_parcelles_refs(props: dict) -> dict:
+        def _find_nearest_poste(pt_lon: float, pt_lat: float, layer: str) -> dict:
+            """Poste le plus proche dans l'index `layer` ("bt", "hta") du moteur de distances."""
             try:
-                numero = props.get('numero') or props.get('numero_parcelle') or props.get('num_parc') or ''
-                section = props.get('section') or props.get('code_section') or ''
-                commune_code = props.get('commune') or props.get('code_commune') or props.get('insee') or ''
-                prefixe = props.get('prefixe') or props.get('code_arr') or ''
-                return {
-                    'numero': numero,
-                    'section': section,
-                    'commune': commune_code,
-                    'prefixe': prefixe,
-                    'reference_complete': f"{commune_code}{prefixe}{section}{numero}".strip()
-                }
-            except Exception:
-                return {}
-
-        def _find_nearest_poste(pt_lon: float, pt_lat: float, postes: list) -> dict:
-            try:
-                p = Point(pt_lon, pt_lat)
-                best = None
-                best_d = None
-                for poste in (postes or []):
-                    try:
-                        g = poste.get('geometry')
-                        if not g:
-                            continue
-                        d = shape(g).distance(p) * 111000
-                        if best_d is None or (d < best_d):
-                            best = poste
-                            best_d = d
-                    except Exception:
-                        continue
-                if best is None:
+                index = distance_engine[layer]
+                distances, indices = index.nearest([(pt_lon, pt_lat)])
+                if indices[0] < 0:
                     return {}
+                best, best_d = index.features[indices[0]], float(distances[0])
                 coords = best.get('geometry', {}).get('coordinates', [None, None])
                 pr = best.get('properties', {})
                 return {
@@ -11011,77 +11564,29 @@ def generate_integrated_commune_report(commune_name, filters=None):
             except Exception:
                 return {}
 
-        # Préparer un index simple des parcelles de la commune si disponible, pour associer par centroïde
-        cadastre_features = []
-        if isinstance(api_cadastre, dict):
-            cadastre_features = (api_cadastre or {}).get('features', []) or []
-
+        # Références cadastrales par jointure sur l'instantané de la commune (STRtree local)
         def _parcelles_for_point(lon: float, lat: float, max_match: int = 3) -> list:
-            out = []
+            # intersects is more tolerant than contains for points on borders
             try:
-                p = Point(lon, lat)
-                for parc in cadastre_features:
-                    try:
-                        g = parc.get('geometry')
-                        if not g:
-                            continue
-                        # intersects is more tolerant than contains for points on borders
-                        if shape(g).intersects(p):
-                            out.append(_format_parcelles_refs(parc.get('properties', {})))
-                            if len(out) >= max_match:
-                                break
-                    except Exception:
-                        continue
+                return cadastre_snapshot.references([Point(lon, lat)], max_match)[0]
             except Exception:
-                pass
-            return out
+                return []
 
         def _parcelles_for_geom(feature_geom: dict, max_match: int = 3) -> list:
             """Retourne les références de parcelles cadastrales qui intersectent la géométrie complète.
             Utilisé de préférence au centroïde pour éviter les faux négatifs en bordure.
             """
-            out = []
+            if not feature_geom:
+                return []
             try:
-                if not feature_geom:
-                    return out
-                shp_feat = shape(feature_geom)
-                for parc in cadastre_features:
-                    try:
-                        g = parc.get('geometry')
-                        if not g:
-                            continue
-                        if shape(g).intersects(shp_feat):
-                            out.append(_format_parcelles_refs(parc.get('properties', {})))
-                            if len(out) >= max_match:
-                                break
-                    except Exception:
-                        continue
+                return cadastre_snapshot.references([feature_geom], max_match)[0]
             except Exception:
-                pass
-            return out
+                return []
 
-        def _parcelles_from_api_near(lon: float, lat: float, tol: float = 0.0006, max_match: int = 3) -> list:
-            """Fallback: interroge l'API Cadastre autour d'un point (petit carré ~60m) pour récupérer des parcelles."""
+        def _parcelles_near(lon: float, lat: float, tol: float = 0.0006, max_match: int = 3) -> list:
+            """Fallback: parcelles autour d'un point (petit carré ~60m)."""
             try:
-                ring = [
-                    [lon - tol, lat - tol],
-                    [lon + tol, lat - tol],
-                    [lon + tol, lat + tol],
-                    [lon - tol, lat + tol],
-                    [lon - tol, lat - tol],
-                ]
-                geom_query = {"type": "Polygon", "coordinates": [ring]}
-                resp = get_api_cadastre_data(geom_query, endpoint="/cadastre/parcelle", source_ign="PCI")
-                feats = (resp or {}).get('features', [])
-                out = []
-                for parc in feats:
-                    try:
-                        out.append(_format_parcelles_refs((parc.get('properties') or {})))
-                        if len(out) >= max_match:
-                            break
-                    except Exception:
-                        continue
-                return out
+                return cadastre_snapshot.references([shapely.box(lon - tol, lat - tol, lon + tol, lat + tol)], max_match)[0]
             except Exception:
                 return []
 
@@ -11095,7 +11600,7 @@ def generate_integrated_commune_report(commune_name, filters=None):
                 if key in _rev_cache:
                     return _rev_cache[key]
                 url = f"https://api-adresse.data.gouv.fr/reverse/?lon={lon_f}&lat={lat_f}"
-                r = requests.get(url, timeout=0.9)
+                r = http_session.get(url, timeout=0.9)
                 if r.ok:
                     js = r.json() or {}
                     feats = js.get("features") or []
@@ -11118,7 +11623,8 @@ def generate_integrated_commune_report(commune_name, filters=None):
 
         # Détails Parkings
         parkings_details = []
-        for feat in (parkings_data or [])[:max_details]:
+        parkings_shown = (parkings_data or [])[:max_details]
+        for feat, (d_bt, d_hta) in zip(parkings_shown, _poste_distances(_feature_centroids(parkings_shown))):
             try:
                 geom = feat.get('geometry')
                 if not geom:
@@ -11127,8 +11633,6 @@ def generate_integrated_commune_report(commune_name, filters=None):
                 c = shp.centroid
                 lat_c, lon_c = c.y, c.x
                 area_m2 = shp_transform(to_l93, shp).area
-                d_bt = calculate_min_distance((lon_c, lat_c), postes_bt_data) if postes_bt_data else None
-                d_hta = calculate_min_distance((lon_c, lat_c), postes_hta_data) if postes_hta_data else None
                 addr_txt = _reverse_address_quick(lon_c, lat_c)
                 details = {
                     'lat': lat_c,
@@ -11136,13 +11640,13 @@ def generate_integrated_commune_report(commune_name, filters=None):
                     'surface_m2': round(area_m2, 2),
                     'min_distance_bt_m': round(d_bt, 2) if d_bt is not None else None,
                     'min_distance_hta_m': round(d_hta, 2) if d_hta is not None else None,
-                    'poste_bt_proche': _find_nearest_poste(lon_c, lat_c, postes_bt_data),
-                    'poste_hta_proche': _find_nearest_poste(lon_c, lat_c, postes_hta_data),
+                    'poste_bt_proche': _find_nearest_poste(lon_c, lat_c, "bt"),
+                    'poste_hta_proche': _find_nearest_poste(lon_c, lat_c, "hta"),
                     'parcelles': (
                         feat.get('properties', {}).get('parcelles_cadastrales')
                         or _parcelles_for_geom(geom)
                         or _parcelles_for_point(lon_c, lat_c)
-                        or _parcelles_from_api_near(lon_c, lat_c)
+                        or _parcelles_near(lon_c, lat_c)
                     ),
                     'adresse': addr_txt,
                     'lien_streetview': f"https://www.google.com/maps/@?api=1&map_action=pano&viewpoint={lat_c},{lon_c}"
@@ -11154,7 +11658,8 @@ def generate_integrated_commune_report(commune_name, filters=None):
 
         # Détails Friches
         friches_details = []
-        for feat in (friches_data or [])[:max_details]:
+        friches_shown = (friches_data or [])[:max_details]
+        for feat, (d_bt, d_hta) in zip(friches_shown, _poste_distances(_feature_centroids(friches_shown))):
             try:
                 geom = feat.get('geometry')
                 if not geom:
@@ -11163,8 +11668,6 @@ def generate_integrated_commune_report(commune_name, filters=None):
                 c = shp.centroid
                 lat_c, lon_c = c.y, c.x
                 area_m2 = shp_transform(to_l93, shp).area
-                d_bt = calculate_min_distance((lon_c, lat_c), postes_bt_data) if postes_bt_data else None
-                d_hta = calculate_min_distance((lon_c, lat_c), postes_hta_data) if postes_hta_data else None
                 addr_txt = _reverse_address_quick(lon_c, lat_c)
                 details = {
                     'lat': lat_c,
@@ -11173,13 +11676,13 @@ def generate_integrated_commune_report(commune_name, filters=None):
                     'surface_ha': round(area_m2 / 10000.0, 4),
                     'min_distance_bt_m': round(d_bt, 2) if d_bt is not None else None,
                     'min_distance_hta_m': round(d_hta, 2) if d_hta is not None else None,
-                    'poste_bt_proche': _find_nearest_poste(lon_c, lat_c, postes_bt_data),
-                    'poste_hta_proche': _find_nearest_poste(lon_c, lat_c, postes_hta_data),
+                    'poste_bt_proche': _find_nearest_poste(lon_c, lat_c, "bt"),
+                    'poste_hta_proche': _find_nearest_poste(lon_c, lat_c, "hta"),
                     'parcelles': (
                         feat.get('properties', {}).get('parcelles_cadastrales')
                         or _parcelles_for_geom(geom)
                         or _parcelles_for_point(lon_c, lat_c)
-                        or _parcelles_from_api_near(lon_c, lat_c)
+                        or _parcelles_near(lon_c, lat_c)
                     ),
                     'adresse': addr_txt,
                     'lien_streetview': f"https://www.google.com/maps/@?api=1&map_action=pano&viewpoint={lat_c},{lon_c}"
@@ -11191,7 +11694,8 @@ def generate_integrated_commune_report(commune_name, filters=None):
 
         # Détails Toitures
         toitures_details = []
-        for feat in (toitures_data or [])[:max_details]:
+        toitures_shown = (toitures_data or [])[:max_details]
+        for feat, (near_bt, near_hta) in zip(toitures_shown, _poste_distances(_feature_centroids(toitures_shown))):
             try:
                 geom = feat.get('geometry')
                 if not geom:
@@ -11204,9 +11708,9 @@ def generate_integrated_commune_report(commune_name, filters=None):
                 d_bt = props.get('min_distance_bt_m')
                 d_hta = props.get('min_distance_hta_m')
                 if d_bt is None:
-                    d_bt = calculate_min_distance((lon_c, lat_c), postes_bt_data) if postes_bt_data else None
+                    d_bt = near_bt
                 if d_hta is None:
-                    d_hta = calculate_min_distance((lon_c, lat_c), postes_hta_data) if postes_hta_data else None
+                    d_hta = near_hta
                 addr_txt = _reverse_address_quick(lon_c, lat_c)
                 pv = {
                     'lat': lat_c,
@@ -11214,13 +11718,13 @@ def generate_integrated_commune_report(commune_name, filters=None):
                     'surface_m2': round(area_m2, 2),
                     'min_distance_bt_m': round(d_bt, 2) if d_bt is not None else None,
                     'min_distance_hta_m': round(d_hta, 2) if d_hta is not None else None,
-                    'poste_bt_proche': _find_nearest_poste(lon_c, lat_c, postes_bt_data),
-                    'poste_hta_proche': _find_nearest_poste(lon_c, lat_c, postes_hta_data),
+                    'poste_bt_proche': _find_nearest_poste(lon_c, lat_c, "bt"),
+                    'poste_hta_proche': _find_nearest_poste(lon_c, lat_c, "hta"),
                     'parcelles': (
                         props.get('parcelles_cadastrales')
                         or _parcelles_for_geom(geom)
                         or _parcelles_for_point(lon_c, lat_c)
-                        or _parcelles_from_api_near(lon_c, lat_c)
+                        or _parcelles_near(lon_c, lat_c)
                     ),
                     'lien_streetview': props.get('lien_streetview') or f"https://www.google.com/maps/@?api=1&map_action=pano&viewpoint={lat_c},{lon_c}",
                     'lien_annuaire': _build_annuaire_link(addr_txt),
@@ -11253,7 +11757,8 @@ def generate_integrated_commune_report(commune_name, filters=None):
             total_surface_rpg = 0
             cultures = {}
             
-            for parcelle in rpg_data:
+            rpg_distances = _poste_distances(_feature_centroids(rpg_data))
+            for parcelle, (d_bt, d_hta) in zip(rpg_data, rpg_distances):
                 try:
                     geom = shape(parcelle["geometry"])
                     surface_ha = shp_transform(to_l93, geom).area / 10000.0
@@ -11267,12 +11772,8 @@ def generate_integrated_commune_report(commune_name, filters=None):
                     centroid = geom.centroid
                     lat_c, lon_c = centroid.y, centroid.x
                     
-                    # Distances aux postes
-                    d_bt = calculate_min_distance((lon_c, lat_c), postes_bt_data) if postes_bt_data else None
-                    d_hta = calculate_min_distance((lon_c, lat_c), postes_hta_data) if postes_hta_data else None
-                    
                     # Références cadastrales
-                    parcelles_refs = _parcelles_for_geom(parcelle["geometry"]) or _parcelles_for_point(lon_c, lat_c) or _parcelles_from_api_near(lon_c, lat_c)
+                    parcelles_refs = _parcelles_for_geom(parcelle["geometry"]) or _parcelles_for_point(lon_c, lat_c) or _parcelles_near(lon_c, lat_c)
                     
                     # Décodage de la culture
                     code_culture = props.get("CODE_CULTU", "")
@@ -11606,7 +12107,7 @@ def generate_integrated_commune_report(commune_name, filters=None):
                         )
                         # Fallback API query around the feature if cache missed parcels
                         if not parc_refs and (lat_c is not None and lon_c is not None):
-                            parc_refs = _parcelles_from_api_near(lon_c, lat_c)
+                            parc_refs = _parcelles_near(lon_c, lat_c)
                         parcelles_txt = _join_parcelles(parc_refs)
                         addr_txt = _reverse_address(lon_c, lat_c) if (lat_c is not None and lon_c is not None) else ""
 
@@ -11716,6 +12217,95 @@ def generate_integrated_commune_report(commune_name, filters=None):
         traceback.print_exc()
         return {"error": f"Erreur lors de la génération du rapport: {str(e)}"}
 
+def rapport_complet_filters(values):
+    """Filtres optionnels du rapport complet lus dans les paramètres de la requête."""
+    return {
+        # Filtres RPG
+        "filter_rpg": values.get("filter_rpg", "true").lower() == "true",
+        "rpg_min_area": float(values.get("rpg_min_area", 1.0)),
+        "rpg_max_area": float(values.get("rpg_max_area", 1000.0)),
+
+        # Filtres parkings
+        "filter_parkings": values.get("filter_parkings", "true").lower() == "true",
+        "parking_min_area": float(values.get("parking_min_area", 1500.0)),
+
+        # Filtres friches
+        "filter_friches": values.get("filter_friches", "true").lower() == "true",
+        "friches_min_area": float(values.get("friches_min_area", 1000.0)),
+
+        # Filtres toitures
+        "filter_toitures": values.get("filter_toitures", "true").lower() == "true",
+        "toitures_min_surface": float(values.get("toitures_min_surface", 100.0)),
+
+        # Filtres zones
+        "filter_zones": values.get("filter_zones", "true").lower() == "true",
+        "zones_min_area": float(values.get("zones_min_area", 1000.0)),
+        "zones_type_filter": values.get("zones_type_filter", ""),
+
+        # Filtres de distance UNIFIÉS (hors zones)
+        "filter_by_distance": values.get("filter_by_distance", "false").lower() == "true",
+        "max_distance_bt": float(values.get("max_distance_bt", 500.0)),
+        "max_distance_hta": float(values.get("max_distance_hta", 2000.0)),
+        "poste_type_filter": values.get("poste_type_filter", "ALL").upper(),
+        "distance_logic": (
+            (lambda v: "AND" if v in ("ET", "AND") else ("OR" if v in ("OU", "OR") else "OR"))
+        )(values.get("distance_logic", "OR").upper()),
+
+        # Autres options
+        "calculate_surface_libre": values.get("calculate_surface_libre", "false").lower() == "true",
+        "include_detailed_analysis": values.get("include_detailed_analysis", "true").lower() == "true",
+        "export_format": values.get("export_format", "json").lower()  # json, html, pdf
+    }
+
+
+def build_rapport_commune_complet(commune, filters):
+    """
+    Rapport complet d'une commune : module rapport_commune_complet, ou version intégrée
+    en fallback. Rend le rapport (éventuellement {"error": ...}) ou None.
+    """
+    # Tentative d'utilisation du module complet, sinon fallback vers la version intégrée
+    rapport = None
+
+    if RAPPORT_COMPLET_AVAILABLE:
+        try:
+            print(f"📊 [RAPPORT_COMPLET] Utilisation du module rapport_commune_complet.py")
+            rapport = generate_comprehensive_commune_report(commune, filters)
+        except Exception as e:
+            print(f"⚠️ [RAPPORT_COMPLET] Erreur module externe: {e}, utilisation version intégrée")
+            rapport = None
+
+    # Si le rapport externe est vide (valeurs toutes à 0), basculer sur la version intégrée
+    def _is_empty_report(r: dict) -> bool:
+        try:
+            r = r or {}
+            info = r.get("commune_info", {})
+            if info.get("superficie_total_ha", 0) > 0:
+                return False
+            rpg = r.get("rpg_analysis", {}).get("resume_executif", {})
+            pk = r.get("parkings_analysis", {}).get("resume_executif", {})
+            fr = r.get("friches_analysis", {}).get("resume_executif", {})
+            toi = r.get("toitures_analysis", {}).get("resume_executif", {})
+            ent = r.get("socioeconomique_analysis", {}).get("economie", {}).get("entreprises", {})
+            if (
+                rpg.get("total_parcelles", 0) > 0 or
+                pk.get("total_parkings", 0) > 0 or
+                fr.get("total_friches", 0) > 0 or
+                toi.get("total_toitures", 0) > 0 or
+                ent.get("total", 0) > 0
+            ):
+                return False
+            return True
+        except Exception:
+            return False
+
+    if (not rapport or rapport.get("error") or _is_empty_report(rapport)):
+        if rapport and not rapport.get("error"):
+            print("⚠️ [RAPPORT_COMPLET] Rapport externe sans données utiles, bascule vers la version intégrée")
+        print(f"📊 [RAPPORT_COMPLET] Utilisation de la version intégrée")
+        rapport = generate_integrated_commune_report(commune, filters)
+    return rapport
+
+
 @app.route("/rapport_commune_complet", methods=["GET", "POST"])
 def rapport_commune_complet():
     """
@@ -11725,96 +12315,42 @@ def rapport_commune_complet():
     from flask import request as flask_request
     
     try:
-        # Récupération des paramètres
-        commune = flask_request.values.get("commune", "").strip()
-        
-        if not commune:
-            return jsonify({"error": "Veuillez fournir une commune."}), 400
-        
-        print(f"📊 [RAPPORT_COMPLET] Génération du rapport exhaustif pour {commune}")
-        
-        # Récupération des filtres optionnels
-        filters = {
-            # Filtres RPG
-            "filter_rpg": flask_request.values.get("filter_rpg", "true").lower() == "true",
-            "rpg_min_area": float(flask_request.values.get("rpg_min_area", 1.0)),
-            "rpg_max_area": float(flask_request.values.get("rpg_max_area", 1000.0)),
-            
-            # Filtres parkings
-            "filter_parkings": flask_request.values.get("filter_parkings", "true").lower() == "true",
-            "parking_min_area": float(flask_request.values.get("parking_min_area", 1500.0)),
+        # Rapport d'un travail commune_report terminé (?job=<id>)
+        job_id = flask_request.values.get("job")
+        if job_id:
+            job = job_store.get(job_id)
+            if job is None or job["kind"] != "commune_report":
+                return jsonify({"error": "Travail inconnu"}), 404
+            if job["status"] in JOB_ACTIVE:
+                return jsonify(job), 202
+            items = job_store.items(job_id)
+            filters = dict(job["params"]["filters"])
+            filters["export_format"] = flask_request.values.get("export_format", filters.get("export_format", "json")).lower()
+            rapport = items[0]["result"] if items else {"error": job.get("error") or "Travail sans résultat"}
+            if items and items[0]["error"]:
+                rapport = {"error": items[0]["error"]}
+        else:
+            # Récupération des paramètres
+            commune = flask_request.values.get("commune", "").strip()
 
-            # Filtres friches
-            "filter_friches": flask_request.values.get("filter_friches", "true").lower() == "true",
-            "friches_min_area": float(flask_request.values.get("friches_min_area", 1000.0)),
+            if not commune:
+                return jsonify({"error": "Veuillez fournir une commune."}), 400
 
-            # Filtres toitures
-            "filter_toitures": flask_request.values.get("filter_toitures", "true").lower() == "true",
-            "toitures_min_surface": float(flask_request.values.get("toitures_min_surface", 100.0)),
-            
-            # Filtres zones
-            "filter_zones": flask_request.values.get("filter_zones", "true").lower() == "true",
-            "zones_min_area": float(flask_request.values.get("zones_min_area", 1000.0)),
-            "zones_type_filter": flask_request.values.get("zones_type_filter", ""),
-            
-            # Filtres de distance UNIFIÉS (hors zones)
-            "filter_by_distance": flask_request.values.get("filter_by_distance", "false").lower() == "true",
-            "max_distance_bt": float(flask_request.values.get("max_distance_bt", 500.0)),
-            "max_distance_hta": float(flask_request.values.get("max_distance_hta", 2000.0)),
-            "poste_type_filter": flask_request.values.get("poste_type_filter", "ALL").upper(),
-            "distance_logic": (
-                (lambda v: "AND" if v in ("ET", "AND") else ("OR" if v in ("OU", "OR") else "OR"))
-            )(flask_request.values.get("distance_logic", "OR").upper()),
-
-            # Autres options
-            "calculate_surface_libre": flask_request.values.get("calculate_surface_libre", "false").lower() == "true",
-            "include_detailed_analysis": flask_request.values.get("include_detailed_analysis", "true").lower() == "true",
-            "export_format": flask_request.values.get("export_format", "json").lower()  # json, html, pdf
-        }
-        
-        print(f"📊 [RAPPORT_COMPLET] Filtres appliqués: {len([k for k, v in filters.items() if k.startswith('filter_') and v])} activés")
-        
-        # Tentative d'utilisation du module complet, sinon fallback vers la version intégrée
-        rapport = None
-        
-        if RAPPORT_COMPLET_AVAILABLE:
-            try:
-                print(f"📊 [RAPPORT_COMPLET] Utilisation du module rapport_commune_complet.py")
-                rapport = generate_comprehensive_commune_report(commune, filters)
-            except Exception as e:
-                print(f"⚠️ [RAPPORT_COMPLET] Erreur module externe: {e}, utilisation version intégrée")
-                rapport = None
-        
-        # Si le rapport externe est vide (valeurs toutes à 0), basculer sur la version intégrée
-        def _is_empty_report(r: dict) -> bool:
-            try:
-                r = r or {}
-                info = r.get("commune_info", {})
-                if info.get("superficie_total_ha", 0) > 0:
-                    return False
-                rpg = r.get("rpg_analysis", {}).get("resume_executif", {})
-                pk = r.get("parkings_analysis", {}).get("resume_executif", {})
-                fr = r.get("friches_analysis", {}).get("resume_executif", {})
-                toi = r.get("toitures_analysis", {}).get("resume_executif", {})
-                ent = r.get("socioeconomique_analysis", {}).get("economie", {}).get("entreprises", {})
-                if (
-                    rpg.get("total_parcelles", 0) > 0 or
-                    pk.get("total_parkings", 0) > 0 or
-                    fr.get("total_friches", 0) > 0 or
-                    toi.get("total_toitures", 0) > 0 or
-                    ent.get("total", 0) > 0
-                ):
-                    return False
-                return True
-            except Exception:
-                return False
+            filters = rapport_complet_filters(flask_request.values)
+            print(f"📊 [RAPPORT_COMPLET] Filtres appliqués: {len([k for k, v in filters.items() if k.startswith('filter_') and v])} activés")
+
+            # ?async=true : rapport calculé hors requête, résultat via ?job=<id>
+            if flask_request.values.get("async", "false").lower() == "true":
+                job_id = job_store.submit("commune_report", {"commune": commune, "filters": filters})
+                return jsonify({
+                    "job": job_id,
+                    "status_url": f"/jobs/{job_id}",
+                    "result_url": f"/rapport_commune_complet?job={job_id}",
+                }), 202
+
+            print(f"📊 [RAPPORT_COMPLET] Génération du rapport exhaustif pour {commune}")
+            rapport = build_rapport_commune_complet(commune, filters)
 
-        if (not rapport or rapport.get("error") or _is_empty_report(rapport)):
-            if rapport and not rapport.get("error"):
-                print("⚠️ [RAPPORT_COMPLET] Rapport externe sans données utiles, bascule vers la version intégrée")
-            print(f"📊 [RAPPORT_COMPLET] Utilisation de la version intégrée")
-            rapport = generate_integrated_commune_report(commune, filters)
-        
         # Vérification du succès
         if not rapport or rapport.get("error"):
             error_msg = rapport.get("error", "Erreur inconnue lors de la génération du rapport") if rapport else "Aucun rapport généré"
@@ -11884,6 +12420,107 @@ def rapport_commune_complet():
             "details": str(e)
         }), 500
 
+def run_commune_report_job(job):
+    """Travail commune_report : rapport complet d'une commune (un seul point de reprise)."""
+    commune = job.params["commune"]
+    job.set_total(1)
+    job.message(f"📊 Rapport complet de {commune}...")
+    rapport = build_rapport_commune_complet(commune, job.params["filters"])
+    key = commune_insee(commune)   # point de reprise par code INSEE, nom à défaut
+    if not rapport or rapport.get("error"):
+        job.checkpoint(key, {"nom": commune}, error=(rapport or {}).get("error") or "Aucun rapport généré")
+    else:
+        job.checkpoint(key, rapport)
+
+
+# Handlers exécutés par JobRunner (job_worker.py ou threads du serveur local)
+JOB_HANDLERS = {
+    "dept_report": run_dept_report_job,
+    "commune_report": run_commune_report_job,
+}
+
+
+def start_job_runner(workers=None):
+    """Démarre des threads d'exécution des travaux dans ce processus."""
+    runner = JobRunner(job_store, JOB_HANDLERS, workers=workers or JOB_INPROCESS_WORKERS)
+    runner.start()
+    print(f"🧵 [JOBS] {runner.workers} worker(s) dans le processus ({JOBS_DB_PATH})")
+    return runner
+
+
+@app.route("/jobs", methods=["GET", "POST"])
+@require_admin
+def jobs_collection():
+    """GET : travaux récents (?status=). POST {kind, params} : dépose un travail."""
+    if request.method == "GET":
+        return jsonify(job_store.list(request.args.get("status"), int(request.args.get("limit", 50))))
+    payload = request.get_json(silent=True) or {}
+    kind = payload.get("kind")
+    if kind not in JOB_HANDLERS:
+        return jsonify({"error": f"Type de travail inconnu: {kind}", "kinds": sorted(JOB_HANDLERS)}), 400
+    params = payload.get("params") or {}
+    if kind == "dept_report":
+        if not params.get("department"):
+            return jsonify({"error": "Paramètre 'department' manquant"}), 400
+        params = dept_report_params(params)
+    elif kind == "commune_report":
+        if not params.get("commune"):
+            return jsonify({"error": "Veuillez fournir une commune."}), 400
+        params = {"commune": params["commune"], "filters": rapport_complet_filters(params.get("filters") or {})}
+    job_id = job_store.submit(kind, params)
+    return jsonify({
+        "job": job_id,
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events",
+        "results_url": f"/jobs/{job_id}/results",
+    }), 202
+
+
+@app.route("/jobs/<job_id>")
+@require_admin
+def job_status(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Travail inconnu"}), 404
+    return jsonify(job)
+
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+@require_admin
+def job_cancel(job_id):
+    if job_store.get(job_id) is None:
+        return jsonify({"error": "Travail inconnu"}), 404
+    return jsonify({"cancelled": job_store.cancel(job_id)})
+
+
+@app.route("/jobs/<job_id>/results")
+@require_admin
+def job_results(job_id):
+    """
+    Résultats enregistrés (éventuellement partiels). ?after=<seq> : suite d'une lecture précédente ;
+    ?format=ndjson : une ligne JSON par élément, en flux.
+    """
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Travail inconnu"}), 404
+    after = int(request.args.get("after", 0))
+    if request.args.get("format") == "ndjson":
+        def lines():
+            for item in job_store.iter_items(job_id, after):
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        return Response(lines(), mimetype="application/x-ndjson")
+    return jsonify({"job": job, "items": job_store.items(job_id, after)})
+
+
+@app.route("/jobs/<job_id>/events")
+@require_admin
+def job_events(job_id):
+    """Avancement d'un travail en SSE (reprise via Last-Event-ID)."""
+    last_job, after = _job_cursor(request.headers.get("Last-Event-ID"))
+    after = after if last_job == job_id else int(request.args.get("after", 0))
+    return Response(stream_with_context(job_event_stream(job_id, after)), mimetype="text/event-stream")
+
+
 if __name__ == "__main__":
     main()  # Ceci inclut Timer + app.run()
 
@@ -8,6 +8,9 @@ import requests
 from urllib.parse import quote
 from typing import Dict, List, Optional
 import time
+from urllib.parse import urlsplit
+
+from utils.http_client import UpstreamClient, UpstreamPolicy
 
 class AgriWebGeoServerConfig:
     """Configuration GeoServer flexible pour AgriWeb 2.0"""
@@ -64,6 +67,9 @@ class AgriWebGeoServerConfig:
             "GeolocalisationEtablissement_Sirene france": "sirene_etablissements"
         }
         
+        # Session unique (connexions keep-alive réutilisées d'un appel à l'autre)
+        self.session = self.create_optimized_session()
+        
         print(f"🗺️ GeoServer configuré: {self.environment} - {self.base_url}")
     
     def get_layer_name(self, layer_name: str) -> str:
@@ -75,8 +81,12 @@ class AgriWebGeoServerConfig:
             return layer_name
     
     def create_optimized_session(self) -> requests.Session:
-        """Crée une session HTTP optimisée pour GeoServer"""
-        session = requests.Session()
+        """Crée une session HTTP optimisée pour GeoServer (pool keep-alive, timeout et retries par défaut)"""
+        session = UpstreamClient({
+            urlsplit(self.base_url).netloc: UpstreamPolicy(
+                pool_size=32, timeout=self.timeout, retries=2, backoff=0.5, retry_post=True
+            )
+        })
         
         # Headers optimisés
         session.headers.update({
@@ -129,7 +139,7 @@ class AgriWebGeoServerConfig:
         Returns:
             Liste des features GeoJSON
         """
-        session = self.create_optimized_session()
+        session = self.session
         params = self.build_wfs_params(layer_name, bbox, max_features, **kwargs)
         
         start_time = time.time()
@@ -186,7 +196,7 @@ class AgriWebGeoServerConfig:
         try:
             # Test version GeoServer
             start_time = time.time()
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/rest/about/version.json",
                 timeout=10
             )
@@ -202,7 +212,7 @@ class AgriWebGeoServerConfig:
                 print(f"✅ GeoServer accessible en {response_time}ms - Version: {test_result['version']}")
                 
                 # Test workspace
-                ws_response = requests.get(
+                ws_response = self.session.get(
                     f"{self.base_url}/rest/workspaces/{self.workspace}.json",
                     timeout=5
                 )
@@ -0,0 +1,53 @@
+"""
+Worker des travaux longs (rapports département, rapports communaux complets).
+
+    python job_worker.py                  # 2 travaux simultanés
+    python job_worker.py --workers 4
+    python job_worker.py --once           # traite la file puis s'arrête
+    AGRIWEB_JOBS_DB=/data/jobs.sqlite python job_worker.py
+
+Processus séparé des workers web : les routes déposent les travaux dans la file
+SQLite (AGRIWEB_JOBS_DB), ce processus les exécute. Un worker arrêté en cours de
+travail est remplacé par le suivant à l'expiration de son bail ; les communes
+déjà traitées ne sont pas recalculées.
+
+Seule l'application agriweb_source dépose des travaux : le Procfile, qui sert
+agriweb_hebergement_gratuit, ne lance donc pas ce worker. Pour un déploiement
+avec file de travaux, démarrer les deux processus sur la même base :
+
+    web: gunicorn agriweb_source:app --bind 0.0.0.0:$PORT --workers 2 --timeout 120
+    worker: python job_worker.py --workers 2
+"""
+import argparse
+import sys
+
+from agriweb_source import JOB_HANDLERS, JOBS_DB_PATH, job_store
+from utils.jobs import JobRunner
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker des travaux longs AgriWeb")
+    parser.add_argument("--workers", type=int, default=2, help="Travaux exécutés simultanément")
+    parser.add_argument("--poll", type=float, default=1.0, help="Attente entre deux lectures de la file (s)")
+    parser.add_argument("--purge-days", type=float, default=7,
+                        help="Supprime au démarrage les travaux terminés depuis plus de N jours (0 : jamais)")
+    parser.add_argument("--once", action="store_true", help="Vide la file puis s'arrête")
+    args = parser.parse_args()
+
+    if args.purge_days > 0:
+        purged = job_store.purge(args.purge_days * 86400)
+        if purged:
+            print(f"🧹 [JOB_WORKER] {purged} travaux anciens supprimés")
+
+    runner = JobRunner(job_store, JOB_HANDLERS, workers=args.workers, poll_interval=args.poll)
+    print(f"✅ [JOB_WORKER] {JOBS_DB_PATH}: {runner.workers} worker(s), types {sorted(JOB_HANDLERS)}")
+    if args.once:
+        while runner.run_once():
+            pass
+        return 0
+    runner.run_forever()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -915,6 +915,7 @@ function handleDeptSearch() {
     const m = getMapFrame();
     if (m?.clearMap) m.clearMap();
     window.lastDeptResults = [];
+    window.lastDeptJob = null;
     const results = window.lastDeptResults;
     let es = null;
     try {
@@ -927,6 +928,10 @@ function handleDeptSearch() {
     es.addEventListener("progress", e => {
       if (logEl) { logEl.textContent += e.data + "\n"; logEl.scrollTop = logEl.scrollHeight; }
     });
+    es.addEventListener("job", e => {
+      // Le rapport départemental sera relu côté serveur depuis ce travail
+      window.lastDeptJob = JSON.parse(e.data).id;
+    });
     es.addEventListener("result", e => {
       const r = JSON.parse(e.data);
       results.push(r);
@@ -941,6 +946,11 @@ function handleDeptSearch() {
       es.close();
     });
     es.onerror = () => {
+      // Le rapport tourne côté serveur : le navigateur se reconnecte et reprend le flux (Last-Event-ID)
+      if (es.readyState === EventSource.CONNECTING) {
+        if (logEl) logEl.textContent += "⏳ Connexion interrompue, reprise du suivi...\n";
+        return;
+      }
       if (logEl) logEl.textContent += "❌ Erreur SSE\n";
       es.close();
     };
@@ -1090,6 +1100,11 @@ function generateDeptReport() {
     alert("Faites d'abord une recherche départementale !");
     return;
   }
+  // Recherche exécutée comme travail serveur : le rapport est construit depuis ses résultats enregistrés
+  if (window.lastDeptJob) {
+    window.open("/rapport_departement?job=" + encodeURIComponent(window.lastDeptJob), "_blank");
+    return;
+  }
   const w = window.open("", "_blank");
   if (!w) {
     alert("Impossible d'ouvrir un nouvel onglet. Vérifiez que les popups ne sont pas bloqués.");
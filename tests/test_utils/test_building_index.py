@@ -0,0 +1,35 @@
+import math
+
+from shapely.geometry import box, mapping
+
+from utils.building_index import BuildingIndex
+from utils.projection import layer_metrics
+
+
+def _feature(geom):
+    return {"type": "Feature", "geometry": mapping(geom), "properties": {}}
+
+
+def test_built_area_is_union_clipped_to_each_parcel():
+    parcel_a = box(2.0, 46.0, 2.001, 46.001)
+    parcel_b = box(2.002, 46.0, 2.003, 46.001)
+    inside = box(2.0002, 46.0002, 2.0004, 46.0004)
+    overlapping = box(2.0003, 46.0002, 2.0005, 46.0004)
+    straddling = box(2.0009, 46.0002, 2.0011, 46.0004)
+    index = BuildingIndex({"type": "FeatureCollection", "features": [
+        _feature(inside), _feature(overlapping), _feature(straddling), {"type": "Feature", "geometry": None},
+    ]})
+    assert len(index) == 3
+
+    result_a, result_b = index.surface_libre([mapping(parcel_a), _feature(parcel_b)])
+    expected = layer_metrics([inside.union(overlapping), straddling.intersection(parcel_a), parcel_a]).area_m2
+    assert math.isclose(result_a["surface_batie_m2"], expected[0] + expected[1], abs_tol=0.05)
+    assert math.isclose(result_a["surface_totale_m2"], expected[2], abs_tol=0.01)
+    assert result_a["batiments_count"] == 3
+    assert result_b["surface_batie_m2"] == 0 and result_b["surface_libre_pct"] == 100.0
+
+
+def test_empty_index():
+    index = BuildingIndex(None)
+    assert len(index) == 0
+    assert index.surface_libre([mapping(box(2.0, 46.0, 2.001, 46.001))])[0]["batiments_count"] == 0
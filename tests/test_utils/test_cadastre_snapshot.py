@@ -0,0 +1,55 @@
+from shapely.geometry import Point, box, mapping, shape
+
+from utils.cadastre_snapshot import CadastreSnapshotStore, covering_tiles, tile_bounds
+from utils.disk_cache import DiskCache
+
+
+def _parcelle(fid, geom, section, numero):
+    return {"type": "Feature", "id": fid, "geometry": mapping(geom),
+            "properties": {"section": section, "numero": numero, "code_com": "056", "commune": "75056", "prefixe": "000"}}
+
+
+PARCELLES = [
+    _parcelle("p1", box(2.000, 46.000, 2.004, 46.004), "AB", "0001"),
+    _parcelle("p2", box(2.004, 46.000, 2.012, 46.004), "AB", "0002"),
+]
+
+
+def _fetch_factory(calls):
+    def fetch(bounds):
+        calls.append(bounds)
+        tile = box(*bounds)
+        return [p for p in PARCELLES if tile.intersects(shape(p["geometry"]))]
+    return fetch
+
+
+def test_snapshot_join_returns_template_references(tmp_path):
+    calls = []
+    store = CadastreSnapshotStore(_fetch_factory(calls), DiskCache(str(tmp_path / "c.sqlite")), workers=2)
+    commune = box(2.0005, 46.0005, 2.0115, 46.0035)
+    assert covering_tiles([mapping(commune)]) == [(200, 4600), (201, 4600)]
+    assert tile_bounds((201, 4600), 0.01) == (2.01, 46.0, 2.02, 46.01)
+
+    snap = store.snapshot([mapping(commune)], key="commune:test")
+    assert len(snap) == 2 and len(calls) == 2  # p2 chevauche deux tuiles, dédoublonnée par id
+    refs = snap.references([mapping(box(2.003, 46.001, 2.005, 46.002)), Point(2.001, 46.001), Point(3, 47)])
+    assert [r["reference_complete"] for r in refs[0]] == ["75056000AB0001", "75056000AB0002"]
+    assert refs[1][0] == {"numero": "0001", "section": "AB", "commune": "75056", "prefixe": "000",
+                          "reference_complete": "75056000AB0001"}
+    assert refs[2] == []
+    assert snap.references([Point(2.004, 46.002)], max_match=1) == [refs[0][:1]]
+
+    # En mémoire par clé, puis depuis le cache disque : aucune nouvelle requête
+    assert store.snapshot([mapping(commune)], key="commune:test") is snap
+    assert len(store.snapshot([mapping(commune)])) == 2 and len(calls) == 2
+    assert store.stats()["tiles_cached"] == 2
+
+
+def test_failed_tiles_are_not_cached():
+    def failing(bounds):
+        raise IOError("apicarto indisponible")
+
+    store = CadastreSnapshotStore(failing)
+    snap = store.snapshot([Point(2.001, 46.001)], key="k")
+    assert len(snap) == 0 and not snap.complete
+    assert store.stats()["tile_errors"] == 1 and store.stats()["in_memory"] == []
@@ -0,0 +1,88 @@
+import time
+
+import numpy as np
+import pytest
+
+from utils.commune_bundle import BundleCache, CommuneBundle, DistanceRule
+
+
+def square(lon, lat, side):
+    return {"type": "Polygon", "coordinates": [[
+        [lon, lat], [lon + side, lat], [lon + side, lat + side], [lon, lat + side], [lon, lat],
+    ]]}
+
+
+def feature(geom, **props):
+    return {"type": "Feature", "geometry": geom, "properties": props}
+
+
+def poste(lon, lat, gid):
+    return feature({"type": "Point", "coordinates": [lon, lat]}, gid=gid)
+
+
+@pytest.fixture
+def bundle():
+    b = CommuneBundle("23096", "Guéret", square(1.80, 46.10, 0.1))
+    b.add("postes_bt", [poste(1.8205, 46.1205, "bt1")])
+    b.add("postes_hta", [poste(1.891, 46.191, "hta1")])
+    b.add("parkings", [
+        feature(square(1.82, 46.12, 0.001), nom="petit, près BT"),     # ~0.9 ha, centroïde à ~0 m du poste BT
+        feature(square(1.85, 46.15, 0.003), nom="grand, loin"),        # ~8 ha, à ~3 km des postes
+        feature(square(1.89, 46.19, 0.002), nom="moyen, près HTA"),    # ~3.4 ha, centroïde sur le poste HTA
+        feature(None, nom="sans géométrie"),
+    ])
+    b.add("batiments", [
+        feature(square(1.82, 46.12, 0.0005), building="yes"),
+        feature(square(2.50, 46.50, 0.0005), building="yes"),          # hors commune
+    ])
+    return b
+
+
+def test_thresholds_apply_to_cached_columns(bundle):
+    cols = bundle.columns("parkings")
+    assert bundle.columns("parkings") is cols  # mesures calculées une fois
+    assert cols.area_m2[3] < 0  # sans géométrie : jamais retenu
+    assert cols.d_bt[0] < 60 and cols.d_hta[2] < 60 and cols.d_bt[1] > 2000
+
+    assert list(cols.select(min_area=5_000)) == [0, 1, 2]
+    assert list(cols.select(min_area=20_000)) == [1, 2]
+    assert list(cols.select(min_area=5_000, rule=DistanceRule(500, 2000, "ALL"))) == [0, 2]
+    assert list(cols.select(min_area=5_000, rule=DistanceRule(500, 2000, "BT"))) == [0]
+    assert list(cols.select(min_area=5_000, rule=DistanceRule(500, 2000, "HTA"))) == [2]
+    assert list(cols.select(where=[True, False, True, True])) == [0, 2]
+
+    # Bâtiments découpés par le contour de la commune
+    assert list(bundle.columns("batiments").inside) == [True, False]
+
+
+def test_present_reuses_enrichments_and_postes_invalidate(bundle):
+    props = lambda c, i: {"surface_m2": round(float(c.area_m2[i])), "min_distance_bt_m": c.rounded(c.d_bt[i])}
+    idx = bundle.columns("parkings").select(min_area=5_000)
+    first = bundle.present("parkings", idx, props)
+    first[0]["properties"]["parcelles_cadastrales"] = ["AB12"]
+    bundle.remember("parkings", idx[:1], first[:1])
+
+    again = bundle.present("parkings", idx, props)
+    assert again[0]["properties"]["parcelles_cadastrales"] == ["AB12"]
+    assert "parcelles_cadastrales" not in again[1]["properties"]
+    assert again[0] is not first[0] and bundle.layers["parkings"][0]["properties"] == {"nom": "petit, près BT"}
+
+    # Nouveaux postes : distances recalculées, y compris pour les features déjà enrichies
+    assert again[0]["properties"]["min_distance_bt_m"] < 60
+    bundle.add("postes_bt", [poste(1.8515, 46.1515, "bt2")])
+    cols = bundle.columns("parkings")
+    assert cols.d_bt[1] < 60 and cols.d_bt[0] > 2000
+    fresh = bundle.present("parkings", idx, props)
+    assert fresh[0]["properties"]["parcelles_cadastrales"] == ["AB12"]
+    assert fresh[0]["properties"]["min_distance_bt_m"] > 2000
+    assert bundle.missing(["parkings", "rpg"]) == ["rpg"]
+
+
+def test_bundle_cache_lru_and_ttl():
+    cache = BundleCache(max_bundles=2, ttl=0.2)
+    for code in ("1", "2", "3"):
+        cache.put(CommuneBundle(code, code, square(0, 0, 1)))
+    assert cache.get("1") is None and cache.get("3").code == "3"
+    time.sleep(0.25)
+    assert cache.get("2") is None and len(cache) == 1
+    assert cache.stats()["hits"] == 1 and cache.invalidate() == 1
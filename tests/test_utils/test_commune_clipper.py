@@ -0,0 +1,28 @@
+from shapely.geometry import Polygon, box, mapping
+
+from utils.commune_clipper import CommuneClipper
+
+
+def _feature(geom):
+    return {"type": "Feature", "geometry": mapping(geom) if geom is not None else None, "properties": {}}
+
+
+COMMUNE = box(0, 0, 10, 10)
+BOWTIE = Polygon([(1, 1), (3, 3), (3, 1), (1, 3), (1, 1)])
+
+
+def test_mask_returns_repaired_geometries_in_one_pass():
+    features = [_feature(box(1, 1, 2, 2)), _feature(box(9, 9, 12, 12)), _feature(box(20, 20, 21, 21)),
+                _feature(None), _feature(BOWTIE), {"type": "Feature", "geometry": {"type": "Bogus"}}]
+    clipper = CommuneClipper(mapping(COMMUNE))
+    inside, geoms = clipper.mask(features)
+    assert inside.tolist() == [True, True, False, False, True, False]
+    assert geoms[4].is_valid and geoms[4].area > 0
+
+    contained, _ = clipper.mask(features, predicate="contains")
+    assert contained.tolist() == [True, False, False, False, True, False]
+
+    kept, kept_geoms = clipper.split(features)
+    assert kept == [features[0], features[1], features[4]]
+    assert len(kept_geoms) == 3 and kept_geoms[0].equals(box(1, 1, 2, 2))
+    assert clipper.clip([]) == []
@@ -0,0 +1,38 @@
+import math
+
+import numpy as np
+
+from utils.dem import DEMStore, read_esri_ascii, write_tile
+from utils.projection import L93, project_points
+
+
+def test_ascii_tiles_bilinear_and_nodata(tmp_path):
+    # Plan z = x/10 + y/100 sur 4x3 cellules de 25 m (Lambert-93), une cellule sans donnée
+    x_ll, y_ll, cell = 650000.0, 6860000.0, 25.0
+    cx = x_ll + cell * (np.arange(4) + 0.5)
+    cy = y_ll + cell * (np.arange(3)[::-1] + 0.5)
+    grid = cx[None, :] / 10 + cy[:, None] / 100
+    grid[0, 3] = -99999
+    rows = "\n".join(" ".join(f"{v:.4f}" for v in row) for row in grid)
+    asc = tmp_path / "dalle.asc"
+    asc.write_text(
+        f"ncols 4\nnrows 3\nxllcorner {x_ll}\nyllcorner {y_ll}\ncellsize {cell}\nNODATA_value -99999\n{rows}\n"
+    )
+
+    data, meta = read_esri_ascii(str(asc))
+    assert data.shape == (3, 4) and meta["y0"] == y_ll + 75
+    write_tile(str(tmp_path / "dem"), "dalle", data, meta, L93)
+    store = DEMStore(str(tmp_path / "dem"))
+    assert len(store) == 1
+
+    targets = np.array([[x_ll + 40.0, y_ll + 30.0], [x_ll + 60.0, y_ll + 20.0], [x_ll + 70.0, y_ll + 55.0]])
+    lonlat = project_points(targets, L93, "EPSG:4326")
+    outside = [(2.0, 45.0)]
+    z = store.sample(np.vstack([lonlat, outside]))
+
+    expected = targets[:, 0] / 10 + targets[:, 1] / 100
+    assert np.allclose(z[:2], expected[:2], atol=0.01)
+    # Voisin sans donnée écarté : valeur interpolée sur les cellules valides, jamais -99999
+    assert math.isfinite(z[2]) and abs(z[2] - expected[2]) < 5
+    assert math.isnan(z[3])
+    assert store.stats()["local"] == 3
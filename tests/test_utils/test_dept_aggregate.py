@@ -0,0 +1,98 @@
+import json
+import random
+
+from utils.dept_aggregate import NO_DISTANCE, DeptAggregate, feature_distance
+from utils.jobs import JobStore
+
+
+def parcelle(pid, dist=None, com="23096"):
+    props = {"ID_PARCEL": pid, "code_com": com}
+    if dist is not None:
+        props["distance_bt"] = dist
+    return {"type": "Feature", "geometry": None, "properties": props}
+
+
+def report(nom, parcelles, eleveurs=0):
+    return {
+        "commune": nom,
+        "rpg_parcelles": {"type": "FeatureCollection", "features": parcelles},
+        "eleveurs": {"type": "FeatureCollection", "features": [{"properties": {}}] * eleveurs},
+    }
+
+
+def reference_top(reports, k):
+    """Ancienne synthèse : concaténation, dédoublonnage, tri stable complet."""
+    seen, unique = set(), []
+    for rpt in reports:
+        for f in rpt["rpg_parcelles"]["features"]:
+            key = (f["properties"]["ID_PARCEL"], f["properties"]["code_com"])
+            if key not in seen:
+                seen.add(key)
+                unique.append(f)
+    return sorted(unique, key=feature_distance)[:k], len(unique)
+
+
+def make_reports(rng, n_communes=12):
+    reports = []
+    for c in range(n_communes):
+        # Parcelles partagées entre communes voisines, distances avec ex aequo et sans mesure
+        feats = [parcelle(f"P{rng.randrange(150)}", rng.choice([None, 0, rng.randrange(1, 40) * 25]))
+                 for _ in range(rng.randrange(0, 30))]
+        reports.append(report(f"C{c}", feats, eleveurs=rng.randrange(4)))
+    return reports
+
+
+def test_streaming_top_matches_full_sort():
+    rng = random.Random(7)
+    reports = make_reports(rng)
+    expected, n_unique = reference_top(reports, 10)
+
+    agg = DeptAggregate(k=10).add_reports(iter(reports))
+    assert [f["properties"]["ID_PARCEL"] for f in agg.top()] == [f["properties"]["ID_PARCEL"] for f in expected]
+    assert agg.parcelles == n_unique
+    assert agg.communes == 12
+    assert agg.eleveurs == sum(len(r["eleveurs"]["features"]) for r in reports)
+    assert agg.doublons == sum(len(r["rpg_parcelles"]["features"]) for r in reports) - n_unique
+    assert feature_distance(parcelle("X")) == NO_DISTANCE
+
+
+def test_merge_and_serialisation_of_partials():
+    rng = random.Random(11)
+    reports = make_reports(rng, 9)
+    # Parcelles distinctes par commune (partition par contour) : la fusion est exacte
+    for i, rpt in enumerate(reports):
+        for f in rpt["rpg_parcelles"]["features"]:
+            f["properties"]["code_com"] = f"C{i}"
+    whole = DeptAggregate(k=8).add_reports(reports)
+
+    parts = [DeptAggregate(k=8).add_reports(reports[i:i + 3]) for i in range(0, 9, 3)]
+    parts[1] = DeptAggregate.from_dict(json.loads(json.dumps(parts[1].to_dict())))
+    merged = DeptAggregate(k=8)
+    for part in parts:
+        merged.merge(part)
+
+    assert [f["properties"] for f in merged.top()] == [f["properties"] for f in whole.top()]
+    assert merged.stats() == whole.stats()
+
+    # Même parcelle vue par deux agrégats : comptée une fois, première occurrence retenue
+    a = DeptAggregate(k=3).add_reports([report("A", [parcelle("P1", 500, "X")])])
+    b = DeptAggregate(k=3).add_reports([report("B", [parcelle("P1", 100, "X"), parcelle("P2", 50)])])
+    a.merge(b)
+    assert a.parcelles == 2 and a.doublons == 1
+    assert [f["properties"]["distance_bt"] for f in a.top()] == [50, 500]
+
+
+def test_job_items_read_in_batches(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    job_id = store.submit("dept_report", {"department": "23"})
+    for i in range(7):
+        store.checkpoint(job_id, f"C{i}", report(f"C{i}", [parcelle(f"P{i}", 100 - i)]))
+    store.checkpoint(job_id, "C7", error="timeout")
+
+    done = list(store.iter_items(job_id, status="done", batch=3))
+    assert [item["key"] for item in done] == [f"C{i}" for i in range(7)]
+    assert len(list(store.iter_items(job_id, batch=3))) == 8
+    assert [item["key"] for item in store.iter_items(job_id, after=done[4]["seq"], batch=2)] == ["C5", "C6", "C7"]
+
+    agg = DeptAggregate(k=2).add_reports(item["result"] for item in done)
+    assert [f["properties"]["ID_PARCEL"] for f in agg.top()] == ["P6", "P5"]
@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+from utils.dept_context import DepartmentContext
+
+
+def square(x, y, size):
+    return {"type": "Polygon", "coordinates": [[[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]]}
+
+
+def commune(nom, x, y):
+    return {"type": "Feature", "properties": {"nom": nom, "centre": {"type": "Point", "coordinates": [x + 0.05, y + 0.05]}},
+            "geometry": square(x, y, 0.1)}
+
+
+# Parcelles le long de la limite des deux communes, certaines à cheval sur plusieurs tuiles
+PARCELS = [
+    {"type": "Feature", "id": f"rpg.{i}", "properties": {"i": i}, "geometry": square(0.02 + 0.03 * i, 0.04, 0.02)}
+    for i in range(6)
+]
+
+
+def test_prefetch_once_partition_and_bbox():
+    calls = []
+    lock = threading.Lock()
+
+    def fetch_rpg(bounds):
+        with lock:
+            calls.append(bounds)
+        minx, miny, maxx, maxy = bounds
+        out = []
+        for feat in PARCELS:
+            (x0, y0), (x1, y1) = feat["geometry"]["coordinates"][0][0], feat["geometry"]["coordinates"][0][2]
+            if x1 >= minx and x0 <= maxx and y1 >= miny and y0 <= maxy:
+                out.append(feat)
+        return out
+
+    ctx = DepartmentContext([commune("Aubusson", 0.0, 0.0), commune("Saint-Éloi", 0.1, 0.0)],
+                            {"rpg": fetch_rpg}, tile_size=0.05, margin_deg=0.0, workers=3)
+    assert ctx.load() == {"rpg": 6}
+    assert len(calls) == len(ctx.tiles()) == len(set(calls))
+
+    a = [f["id"] for f in ctx.assigned("rpg", "Aubusson")]
+    b = [f["id"] for f in ctx.assigned("rpg", "st eloi")]
+    # Chaque parcelle dans une seule commune (point représentatif)
+    assert sorted(a + b) == [f"rpg.{i}" for i in range(6)] and not set(a) & set(b)
+    assert "rpg.0" in a and "rpg.5" in b
+    assert ctx.centre("Saint-Éloi") == pytest.approx((0.05, 0.15))
+    assert [f["id"] for f in ctx.in_bbox("rpg", (0.0, 0.0, 0.05, 0.1))] == ["rpg.0", "rpg.1"]
+    assert ctx.assigned("rpg", "Inconnue") == []
+
+
+def test_failed_tile_marks_covered_communes_incomplete():
+    def fetch_rpg(bounds):
+        if bounds[0] >= 0.15:
+            raise TimeoutError("GeoServer 504")
+        return [f for f in PARCELS if f["geometry"]["coordinates"][0][0][0] < bounds[2]
+                and f["geometry"]["coordinates"][0][2][0] > bounds[0]]
+
+    ctx = DepartmentContext([commune("Aubusson", 0.0, 0.0), commune("Saint-Éloi", 0.1, 0.0)],
+                            {"rpg": fetch_rpg}, tile_size=0.05, margin_deg=0.0, workers=2)
+    ctx.load()
+    # L'échec est compté, pas présenté comme une tuile vide
+    assert ctx.tile_errors == len(ctx.failed_tiles["rpg"]) > 0
+    assert ctx.incomplete("Aubusson") == []
+    assert ctx.incomplete("Saint-Éloi") == ["rpg"]
+
+
+def test_homonyms_resolved_by_insee_code():
+    first, second = commune("Saint-Martin", 0.0, 0.0), commune("Saint-Martin", 0.2, 0.0)
+    first["properties"]["code"], second["properties"]["code"] = "23001", "23002"
+    ctx = DepartmentContext([first, second], {"rpg": lambda bounds: []}, tile_size=0.1, margin_deg=0.0)
+
+    assert ctx.centre("23002") == pytest.approx((0.05, 0.25))
+    assert ctx.centre("23001") == ctx.centre("Saint-Martin") == pytest.approx((0.05, 0.05))
+    assert ctx.commune("99999") is None
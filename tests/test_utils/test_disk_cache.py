@@ -0,0 +1,21 @@
+import time
+
+from utils.disk_cache import DiskCache
+
+
+def test_roundtrip_ttl_and_eviction(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite"), default_ttl=60, max_entries=2)
+    cache.set("dem", "a", {"z": [1.5, 2.5]})
+    cache.set("dem", "b", [1, 2], ttl=-1)
+    assert cache.get("dem", "a") == {"z": [1.5, 2.5]}
+    assert cache.get("dem", "b") is None
+    assert cache.get("other", "a") is None
+
+    time.sleep(0.01)
+    cache.set_many("pvgis", {"c": 3})
+    # "b" (jamais relue) est évincée en premier
+    assert set(cache.get_many("dem", ["a", "b"])) == {"a"}
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["namespaces"]["dem"]["hits"] == 2 and stats["namespaces"]["dem"]["expired"] == 1
+    assert cache.clear("dem") == 1 and cache.get("pvgis", "c") == 3
@@ -0,0 +1,39 @@
+import math
+
+from utils.distance_engine import DistanceEngine, NearestFeatureIndex
+
+
+def _poste(fid, lon, lat):
+    return {"type": "Feature", "id": fid, "geometry": {"type": "Point", "coordinates": [lon, lat]}, "properties": {}}
+
+
+POSTES_BT = [_poste("bt.1", 2.0, 46.0), _poste("bt.2", 2.1, 46.0), {"type": "Feature", "geometry": None}]
+
+
+def test_batch_query_returns_lambert93_metres_and_ids():
+    engine = DistanceEngine(bt=POSTES_BT, hta=[])
+    result = engine.query([(2.0, 46.01), (2.09, 46.0)])
+    assert result["bt"]["id"] == ["bt.1", "bt.2"]
+    # 0.01° de latitude ≈ 1,11 km ; 0.01° de longitude à 46° N ≈ 0,77 km (et non 1,11 km)
+    assert math.isclose(result["bt"]["distance_m"][0], 1110, rel_tol=0.01)
+    assert math.isclose(result["bt"]["distance_m"][1], 775, rel_tol=0.01)
+    assert result["hta"] == {"distance_m": [None, None], "id": [None, None]}
+    assert engine.min_distance("hta", (2.0, 46.0)) is None
+
+
+def test_index_built_once_serves_points_and_batches():
+    index = NearestFeatureIndex(POSTES_BT)
+    assert len(index) == 2
+    distances, indices = index.nearest([(2.09, 46.0), (2.0, 46.0)])
+    assert indices.tolist() == [1, 0] and distances[1] == 0
+    assert index.min_distance((2.0, 46.0)) == 0
+    assert DistanceEngine(bt=POSTES_BT).query([])["bt"] == {"distance_m": [], "id": []}
+
+
+def test_ranked_selects_the_k_nearest_in_order():
+    index = NearestFeatureIndex([_poste(f"capa.{i}", 2.0 + 0.01 * i, 46.0) for i in range(6)])
+    distances, order = index.ranked((2.031, 46.0), k=3)
+    assert order.tolist() == [3, 4, 2]
+    assert list(distances) == sorted(distances)
+    assert index.ranked((2.0, 46.0))[1].tolist() == list(range(6))
+    assert NearestFeatureIndex([]).ranked((2.0, 46.0), k=2)[1].tolist() == []
@@ -0,0 +1,50 @@
+import time
+
+from utils.fetch_stage import FetchStage
+
+
+def test_dependent_source_receives_upstream_result():
+    stage = FetchStage(max_workers=4)
+    stage.add("raw", lambda: [1, 2, 3, 4], default=[])
+    stage.add("pairs", lambda raw, keep: [x for x in raw if x % 2 == keep], depends_on=["raw"], keep=0, default=[])
+    results = stage.run()
+    assert results["pairs"] == [2, 4]
+    assert stage.timings["raw"]["status"] == "ok" and stage.timings["pairs"]["status"] == "ok"
+
+
+def test_timeout_and_error_fall_back_to_default():
+    def slow():
+        time.sleep(1.0)
+        return ["trop tard"]
+
+    def broken():
+        raise RuntimeError("upstream 500")
+
+    default = []
+    stage = FetchStage(max_workers=4)
+    stage.add("slow", slow, timeout=0.1, default=default)
+    stage.add("broken", broken, default=default)
+    stage.add("after_broken", lambda data: data + ["ok"], depends_on=["broken"], default=None)
+    stage.add("fast", lambda: "ok")
+    started = time.time()
+    results = stage.run()
+    assert time.time() - started < 0.8
+    assert results["slow"] == [] and results["broken"] == []
+    assert results["slow"] is not default  # chaque source reçoit sa propre copie
+    assert results["after_broken"] == ["ok"] and results["fast"] == "ok"
+    assert stage.timings["slow"]["status"] == "timeout"
+    assert stage.timings["broken"]["status"] == "error"
+
+
+def test_timeout_starts_when_source_runs_not_when_queued():
+    def slow(value):
+        time.sleep(0.15)
+        return value
+
+    # Un seul thread : "b" attend "a" dans la file, son délai ne court qu'à son démarrage
+    stage = FetchStage(max_workers=1)
+    stage.add("a", slow, "a", timeout=0.25)
+    stage.add("b", slow, "b", timeout=0.25)
+    results = stage.run()
+    assert results == {"a": "a", "b": "b"}
+    assert stage.timings["b"]["status"] == "ok" and stage.timings["b"]["queued"] >= 0.1
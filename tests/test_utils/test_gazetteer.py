@@ -0,0 +1,43 @@
+import shapely
+
+from utils.gazetteer import Gazetteer, normalize_name
+
+
+def square(x, y, size=0.1):
+    return {"type": "Polygon", "coordinates": [[[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]]}
+
+
+COMMUNES = [
+    {"nom": "Saint-Étienne", "code": "42218", "codeDepartement": "42", "departement": {"code": "42", "nom": "Loire"},
+     "population": 170000, "surface": 7997, "centre": {"type": "Point", "coordinates": [4.35, 45.45]},
+     "contour": square(4.3, 45.4), "codesPostaux": ["42000", "42100"]},
+    {"nom": "Saint-Martin", "code": "32390", "codeDepartement": "32", "population": 300,
+     "centre": {"type": "Point", "coordinates": [0.05, 43.55]}, "contour": square(0.0, 43.5)},
+    {"nom": "Saint-Martin", "code": "67430", "codeDepartement": "67", "population": 450,
+     "centre": {"type": "Point", "coordinates": [7.35, 48.35]}, "contour": square(7.3, 48.3)},
+]
+
+
+def test_search_locate_and_levels(tmp_path):
+    path = str(tmp_path / "communes.sqlite")
+    assert not Gazetteer(path).available
+    assert Gazetteer(path).import_communes(COMMUNES) == 3
+
+    gazetteer = Gazetteer(path)
+    assert gazetteer.available and len(gazetteer) == 3
+    assert normalize_name("St-ÉTIENNE") == "saint etienne"
+
+    [se] = gazetteer.search("st etienne", fields="centre,contour,population")
+    assert set(se) == {"nom", "code", "centre", "contour", "population"}
+    assert se["code"] == "42218" and se["centre"]["coordinates"] == [4.35, 45.45]
+    assert shapely.geometry.shape(se["contour"]).equals(shapely.geometry.shape(square(4.3, 45.4)))
+    # Homonymes : le plus peuplé d'abord ; code INSEE accepté
+    assert [c["code"] for c in gazetteer.search("saint martin")] == ["67430", "32390"]
+    assert gazetteer.search("42218", fields="nom")[0]["nom"] == "Saint-Étienne"
+    assert gazetteer.search("Inconnue") == []
+
+    assert gazetteer.contour("42218", "1km") is not None
+    assert gazetteer.locate(7.35, 48.32)["code"] == "67430"
+    assert gazetteer.locate(5.0, 45.0) is None
+    assert [c["code"] for c in gazetteer.in_departement("42", fields="code")] == ["42218"]
+    assert gazetteer.get("42218")["departement"] == {"code": "42", "nom": "Loire"}
@@ -0,0 +1,74 @@
+import json
+
+from shapely.geometry import MultiPolygon, Point, box, mapping, shape
+
+from utils.geometry_tiling import fan_out, merge_collections, split_for_url
+
+
+def _scattered_parts():
+    # Îlots éloignés (communes à enclaves) : ni l'élargissement ni la simplification ne les fusionnent
+    parts = [box(0.05 * i, 0.05 * j, 0.05 * i + 0.001, 0.05 * j + 0.001) for i in range(20) for j in range(15)]
+    return MultiPolygon(parts)
+
+
+def test_split_tiles_fit_budget_and_cover_original():
+    poly = _scattered_parts()
+    assert len(json.dumps(mapping(poly))) > 4000
+    tiles = split_for_url(poly, budget=4000)
+    assert len(tiles) > 1
+    assert all(len(json.dumps(t)) <= 4000 for t in tiles)
+    union = shape(tiles[0]).union(shape(tiles[1]))
+    for t in tiles[2:]:
+        union = union.union(shape(t))
+    assert union.buffer(1e-9).covers(poly)
+    assert split_for_url(mapping(box(0, 0, 1, 1))) == [mapping(box(0, 0, 1, 1))]
+
+
+def test_fan_out_merges_dedups_and_clips():
+    poly = _scattered_parts()
+    calls = []
+
+    def fetch(endpoint, tile):
+        calls.append(endpoint)
+        if endpoint == "down":
+            raise IOError("timeout")
+        feats = [
+            {"type": "Feature", "id": "inside", "geometry": mapping(Point(0.0505, 0.0505)), "properties": {}},
+            {"type": "Feature", "id": "outside", "geometry": mapping(Point(5, 5)), "properties": {}},
+            {"type": "Feature", "id": "doc", "geometry": None, "properties": {}},
+        ]
+        return {"type": "FeatureCollection", "features": feats}
+
+    results, n_tiles, failed = fan_out(fetch, ["zone-urba", "down"], poly, max_workers=4)
+    assert n_tiles > 1 and len(calls) == 2 * n_tiles
+    assert [f["id"] for f in results["zone-urba"]["features"]] == ["inside", "doc"]
+    assert "failed_tiles" not in results["zone-urba"]
+    assert results["down"] is None and failed == {"down": n_tiles}
+    assert merge_collections([None, None]) is None
+
+
+def test_fan_out_caps_requests_and_reports_failed_tiles():
+    poly = _scattered_parts()
+    calls = []
+
+    def fetch(endpoint, tile):
+        calls.append(tile)
+        # Une tuile sur deux ne répond pas
+        if len(calls) % 2 == 0:
+            return None
+        return {"type": "FeatureCollection", "features": [
+            {"type": "Feature", "id": f"f{len(calls)}", "geometry": None, "properties": {}},
+        ]}
+
+    uncapped = len(split_for_url(poly))
+    keys = [f"e{i}" for i in range(5)]
+    results, n_tiles, failed = fan_out(fetch, keys, poly, max_workers=1, max_requests=3 * len(keys))
+    assert n_tiles < uncapped and len(calls) == n_tiles * len(keys) <= 3 * len(keys)
+    assert sum(failed.values()) == len(calls) // 2
+    for key, n in failed.items():
+        assert results[key] is None if n == n_tiles else results[key]["failed_tiles"] == n
+
+    # Plafond inférieur au nombre de clés : une seule tuile, une requête par clé
+    calls.clear()
+    _, n_tiles, _ = fan_out(fetch, keys, poly, max_requests=2)
+    assert n_tiles == 1 and len(calls) == len(keys)
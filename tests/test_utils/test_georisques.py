@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+
+from utils.disk_cache import DiskCache
+from utils.georisques import COMMUNE, POINT, GeoRisquesClient, RiskEndpoint
+
+ENDPOINTS = [
+    RiskEndpoint("sismique", "zonage_sismique", COMMUNE),
+    RiskEndpoint("radon", "radon", COMMUNE),
+    RiskEndpoint("cavites", "cavites", POINT, 1000),
+    RiskEndpoint("mvt", "mvt", POINT, 1000),
+    RiskEndpoint("installations", "installations", POINT, 2000),
+]
+
+
+@pytest.fixture
+def server():
+    hits = []
+    radon_calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            hits.append((url.path, parse_qs(url.query)))
+            if url.path.endswith("/mvt"):
+                time.sleep(1.0)
+            status = 200
+            if url.path.endswith("/radon"):
+                radon_calls.append(1)
+                status = 500 if len(radon_calls) == 1 else 200
+            body = json.dumps({"data": [{"path": url.path}]}).encode()
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/api/v1", hits
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_deadline_partial_results_and_insee_cache(server, tmp_path):
+    base_url, hits = server
+    client = GeoRisquesClient(requests.Session(), DiskCache(str(tmp_path / "c.sqlite")),
+                              insee_resolver=lambda lat, lon: "75056", deadline=0.5,
+                              endpoints=ENDPOINTS, base_url=base_url)
+    risques, meta = client.fetch(48.85, 2.35)
+    assert list(risques) == ["sismique", "radon", "cavites", "mvt", "installations"]
+    assert risques["mvt"] == [] and meta["late"] == ["mvt"]
+    assert risques["radon"] == [] and meta["errors"] == ["radon"]
+    assert meta["unavailable"] == ["mvt", "radon"]
+    assert risques["cavites"] == [{"path": "/api/v1/cavites"}]
+    params = dict(hits)
+    assert params["/api/v1/zonage_sismique"] == {"code_insee": ["75056"]}
+    assert params["/api/v1/installations"] == {"latlon": ["2.35,48.85"], "rayon": ["2000"]}
+
+    hits.clear()
+    risques, meta = client.fetch(48.86, 2.36)
+    # Sismique servi par le cache INSEE ; radon (en erreur au premier appel) redemandé
+    assert meta["cached"] == ["sismique"]
+    assert "/api/v1/zonage_sismique" not in [h[0] for h in hits]
+    assert risques["sismique"] == [{"path": "/api/v1/zonage_sismique"}]
+    assert risques["radon"] == [{"path": "/api/v1/radon"}]
@@ -0,0 +1,62 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.http_client import UpstreamClient, UpstreamPolicy
+
+
+@pytest.fixture
+def server():
+    hits = {"flaky": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/flaky":
+                hits["flaky"] += 1
+                status = 503 if hits["flaky"] == 1 else 200
+            else:
+                status = 404 if self.path == "/missing" else 200
+            self.send_response(status)
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"127.0.0.1:{httpd.server_address[1]}", hits
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_policy_applies_per_host_with_metrics(server):
+    host, hits = server
+    client = UpstreamClient({host: UpstreamPolicy(pool_size=2, timeout=3, retries=2, backoff=0)})
+    sent = {}
+    original = client.send
+
+    def spy(request, **kwargs):
+        sent["timeout"] = kwargs.get("timeout")
+        return original(request, **kwargs)
+
+    client.send = spy
+    assert client.get(f"http://{host}/ok").status_code == 200
+    assert sent["timeout"] == 3
+    assert client.get(f"http://{host}/flaky").status_code == 200
+    assert hits["flaky"] == 2
+    assert client.get(f"http://{host}/missing").status_code == 404
+
+    stats = client.stats()[host]
+    assert stats["requests"] == 3 and stats["retries"] == 1 and stats["http_errors"] == 1
+    assert stats["latency_ms"]["p50"] is not None
+
+
+def test_connection_errors_are_counted():
+    client = UpstreamClient(default=UpstreamPolicy(retries=0, timeout=1))
+    with pytest.raises(Exception):
+        client.get("http://127.0.0.1:9/")
+    assert client.stats()["127.0.0.1:9"]["errors"] == 1
@@ -0,0 +1,69 @@
+import time
+
+from utils.jobs import JobRunner, JobStore
+
+
+def test_submit_dedupe_and_resume_after_worker_death(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"), lease=0.2)
+    job_id = store.submit("dept_report", {"department": "23", "workers": 2})
+    # Même demande pendant que le travail est actif : même travail
+    assert store.submit("dept_report", {"workers": 2, "department": "23"}) == job_id
+    # Le parallélisme ne change pas le résultat : même travail
+    assert store.submit("dept_report", {"department": "23", "workers": 6}) == job_id
+    assert store.submit("dept_report", {"department": "87"}) != job_id
+
+    # Un premier worker traite deux communes puis meurt (plus de battement de bail)
+    job = store.claim("mort")
+    assert job["id"] == job_id and job["status"] == "running"
+    store.update(job_id, total=4)
+    store.checkpoint(job_id, "Aubusson", {"nom": "Aubusson"})
+    store.checkpoint(job_id, "Bourganeuf", error="timeout amont")
+    assert store.claim("autre", ["dept_report"])["params"]["department"] == "87"
+    assert store.claim("autre", ["dept_report"]) is None  # bail encore valide
+
+    calls = []
+
+    def handler(ctx):
+        assert ctx.resumed
+        for nom in ["Aubusson", "Bourganeuf", "Guéret", "La Souterraine"]:
+            if nom in ctx.done_keys():
+                continue
+            calls.append(nom)
+            ctx.checkpoint(nom, {"nom": nom})
+
+    time.sleep(0.25)
+    assert JobRunner(store, {"dept_report": handler}).run_once("relais")
+    # Seules les communes manquantes (et l'échec) sont recalculées
+    assert calls == ["Bourganeuf", "Guéret", "La Souterraine"]
+    job = store.get(job_id)
+    assert job["status"] == "done" and job["attempts"] == 2
+    assert job["progress"] == {"done": 4, "failed": 0, "total": 4}
+
+    items = store.items(job_id)
+    assert [i["key"] for i in items] == ["Aubusson", "Bourganeuf", "Guéret", "La Souterraine"]
+    assert items[1]["result"] == {"nom": "Bourganeuf"} and items[1]["error"] is None
+    # Reprise d'un flux après un curseur, jusqu'à l'état final
+    events = list(store.follow(job_id, after=items[1]["seq"], poll_interval=0.01))
+    assert [e["key"] for e in events if e["type"] == "item"] == ["Guéret", "La Souterraine"]
+    assert events[-1]["type"] == "end" and events[-1]["job"]["status"] == "done"
+
+
+def test_failure_cancel_and_purge(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+
+    def broken(ctx):
+        raise ValueError("département inconnu")
+
+    failed = store.submit("dept_report", {"department": "XX"})
+    runner = JobRunner(store, {"dept_report": broken})
+    assert runner.run_once() and not runner.run_once()
+    assert store.get(failed)["status"] == "failed"
+    assert store.get(failed)["error"] == "département inconnu"
+
+    cancelled = store.submit("dept_report", {"department": "23"})
+    assert store.cancel(cancelled) and not store.cancel(cancelled)
+    assert store.claim("w") is None
+    assert store.stats()["jobs"] == {"failed": 1, "cancelled": 1}
+
+    assert store.purge(older_than=3600) == 0
+    assert store.purge(older_than=0) == 2 and store.list() == []
@@ -0,0 +1,98 @@
+from shapely.geometry import Polygon
+
+from utils.layer_store import LayerStore
+
+
+def _feature(fid, coords, geom_type="Point"):
+    return {"type": "Feature", "id": fid, "geometry": {"type": geom_type, "coordinates": coords},
+            "geometry_name": "the_geom", "properties": {"nom": fid}}
+
+
+FEATURES = [
+    _feature("p.1", [1.04, 46.01]),
+    _feature("p.2", [1.02, 46.09]),
+    _feature("p.3", [[[1.5, 46.5], [1.6, 46.5], [1.6, 46.6], [1.5, 46.5]]], "Polygon"),
+]
+
+
+def test_query_returns_geoserver_shaped_features(tmp_path):
+    store = LayerStore(str(tmp_path / "layers.sqlite"))
+    assert store.import_layer("gpu:postes", [FEATURES[:2], FEATURES[2:]], version="1") == 3
+    found = store.query("gpu:postes", "1.0,46.0,1.05,46.05,EPSG:4326")
+    assert found == [FEATURES[0]]
+    # Emprise du triangle recoupée mais géométrie hors zone : exclue comme par GeoServer
+    assert store.query("gpu:postes", "1.5,46.55,1.54,46.6,EPSG:4326") == []
+    # p.2 est dans l'emprise du triangle mais hors du triangle
+    commune = Polygon([(1.0, 46.0), (1.1, 46.0), (1.1, 46.1)])
+    assert [f["id"] for f in store.query("gpu:postes", None, geometry=commune)] == ["p.1"]
+    assert store.has_layer("gpu:postes") and not store.has_layer("gpu:postes", "EPSG:2154")
+
+
+def test_refresh_only_when_version_changes(tmp_path):
+    store = LayerStore(str(tmp_path / "layers.sqlite"))
+    calls = []
+
+    def pages():
+        calls.append(1)
+        return [FEATURES]
+
+    assert store.refresh_layer("gpu:postes", pages, "1") == 3
+    assert store.refresh_layer("gpu:postes", pages, "1") is None
+    assert store.refresh_layer("gpu:postes", lambda: [FEATURES[:1]], "2") == 1
+    assert len(calls) == 1
+    assert store.layer_info("gpu:postes")["feature_count"] == 1
+    assert [f["id"] for f in store.query("gpu:postes", "0,0,2,47,EPSG:4326")] == ["p.1"]
+
+
+def test_failed_import_keeps_previous_version(tmp_path):
+    store = LayerStore(str(tmp_path / "layers.sqlite"))
+    store.import_layer("gpu:postes", [FEATURES], version="1")
+
+    def broken_pages():
+        yield FEATURES[:1]
+        raise ConnectionError("tunnel coupé")
+
+    try:
+        store.import_layer("gpu:postes", broken_pages(), version="2")
+    except ConnectionError:
+        pass
+    assert store.layer_info("gpu:postes")["version"] == "1"
+    assert len(store.query("gpu:postes", "0,0,2,47,EPSG:4326")) == 3
+
+
+class _Capabilities:
+    def __init__(self, body):
+        self.content = body
+
+    def get(self, url, params=None, timeout=None):
+        return self
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_catalog_change_refreshes_only_the_modified_layer(tmp_path):
+    from utils.wfs_cache import read_layer_versions
+
+    def capabilities(postes_bbox):
+        return (
+            '<wfs:WFS_Capabilities updateSequence="{seq}"><FeatureTypeList>'
+            '<FeatureType xmlns:gpu="gpu"><Name>gpu:postes</Name><ows:WGS84BoundingBox>{bbox}'
+            '</ows:WGS84BoundingBox></FeatureType>'
+            '<FeatureType xmlns:gpu="gpu"><Name>gpu:friches</Name><ows:WGS84BoundingBox>1 46 2 47'
+            '</ows:WGS84BoundingBox></FeatureType></FeatureTypeList></wfs:WFS_Capabilities>'
+        ).format(seq=postes_bbox[0], bbox=postes_bbox).encode()
+
+    store = LayerStore(str(tmp_path / "layers.sqlite"))
+    before = read_layer_versions(_Capabilities(capabilities("1 46 2 47")), "http://geoserver/wfs")
+    for layer in ("gpu:postes", "gpu:friches"):
+        store.refresh_layer(layer, lambda: [FEATURES], before[layer])
+
+    # Seule la couche des postes est rechargée : l'updateSequence global change, pas les friches
+    after = read_layer_versions(_Capabilities(capabilities("0 45 2 47")), "http://geoserver/wfs")
+    assert after["gpu:friches"] == before["gpu:friches"] and after["gpu:postes"] != before["gpu:postes"]
+    assert store.refresh_layer("gpu:friches", lambda: [FEATURES], after["gpu:friches"]) is None
+    assert store.refresh_layer("gpu:postes", lambda: [FEATURES[:1]], after["gpu:postes"]) == 1
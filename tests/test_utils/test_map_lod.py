@@ -0,0 +1,74 @@
+import json
+import math
+
+from shapely.geometry import Polygon, mapping, shape
+
+from utils.map_lod import LODCache, MapLOD, count_vertices, simplify_geometry
+
+
+def _detailed_parcel(n=400):
+    # Contour de ~200 m de rayon avec un sommet tous les ~3 m
+    coords = []
+    for i in range(n):
+        a = 2 * math.pi * i / n
+        r = 0.002 + 0.00002 * math.sin(25 * a)
+        coords.append((2.0 + r * math.cos(a), 46.0 + r * math.sin(a)))
+    return mapping(Polygon(coords))
+
+
+def test_simplification_reduces_vertices_and_stays_valid():
+    geom = _detailed_parcel()
+    coarse = simplify_geometry(geom, 20.0)
+    assert count_vertices(coarse) < count_vertices(geom) / 4
+    assert shape(coarse).is_valid
+    assert abs(shape(coarse).area - shape(geom).area) / shape(geom).area < 0.1
+    assert simplify_geometry(geom, 0) is geom
+    point = {"type": "Point", "coordinates": [2.0, 46.0]}
+    assert simplify_geometry(point, 20.0) is point
+
+
+def test_levels_are_served_per_layer():
+    lod = MapLOD()
+    geom = _detailed_parcel()
+    shown = lod.initial(geom)
+    lod.register("geo_json_abc", geom, shown)
+    assert lod.level("coarse") == {"geo_json_abc": shown}
+    assert lod.level("full") == {"geo_json_abc": geom}
+    medium = lod.level("medium")["geo_json_abc"]
+    assert count_vertices(shown) < count_vertices(medium) < count_vertices(geom)
+    stats = lod.stats()
+    assert stats["vertices_initial"] < stats["vertices_full"]
+    assert stats["geojson_bytes_initial"] < stats["geojson_bytes_full"]
+    assert lod.id in lod.zoom_script("/map_lod")
+
+
+def test_cache_keeps_most_recent_maps():
+    cache = LODCache(max_maps=2)
+    first, second, third = MapLOD(), MapLOD(), MapLOD()
+    for lod in (first, second):
+        cache.put(lod)
+    assert cache.get(first.id) is first
+    cache.put(third)
+    assert cache.get(second.id) is None
+    assert set(cache.ids()) == {first.id, third.id}
+    expired = LODCache(ttl=-1)
+    expired.put(first)
+    assert expired.get(first.id) is None
+
+
+def test_persisted_maps_outlive_memory_cache(tmp_path):
+    geom = _detailed_parcel()
+    lod = MapLOD()
+    lod.register("geo_json_abc", geom, lod.initial(geom))
+    LODCache(directory=str(tmp_path)).put(lod)
+
+    # Autre worker, redémarrage ou expiration : la carte est relue depuis son fichier
+    other = LODCache(ttl=-1, directory=str(tmp_path))
+    reloaded = other.get(lod.id)
+    assert reloaded.level("full") == {"geo_json_abc": json.loads(json.dumps(geom))}
+    assert count_vertices(reloaded.level("coarse")["geo_json_abc"]) < count_vertices(geom)
+    assert other.get("../" + lod.id) is None and other.get("0" * 32) is None
+
+    script = lod.zoom_script("/map_lod", f"/static/cartes/lod/{lod.id}.json")
+    assert f'FALLBACK = "/static/cartes/lod/{lod.id}.json"' in script
+    assert "FALLBACK = null" in lod.zoom_script("/map_lod")
@@ -0,0 +1,54 @@
+import threading
+import time
+
+from utils.parallel_stream import stream_unordered
+
+
+def test_completion_order_bounded_concurrency_and_retries():
+    active, peak, calls = [0], [0], {}
+    lock = threading.Lock()
+
+    def work(item):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            calls[item] = calls.get(item, 0) + 1
+        try:
+            time.sleep({"slow": 0.4}.get(item, 0.05))
+            if item == "flaky" and calls[item] == 1:
+                raise RuntimeError("timeout amont")
+            if item == "broken":
+                raise ValueError("commune introuvable")
+            return item.upper()
+        finally:
+            with lock:
+                active[0] -= 1
+
+    retried = []
+    outcomes = list(stream_unordered(work, ["slow", "a", "flaky", "broken", "b", "c"], max_workers=3,
+                                     retries=1, retry_delay=0.05, on_retry=lambda i, e, n: retried.append(i)))
+
+    order = [o.item for o in outcomes]
+    assert sorted(order) == sorted(["slow", "a", "flaky", "broken", "b", "c"])
+    # La tâche lente n'a pas retenu les autres
+    assert order.index("slow") > order.index("b")
+    assert peak[0] <= 3
+    by_item = {o.item: o for o in outcomes}
+    assert by_item["flaky"].ok and by_item["flaky"].result == "FLAKY" and by_item["flaky"].attempts == 2
+    assert not by_item["broken"].ok and by_item["broken"].attempts == 2 and calls["broken"] == 2
+    assert sorted(retried) == ["broken", "flaky"]
+
+
+def test_stop_cancels_pending():
+    started = []
+
+    def work(item):
+        started.append(item)
+        time.sleep(0.05)
+        return item
+
+    stream = stream_unordered(work, range(50), max_workers=2)
+    next(stream)
+    stream.close()
+    time.sleep(0.2)
+    assert len(started) <= 4
@@ -0,0 +1,34 @@
+import math
+import threading
+
+from pyproj import Transformer
+from shapely.geometry import Polygon, box, mapping
+
+from utils.projection import get_transformer, layer_metrics, project
+
+
+def test_layer_metrics_match_per_feature_projection():
+    feats = [
+        {"type": "Feature", "geometry": mapping(box(2.0, 46.0, 2.01, 46.01)), "properties": {}},
+        {"type": "Feature", "geometry": None, "properties": {}},
+        mapping(box(2.0, 46.0, 2.001, 46.001)),
+    ]
+    metrics = layer_metrics(feats)
+    tr = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True)
+    expected = Polygon([tr.transform(x, y) for x, y in box(2.0, 46.0, 2.01, 46.01).exterior.coords])
+    assert math.isclose(metrics.area_m2[0], expected.area, rel_tol=1e-9)
+    assert math.isnan(metrics.area_m2[1])
+    lon, lat = metrics.centroid(0)
+    assert math.isclose(lon, 2.005, abs_tol=1e-6) and math.isclose(lat, 46.005, abs_tol=1e-4)
+    assert math.isclose(metrics.centroid_l93[0, 0], expected.centroid.x)
+    assert len(layer_metrics([])) == 0
+
+
+def test_transformers_are_cached_per_thread():
+    assert get_transformer() is get_transformer("EPSG:4326", "EPSG:2154")
+    other = []
+    thread = threading.Thread(target=lambda: other.append(get_transformer()))
+    thread.start()
+    thread.join()
+    assert other[0] is not get_transformer()
+    assert project(None) is None
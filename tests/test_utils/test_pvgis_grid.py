@@ -0,0 +1,73 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import requests
+
+from utils.disk_cache import DiskCache
+from utils.pvgis_grid import PVGISGrid, PVGISYield, build_grid
+
+
+def plane(lat, lon, tilt, azimuth):
+    return 1500.0 - 20.0 * lat + 5.0 * lon + tilt
+
+
+def fetch(lat, lon, tilt, azimuth):
+    # Un nœud « en mer » sans valeur
+    return None if (lat, lon) == (45.0, 3.0) else plane(lat, lon, tilt, azimuth)
+
+
+def test_grid_build_lookup_and_roundtrip(tmp_path):
+    grid = build_grid(fetch, bounds=(1.0, 43.0, 3.0, 45.0), step=0.5, configs=[(30, 180), (10, 180)], workers=3)
+    assert grid.shape == (5, 5) and np.isnan(grid.yields[0, 4, 4])
+    grid.save(str(tmp_path / "grid.npz"))
+    grid = PVGISGrid.load(str(tmp_path / "grid.npz"))
+
+    lons, lats = np.array([1.2, 2.7, 2.9, 5.0]), np.array([43.3, 44.1, 44.9, 44.0])
+    values = grid.lookup(lons, lats, 30, 180)
+    assert np.allclose(values[:2], plane(lats[:2], lons[:2], 30, 180), atol=1e-3)
+    # Voisin sans valeur écarté, point hors grille en NaN
+    assert np.isfinite(values[2]) and np.isnan(values[3])
+    assert np.isnan(grid.lookup(lons, lats, 35, 180)).all()
+
+
+def test_live_fallback_is_cached(tmp_path):
+    calls = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            calls.append(parse_qs(urlsplit(self.path).query))
+            body = json.dumps({"outputs": {"totals": {"fixed": {"E_y": 1234.5}}}}).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    try:
+        build_grid(fetch, bounds=(1.0, 43.0, 3.0, 45.0), step=0.5).save(str(tmp_path / "grid.npz"))
+        pv = PVGISYield(str(tmp_path / "grid.npz"), requests.Session(), DiskCache(str(tmp_path / "c.sqlite")),
+                        url=f"http://127.0.0.1:{httpd.server_address[1]}/api/v5_2/PVcalc")
+        assert abs(pv.at(44.0, 2.0) - plane(44.0, 2.0, 30, 180)) < 1e-3 and not calls
+
+        assert pv.at(48.853, 2.349) == 1234.5
+        assert pv.at(48.851, 2.351) == 1234.5
+        assert len(calls) == 1 and calls[0]["lat"] == ["48.85"] and calls[0]["aspect"] == ["0.0"]
+
+        features = [
+            {"type": "Feature", "geometry": {"type": "Point", "coordinates": [1.5, 44.5]}, "properties": {}},
+            {"type": "Feature", "geometry": None, "properties": {}},
+        ]
+        assert pv.annotate(features) == 1
+        assert features[0]["properties"]["productible_kwh_kwc"] == round(plane(44.5, 1.5, 30, 180), 1)
+        assert features[1]["properties"]["productible_kwh_kwc"] is None
+        assert pv.stats()["api_calls"] == 1 and pv.stats()["cache_hits"] == 1
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
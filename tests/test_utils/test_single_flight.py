@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from utils.single_flight import SingleFlight
+
+
+def _run_concurrently(n, target):
+    results = [None] * n
+    errors = [None] * n
+
+    def run(i):
+        try:
+            results[i] = target()
+        except Exception as e:
+            errors[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, errors
+
+
+def test_identical_concurrent_calls_share_one_upstream_call():
+    flight = SingleFlight()
+    upstream = []
+
+    @flight.wrap("wfs")
+    def fetch(layer, bbox):
+        upstream.append((layer, bbox))
+        time.sleep(0.2)
+        return [{"id": "p.1", "properties": {}}]
+
+    results, errors = _run_concurrently(5, lambda: fetch("gpu:postes", "0,0,1,1"))
+    assert errors == [None] * 5
+    assert len(upstream) == 1
+    # Chaque appelant a sa propre copie
+    results[0][0]["properties"]["x"] = 1
+    assert all("x" not in r[0]["properties"] for r in results[1:])
+    stats = flight.stats()
+    assert stats["upstream"] == 1 and stats["coalesced"] == 4 and stats["in_flight"] == 0
+
+    fetch("gpu:postes", "0,0,1,1")  # appel terminé : rien n'est conservé
+    assert len(upstream) == 2
+
+
+def test_errors_propagate_to_followers_and_are_not_retained():
+    flight = SingleFlight()
+
+    @flight.wrap("gpu")
+    def broken():
+        time.sleep(0.1)
+        raise RuntimeError("503")
+
+    _, errors = _run_concurrently(3, broken)
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    with pytest.raises(RuntimeError):
+        broken()
+    assert flight.stats()["namespaces"]["gpu"]["upstream"] == 2
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import Point, box
+
+from utils.wfs_binary import BinaryFormatUnavailable, FeatureTable, WFSBinaryReader, decode_flatgeobuf
+
+
+def _flatgeobuf(tmp_path, geoms, names, surfaces):
+    raw = pytest.importorskip("pyogrio.raw")
+    path = str(tmp_path / "page.fgb")
+    raw.write(path, shapely.to_wkb(np.array(geoms, dtype=object)),
+              [np.array(names, dtype=object), np.array(surfaces)], ["ID_PARCEL", "SURF_PARC"],
+              driver="FlatGeobuf", geometry_type="Polygon", crs="EPSG:4326", spatial_index=False)
+    with open(path, "rb") as fh:
+        return fh.read()
+
+
+class _Resp:
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+class _Session:
+    def __init__(self, pages, matched=None):
+        self.pages = list(pages)
+        self.matched = matched
+        self.params = []
+
+    def get(self, url, params=None, timeout=None):
+        if params.get("resultType") == "hits":
+            hits = b"<ows:ExceptionReport/>" if self.matched is None else b'<wfs:FeatureCollection numberMatched="%d" numberReturned="0"/>' % self.matched
+            return _Resp(hits)
+        self.params.append(params)
+        return _Resp(self.pages.pop(0))
+
+
+def test_flatgeobuf_decodes_to_columns(tmp_path):
+    content = _flatgeobuf(tmp_path, [box(0, 0, 1, 1), box(2, 2, 3, 3)], ["a", "b"], [1.5, float("nan")])
+    table = decode_flatgeobuf(content)
+    assert len(table) == 2 and table.crs == "EPSG:4326"
+    assert list(shapely.intersects(table.geometries, Point(0.5, 0.5))) == [True, False]
+    hit = table.take(shapely.intersects(table.geometries, Point(2.5, 2.5))).to_features()
+    assert hit == [{"type": "Feature", "geometry": shapely.geometry.mapping(box(2, 2, 3, 3)),
+                    "properties": {"ID_PARCEL": "b", "SURF_PARC": None}}]
+
+
+def test_reader_pages_and_falls_back_when_format_refused(tmp_path):
+    first = _flatgeobuf(tmp_path, [box(0, 0, 1, 1), box(1, 1, 2, 2)], ["a", "b"], [1.0, 2.0])
+    last = _flatgeobuf(tmp_path, [box(2, 2, 3, 3)], ["c"], [3.0])
+    session = _Session([first, last], matched=3)
+    table = WFSBinaryReader(session, "http://geo/ows", page_size=2).read("gpu:rpg", "0,0,3,3,EPSG:4326")
+    assert list(table.column("ID_PARCEL")) == ["a", "b", "c"]
+    assert [p["startIndex"] for p in session.params] == [0, 2]
+
+    refused = WFSBinaryReader(_Session([b"<ows:ExceptionReport>Unknown output format</ows:ExceptionReport>"]), "u")
+    with pytest.raises(BinaryFormatUnavailable):
+        refused.read("gpu:rpg")
+    assert refused.supported is False
+    with pytest.raises(BinaryFormatUnavailable):
+        refused.read("gpu:rpg")
+
+
+def test_reader_pages_past_server_cap(tmp_path):
+    # GeoServer plafonne à 2 entités par requête, en dessous du page_size demandé
+    capped = [_flatgeobuf(tmp_path, [box(0, 0, 1, 1), box(1, 1, 2, 2)], ["a", "b"], [1.0, 2.0]),
+              _flatgeobuf(tmp_path, [box(2, 2, 3, 3)], ["c"], [3.0])]
+    session = _Session(capped, matched=3)
+    table = WFSBinaryReader(session, "http://geo/ows", page_size=5).read("gpu:rpg")
+    assert list(table.column("ID_PARCEL")) == ["a", "b", "c"]
+    assert [p["startIndex"] for p in session.params] == [0, 2]
+
+    # Sans numberMatched, une page courte peut être tronquée : repli GeoJSON plutôt qu'une couche incomplète
+    reader = WFSBinaryReader(_Session(capped[:1]), "http://geo/ows", page_size=5)
+    with pytest.raises(BinaryFormatUnavailable):
+        reader.read("gpu:rpg")
+    assert reader.supported is True
+
+
+def test_geojson_fallback_builds_same_table():
+    features = [{"type": "Feature", "id": "rpg.1", "geometry": shapely.geometry.mapping(box(0, 0, 1, 1)),
+                 "properties": {"ID_PARCEL": "a"}},
+                {"type": "Feature", "id": "rpg.2", "geometry": None, "properties": {"CODE_CULTU": "BTH"}}]
+    table = FeatureTable.from_features(features)
+    assert list(table.column("ID_PARCEL")) == ["a", None]
+    assert list(shapely.intersects(table.geometries, Point(0.5, 0.5))) == [True, False]
+    assert table.to_features()[0]["id"] == "rpg.1"
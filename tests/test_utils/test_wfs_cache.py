@@ -0,0 +1,83 @@
+from utils.wfs_cache import WFSTileCache, parse_bbox
+
+
+def _point(fid, x, y):
+    return {"type": "Feature", "id": fid, "geometry": {"type": "Point", "coordinates": [x, y]}, "properties": {}}
+
+
+FEATURES = [_point("p.1", 1.01, 46.01), _point("p.2", 1.07, 46.02), _point("p.3", 1.30, 46.30)]
+
+
+def _fake_fetch(calls):
+    def fetch(bbox):
+        calls.append(bbox)
+        (minx, miny, maxx, maxy), _ = parse_bbox(bbox)
+        return [f for f in FEATURES
+                if minx <= f["geometry"]["coordinates"][0] <= maxx and miny <= f["geometry"]["coordinates"][1] <= maxy]
+    return fetch
+
+
+def test_tiles_are_reused_across_overlapping_bboxes(tmp_path):
+    cache = WFSTileCache(str(tmp_path / "wfs.sqlite"), layer_ttls={"gpu:postes": 3600},
+                         tile_sizes={"gpu:postes": {"EPSG:4326": 0.1}})
+    calls = []
+    first = cache.get_features("gpu:postes", "1.005,46.005,1.04,46.04,EPSG:4326", "EPSG:4326", _fake_fetch(calls))
+    assert [f["id"] for f in first] == ["p.1"]
+    # Bbox voisine dans la même tuile : aucune requête supplémentaire
+    second = cache.get_features("gpu:postes", "1.05,46.005,1.09,46.04,EPSG:4326", "EPSG:4326", _fake_fetch(calls))
+    assert [f["id"] for f in second] == ["p.2"]
+    assert len(calls) == 1
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_version_change_invalidates_tiles(tmp_path):
+    version = {"v": "1"}
+    cache = WFSTileCache(str(tmp_path / "wfs.sqlite"), layer_ttls={"gpu:postes": 3600},
+                         version_provider=lambda layer: version["v"], version_check_interval=0)
+    calls = []
+    cache.get_features("gpu:postes", "1.005,46.005,1.04,46.04,EPSG:4326", "EPSG:4326", _fake_fetch(calls))
+    version["v"] = "2"
+    cache.get_features("gpu:postes", "1.005,46.005,1.04,46.04,EPSG:4326", "EPSG:4326", _fake_fetch(calls))
+    assert len(calls) == 2
+    assert cache.stats()["stale"] == 1
+
+
+def test_lru_eviction_and_uncached_layers(tmp_path):
+    cache = WFSTileCache(str(tmp_path / "wfs.sqlite"), layer_ttls={"gpu:postes": 3600}, max_tiles=1)
+    calls = []
+    cache.get_features("gpu:postes", "1.005,46.005,1.04,46.04,EPSG:4326", "EPSG:4326", _fake_fetch(calls))
+    cache.get_features("gpu:postes", "1.26,46.26,1.29,46.29,EPSG:4326", "EPSG:4326", _fake_fetch(calls))
+    assert cache.stats()["tiles"] == 1 and cache.stats()["evictions"] == 1
+    cache.get_features("gpu:autre", "1.005,46.005,1.04,46.04,EPSG:4326", "EPSG:4326", _fake_fetch(calls))
+    assert cache.stats()["bypass"] == 1
+
+
+def test_only_missing_runs_are_fetched_and_truncated_replies_not_cached(tmp_path):
+    cache = WFSTileCache(str(tmp_path / "wfs.sqlite"), layer_ttls={"gpu:postes": 3600},
+                         tile_sizes={"gpu:postes": {"EPSG:4326": 0.1}}, feature_limit=2)
+    calls = []
+    # Tuile centrale (1.1-1.2) en cache : la bbox élargie ne redemande que les colonnes voisines
+    cache.get_features("gpu:postes", "1.12,46.01,1.18,46.09,EPSG:4326", "EPSG:4326", _fake_fetch(calls))
+    calls.clear()
+    cache.get_features("gpu:postes", "1.01,46.01,1.29,46.09,EPSG:4326", "EPSG:4326", _fake_fetch(calls))
+    fetched = sorted(tuple(round(v, 6) for v in parse_bbox(b)[0]) for b in calls)
+    assert fetched == [(1.0, 46.0, 1.1, 46.1), (1.2, 46.0, 1.3, 46.1)]
+
+    # Réponse au plafond (2 features) : servie mais pas mise en cache
+    calls.clear()
+    first = cache.get_features("gpu:postes", "0.95,45.95,1.35,46.35,EPSG:4326", "EPSG:4326", _fake_fetch(calls))
+    assert len(first) == 3 and cache.stats()["truncated"] >= 1
+    n = len(calls)
+    cache.get_features("gpu:postes", "0.95,45.95,1.35,46.35,EPSG:4326", "EPSG:4326", _fake_fetch(calls))
+    assert len(calls) > n
+
+
+def test_missing_blocks_never_include_cached_tiles():
+    from utils.wfs_cache import missing_blocks
+    # L : 3 tuiles en ligne 0, 1 tuile en ligne 1 (la tuile (1, 1) est en cache)
+    missing = [(0, 0), (1, 0), (2, 0), (0, 1), (2, 1)]
+    blocks = missing_blocks(missing)
+    covered = sorted((ix, iy) for x0, y0, x1, y1 in blocks for ix in range(x0, x1 + 1) for iy in range(y0, y1 + 1))
+    assert covered == sorted(missing)
+    assert missing_blocks([(0, 0), (0, 1), (1, 0), (1, 1)]) == [(0, 0, 1, 1)]
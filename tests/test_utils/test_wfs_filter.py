@@ -0,0 +1,63 @@
+import math
+
+from shapely.geometry import Point, Polygon
+
+from utils.wfs_filter import build_geometry_filter, clip_features, describe_feature_type, project_properties
+
+
+def _wiggly_polygon(n=2000):
+    # Contour très détaillé, à la manière d'un contour de commune
+    coords = []
+    for i in range(n):
+        a = 2 * math.pi * i / n
+        r = 0.05 + 0.002 * math.sin(40 * a)
+        coords.append((2.0 + r * math.cos(a), 46.0 + r * math.sin(a)))
+    return Polygon(coords)
+
+
+def _feature(fid, x, y):
+    return {"type": "Feature", "id": fid, "geometry": {"type": "Point", "coordinates": [x, y]}, "properties": {}}
+
+
+def test_small_polygon_is_sent_exactly():
+    square = Polygon([(2, 46), (2.1, 46), (2.1, 46.1), (2, 46.1)])
+    gf = build_geometry_filter(square, "geom")
+    assert gf.method == "GET" and not gf.simplified
+    assert gf.cql.startswith("INTERSECTS(geom, SRID=4326;POLYGON")
+
+
+def test_large_polygon_is_simplified_to_a_cover_and_refined():
+    poly = _wiggly_polygon()
+    gf = build_geometry_filter(poly, "the_geom", get_budget=3000)
+    assert gf.method == "GET" and gf.simplified
+    assert len(gf.cql) <= 3000
+    inside, outside = _feature("in", 2.0, 46.0), _feature("out", 2.0535, 46.0)
+    assert not poly.contains(Point(2.0535, 46.0))
+    assert [f["id"] for f in gf.refine([inside, outside])] == ["in"]
+    # Trop long même simplifié pour l'URL : passage en POST
+    assert build_geometry_filter(poly, "the_geom", get_budget=200).method == "POST"
+
+
+def test_clip_project_and_describe_feature_type():
+    square = Polygon([(0, 0), (1, 0), (1, 1), (0, 1)])
+    feats = [_feature("a", 0.5, 0.5), _feature("b", 2, 2), {"type": "Feature", "geometry": None}]
+    assert [f["id"] for f in clip_features(feats, square)] == ["a"]
+    wide = {"type": "Feature", "id": "e.1", "geometry": None, "properties": {"siret": "1", "x": 2, "y": 3}}
+    assert project_properties([wide], ["siret", "absent"])[0]["properties"] == {"siret": "1"}
+    assert wide["properties"]["x"] == 2
+
+    class _Resp:
+        text = ('<xsd:complexType><xsd:sequence>'
+                '<xsd:element maxOccurs="1" name="nom" nillable="true" type="xsd:string"/>'
+                '<xsd:element name="geom" type="gml:MultiSurfacePropertyType"/>'
+                '</xsd:sequence></xsd:complexType>')
+
+        def raise_for_status(self):
+            pass
+
+    class _Session:
+        def get(self, url, params=None, timeout=None):
+            return _Resp()
+
+    schema = describe_feature_type(_Session(), "http://geo/ows", "gpu:plu")
+    assert schema == {"geometry": "geom", "attributes": ["nom"]}
@@ -0,0 +1,87 @@
+import json
+
+from utils.wfs_stream import FeatureArrayParser, FeatureList, WFSFeatureStream
+
+
+def _collection(ids, matched):
+    return json.dumps({
+        "type": "FeatureCollection",
+        "features": [{"type": "Feature", "id": i, "geometry": None, "properties": {"nom": "é,]}"}} for i in ids],
+        "totalFeatures": matched, "numberMatched": matched, "numberReturned": len(ids),
+    }).encode("utf-8")
+
+
+class _FakeResponse:
+    def __init__(self, body):
+        self.body = body
+        self.headers = {"Content-Type": "application/json"}
+        self.encoding = "utf-8"
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1):
+        for i in range(0, len(self.body), 7):  # petits morceaux pour couper les objets
+            yield self.body[i:i + 7]
+
+    def close(self):
+        pass
+
+
+class _FakeSession:
+    def __init__(self, total, server_cap=None):
+        self.total = total
+        self.server_cap = server_cap
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None, stream=False):
+        self.calls.append(params)
+        start, count = params["startIndex"], min(params["count"], self.server_cap or params["count"])
+        ids = list(range(start, min(start + count, self.total)))
+        return _FakeResponse(_collection(ids, self.total))
+
+
+def test_parser_handles_split_chunks():
+    parser = FeatureArrayParser()
+    body = _collection([1, 2, 3], 3).decode("utf-8")
+    out = []
+    for i in range(0, len(body), 5):
+        out.extend(parser.feed(body[i:i + 5]))
+    parser.close()
+    assert [f["id"] for f in out] == [1, 2, 3]
+    assert out[0]["properties"]["nom"] == "é,]}"
+    assert parser.metadata["numberMatched"] == 3
+
+
+def test_stream_pages_until_number_matched():
+    session = _FakeSession(total=25)
+    stream = WFSFeatureStream(session, "http://geo/ows", "gpu:rpg", "0,0,1,1,EPSG:4326", page_size=10)
+    pages = list(stream.pages())
+    assert [len(p) for p in pages] == [10, 10, 5]
+    assert stream.number_matched == 25 and not stream.truncated
+    assert [c["startIndex"] for c in session.calls] == [0, 10, 20]
+
+
+def test_parser_resumes_inside_an_incomplete_object():
+    parser = FeatureArrayParser()
+    body = '{"features": [{"id": 1, "properties": {"nom": "a\\"b"}}, {"id": 2}]}'
+    cut = body.index("b")  # coupure entre la barre d'échappement et le guillemet échappé
+    assert parser.feed(body[:cut - 1]) == []
+    # Seul l'objet en cours est conservé, déjà parcouru jusqu'à la coupure
+    assert parser._buffer.startswith('{"id": 1') and parser._scan == len(parser._buffer) - 1
+    out = parser.feed(body[cut - 1:])
+    assert [f["id"] for f in out] == [1, 2] and out[0]["properties"]["nom"] == 'a"b'
+
+
+def test_stream_sorts_pages_and_follows_server_cap():
+    session = _FakeSession(total=11, server_cap=4)
+    stream = WFSFeatureStream(session, "http://geo/ows", "gpu:rpg", page_size=10, sort_by="ID_PARCEL")
+    features = stream.collect()
+    assert [f["id"] for f in features] == list(range(11)) and not features.truncated
+    assert [c["startIndex"] for c in session.calls] == [0, 4, 8]
+    assert {c["sortBy"] for c in session.calls} == {"ID_PARCEL"}
+
+    capped = WFSFeatureStream(_FakeSession(total=11), "http://geo/ows", "gpu:rpg", page_size=5, max_features=7)
+    features = capped.collect()
+    assert len(features) == 7 and features.truncated
+    assert FeatureList([1]).truncated is False
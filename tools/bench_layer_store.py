@@ -0,0 +1,71 @@
+"""
+Compare la latence des requêtes bbox : GeoServer (WFS direct, sans cache) vs magasin local.
+
+    python tools/bench_layer_store.py Guéret Limoges Tulle --layers gpu:poste_elec_shapefile gpu:gpu1
+
+Vérifie au passage que les deux sources renvoient les mêmes identifiants de features.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shapely.geometry import shape  # noqa: E402
+
+from agriweb_source import (  # noqa: E402
+    LAYER_STORE_PATH, POSTE_LAYER, HT_POSTE_LAYER, PLU_LAYER, ZAER_LAYER,
+    _fetch_wfs_features, get_commune_infos,
+)
+from utils.layer_store import LayerStore  # noqa: E402
+
+
+def timed(fn, repeat):
+    durations, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - start)
+    return result, durations
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GeoServer vs magasin local")
+    parser.add_argument("communes", nargs="+")
+    parser.add_argument("--layers", nargs="*", default=[POSTE_LAYER, HT_POSTE_LAYER, PLU_LAYER, ZAER_LAYER])
+    parser.add_argument("--path", default=LAYER_STORE_PATH)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    store = LayerStore(args.path)
+    wfs_times, local_times = [], []
+    for commune in args.communes:
+        infos = get_commune_infos(commune)
+        if not infos or not infos[0].get("contour"):
+            print(f"⚠️ {commune}: introuvable")
+            continue
+        minx, miny, maxx, maxy = shape(infos[0]["contour"]).bounds
+        bbox = f"{minx},{miny},{maxx},{maxy},EPSG:4326"
+        for layer in args.layers:
+            if not store.has_layer(layer):
+                print(f"⚠️ {layer}: non importée, ignorée")
+                continue
+            remote, rt = timed(lambda: _fetch_wfs_features(layer, bbox), args.repeat)
+            local, lt = timed(lambda: store.query(layer, bbox), args.repeat)
+            wfs_times.extend(rt)
+            local_times.extend(lt)
+            same = sorted(f.get("id") for f in remote) == sorted(f.get("id") for f in local)
+            print(f"{commune:<20} {layer:<45} wfs {statistics.median(rt) * 1000:8.1f} ms "
+                  f"local {statistics.median(lt) * 1000:8.1f} ms  {len(local):>6} features "
+                  f"{'✅' if same else '❌ différences'}")
+
+    if wfs_times and local_times:
+        print(f"\nMédiane WFS {statistics.median(wfs_times) * 1000:.1f} ms — "
+              f"locale {statistics.median(local_times) * 1000:.1f} ms "
+              f"(x{statistics.median(wfs_times) / max(statistics.median(local_times), 1e-9):.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Compare le décodage GeoJSON (json + shape par feature) et FlatGeobuf (colonnes shapely/numpy).
+
+    python tools/bench_wfs_decode.py --features 20000 --vertices 40
+    python tools/bench_wfs_decode.py --layer gpu:PARCELLES_GRAPHIQUES --bbox 1.8,45.9,2.0,46.1,EPSG:4326
+
+Sans --layer, des parcelles synthétiques (type RPG) sont encodées dans les deux formats ;
+avec --layer, les deux réponses sont demandées à GeoServer (l'extension FlatGeobuf doit
+être installée). Mesure le temps de décodage et le pic mémoire Python (tracemalloc).
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import shapely  # noqa: E402
+from shapely.geometry import shape  # noqa: E402
+
+from utils.wfs_binary import FLATGEOBUF_OUTPUT_FORMAT, decode_flatgeobuf  # noqa: E402
+
+
+def synthetic_payloads(n, vertices):
+    """Parcelles polygonales aléatoires encodées en GeoJSON et en FlatGeobuf."""
+    from pyogrio.raw import write
+
+    rng = np.random.default_rng(0)
+    geoms, features = [], []
+    for i in range(n):
+        cx, cy = 1.0 + rng.random() * 2, 45.0 + rng.random() * 2
+        angles = np.sort(rng.random(vertices)) * 2 * math.pi
+        radii = 0.001 + rng.random(vertices) * 0.0005
+        ring = [(cx + r * math.cos(a), cy + r * math.sin(a)) for a, r in zip(angles, radii)]
+        poly = shapely.Polygon(ring)
+        geoms.append(poly)
+        features.append({"type": "Feature", "id": f"rpg.{i}", "geometry": shapely.geometry.mapping(poly),
+                         "properties": {"ID_PARCEL": str(i), "CODE_CULTU": "BTH", "SURF_PARC": round(rng.random() * 10, 2)}})
+    geojson = json.dumps({"type": "FeatureCollection", "features": features}).encode("utf-8")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.fgb")
+        write(path, shapely.to_wkb(np.array(geoms, dtype=object)),
+              [np.array([f["properties"]["ID_PARCEL"] for f in features], dtype=object),
+               np.array(["BTH"] * n, dtype=object),
+               np.array([f["properties"]["SURF_PARC"] for f in features])],
+              ["ID_PARCEL", "CODE_CULTU", "SURF_PARC"],
+              driver="FlatGeobuf", geometry_type="Polygon", crs="EPSG:4326")
+        with open(path, "rb") as fh:
+            fgb = fh.read()
+    return geojson, fgb
+
+
+def remote_payloads(layer, bbox):
+    from agriweb_source import GEOSERVER_WFS_URL, http_session
+
+    params = {"service": "WFS", "version": "2.0.0", "request": "GetFeature", "typeNames": layer,
+              "srsName": "EPSG:4326", "bbox": bbox}
+    geojson = http_session.get(GEOSERVER_WFS_URL, params={**params, "outputFormat": "application/json"}, timeout=60)
+    fgb = http_session.get(GEOSERVER_WFS_URL, params={**params, "outputFormat": FLATGEOBUF_OUTPUT_FORMAT}, timeout=60)
+    geojson.raise_for_status()
+    fgb.raise_for_status()
+    return geojson.content, fgb.content
+
+
+def decode_geojson(content):
+    features = json.loads(content)["features"]
+    return [shape(f["geometry"]) for f in features if f.get("geometry")], features
+
+
+def measure(fn, payload, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(payload)
+        durations.append(time.perf_counter() - start)
+    tracemalloc.start()
+    result = fn(payload)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, statistics.median(durations), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark décodage GeoJSON vs FlatGeobuf")
+    parser.add_argument("--features", type=int, default=20000)
+    parser.add_argument("--vertices", type=int, default=40)
+    parser.add_argument("--layer")
+    parser.add_argument("--bbox")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.layer:
+        geojson, fgb = remote_payloads(args.layer, args.bbox)
+    else:
+        geojson, fgb = synthetic_payloads(args.features, args.vertices)
+
+    (geoms, _), gj_time, gj_peak = measure(decode_geojson, geojson, args.repeat)
+    table, fgb_time, fgb_peak = measure(decode_flatgeobuf, fgb, args.repeat)
+    print(f"{len(geoms)} features — GeoJSON {len(geojson) / 1e6:.1f} Mo, FlatGeobuf {len(fgb) / 1e6:.1f} Mo")
+    print(f"GeoJSON    : {gj_time * 1000:8.1f} ms, pic mémoire {gj_peak / 1e6:7.1f} Mo")
+    print(f"FlatGeobuf : {fgb_time * 1000:8.1f} ms, pic mémoire {fgb_peak / 1e6:7.1f} Mo "
+          f"(x{gj_time / max(fgb_time, 1e-9):.1f})")
+    if len(table) != len(geoms):
+        print(f"❌ Nombre de features différent : {len(table)} vs {len(geoms)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Conversion de dalles MNT (BD ALTI / RGE ALTI) en grilles .npy pour le backend d'altitude local.
+
+    python tools/build_dem_tiles.py BDALTIV2_25M_*.asc               # grilles ESRI ASCII Lambert-93
+    python tools/build_dem_tiles.py --crs EPSG:4326 srtm_*.tif       # GeoTIFF (nécessite rasterio)
+    AGRIWEB_DEM_DIR=/data/dem python tools/build_dem_tiles.py dalles/*.asc
+
+Chaque dalle est enregistrée dans le répertoire DEM (index.json mis à jour) ;
+les dalles déjà présentes sous le même nom sont remplacées.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agriweb_source import DEM_DIR  # noqa: E402
+from utils.dem import read_esri_ascii, write_tile  # noqa: E402
+from utils.projection import L93  # noqa: E402
+
+
+def read_geotiff(path):
+    """Lit une dalle GeoTIFF mono-bande (grille, métadonnées, CRS) via rasterio."""
+    import rasterio
+
+    with rasterio.open(path) as src:
+        if src.transform.b or src.transform.d:
+            raise ValueError("dalle tournée non prise en charge")
+        meta = {
+            "x0": src.transform.c,
+            "y0": src.transform.f,
+            "cellsize": src.transform.a,
+            "nrows": src.height,
+            "ncols": src.width,
+            "nodata": src.nodata,
+        }
+        crs = src.crs.to_string() if src.crs else None
+        return src.read(1), meta, crs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversion de dalles MNT en grilles .npy")
+    parser.add_argument("files", nargs="+", help="Dalles .asc ou .tif")
+    parser.add_argument("--dir", default=DEM_DIR, help="Répertoire des dalles converties")
+    parser.add_argument("--crs", default=L93, help="CRS des dalles .asc (défaut : Lambert-93)")
+    args = parser.parse_args()
+
+    failed = 0
+    for path in args.files:
+        start = time.time()
+        name = os.path.splitext(os.path.basename(path))[0]
+        try:
+            if path.lower().endswith((".tif", ".tiff")):
+                grid, meta, crs = read_geotiff(path)
+                crs = crs or args.crs
+            else:
+                grid, meta = read_esri_ascii(path)
+                crs = args.crs
+            write_tile(args.dir, name, grid, meta, crs)
+        except Exception as e:
+            failed += 1
+            print(f"❌ {path}: {e}")
+            continue
+        print(f"✅ {name}: {meta['ncols']}x{meta['nrows']} @ {meta['cellsize']} en {time.time() - start:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Construction du répertoire local des communes depuis le référentiel officiel geo.api.gouv.fr.
+
+    python tools/build_gazetteer.py                          # toutes les communes, département par département
+    python tools/build_gazetteer.py --from-json communes.json
+    AGRIWEB_GAZETTEER_PATH=/data/communes.sqlite python tools/build_gazetteer.py
+
+Le répertoire est remplacé en une transaction : en cas d'erreur, l'ancienne
+version reste en place. Un département en échec fait échouer la construction
+(un répertoire incomplet ferait rater des communes sans repli sur l'API).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agriweb_source import GAZETTEER_PATH, http_session  # noqa: E402
+from utils.gazetteer import Gazetteer  # noqa: E402
+
+GEO_API_URL = "https://geo.api.gouv.fr"
+FIELDS = "nom,code,codesPostaux,codeDepartement,departement,population,surface,centre,contour,mairie"
+
+
+def iter_geo_api_communes():
+    resp = http_session.get(f"{GEO_API_URL}/departements", params={"fields": "code"}, timeout=30)
+    resp.raise_for_status()
+    for dept in resp.json():
+        resp = http_session.get(f"{GEO_API_URL}/departements/{dept['code']}/communes",
+                                params={"fields": FIELDS, "format": "json"}, timeout=120)
+        resp.raise_for_status()
+        communes = resp.json()
+        print(f"    📍 {dept['code']}: {len(communes)} communes")
+        yield from communes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construction du répertoire local des communes")
+    parser.add_argument("--path", default=GAZETTEER_PATH, help="Fichier SQLite du répertoire")
+    parser.add_argument("--from-json", help="Liste de communes au format geo.api.gouv.fr (au lieu de l'API)")
+    args = parser.parse_args()
+
+    start = time.time()
+    if args.from_json:
+        with open(args.from_json, "r", encoding="utf-8") as f:
+            communes = json.load(f)
+    else:
+        communes = iter_geo_api_communes()
+    try:
+        count = Gazetteer(args.path).import_communes(communes)
+    except Exception as e:
+        print(f"❌ [GAZETTEER] {e}")
+        return 1
+    print(f"✅ [GAZETTEER] {args.path}: {count} communes en {time.time() - start:.0f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
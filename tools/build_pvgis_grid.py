@@ -0,0 +1,60 @@
+"""
+Calcul de la grille nationale de productible PVGIS (kWh/kWc/an).
+
+    python tools/build_pvgis_grid.py                               # France, 0.1°, 30°/plein sud
+    python tools/build_pvgis_grid.py --step 0.2 --config 30:180 --config 10:180 --config 30:90
+    AGRIWEB_PVGIS_GRID=/data/pvgis_grid.npz python tools/build_pvgis_grid.py
+
+Chaque nœud est un appel PVGIS mis en cache disque (espace "pvgis") : un
+calcul interrompu reprend là où il s'était arrêté. Les nœuds sans réponse
+(mer, hors couverture) restent vides et sont écartés à l'interpolation.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agriweb_source import PVGIS_GRID_PATH, pvgis_yield  # noqa: E402
+from utils.pvgis_grid import FRANCE_BOUNDS, build_grid  # noqa: E402
+
+
+def parse_config(value):
+    tilt, azimuth = value.split(":")
+    return float(tilt), float(azimuth)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calcul de la grille de productible PVGIS")
+    parser.add_argument("--out", default=PVGIS_GRID_PATH, help="Fichier .npz de la grille")
+    parser.add_argument("--bounds", type=float, nargs=4, default=FRANCE_BOUNDS,
+                        metavar=("LON_MIN", "LAT_MIN", "LON_MAX", "LAT_MAX"))
+    parser.add_argument("--step", type=float, default=0.1, help="Pas de la grille (degrés)")
+    parser.add_argument("--config", type=parse_config, action="append",
+                        help="Inclinaison:azimut (répétable, défaut 30:180)")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    configs = args.config or [(30.0, 180.0)]
+    start = time.time()
+
+    def progress(done, total):
+        if done % 500 == 0 or done == total:
+            print(f"    📍 {done}/{total} nœuds ({time.time() - start:.0f}s)")
+
+    grid = build_grid(pvgis_yield.fetch_live, tuple(args.bounds), args.step, configs, args.workers, progress)
+    directory = os.path.dirname(args.out)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    grid.save(args.out)
+    missing = int(np.isnan(grid.yields).sum())
+    print(f"✅ [PVGIS_GRID] {args.out}: {grid.shape} x {len(configs)} configurations, "
+          f"{missing} nœuds sans valeur, {time.time() - start:.0f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Import des couches GeoServer dans le magasin local SQLite/R-tree.
+
+    python tools/import_layer_store.py                 # couches modifiées depuis le dernier import
+    python tools/import_layer_store.py --force gpu:gpu1
+    AGRIWEB_LAYER_STORE_PATH=/data/layers.sqlite python tools/import_layer_store.py
+
+Une couche n'est réimportée que si sa version GeoServer (empreinte de sa déclaration
+dans le GetCapabilities) a changé, ou avec --force.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agriweb_source import (  # noqa: E402
+    LAYER_STORE_PATH, STORE_LAYERS, geoserver_layer_versions, iter_wfs_features,
+)
+from utils.layer_store import LayerStore  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import des couches GeoServer dans le magasin local")
+    parser.add_argument("layers", nargs="*", help="Couches à importer (défaut : toutes les *_LAYER)")
+    parser.add_argument("--force", action="store_true", help="Réimporter même si la version n'a pas changé")
+    parser.add_argument("--path", default=LAYER_STORE_PATH, help="Fichier SQLite du magasin")
+    parser.add_argument("--page-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    store = LayerStore(args.path)
+    versions = geoserver_layer_versions(max_age=0)
+    print(f"🗃️ [LAYER_STORE] {args.path} — {len(versions)} couches publiées par GeoServer")
+
+    failed = 0
+    for layer in args.layers or STORE_LAYERS:
+        start = time.time()
+        try:
+            count = store.refresh_layer(
+                layer, lambda: iter_wfs_features(layer, None, page_size=args.page_size).pages(),
+                versions.get(layer), force=args.force,
+            )
+        except Exception as e:
+            failed += 1
+            print(f"❌ {layer}: {e}")
+            continue
+        if count is None:
+            print(f"✅ {layer}: à jour")
+        else:
+            print(f"✅ {layer}: {count} features importées en {time.time() - start:.1f}s")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+# utils/cadastre_snapshot.py
+"""
+Instantané local du cadastre (parcelles PCI) et jointure spatiale par lots.
+
+Au lieu d'une requête API Carto /cadastre/parcelle par parking, toiture ou
+parcelle RPG, les parcelles sont chargées une fois pour l'emprise utile, par
+tuiles d'une grille fixe (0.01° par défaut) mises en cache sur disque
+(DiskCache). Un STRtree sur ces parcelles répond ensuite, pour tout un lot de
+géométries, avec les références cadastrales au format attendu par les
+templates (numero, section, commune, prefixe, reference_complete).
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from math import floor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+
+from utils.commune_clipper import repair_geometries
+from utils.projection import geometry_array
+
+Bounds = Tuple[float, float, float, float]
+Tile = Tuple[int, int]
+
+CACHE_NAMESPACE = "cadastre"
+DEFAULT_TILE_SIZE = 0.01  # ~1 km
+
+
+def parcel_reference(props: Dict[str, Any]) -> Dict[str, str]:
+    """Référence cadastrale d'une parcelle API Carto (noms d'attributs alternatifs tolérés)."""
+    props = props or {}
+    numero = props.get('numero') or props.get('numero_parcelle') or props.get('num_parc') or ''
+    section = props.get('section') or props.get('code_section') or ''
+    commune = props.get('commune') or props.get('code_commune') or props.get('insee') or ''
+    prefixe = props.get('prefixe') or props.get('code_arr') or ''
+    return {
+        'numero': numero,
+        'section': section,
+        'commune': commune,
+        'prefixe': prefixe,
+        'reference_complete': f"{commune}{prefixe}{section}{numero}".strip(),
+    }
+
+
+def tile_bounds(tile: Tile, size: float) -> Bounds:
+    ix, iy = tile
+    return (round(ix * size, 9), round(iy * size, 9), round((ix + 1) * size, 9), round((iy + 1) * size, 9))
+
+
+def covering_tiles(geometries: Sequence[Any], size: float = DEFAULT_TILE_SIZE) -> List[Tile]:
+    """Tuiles de la grille qui intersectent au moins une des géométries (WGS84)."""
+    geoms = repair_geometries(geometry_array(list(geometries)))
+    tiles = set()
+    for geom in geoms:
+        if geom is None or geom.is_empty:
+            continue
+        minx, miny, maxx, maxy = geom.bounds
+        candidates = [
+            (ix, iy)
+            for ix in range(floor(minx / size), floor(maxx / size) + 1)
+            for iy in range(floor(miny / size), floor(maxy / size) + 1)
+        ]
+        if len(candidates) > 1:
+            boxes = shapely.box(*np.array([tile_bounds(t, size) for t in candidates]).T)
+            candidates = [t for t, hit in zip(candidates, shapely.intersects(boxes, geom)) if hit]
+        tiles.update(candidates)
+    return sorted(tiles)
+
+
+class CadastreSnapshot:
+    """
+    Parcelles indexées (STRtree, WGS84) pour la jointure avec des features.
+
+    Args:
+        features (list): Parcelles GeoJSON (dédoublonnées par id par le chargeur).
+        complete (bool): Faux si des tuiles n'ont pas pu être chargées.
+    """
+
+    def __init__(self, features: Sequence[Dict[str, Any]], complete: bool = True):
+        features = list(features or [])
+        geoms = repair_geometries(geometry_array(features))
+        keep = ~shapely.is_missing(geoms) if len(geoms) else np.zeros(0, dtype=bool)
+        self.features = [f for f, k in zip(features, keep) if k]
+        self.geometries = geoms[keep]
+        self.tree = shapely.STRtree(self.geometries)
+        self.complete = complete
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    def query(self, items: Sequence[Any], max_match: Optional[int] = None) -> List[List[int]]:
+        """Indices des parcelles intersectant chaque géométrie (features, GeoJSON ou shapely)."""
+        geoms = repair_geometries(geometry_array(list(items)))
+        out: List[List[int]] = [[] for _ in range(len(geoms))]
+        if not len(geoms) or not len(self):
+            return out
+        src, dst = self.tree.query(geoms, predicate="intersects")
+        order = np.lexsort((dst, src))
+        for s, d in zip(src[order], dst[order]):
+            if max_match is None or len(out[s]) < max_match:
+                out[s].append(int(d))
+        return out
+
+    def parcels(self, items: Sequence[Any], max_match: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """Parcelles GeoJSON intersectant chaque géométrie."""
+        return [[self.features[i] for i in hits] for hits in self.query(items, max_match)]
+
+    def references(self, items: Sequence[Any], max_match: Optional[int] = None) -> List[List[Dict[str, str]]]:
+        """Références cadastrales (parcel_reference) des parcelles intersectant chaque géométrie."""
+        return [
+            [parcel_reference(self.features[i].get("properties")) for i in hits]
+            for hits in self.query(items, max_match)
+        ]
+
+
+class CadastreSnapshotStore:
+    """
+    Chargement des instantanés : tuiles en cache disque, tuiles manquantes demandées
+    en parallèle, instantanés récents gardés en mémoire par clé (ex. code commune).
+
+    Args:
+        fetch_tile (callable): (minx, miny, maxx, maxy) -> parcelles GeoJSON ; lève une
+            exception en cas d'erreur (une erreur n'est jamais mise en cache).
+        cache: DiskCache ou None (pas de persistance).
+        tile_size (float): Pas de la grille, en degrés.
+        ttl (float): Durée de vie des tuiles en cache disque (s).
+        workers (int): Requêtes de tuiles simultanées.
+        max_snapshots (int): Instantanés conservés en mémoire.
+    """
+
+    def __init__(
+        self,
+        fetch_tile: Callable[[Bounds], List[Dict[str, Any]]],
+        cache: Any = None,
+        tile_size: float = DEFAULT_TILE_SIZE,
+        ttl: float = 30 * 86400,
+        workers: int = 4,
+        max_snapshots: int = 8,
+    ):
+        self.fetch_tile = fetch_tile
+        self.cache = cache
+        self.tile_size = tile_size
+        self.ttl = ttl
+        self.workers = workers
+        self.max_snapshots = max_snapshots
+        self._snapshots: "OrderedDict[str, CadastreSnapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"snapshots": 0, "memory_hits": 0, "tiles_cached": 0, "tiles_fetched": 0, "tile_errors": 0}
+
+    def _tile_key(self, tile: Tile) -> str:
+        return f"{self.tile_size}:{tile[0]}:{tile[1]}"
+
+    def _fetch(self, tile: Tile):
+        try:
+            return tile, self.fetch_tile(tile_bounds(tile, self.tile_size)), None
+        except Exception as e:
+            return tile, None, e
+
+    def load_tiles(self, tiles: Sequence[Tile]) -> Tuple[Dict[Tile, List[Dict[str, Any]]], bool]:
+        """
+        Parcelles de chaque tuile (cache disque puis API).
+
+        Returns:
+            tuple: ({tuile: parcelles}, vrai si toutes les tuiles ont été chargées)
+        """
+        keys = {self._tile_key(t): t for t in tiles}
+        cached = self.cache.get_many(CACHE_NAMESPACE, keys) if self.cache is not None else {}
+        loaded = {keys[k]: v for k, v in cached.items()}
+        missing = [t for t in tiles if t not in loaded]
+
+        fetched, complete = {}, True
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(missing)))) as pool:
+                for tile, features, error in pool.map(self._fetch, missing):
+                    if error is not None:
+                        complete = False
+                        print(f"⚠️ [CADASTRE_SNAPSHOT] Tuile {tile} indisponible: {error}")
+                        continue
+                    fetched[tile] = features or []
+            if self.cache is not None and fetched:
+                self.cache.set_many(CACHE_NAMESPACE, {self._tile_key(t): f for t, f in fetched.items()}, self.ttl)
+        loaded.update(fetched)
+
+        with self._lock:
+            self._stats["tiles_cached"] += len(cached)
+            self._stats["tiles_fetched"] += len(fetched)
+            self._stats["tile_errors"] += len(missing) - len(fetched)
+        return loaded, complete
+
+    def snapshot(self, geometries: Sequence[Any], key: Optional[str] = None) -> CadastreSnapshot:
+        """
+        Instantané couvrant les géométries données (contour de commune, lot de features...).
+
+        Args:
+            geometries (list): Géométries GeoJSON / shapely ou features (WGS84).
+            key (str): Clé de réutilisation en mémoire (ex. "commune:75056") ; None pour ne pas mémoriser.
+        """
+        if key is not None:
+            with self._lock:
+                snap = self._snapshots.get(key)
+                if snap is not None:
+                    self._snapshots.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return snap
+
+        tiles = covering_tiles(geometries, self.tile_size)
+        loaded, complete = self.load_tiles(tiles)
+        seen, features = set(), []
+        for tile in tiles:
+            for feat in loaded.get(tile, ()):
+                fid = feat.get("id") or (feat.get("properties") or {}).get("idu")
+                if fid is not None:
+                    if fid in seen:
+                        continue
+                    seen.add(fid)
+                features.append(feat)
+        snap = CadastreSnapshot(features, complete=complete)
+        print(f"🏛️ [CADASTRE_SNAPSHOT] {len(snap)} parcelles, {len(tiles)} tuiles"
+              f"{'' if complete else ' (incomplet)'}")
+
+        with self._lock:
+            self._stats["snapshots"] += 1
+            # Un instantané incomplet n'est pas mémorisé : les tuiles manquantes seront redemandées
+            if key is not None and complete:
+                self._snapshots[key] = snap
+                while len(self._snapshots) > self.max_snapshots:
+                    self._snapshots.popitem(last=False)
+        return snap
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "tile_size": self.tile_size, "in_memory": list(self._snapshots)}
@@ -0,0 +1,252 @@
+# utils/commune_bundle.py
+"""
+Couches brutes d'une commune, indépendantes des curseurs, et leurs mesures par
+feature (surface, centroïde, distances aux postes BT/HTA).
+
+Une recherche par commune télécharge ses couches une fois ; tant que le lot est
+en cache (clé : code INSEE), changer un seuil (surface minimale, distance aux
+postes, type de poste...) ne fait que recalculer des masques numpy sur des
+colonnes déjà mesurées. Les enrichissements coûteux calculés par la recherche
+complète (références cadastrales, adresses...) sont mémorisés par feature et
+réappliqués lors des filtrages suivants.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from utils.commune_clipper import CommuneClipper
+from utils.distance_engine import DistanceEngine
+from utils.projection import LayerMetrics, geometry_array
+
+POSTE_LAYERS = ("postes_bt", "postes_hta")
+# Propriétés mémorisées qui dépendent des postes (distances, poste le plus proche)
+POSTE_PROPERTIES = frozenset({"min_bt_distance_m", "min_ht_distance_m", "min_distance_bt_m", "min_distance_hta_m",
+                              "poste_bt_id", "poste_hta_id"})
+
+
+def _depends_on_postes(name: str) -> bool:
+    return name in POSTE_PROPERTIES or name.startswith("distance_")
+
+
+class DistanceRule(NamedTuple):
+    """Seuils de distance aux postes (m) ; poste_type ALL = BT ou HTA suffit."""
+    max_bt_m: float
+    max_hta_m: float
+    poste_type: str = "ALL"
+
+    def mask(self, d_bt: np.ndarray, d_hta: np.ndarray) -> np.ndarray:
+        # NaN (aucun poste) : comparaisons fausses, feature rejetée
+        with np.errstate(invalid="ignore"):
+            bt_ok = d_bt <= self.max_bt_m
+            hta_ok = d_hta <= self.max_hta_m
+        if self.poste_type == "BT":
+            return bt_ok
+        if self.poste_type == "HTA":
+            return hta_ok
+        return bt_ok | hta_ok
+
+
+class LayerColumns:
+    """
+    Mesures d'une couche, une ligne par feature.
+
+    Attributes:
+        features: Features brutes (non modifiées).
+        metrics (LayerMetrics): Surfaces (m²) et centroïdes.
+        d_bt, d_hta: Distances (m) au poste le plus proche, NaN si aucun.
+        bt_id, hta_id: Identifiants des postes les plus proches.
+        inside: Masque des features dans la commune (tout vrai si la couche n'est pas découpée).
+    """
+
+    def __init__(self, features: Sequence[Dict[str, Any]], engine: DistanceEngine, clip_to: Any = None):
+        self.features = list(features)
+        if clip_to is not None:
+            self.inside, geoms = CommuneClipper(clip_to).mask(self.features)
+        else:
+            geoms = geometry_array(self.features)
+            self.inside = np.ones(len(self.features), dtype=bool)
+        self.metrics = LayerMetrics(geoms)
+        self.area_m2 = np.nan_to_num(np.asarray(self.metrics.area_m2, dtype=float), nan=-1.0)
+        if len(self.features):
+            nearest = engine.query(self.metrics.centroid_wgs84)
+        else:
+            nearest = {"bt": {"distance_m": [], "id": []}, "hta": {"distance_m": [], "id": []}}
+        self.d_bt = np.array([np.nan if d is None else d for d in nearest["bt"]["distance_m"]], dtype=float)
+        self.d_hta = np.array([np.nan if d is None else d for d in nearest["hta"]["distance_m"]], dtype=float)
+        self.bt_id = list(nearest["bt"]["id"])
+        self.hta_id = list(nearest["hta"]["id"])
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    def select(self, min_area: float = 0.0, max_area: float = float("inf"), rule: Optional[DistanceRule] = None,
+               where: Optional[np.ndarray] = None) -> np.ndarray:
+        """Indices des features retenues (dans la commune, surface dans [min_area, max_area] m², distances)."""
+        keep = self.inside & (self.area_m2 >= min_area) & (self.area_m2 <= max_area)
+        if rule is not None:
+            keep &= rule.mask(self.d_bt, self.d_hta)
+        if where is not None:
+            keep &= np.asarray(where, dtype=bool)
+        return np.flatnonzero(keep)
+
+    @staticmethod
+    def rounded(value: float, digits: int = 2) -> Optional[float]:
+        return None if np.isnan(value) else round(float(value), digits)
+
+
+class CommuneBundle:
+    """
+    Usage:
+        bundle = CommuneBundle("23096", "Guéret", contour)
+        bundle.add("postes_bt", postes_bt); bundle.add("postes_hta", postes_hta); bundle.add("parkings", parkings)
+        cols = bundle.columns("parkings")
+        idx = cols.select(min_area=1500, rule=DistanceRule(500, 2000, "ALL"))
+
+    Args:
+        code (str): Code INSEE (clé du cache).
+        nom (str): Nom de la commune.
+        contour (dict): Contour GeoJSON (découpage des couches listées dans `clip_layers`).
+        clip_layers (iterable): Couches dont seules les features intersectant la commune sont retenues.
+    """
+
+    def __init__(self, code: str, nom: str, contour: Dict[str, Any], clip_layers: Iterable[str] = ("batiments",)):
+        self.code = code
+        self.nom = nom
+        self.contour = contour
+        self.clip_layers = set(clip_layers)
+        self.created = time.time()
+        self.layers: Dict[str, Any] = {}
+        self._columns: Dict[str, LayerColumns] = {}
+        self._extras: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._engine: Optional[DistanceEngine] = None
+        # Index des bâtiments (surface libre), construit à la première demande puis réutilisé
+        self.building_index: Any = None
+        # Date (time.time) du dernier échec de construction de l'index, None sinon
+        self.building_index_failed_at: Optional[float] = None
+        self._lock = threading.RLock()
+
+    def has(self, key: str) -> bool:
+        return key in self.layers
+
+    def missing(self, keys: Iterable[str]) -> List[str]:
+        return [k for k in keys if k not in self.layers]
+
+    def add(self, key: str, data: Any) -> None:
+        """Ajoute (ou remplace) une couche brute ; invalide les mesures qui en dépendent."""
+        with self._lock:
+            self.layers[key] = data
+            self._columns.pop(key, None)
+            self._extras.pop(key, None)
+            if key in POSTE_LAYERS:
+                self._engine = None
+                self._columns.clear()
+                # Enrichissements conservés (cadastre, adresses...), distances recalculées par present()
+                for extras in self._extras.values():
+                    for props in extras.values():
+                        for name in [n for n in props if _depends_on_postes(n)]:
+                            del props[name]
+
+    @property
+    def engine(self) -> DistanceEngine:
+        with self._lock:
+            if self._engine is None:
+                self._engine = DistanceEngine(bt=self.layers.get("postes_bt") or [],
+                                              hta=self.layers.get("postes_hta") or [])
+            return self._engine
+
+    def columns(self, key: str) -> LayerColumns:
+        """Mesures de la couche (calculées au premier appel, puis réutilisées)."""
+        with self._lock:
+            cols = self._columns.get(key)
+            if cols is None:
+                clip = self.contour if key in self.clip_layers else None
+                cols = LayerColumns(self.layers.get(key) or [], self.engine, clip)
+                self._columns[key] = cols
+            return cols
+
+    def remember(self, key: str, indices: Sequence[int], features: Sequence[Dict[str, Any]]) -> None:
+        """Mémorise les propriétés finales (enrichies) des features retenues, par indice de la couche."""
+        with self._lock:
+            extras = self._extras.setdefault(key, {})
+            for i, feat in zip(indices, features):
+                extras[int(i)] = dict(feat.get("properties") or {})
+
+    def present(self, key: str, indices: Sequence[int],
+                properties: Callable[[LayerColumns, int], Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Features retenues (copies) : `properties(colonnes, i)`, recouvertes par les propriétés
+        mémorisées si la feature a déjà été enrichie.
+        """
+        cols = self.columns(key)
+        extras = self._extras.get(key, {})
+        out = []
+        for i in indices:
+            i = int(i)
+            props = properties(cols, i)
+            if i in extras:
+                props.update(extras[i])
+            out.append({"type": "Feature", "geometry": cols.features[i].get("geometry"), "properties": props})
+        return out
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "code": self.code,
+            "nom": self.nom,
+            "age_s": round(self.age),
+            "layers": {k: len(v) if isinstance(v, list) else 1 for k, v in self.layers.items()},
+            "measured": sorted(self._columns),
+        }
+
+
+class BundleCache:
+    """Cache mémoire LRU des lots de couches par code INSEE (avec expiration)."""
+
+    def __init__(self, max_bundles: int = 8, ttl: float = 1800.0):
+        self.max_bundles = max_bundles
+        self.ttl = ttl
+        self._bundles: "OrderedDict[str, CommuneBundle]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get(self, code: str) -> Optional[CommuneBundle]:
+        with self._lock:
+            bundle = self._bundles.get(code)
+            if bundle is not None and bundle.age > self.ttl:
+                del self._bundles[code]
+                bundle = None
+            if bundle is None:
+                self._stats["misses"] += 1
+                return None
+            self._bundles.move_to_end(code)
+            self._stats["hits"] += 1
+            return bundle
+
+    def put(self, bundle: CommuneBundle) -> None:
+        with self._lock:
+            self._bundles[bundle.code] = bundle
+            self._bundles.move_to_end(bundle.code)
+            while len(self._bundles) > self.max_bundles:
+                self._bundles.popitem(last=False)
+
+    def invalidate(self, code: Optional[str] = None) -> int:
+        with self._lock:
+            if code is None:
+                n = len(self._bundles)
+                self._bundles.clear()
+                return n
+            return 1 if self._bundles.pop(code, None) is not None else 0
+
+    def __len__(self) -> int:
+        return len(self._bundles)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "bundles": [b.stats() for b in self._bundles.values()]}
@@ -0,0 +1,79 @@
+# utils/commune_clipper.py
+"""
+Découpage de couches au polygone d'une commune, en un appel vectorisé.
+
+Le polygone est réparé et préparé une seule fois (shapely.prepare) ; les
+features sont converties en tableau shapely, les géométries invalides sont
+réparées en lot (buffer(0)) et intersects/contains s'évaluent sur tout le
+tableau. Le masque et les géométries parsées sont renvoyés ensemble pour que
+les étapes suivantes (surfaces, centroïdes...) ne refassent pas shape().
+"""
+
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from shapely.geometry.base import BaseGeometry
+
+from utils.projection import geometry_array
+
+
+def repair_geometries(geoms: np.ndarray) -> np.ndarray:
+    """Répare en place (buffer(0)) les géométries invalides ; celles encore invalides deviennent None."""
+    if not len(geoms):
+        return geoms
+    invalid = ~shapely.is_missing(geoms) & ~shapely.is_valid(geoms)
+    if invalid.any():
+        repaired = shapely.buffer(geoms[invalid], 0)
+        repaired[~shapely.is_valid(repaired)] = None
+        geoms[invalid] = repaired
+    return geoms
+
+
+class CommuneClipper:
+    """
+    Polygone préparé d'une commune (ou de toute zone de recherche).
+
+    Args:
+        geom: Géométrie shapely ou dict GeoJSON (réparée par make_valid si invalide).
+    """
+
+    def __init__(self, geom: Any):
+        g = geom if isinstance(geom, BaseGeometry) else shape(geom)
+        if not g.is_valid:
+            g = shapely.make_valid(g)
+        shapely.prepare(g)
+        self.geometry = g
+        self.bounds = g.bounds
+
+    def geometries(self, items: Sequence[Any]) -> np.ndarray:
+        """Géométries shapely parsées et réparées (None si absente ou irréparable)."""
+        return repair_geometries(geometry_array(list(items)))
+
+    def mask(self, items: Sequence[Any], predicate: str = "intersects") -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Évalue `predicate` ("intersects" ou "contains") pour tout le tableau.
+
+        Args:
+            items (list): Features GeoJSON, géométries GeoJSON ou shapely.
+
+        Returns:
+            tuple: (masque booléen, géométries shapely parsées et réparées)
+        """
+        geoms = self.geometries(items)
+        if not len(geoms):
+            return np.zeros(0, dtype=bool), geoms
+        test = shapely.contains if predicate == "contains" else shapely.intersects
+        inside = ~shapely.is_missing(geoms) & test(self.geometry, geoms)
+        return inside, geoms
+
+    def split(self, features: Sequence[Dict[str, Any]], predicate: str = "intersects") -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        """Features retenues et leurs géométries shapely (même ordre)."""
+        features = list(features or [])
+        inside, geoms = self.mask(features, predicate)
+        return [f for f, keep in zip(features, inside) if keep], geoms[inside]
+
+    def clip(self, features: Sequence[Dict[str, Any]], predicate: str = "intersects") -> List[Dict[str, Any]]:
+        """Features dont la géométrie vérifie `predicate` avec le polygone."""
+        return self.split(features, predicate)[0]
@@ -0,0 +1,189 @@
+# utils/dem.py
+"""
+Modèle numérique de terrain local : altitudes par échantillonnage bilinéaire de
+grilles stockées sur disque.
+
+Les dalles (ex. BD ALTI / RGE ALTI de l'IGN, distribuées en grilles ESRI ASCII
+Lambert-93) sont converties une fois en tableaux .npy par tools/build_dem_tiles.py
+et décrites dans un index.json. Elles sont ouvertes en mémoire projetée
+(np.load(mmap_mode="r")) : seules les pages lues sont chargées. Un point ou un
+profil entier est projeté dans le CRS des dalles en un appel, puis interpolé de
+façon vectorisée. Hors des dalles disponibles, l'altitude vaut NaN et
+l'appelant se rabat sur les API distantes.
+"""
+
+import json
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from utils.projection import WGS84, project_points
+
+INDEX_FILE = "index.json"
+
+
+def read_esri_ascii(path: str) -> Tuple[np.ndarray, Dict[str, Any]]:
+    """
+    Lit une grille ESRI ASCII (.asc).
+
+    Returns:
+        tuple: (grille float32, métadonnées {x0, y0, cellsize, nrows, ncols, nodata}) ;
+            (x0, y0) est le coin haut-gauche de la grille.
+    """
+    header: Dict[str, float] = {}
+    with open(path, "r", encoding="ascii", errors="replace") as f:
+        while True:
+            pos = f.tell()
+            line = f.readline()
+            parts = line.split()
+            if len(parts) != 2 or parts[0][0].isdigit() or parts[0][0] in "-+.":
+                f.seek(pos)
+                break
+            header[parts[0].lower()] = float(parts[1])
+        grid = np.loadtxt(f, dtype=np.float32, ndmin=2)
+    nrows, ncols = int(header["nrows"]), int(header["ncols"])
+    cellsize = header["cellsize"]
+    # xllcenter/yllcenter : centre de la cellule bas-gauche ; xllcorner/yllcorner : son coin
+    x_ll = header["xllcorner"] if "xllcorner" in header else header["xllcenter"] - cellsize / 2
+    y_ll = header["yllcorner"] if "yllcorner" in header else header["yllcenter"] - cellsize / 2
+    meta = {
+        "x0": x_ll,
+        "y0": y_ll + nrows * cellsize,
+        "cellsize": cellsize,
+        "nrows": nrows,
+        "ncols": ncols,
+        "nodata": header.get("nodata_value", -99999.0),
+    }
+    return grid.reshape(nrows, ncols), meta
+
+
+def bilinear(data: np.ndarray, row: np.ndarray, col: np.ndarray, nodata: Optional[float] = None) -> np.ndarray:
+    """
+    Interpolation bilinéaire d'une grille 2D aux indices fractionnaires (row, col)
+    des centres de cellules, bornés aux bords de la grille.
+
+    Les voisins sans donnée (NaN ou `nodata`) sont écartés et les poids renormalisés ;
+    NaN si aucun des quatre voisins pondérés n'a de valeur.
+    """
+    nrows, ncols = data.shape
+    row = np.clip(row, 0, nrows - 1)
+    col = np.clip(col, 0, ncols - 1)
+    r0 = np.floor(row).astype(np.int64)
+    c0 = np.floor(col).astype(np.int64)
+    r1 = np.minimum(r0 + 1, nrows - 1)
+    c1 = np.minimum(c0 + 1, ncols - 1)
+    fr, fc = row - r0, col - c0
+
+    values = np.stack([data[r0, c0], data[r0, c1], data[r1, c0], data[r1, c1]]).astype(np.float64)
+    weights = np.stack([(1 - fr) * (1 - fc), (1 - fr) * fc, fr * (1 - fc), fr * fc])
+    valid = np.isfinite(values)
+    if nodata is not None:
+        valid &= values != nodata
+    weights = np.where(valid, weights, 0.0)
+    total = weights.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        out = (np.where(valid, values, 0.0) * weights).sum(axis=0) / total
+    return np.where(total > 0, out, np.nan)
+
+
+class DEMTile:
+    """Dalle régulière (coin haut-gauche x0, y0 ; lignes vers le sud), chargée à la première lecture."""
+
+    def __init__(self, path: str, x0: float, y0: float, cellsize: float, nrows: int, ncols: int,
+                 nodata: Optional[float] = None, **_):
+        self.path = path
+        self.x0, self.y0, self.cellsize = float(x0), float(y0), float(cellsize)
+        self.nrows, self.ncols = int(nrows), int(ncols)
+        self.nodata = nodata
+        self._data = None
+        self._lock = threading.Lock()
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        return (self.x0, self.y0 - self.nrows * self.cellsize, self.x0 + self.ncols * self.cellsize, self.y0)
+
+    @property
+    def data(self) -> np.ndarray:
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = np.load(self.path, mmap_mode="r")
+        return self._data
+
+    def sample(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Altitudes aux coordonnées (x, y) du CRS de la dalle."""
+        col = (x - self.x0) / self.cellsize - 0.5
+        row = (self.y0 - y) / self.cellsize - 0.5
+        return bilinear(self.data, row, col, self.nodata)
+
+
+class DEMStore:
+    """
+    Ensemble de dalles décrit par `<directory>/index.json` :
+        {"crs": "EPSG:2154", "tiles": [{"file": "x.npy", "x0": .., "y0": .., "cellsize": .., "nrows": .., "ncols": .., "nodata": ..}]}
+
+    Args:
+        directory (str): Répertoire des dalles ; absent ou vide = aucune couverture locale.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.crs = WGS84
+        self.tiles: List[DEMTile] = []
+        index_path = os.path.join(directory, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            self.crs = index.get("crs", WGS84)
+            self.tiles = [DEMTile(os.path.join(directory, t["file"]), **t) for t in index.get("tiles", [])]
+        bounds = np.array([t.bounds for t in self.tiles], dtype=float).reshape(-1, 4)
+        self._minx, self._miny, self._maxx, self._maxy = bounds.T
+        self._stats = {"points": 0, "local": 0}
+
+    def __len__(self) -> int:
+        return len(self.tiles)
+
+    def sample(self, lonlat: Sequence[Tuple[float, float]]) -> np.ndarray:
+        """
+        Altitudes (m) des points (lon, lat) WGS84 ; NaN hors couverture locale.
+        """
+        lonlat = np.asarray(lonlat, dtype=float).reshape(-1, 2)
+        out = np.full(len(lonlat), np.nan)
+        self._stats["points"] += len(lonlat)
+        if not len(lonlat) or not self.tiles:
+            return out
+        xy = lonlat if self.crs == WGS84 else project_points(lonlat, WGS84, self.crs)
+        x, y = xy[:, 0], xy[:, 1]
+        # Dalles recoupant l'emprise de la requête, puis points de chaque dalle
+        near = np.nonzero((self._minx <= x.max()) & (self._maxx >= x.min())
+                          & (self._miny <= y.max()) & (self._maxy >= y.min()))[0]
+        for i in near:
+            todo = np.isnan(out) & (x >= self._minx[i]) & (x <= self._maxx[i]) & (y >= self._miny[i]) & (y <= self._maxy[i])
+            if todo.any():
+                out[todo] = self.tiles[i].sample(x[todo], y[todo])
+        self._stats["local"] += int(np.isfinite(out).sum())
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {"directory": self.directory, "tiles": len(self.tiles), "crs": self.crs, **self._stats}
+
+
+def write_tile(directory: str, name: str, grid: np.ndarray, meta: Dict[str, Any], crs: str) -> Dict[str, Any]:
+    """Enregistre une dalle .npy et l'ajoute (ou la remplace) dans index.json."""
+    os.makedirs(directory, exist_ok=True)
+    filename = f"{name}.npy"
+    np.save(os.path.join(directory, filename), np.ascontiguousarray(grid, dtype=np.float32))
+    index_path = os.path.join(directory, INDEX_FILE)
+    index = {"crs": crs, "tiles": []}
+    if os.path.exists(index_path):
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    if index.get("crs", crs) != crs:
+        raise ValueError(f"CRS {crs} différent de celui de l'index ({index['crs']})")
+    entry = {"file": filename, **{k: meta[k] for k in ("x0", "y0", "cellsize", "nrows", "ncols", "nodata")}}
+    index["tiles"] = [t for t in index.get("tiles", []) if t["file"] != filename] + [entry]
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f)
+    return entry
@@ -0,0 +1,186 @@
+# utils/dept_aggregate.py
+"""
+Synthèse départementale calculée au fil des rapports communaux.
+
+La synthèse retient les K parcelles RPG les plus proches d'un poste (après
+dédoublonnage entre communes voisines) et compte parcelles et éleveurs. Plutôt
+que de concaténer toutes les features du département puis de les trier, chaque
+rapport est consommé dès qu'il arrive : un tas borné garde les K meilleures
+parcelles, un ensemble d'empreintes 64 bits sert au dédoublonnage et des
+compteurs remplacent les listes. La mémoire ne dépend que de K et du nombre de
+parcelles distinctes, pas de la taille des rapports.
+
+Des agrégats partiels (un par worker, par lot de communes...) se fusionnent
+avec `merge` ou se transmettent sérialisés (`to_dict` / `from_dict`).
+"""
+
+import hashlib
+import heapq
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Champs de distance (m) examinés dans l'ordre ; le premier positif fait foi
+DISTANCE_KEYS = ("distance_bt", "distance_au_poste", "distance_hta", "min_bt_distance_m", "min_ht_distance_m")
+# Distance des parcelles sans mesure (classées en dernier)
+NO_DISTANCE = 999999
+
+
+def feature_distance(feat: Dict[str, Any]) -> float:
+    """Distance (m) de la parcelle au poste, NO_DISTANCE si aucune mesure exploitable."""
+    props = feat.get("properties") or {}
+    for key in DISTANCE_KEYS:
+        v = props.get(key)
+        if v is not None and isinstance(v, (int, float)) and v > 0:
+            return v
+    return NO_DISTANCE
+
+
+def parcel_key(feat: Dict[str, Any]) -> int:
+    """
+    Empreinte 64 bits d'une parcelle : identifiant RPG, commune et référence cadastrale.
+    Deux communes voisines rendant la même parcelle produisent la même empreinte.
+    """
+    props = feat.get("properties") or {}
+    ident = (
+        props.get("ID_PARCEL") or props.get("id"),
+        props.get("code_com"),
+        props.get("com_abs"),
+        props.get("section") or props.get("cadastre_section"),
+        props.get("numero") or props.get("cadastre_numero"),
+    )
+    return int.from_bytes(hashlib.blake2b(repr(ident).encode(), digest_size=8).digest(), "big")
+
+
+def _features(rpt: Dict[str, Any], key: str) -> List[Dict[str, Any]]:
+    fc = rpt.get(key)
+    if fc and isinstance(fc, dict):
+        return fc.get("features") or []
+    return []
+
+
+class DeptAggregate:
+    """
+    Usage:
+        agg = DeptAggregate(k=50)
+        for rpt in reports:          # liste, générateur, éléments d'un travail...
+            agg.add_report(rpt)
+        agg.top()                    # K parcelles, distance croissante
+        agg.parcelles, agg.eleveurs  # parcelles distinctes, éleveurs
+
+        # Agrégats partiels (workers parallèles)
+        total = DeptAggregate(50).merge(part_a).merge(part_b)
+
+    Args:
+        k (int): Nombre de parcelles retenues.
+
+    À distance égale, la parcelle rencontrée la première l'emporte, comme avec un tri
+    stable de la liste complète. Une parcelle vue par deux agrégats fusionnés n'est
+    comptée qu'une fois ; si de tels doublons occupent le top K d'un agrégat partiel,
+    les parcelles qui les suivaient ne sont plus connues (cas des rapports par bbox qui
+    se recouvrent) : le top fusionné peut alors compter moins de K parcelles.
+    """
+
+    def __init__(self, k: int = 50):
+        self.k = k
+        self.communes = 0
+        self.rpg_total = 0
+        self.eleveurs = 0
+        self._seen: set = set()
+        # Tas min sur (-distance, -ordre) : la racine est la pire parcelle retenue
+        self._heap: List[Tuple[float, int, int, Dict[str, Any]]] = []
+        self._seq = 0
+
+    @property
+    def parcelles(self) -> int:
+        """Parcelles RPG distinctes."""
+        return len(self._seen)
+
+    @property
+    def doublons(self) -> int:
+        return self.rpg_total - len(self._seen)
+
+    def _offer(self, dist: float, seq: int, key: int, feat: Dict[str, Any]) -> None:
+        entry = (-dist, -seq, key, feat)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, entry)
+        elif entry > self._heap[0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def add_features(self, features: Iterable[Dict[str, Any]]) -> None:
+        """Ajoute des parcelles RPG (les doublons déjà vus sont ignorés)."""
+        for feat in features:
+            self.rpg_total += 1
+            key = parcel_key(feat)
+            if key in self._seen:
+                continue
+            self._seen.add(key)
+            self._seq += 1
+            if self.k > 0:
+                self._offer(feature_distance(feat), self._seq, key, feat)
+
+    def add_report(self, rpt: Optional[Dict[str, Any]]) -> None:
+        """Consomme un rapport communal (rpg_parcelles et eleveurs en FeatureCollection)."""
+        if not rpt:
+            return
+        self.communes += 1
+        self.add_features(_features(rpt, "rpg_parcelles"))
+        self.eleveurs += len(_features(rpt, "eleveurs"))
+
+    def add_reports(self, reports: Iterable[Dict[str, Any]]) -> "DeptAggregate":
+        for rpt in reports:
+            self.add_report(rpt)
+        return self
+
+    def merge(self, other: "DeptAggregate") -> "DeptAggregate":
+        """
+        Fusionne un agrégat partiel, placé après celui-ci dans l'ordre des rapports.
+
+        Returns:
+            DeptAggregate: self (chaînable).
+        """
+        offset = self._seq
+        for neg_dist, neg_seq, key, feat in other._heap:
+            if key not in self._seen:
+                self._offer(-neg_dist, offset - neg_seq, key, feat)
+        self._seen |= other._seen
+        self._seq = offset + other._seq
+        self.communes += other.communes
+        self.rpg_total += other.rpg_total
+        self.eleveurs += other.eleveurs
+        return self
+
+    def top(self) -> List[Dict[str, Any]]:
+        """Parcelles retenues, de la plus proche à la plus éloignée d'un poste."""
+        return [entry[3] for entry in sorted(self._heap, key=lambda e: (-e[0], -e[1]))]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "communes": self.communes,
+            "parcelles": self.parcelles,
+            "doublons": self.doublons,
+            "eleveurs": self.eleveurs,
+            "top": len(self._heap),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Forme JSON de l'agrégat (transmission entre processus)."""
+        return {
+            "k": self.k,
+            "communes": self.communes,
+            "rpg_total": self.rpg_total,
+            "eleveurs": self.eleveurs,
+            "seq": self._seq,
+            "seen": sorted(self._seen),
+            "heap": [[-neg_dist, -neg_seq, key, feat] for neg_dist, neg_seq, key, feat in self._heap],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DeptAggregate":
+        agg = cls(data.get("k", 50))
+        agg.communes = data.get("communes", 0)
+        agg.rpg_total = data.get("rpg_total", 0)
+        agg.eleveurs = data.get("eleveurs", 0)
+        agg._seq = data.get("seq", 0)
+        agg._seen = set(data.get("seen") or [])
+        agg._heap = [(-dist, -seq, key, feat) for dist, seq, key, feat in data.get("heap") or []]
+        heapq.heapify(agg._heap)
+        return agg
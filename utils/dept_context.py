@@ -0,0 +1,211 @@
+# utils/dept_context.py
+"""
+Couches d'un département chargées une fois, puis réparties par commune.
+
+En mode département, chaque rapport communal interrogeait RPG et postes dans
+une fenêtre de ~5 km autour du centre de la commune : les fenêtres voisines se
+recouvrent et les mêmes features étaient téléchargées des dizaines de fois.
+Ici, chaque couche est lue une seule fois sur l'emprise du département (grille
+de tuiles, requêtes en parallèle, dédoublonnage par id) et indexée (STRtree).
+Les rapports communaux interrogent ensuite ces index : par contour de commune
+(partition, chaque feature rattachée à la commune qui contient son point
+représentatif) ou par bbox (mêmes fenêtres qu'avant, sans réseau).
+
+Une tuile en échec n'est pas confondue avec une zone vide : elle est comptée
+dans `tile_errors` et les communes qu'elle couvre sont signalées par
+`incomplete` (l'appelant se rabat alors sur les requêtes par commune).
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+
+from utils.cadastre_snapshot import covering_tiles, tile_bounds
+from utils.commune_clipper import repair_geometries
+from utils.gazetteer import normalize_name
+from utils.geometry_tiling import feature_key
+from utils.projection import geometry_array
+
+Bounds = Tuple[float, float, float, float]
+
+
+class LayerIndex:
+    """Features d'une couche et STRtree de leurs géométries (WGS84)."""
+
+    def __init__(self, features: Sequence[Dict[str, Any]]):
+        geoms = repair_geometries(geometry_array(list(features)))
+        keep = ~shapely.is_missing(geoms) if len(geoms) else np.zeros(0, dtype=bool)
+        self.features = [f for f, k in zip(features, keep) if k]
+        self.geometries = geoms[keep]
+        self.tree = shapely.STRtree(self.geometries)
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    def in_bbox(self, bounds: Bounds) -> List[Dict[str, Any]]:
+        """Features intersectant la bbox (équivalent local d'une requête WFS BBOX)."""
+        hits = self.tree.query(shapely.box(*bounds), predicate="intersects")
+        return [self.features[i] for i in np.sort(hits)]
+
+
+class DepartmentContext:
+    """
+    Usage:
+        ctx = DepartmentContext(communes, {"rpg": fetch_rpg, "bt": fetch_postes_bt})
+        ctx.load()
+        ctx.assigned("rpg", "Guéret")                    # parcelles rattachées à la commune
+        ctx.in_bbox("bt", (1.8, 46.1, 1.9, 46.2))        # postes de la fenêtre
+
+    Args:
+        communes (list): Features des communes (properties.nom, properties.code, properties.centre,
+            geometry = contour), telles que rendues par get_communes_for_dept. Les méthodes par
+            commune acceptent le code INSEE ou le nom (ambigu entre homonymes : première commune).
+        layers (dict): {clé: fetch(bounds) -> features} ; bounds = (minx, miny, maxx, maxy) WGS84.
+            fetch doit lever une exception en cas d'échec (une liste vide = tuile réellement vide).
+        tile_size (float): Pas de la grille de préchargement, en degrés.
+        margin_deg (float): Marge autour de chaque commune (fenêtres bbox des rapports).
+        workers (int): Requêtes de tuiles simultanées.
+    """
+
+    def __init__(
+        self,
+        communes: Sequence[Dict[str, Any]],
+        layers: Dict[str, Callable[[Bounds], List[Dict[str, Any]]]],
+        tile_size: float = 0.1,
+        margin_deg: float = 0.06,
+        workers: int = 6,
+    ):
+        self.communes = [c for c in communes if c.get("geometry")]
+        self.layers = layers
+        self.tile_size = tile_size
+        self.margin_deg = margin_deg
+        self.workers = workers
+        self.indexes: Dict[str, LayerIndex] = {}
+        self.tile_errors = 0
+        self.failed_tiles: Dict[str, List[Bounds]] = {}
+        self._by_name: Dict[str, int] = {}
+        for i, c in enumerate(self.communes):
+            self._by_name.setdefault(normalize_name(c["properties"].get("nom", "")), i)
+        self._by_code = {str(c["properties"]["code"]): i for i, c in enumerate(self.communes)
+                         if c["properties"].get("code")}
+        self._contours = repair_geometries(geometry_array(self.communes))
+        self._assigned: Dict[str, Dict[int, List[Dict[str, Any]]]] = {}
+
+    def tiles(self) -> List[Bounds]:
+        """Tuiles couvrant chaque commune élargie de la marge."""
+        m = self.margin_deg
+        boxes = [
+            shapely.box(minx - m, miny - m, maxx + m, maxy + m)
+            for minx, miny, maxx, maxy in (g.bounds for g in self._contours if g is not None)
+        ]
+        return [tile_bounds(t, self.tile_size) for t in covering_tiles(boxes, self.tile_size)]
+
+    def load(self) -> Dict[str, int]:
+        """
+        Charge toutes les couches (couches x tuiles en parallèle).
+
+        Returns:
+            dict: {clé: nombre de features après dédoublonnage}
+        """
+        tiles = self.tiles()
+        jobs = [(key, bounds) for key in self.layers for bounds in tiles]
+
+        def run(job):
+            key, bounds = job
+            try:
+                return key, self.layers[key](bounds) or [], None
+            except Exception as e:
+                return key, [], e
+
+        per_layer: Dict[str, Dict[str, Dict[str, Any]]] = {key: {} for key in self.layers}
+        self.tile_errors = 0
+        self.failed_tiles = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(jobs) or 1))) as pool:
+            for (key, bounds), (_, features, error) in zip(jobs, pool.map(run, jobs)):
+                if error is not None:
+                    self.tile_errors += 1
+                    self.failed_tiles.setdefault(key, []).append(bounds)
+                    print(f"⚠️ [DEPT_CONTEXT] {key}: tuile {bounds} indisponible ({error})")
+                for feat in features:
+                    per_layer[key].setdefault(feature_key(feat), feat)
+
+        self.indexes = {key: LayerIndex(list(found.values())) for key, found in per_layer.items()}
+        self._assigned = {}
+        counts = {key: len(index) for key, index in self.indexes.items()}
+        print(f"📦 [DEPT_CONTEXT] {len(self.communes)} communes, {len(tiles)} tuiles: {counts}"
+              + (f", {self.tile_errors} tuiles en échec" if self.tile_errors else ""))
+        return counts
+
+    def incomplete(self, nom: str) -> List[str]:
+        """
+        Couches dont une tuile en échec recouvre la commune élargie de la marge :
+        ses données préchargées y sont partielles.
+        """
+        i = self.commune_index(nom)
+        if i is None or not self.failed_tiles or self._contours[i] is None:
+            return []
+        minx, miny, maxx, maxy = self._contours[i].bounds
+        m = self.margin_deg
+        return [
+            key for key, failed in self.failed_tiles.items()
+            if any(bx0 <= maxx + m and bx1 >= minx - m and by0 <= maxy + m and by1 >= miny - m
+                   for bx0, by0, bx1, by1 in failed)
+        ]
+
+    def commune_index(self, nom: str) -> Optional[int]:
+        """Position de la commune, par code INSEE puis par nom."""
+        i = self._by_code.get(str(nom))
+        return i if i is not None else self._by_name.get(normalize_name(nom))
+
+    def commune(self, nom: str) -> Optional[Dict[str, Any]]:
+        i = self.commune_index(nom)
+        return self.communes[i] if i is not None else None
+
+    def centre(self, nom: str) -> Optional[Tuple[float, float]]:
+        """(lat, lon) du centre de la commune (point représentatif du contour à défaut)."""
+        i = self.commune_index(nom)
+        if i is None:
+            return None
+        centre = (self.communes[i]["properties"].get("centre") or {}).get("coordinates")
+        if centre:
+            return centre[1], centre[0]
+        point = self._contours[i].representative_point() if self._contours[i] is not None else None
+        return (point.y, point.x) if point is not None else None
+
+    def has_layer(self, key: str) -> bool:
+        return key in self.indexes
+
+    def in_bbox(self, key: str, bounds: Bounds) -> List[Dict[str, Any]]:
+        return self.indexes[key].in_bbox(bounds)
+
+    def assigned(self, key: str, nom: str) -> List[Dict[str, Any]]:
+        """Features de la couche rattachées à la commune (point représentatif dans son contour)."""
+        if key not in self._assigned:
+            self._assigned[key] = self._partition(self.indexes[key])
+        i = self.commune_index(nom)
+        return list(self._assigned[key].get(i, [])) if i is not None else []
+
+    def _partition(self, index: LayerIndex) -> Dict[int, List[Dict[str, Any]]]:
+        out: Dict[int, List[Dict[str, Any]]] = {}
+        if not len(index):
+            return out
+        contours = np.array([g if g is not None else shapely.Polygon() for g in self._contours], dtype=object)
+        points = shapely.point_on_surface(index.geometries)
+        src, dst = shapely.STRtree(contours).query(points, predicate="within")
+        seen = set()
+        for s, d in sorted(zip(src.tolist(), dst.tolist())):
+            if s in seen:  # point sur une limite communale : première commune
+                continue
+            seen.add(s)
+            out.setdefault(d, []).append(index.features[s])
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "communes": len(self.communes),
+            "layers": {key: len(index) for key, index in self.indexes.items()},
+            "tile_errors": self.tile_errors,
+            "failed_tiles": {key: len(failed) for key, failed in self.failed_tiles.items()},
+        }
@@ -0,0 +1,168 @@
+# utils/disk_cache.py
+"""
+Cache disque clé/valeur générique (SQLite), avec TTL et éviction LRU.
+
+Les valeurs sont sérialisées en JSON compressé (zlib) et rangées par espace de
+noms (ex. "cadastre", "dem", "pvgis"). Une valeur expirée est traitée comme
+absente ; au-delà de `max_entries`, les entrées les moins récemment lues sont
+supprimées. Les erreurs SQLite sont journalisées et traitées comme des
+absences : le cache ne doit jamais faire échouer l'appelant.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, Optional
+
+
+class DiskCache:
+    """
+    Usage:
+        cache = DiskCache("cache/agriweb_cache.sqlite", default_ttl=86400)
+        cache.set("cadastre", "tile:0.01:210:4610", features, ttl=30 * 86400)
+        features = cache.get("cadastre", "tile:0.01:210:4610")
+
+    Args:
+        db_path (str): Fichier SQLite (répertoire créé si besoin).
+        default_ttl (float): Durée de vie par défaut des entrées, en secondes.
+        max_entries (int): Nombre maximal d'entrées conservées (tous espaces confondus).
+    """
+
+    def __init__(self, db_path: str, default_ttl: float = 86400.0, max_entries: int = 100_000):
+        self.db_path = db_path
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL, key TEXT NOT NULL,
+                expires REAL NOT NULL, accessed REAL NOT NULL,
+                nbytes INTEGER NOT NULL, payload BLOB NOT NULL,
+                PRIMARY KEY (namespace, key))"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._conn.commit()
+
+    def _count(self, namespace: str, name: str, n: int = 1) -> None:
+        ns = self._stats.setdefault(namespace, {"hits": 0, "misses": 0, "expired": 0, "writes": 0})
+        ns[name] += n
+
+    # ── Lecture ────────────────────────────────────────────────
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        """Valeur en cache, ou None si absente / expirée."""
+        return self.get_many(namespace, [key]).get(key)
+
+    def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, Any]:
+        """Valeurs présentes et non expirées parmi `keys` (les absentes sont omises)."""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        now = time.time()
+        found: Dict[str, Any] = {}
+        try:
+            with self._lock:
+                rows = []
+                # Limite de variables SQLite : lecture par paquets
+                for i in range(0, len(keys), 500):
+                    chunk = keys[i:i + 500]
+                    rows.extend(self._conn.execute(
+                        f"SELECT key, expires, payload FROM entries WHERE namespace=? "
+                        f"AND key IN ({','.join('?' * len(chunk))})",
+                        (namespace, *chunk),
+                    ).fetchall())
+                fresh = []
+                for key, expires, payload in rows:
+                    if expires < now:
+                        self._count(namespace, "expired")
+                        continue
+                    found[key] = json.loads(zlib.decompress(payload))
+                    fresh.append((now, namespace, key))
+                if fresh:
+                    self._conn.executemany("UPDATE entries SET accessed=? WHERE namespace=? AND key=?", fresh)
+                    self._conn.commit()
+                self._count(namespace, "hits", len(found))
+                self._count(namespace, "misses", len(keys) - len(found))
+        except (sqlite3.Error, ValueError, zlib.error) as e:
+            print(f"⚠️ [DISK_CACHE] Lecture impossible ({namespace}): {e}")
+            return {}
+        return found
+
+    # ── Écriture / éviction ────────────────────────────────────
+    def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.set_many(namespace, {key: value}, ttl)
+
+    def set_many(self, namespace: str, items: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        """Enregistre plusieurs valeurs (sérialisables en JSON) avec le même TTL."""
+        if not items:
+            return
+        now = time.time()
+        expires = now + (self.default_ttl if ttl is None else ttl)
+        rows = []
+        for key, value in items.items():
+            payload = zlib.compress(json.dumps(value).encode("utf-8"))
+            rows.append((namespace, key, expires, now, len(payload), payload))
+        try:
+            with self._lock:
+                self._conn.executemany("INSERT OR REPLACE INTO entries VALUES (?,?,?,?,?,?)", rows)
+                count = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                excess = count - self.max_entries
+                if excess > 0:
+                    self._conn.execute(
+                        """DELETE FROM entries WHERE rowid IN (
+                           SELECT rowid FROM entries ORDER BY accessed ASC LIMIT ?)""",
+                        (excess,),
+                    )
+                self._conn.commit()
+                self._count(namespace, "writes", len(rows))
+        except sqlite3.Error as e:
+            print(f"⚠️ [DISK_CACHE] Écriture impossible ({namespace}): {e}")
+
+    def delete(self, namespace: str, key: str) -> bool:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM entries WHERE namespace=? AND key=?", (namespace, key))
+            self._conn.commit()
+        return cur.rowcount > 0
+
+    def clear(self, namespace: Optional[str] = None) -> int:
+        """Vide un espace de noms (ou tout le cache). Retourne le nombre d'entrées supprimées."""
+        with self._lock:
+            if namespace is None:
+                cur = self._conn.execute("DELETE FROM entries")
+            else:
+                cur = self._conn.execute("DELETE FROM entries WHERE namespace=?", (namespace,))
+            self._conn.commit()
+        return cur.rowcount
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM entries WHERE expires < ?", (time.time(),))
+            self._conn.commit()
+        return cur.rowcount
+
+    # ── Statistiques ───────────────────────────────────────────
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs par espace de noms et occupation du cache."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT namespace, COUNT(*), COALESCE(SUM(nbytes), 0) FROM entries GROUP BY namespace"
+            ).fetchall()
+        usage = {ns: {"entries": n, "bytes": b} for ns, n, b in rows}
+        return {
+            "path": self.db_path,
+            "entries": sum(u["entries"] for u in usage.values()),
+            "bytes": sum(u["bytes"] for u in usage.values()),
+            "namespaces": {
+                ns: {**usage.get(ns, {"entries": 0, "bytes": 0}), **self._stats.get(ns, {})}
+                for ns in sorted(set(usage) | set(self._stats))
+            },
+        }
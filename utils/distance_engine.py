@@ -0,0 +1,127 @@
+# utils/distance_engine.py
+"""
+Distances aux postes électriques : index STRtree en Lambert-93.
+
+Les couches de postes (BT, HTA, capacités d'accueil) sont converties une seule
+fois par recherche en tableau shapely 2 projeté en EPSG:2154, indexé par un
+STRtree. Une requête « plus proche voisin » répond pour tout un lot de
+centroïdes (WGS84) en un appel vectorisé : distance en mètres et identifiant
+du poste le plus proche.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+from utils.projection import project as to_lambert93
+
+
+def as_points(centroids: Sequence[Any]) -> np.ndarray:
+    """Tableau de points shapely depuis des (lon, lat) ou des géométries shapely."""
+    if isinstance(centroids, np.ndarray) and centroids.dtype == object:
+        return centroids
+    items = list(centroids)
+    if items and not isinstance(items[0], shapely.Geometry):
+        coords = np.asarray(items, dtype=float).reshape(-1, 2)
+        return shapely.points(coords)
+    return np.asarray(items, dtype=object)
+
+
+class NearestFeatureIndex:
+    """
+    Index plus-proche-voisin sur une liste de features GeoJSON (EPSG:4326).
+
+    Args:
+        features (list): Features GeoJSON (les entrées sans géométrie sont ignorées).
+    """
+
+    def __init__(self, features: Sequence[Dict[str, Any]]):
+        self.features: List[Dict[str, Any]] = [f for f in (features or []) if f.get("geometry")]
+        geoms = np.array([shape(f["geometry"]) for f in self.features], dtype=object)
+        self.geometries = to_lambert93(geoms) if len(geoms) else geoms
+        self.tree = shapely.STRtree(self.geometries)
+
+    def __len__(self) -> int:
+        return len(self.features)
+
+    def nearest(self, centroids: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Plus proche feature pour chaque centroïde (lon, lat).
+
+        Returns:
+            tuple: (distances en mètres, indices dans self.features) ; NaN et -1 si l'index est vide.
+        """
+        points = as_points(centroids)
+        distances = np.full(len(points), np.nan)
+        indices = np.full(len(points), -1, dtype=np.int64)
+        if not len(points) or not len(self):
+            return distances, indices
+        (src, dst), dist = self.tree.query_nearest(to_lambert93(points), return_distance=True, all_matches=False)
+        distances[src] = dist
+        indices[src] = dst
+        return distances, indices
+
+    def nearest_ids(self, centroids: Sequence[Any]) -> Tuple[np.ndarray, List[Optional[str]]]:
+        """(distances en mètres, identifiant GeoServer du poste le plus proche ou None)."""
+        distances, indices = self.nearest(centroids)
+        return distances, [self.features[i].get("id") if i >= 0 else None for i in indices]
+
+    def min_distance(self, centroid: Tuple[float, float]) -> Optional[float]:
+        """Distance (m) du point (lon, lat) à la feature la plus proche, None si l'index est vide."""
+        distances, _ = self.nearest([centroid])
+        return None if np.isnan(distances[0]) else float(distances[0])
+
+    def ranked(self, centroid: Tuple[float, float], k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Features par distance croissante au point (lon, lat), en un calcul vectorisé.
+
+        Args:
+            k (int): Ne rendre que les k plus proches (sélection partielle, sans tri complet).
+        Returns:
+            tuple: (distances en mètres, indices dans self.features), triés par distance.
+        """
+        if not len(self) or k == 0:
+            return np.empty(0), np.empty(0, dtype=np.int64)
+        point = to_lambert93(as_points([centroid]))[0]
+        distances = shapely.distance(self.geometries, point)
+        if k is not None and k < len(distances):
+            candidates = np.argpartition(distances, k - 1)[:k]
+        else:
+            candidates = np.arange(len(distances))
+        order = candidates[np.argsort(distances[candidates], kind="stable")]
+        return distances[order], order
+
+
+class DistanceEngine:
+    """
+    Index nommés (ex. bt, hta, capacites) construits une fois par recherche.
+
+    Usage:
+        engine = DistanceEngine(bt=postes_bt_data, hta=postes_hta_data)
+        result = engine.query(centroids)
+        result["bt"]["distance_m"][i], result["bt"]["id"][i]
+    """
+
+    def __init__(self, **layers: Optional[Sequence[Dict[str, Any]]]):
+        self.indexes = {name: NearestFeatureIndex(features or []) for name, features in layers.items()}
+
+    def __getitem__(self, name: str) -> NearestFeatureIndex:
+        return self.indexes[name]
+
+    def min_distance(self, name: str, centroid: Tuple[float, float]) -> Optional[float]:
+        return self.indexes[name].min_distance(centroid)
+
+    def query(self, centroids: Sequence[Any]) -> Dict[str, Dict[str, list]]:
+        """Distance minimale (m, None si couche vide) et identifiant du plus proche, par couche, pour un lot de centroïdes."""
+        points = as_points(centroids)
+        result = {}
+        for name, index in self.indexes.items():
+            distances, ids = index.nearest_ids(points)
+            result[name] = {
+                "distance_m": [None if np.isnan(d) else float(d) for d in distances],
+                "id": ids,
+            }
+        return result
+
@@ -0,0 +1,157 @@
+# utils/fetch_stage.py
+"""
+Étape de collecte concurrente : chaque source de données est déclarée avec ses
+dépendances, puis exécutée sur un pool de threads borné.
+
+Une source sans dépendance démarre immédiatement ; une source dépendante démarre
+dès que toutes ses dépendances ont répondu (ex. le filtrage des postes commence
+dès que les postes arrivent, sans attendre les autres couches). Chaque source a
+son propre délai, compté à partir du moment où elle commence réellement (pas de
+son attente dans la file du pool) : passé ce délai, sa valeur par défaut est
+utilisée et la collecte continue. Les durées de chaque source sont enregistrées
+sur l'étape (une étape par requête, aucun état partagé).
+"""
+
+import copy
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# Intervalle de vérification du démarrage des sources encore en file (s)
+_QUEUE_POLL = 0.05
+
+
+class _Source:
+    __slots__ = ("name", "fn", "args", "kwargs", "depends_on", "timeout", "default")
+
+    def __init__(self, name, fn, args, kwargs, depends_on, timeout, default):
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.depends_on = tuple(depends_on)
+        self.timeout = timeout
+        self.default = default
+
+
+class FetchStage:
+    """
+    Graphe de sources à collecter en parallèle.
+
+    Args:
+        max_workers (int): Taille du pool de threads.
+        default_timeout (float): Délai par défaut d'une source (s).
+        label (str): Préfixe des logs.
+
+    Usage:
+        stage = FetchStage(max_workers=8)
+        stage.add("postes_raw", fetch_wfs_data, POSTE_LAYER, bbox, default=[])
+        stage.add("postes", filter_in_commune, depends_on=["postes_raw"], default=[])
+        results = stage.run()   # {"postes_raw": [...], "postes": [...]}
+        stage.timings           # {"postes_raw": {"seconds": 0.41, "status": "ok", "queued": 0.0}, ...}
+    """
+
+    def __init__(self, max_workers: int = 8, default_timeout: float = 30.0, label: str = "FETCH"):
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        self.label = label
+        self._sources: Dict[str, _Source] = {}
+        self.results: Dict[str, Any] = {}
+        self.timings: Dict[str, Dict[str, Any]] = {}
+
+    def add(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        *args,
+        depends_on: Iterable[str] = (),
+        timeout: Optional[float] = None,
+        default: Any = None,
+        **kwargs,
+    ) -> "FetchStage":
+        """
+        Déclare une source. Si elle a des dépendances, leurs résultats sont passés
+        en premiers arguments positionnels, dans l'ordre de depends_on.
+        """
+        if name in self._sources:
+            raise ValueError(f"Source déjà déclarée: {name}")
+        self._sources[name] = _Source(
+            name, fn, args, kwargs, depends_on,
+            self.default_timeout if timeout is None else timeout, default,
+        )
+        return self
+
+    def _fallback(self, source: _Source, status: str, started: float, error: Optional[str] = None):
+        self.results[source.name] = copy.deepcopy(source.default)
+        self.timings[source.name] = {"seconds": round(time.time() - started, 3), "status": status}
+        if error:
+            self.timings[source.name]["error"] = error
+
+    def run(self) -> Dict[str, Any]:
+        """Exécute toutes les sources et retourne {nom: résultat}."""
+        for source in self._sources.values():
+            unknown = [d for d in source.depends_on if d not in self._sources]
+            if unknown:
+                raise ValueError(f"Dépendance inconnue pour {source.name}: {unknown}")
+
+        waiting = dict(self._sources)
+        running = {}   # future -> source
+        started: Dict[str, float] = {}   # nom -> début effectif (thread du pool)
+        stage_start = time.time()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fetch")
+
+        def call(source, dep_values):
+            started[source.name] = time.time()
+            return source.fn(*dep_values, *source.args, **source.kwargs)
+
+        try:
+            while waiting or running:
+                for name, source in list(waiting.items()):
+                    if all(d in self.results for d in source.depends_on):
+                        dep_values = [self.results[d] for d in source.depends_on]
+                        running[executor.submit(call, source, dep_values)] = source
+                        del waiting[name]
+                if not running:
+                    break  # cycle de dépendances : rien ne peut plus démarrer
+
+                now = time.time()
+                deadlines = [started[src.name] + src.timeout for src in running.values() if src.name in started]
+                # Sources encore en file : leur délai n'a pas commencé, on revient voir si elles ont démarré
+                timeout = max(0.0, min(deadlines) - now) if deadlines else None
+                if len(deadlines) < len(running):
+                    timeout = _QUEUE_POLL if timeout is None else min(timeout, _QUEUE_POLL)
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    source = running.pop(future)
+                    begin = started.get(source.name, now)
+                    try:
+                        self.results[source.name] = future.result()
+                        self.timings[source.name] = {
+                            "seconds": round(time.time() - begin, 3), "status": "ok",
+                            "queued": round(begin - stage_start, 3),
+                        }
+                    except Exception as e:
+                        print(f"⚠️ [{self.label}] {source.name}: erreur {e}")
+                        self._fallback(source, "error", begin, str(e))
+
+                now = time.time()
+                for future, source in list(running.items()):
+                    begin = started.get(source.name)
+                    if begin is not None and now - begin >= source.timeout:
+                        # Un thread déjà lancé ne peut pas être interrompu : son résultat sera ignoré
+                        print(f"⏱️ [{self.label}] {source.name}: délai de {source.timeout}s dépassé")
+                        future.cancel()
+                        running.pop(future)
+                        self._fallback(source, "timeout", begin)
+
+            for name, source in waiting.items():
+                self._fallback(source, "skipped", stage_start, "dépendances non résolues")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        total = time.time() - stage_start
+        slowest = sorted(self.timings.items(), key=lambda kv: kv[1]["seconds"], reverse=True)[:5]
+        print(f"⏱️ [{self.label}] {len(self._sources)} sources en {total:.2f}s — plus lentes: "
+              + ", ".join(f"{n}={t['seconds']}s" for n, t in slowest))
+        self.timings["_total"] = {"seconds": round(total, 3), "status": "ok"}
+        return self.results
@@ -0,0 +1,254 @@
+# utils/gazetteer.py
+"""
+Répertoire local des communes (SQLite + R-tree), construit une fois depuis le
+référentiel officiel geo.api.gouv.fr par tools/build_gazetteer.py.
+
+Chaque commune garde son code INSEE, son nom (index insensible aux accents, à
+la casse et aux tirets), son département, sa population, sa surface, son
+centre, sa mairie et ses contours à plusieurs niveaux de simplification (WKB).
+Rien n'est chargé en mémoire : la base est ouverte à la première requête et
+chaque recherche est une lecture indexée. Les enregistrements rendus ont la
+forme des réponses geo.api.gouv.fr (nom, code, centre, contour...) pour que
+les appelants n'aient rien à adapter.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import shapely
+from shapely.geometry import mapping, shape
+
+# Niveaux de contour : tolérance de simplification en degrés (0 = contour officiel)
+LEVELS = {"full": 0.0, "100m": 0.001, "1km": 0.01}
+# Champs geo.api.gouv.fr disponibles localement
+LOCAL_FIELDS = {
+    "nom", "code", "codesPostaux", "codeDepartement", "departement",
+    "population", "surface", "centre", "contour", "mairie",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS communes (
+    rid INTEGER PRIMARY KEY,
+    code TEXT NOT NULL UNIQUE,
+    nom TEXT NOT NULL,
+    nom_norm TEXT NOT NULL,
+    dept TEXT,
+    dept_nom TEXT,
+    population INTEGER,
+    surface REAL,
+    lon REAL,
+    lat REAL,
+    codes_postaux TEXT,
+    mairie TEXT
+);
+CREATE INDEX IF NOT EXISTS communes_nom ON communes(nom_norm);
+CREATE INDEX IF NOT EXISTS communes_dept ON communes(dept);
+CREATE TABLE IF NOT EXISTS contours (
+    code TEXT NOT NULL,
+    level TEXT NOT NULL,
+    wkb BLOB NOT NULL,
+    PRIMARY KEY (code, level)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS communes_rtree USING rtree(rid, minx, maxx, miny, maxy);
+"""
+
+_COLUMNS = "code, nom, dept, dept_nom, population, surface, lon, lat, codes_postaux, mairie"
+
+
+def normalize_name(name: str) -> str:
+    """Forme de recherche d'un nom de commune : 'Saint-Étienne' et 'st etienne' -> 'saint etienne'."""
+    text = unicodedata.normalize("NFKD", name or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.lower().replace("œ", "oe").replace("æ", "ae")
+    text = re.sub(r"[-'’_.,/]+", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return re.sub(r"\b(st|ste)\b", lambda m: "saint" if m.group(1) == "st" else "sainte", text)
+
+
+class Gazetteer:
+    """
+    Usage:
+        gazetteer = Gazetteer("data/communes.sqlite")
+        gazetteer.search("saint etienne", fields="centre,contour,code", level="100m")
+        gazetteer.locate(2.35, 48.85)["code"]     # '75056'
+
+    Args:
+        db_path (str): Fichier SQLite ; absent = répertoire indisponible (les appelants se rabattent sur l'API).
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._count: Optional[int] = None
+        self._stats = {"lookups": 0, "hits": 0}
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    @property
+    def available(self) -> bool:
+        """Vrai si la base existe et contient des communes (vérifié une fois)."""
+        if self._count is None:
+            if not os.path.exists(self.db_path):
+                return False
+            try:
+                self._count = self._conn().execute("SELECT COUNT(*) FROM communes").fetchone()[0]
+            except sqlite3.Error as e:
+                print(f"⚠️ [GAZETTEER] Base illisible ({self.db_path}): {e}")
+                self._count = 0
+        return self._count > 0
+
+    def __len__(self) -> int:
+        return self._count if self.available else 0
+
+    # ── Construction ───────────────────────────────────────────
+    def import_communes(self, communes: Iterable[Dict[str, Any]], levels: Optional[Dict[str, float]] = None) -> int:
+        """
+        Remplace le contenu du répertoire par des communes au format geo.api.gouv.fr
+        (nom, code, codeDepartement, departement, population, surface, centre, contour, codesPostaux, mairie).
+
+        Returns:
+            int: Nombre de communes importées.
+        """
+        levels = LEVELS if levels is None else levels
+        count = 0
+        with self._write_lock:
+            conn = self._conn()
+            try:
+                conn.execute("BEGIN")
+                for table in ("communes_rtree", "contours", "communes"):
+                    conn.execute(f"DELETE FROM {table}")
+                for c in communes:
+                    code = c.get("code")
+                    if not code or not c.get("nom"):
+                        continue
+                    centre = (c.get("centre") or {}).get("coordinates") or (None, None)
+                    dept = c.get("departement") or {}
+                    cur = conn.execute(
+                        f"INSERT INTO communes ({_COLUMNS}, nom_norm) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            code, c["nom"], c.get("codeDepartement") or dept.get("code"), dept.get("nom"),
+                            c.get("population"), c.get("surface"), centre[0], centre[1],
+                            json.dumps(c.get("codesPostaux") or []),
+                            json.dumps(c["mairie"]) if c.get("mairie") else None,
+                            normalize_name(c["nom"]),
+                        ),
+                    )
+                    if c.get("contour"):
+                        geom = shape(c["contour"])
+                        if not geom.is_valid:
+                            geom = geom.buffer(0)
+                        minx, miny, maxx, maxy = geom.bounds
+                        conn.execute(
+                            "INSERT INTO communes_rtree (rid, minx, maxx, miny, maxy) VALUES (?, ?, ?, ?, ?)",
+                            (cur.lastrowid, minx, maxx, miny, maxy),
+                        )
+                        for level, tolerance in levels.items():
+                            simplified = geom.simplify(tolerance, preserve_topology=True) if tolerance else geom
+                            conn.execute("INSERT INTO contours (code, level, wkb) VALUES (?, ?, ?)",
+                                         (code, level, shapely.to_wkb(simplified)))
+                    count += 1
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        self._count = count
+        return count
+
+    # ── Lecture ────────────────────────────────────────────────
+    def _record(self, row: Sequence[Any]) -> Dict[str, Any]:
+        code, nom, dept, dept_nom, population, surface, lon, lat, codes_postaux, mairie = row
+        return {
+            "nom": nom,
+            "code": code,
+            "codesPostaux": json.loads(codes_postaux or "[]"),
+            "codeDepartement": dept,
+            "departement": {"code": dept, "nom": dept_nom},
+            "population": population,
+            "surface": surface,
+            "centre": {"type": "Point", "coordinates": [lon, lat]} if lon is not None else None,
+            "mairie": json.loads(mairie) if mairie else None,
+        }
+
+    def contour(self, code: str, level: str = "full") -> Optional[Dict[str, Any]]:
+        """Contour GeoJSON de la commune au niveau de simplification demandé (LEVELS)."""
+        geom = self.contour_geometry(code, level)
+        return mapping(geom) if geom is not None else None
+
+    def contour_geometry(self, code: str, level: str = "full"):
+        row = self._conn().execute("SELECT wkb FROM contours WHERE code = ? AND level = ?", (code, level)).fetchone()
+        return shapely.from_wkb(row[0]) if row else None
+
+    def _present(self, records: List[Dict[str, Any]], fields: Optional[str], level: str) -> List[Dict[str, Any]]:
+        wanted = None if fields is None else {f.strip() for f in fields.split(",") if f.strip()} | {"nom", "code"}
+        out = []
+        for rec in records:
+            if wanted is None or "contour" in wanted:
+                rec["contour"] = self.contour(rec["code"], level)
+            out.append(rec if wanted is None else {k: v for k, v in rec.items() if k in wanted})
+        return out
+
+    def get(self, code: str, fields: Optional[str] = None, level: str = "full") -> Optional[Dict[str, Any]]:
+        """Commune par code INSEE."""
+        row = self._conn().execute(f"SELECT {_COLUMNS} FROM communes WHERE code = ?", (code,)).fetchone()
+        return self._present([self._record(row)], fields, level)[0] if row else None
+
+    def search(self, name: str, fields: Optional[str] = None, level: str = "full") -> List[Dict[str, Any]]:
+        """
+        Communes portant ce nom (homonymes par population décroissante) ; un code INSEE est aussi accepté.
+
+        Args:
+            name (str): Nom de commune (accents, casse, tirets et 'St' indifférents) ou code INSEE.
+            fields (str): Champs geo.api.gouv.fr à rendre, séparés par des virgules (None : tous).
+            level (str): Niveau de simplification du contour.
+        """
+        self._stats["lookups"] += 1
+        name = (name or "").strip()
+        if re.fullmatch(r"\d[\dAB]\d{3}", name.upper()):
+            rows = self._conn().execute(f"SELECT {_COLUMNS} FROM communes WHERE code = ?", (name.upper(),)).fetchall()
+        else:
+            rows = self._conn().execute(
+                f"SELECT {_COLUMNS} FROM communes WHERE nom_norm = ? ORDER BY population DESC",
+                (normalize_name(name),),
+            ).fetchall()
+        if rows:
+            self._stats["hits"] += 1
+        return self._present([self._record(r) for r in rows], fields, level)
+
+    def in_departement(self, dept: str, fields: Optional[str] = None, level: str = "full") -> List[Dict[str, Any]]:
+        """Communes d'un département, par code INSEE."""
+        rows = self._conn().execute(
+            f"SELECT {_COLUMNS} FROM communes WHERE dept = ? ORDER BY code", (str(dept),)
+        ).fetchall()
+        return self._present([self._record(r) for r in rows], fields, level)
+
+    def locate(self, lon: float, lat: float) -> Optional[Dict[str, Any]]:
+        """Commune contenant le point (R-tree des emprises puis contour officiel)."""
+        rows = self._conn().execute(
+            f"SELECT {', '.join('c.' + c.strip() for c in _COLUMNS.split(','))} FROM communes_rtree r "
+            "JOIN communes c ON c.rid = r.rid WHERE r.minx <= ? AND r.maxx >= ? AND r.miny <= ? AND r.maxy >= ?",
+            (lon, lon, lat, lat),
+        ).fetchall()
+        point = shapely.Point(lon, lat)
+        for row in rows:
+            geom = self.contour_geometry(row[0])
+            if geom is not None and geom.covers(point):
+                return self._record(row)
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"path": self.db_path, "communes": len(self), **self._stats}
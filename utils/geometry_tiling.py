@@ -0,0 +1,194 @@
+# utils/geometry_tiling.py
+"""
+Requêtes API Carto (GPU, Nature...) sur des polygones trop longs pour une URL.
+
+Le paramètre `geom` part dans l'URL : au-delà d'environ 4 000 caractères, le
+serveur répond 414. Plutôt que de remplacer le contour par sa bbox (qui
+ramène des zones hors commune), le polygone est élargi puis simplifié
+(buffer(t).simplify(t), qui couvre toujours l'original) et, s'il reste trop
+long, découpé en quadrants simplifiés à leur tour. Les tuiles sont
+interrogées en parallèle ; les résultats sont fusionnés, dédoublonnés par id
+puis redécoupés au contour exact.
+
+Le nombre de requêtes (endpoints × tuiles) est plafonné : au-delà, le découpage
+est moins profond (tuiles plus grossières, redécoupées de même au contour). Les
+tuiles en échec sont signalées à l'appelant plutôt que fusionnées en silence.
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import mapping
+
+from utils.commune_clipper import CommuneClipper
+from utils.wfs_filter import as_geometry
+
+# Longueur maximale du JSON de la géométrie (seuil historique anti-414)
+DEFAULT_URL_BUDGET = 4000
+# Requêtes (endpoints × tuiles) d'un même fan-out
+DEFAULT_MAX_REQUESTS = 128
+
+
+def _geojson(geom, precision: int) -> Dict[str, Any]:
+    rounded = shapely.transform(geom, lambda coords: np.round(coords, precision))
+    return mapping(rounded)
+
+
+def _fits(geojson: Dict[str, Any], budget: int) -> bool:
+    return len(json.dumps(geojson)) <= budget
+
+
+def covering_simplification(geom, budget: int = DEFAULT_URL_BUDGET, precision: int = 6) -> Optional[Dict[str, Any]]:
+    """
+    GeoJSON de `geom` (ou d'une version élargie puis simplifiée qui la couvre) tenant dans
+    `budget` caractères ; None si la tolérance nécessaire dépasse 1/50 de l'emprise.
+    """
+    gj = _geojson(geom, precision)
+    if _fits(gj, budget):
+        return gj
+    minx, miny, maxx, maxy = geom.bounds
+    span = max(maxx - minx, maxy - miny) or 1e-6
+    tolerance = span / 2000.0
+    while tolerance <= span / 50.0:
+        gj = _geojson(geom.buffer(tolerance).simplify(tolerance, preserve_topology=True), precision)
+        if _fits(gj, budget):
+            return gj
+        tolerance *= 2
+    return None
+
+
+def split_for_url(geom: Any, budget: int = DEFAULT_URL_BUDGET, precision: int = 6, max_depth: int = 4) -> List[Dict[str, Any]]:
+    """
+    Découpe une géométrie en tuiles GeoJSON qui tiennent chacune dans une URL.
+
+    Args:
+        geom: Géométrie shapely ou GeoJSON (réparée si invalide).
+        budget (int): Longueur maximale du JSON de chaque tuile.
+        precision (int): Décimales conservées.
+        max_depth (int): Profondeur maximale du découpage en quadrants.
+
+    Returns:
+        list: Géométries GeoJSON dont l'union couvre `geom` (une seule si elle tient telle quelle).
+    """
+    original = as_geometry(geom)
+
+    def fit(part, depth):
+        gj = covering_simplification(part, budget, precision)
+        if gj is not None:
+            return [gj]
+        minx, miny, maxx, maxy = part.bounds
+        if depth >= max_depth:
+            return [_geojson(shapely.box(minx, miny, maxx, maxy), precision)]
+        midx, midy = (minx + maxx) / 2, (miny + maxy) / 2
+        tiles = []
+        for quadrant in (
+            shapely.box(minx, miny, midx, midy), shapely.box(midx, miny, maxx, midy),
+            shapely.box(minx, midy, midx, maxy), shapely.box(midx, midy, maxx, maxy),
+        ):
+            piece = part.intersection(quadrant)
+            if not piece.is_empty and piece.area > 0:
+                tiles.extend(fit(piece, depth + 1))
+        return tiles
+
+    return fit(original, 0)
+
+
+def feature_key(feat: Dict[str, Any]) -> str:
+    """Clé de dédoublonnage : id de la feature, sinon son contenu."""
+    fid = feat.get("id")
+    return str(fid) if fid is not None else json.dumps(feat, sort_keys=True)
+
+
+def merge_collections(collections: Sequence[Optional[Dict[str, Any]]], clip: Any = None) -> Optional[Dict[str, Any]]:
+    """
+    Fusionne les FeatureCollections des tuiles : dédoublonnage par id, puis découpage
+    au contour `clip` (les features sans géométrie sont conservées).
+
+    Returns:
+        dict | None: FeatureCollection, ou None si aucune tuile n'a répondu. Si une partie
+        des tuiles seulement a répondu, "failed_tiles" donne le nombre de tuiles manquantes.
+    """
+    answered = [c for c in collections if isinstance(c, dict)]
+    if not answered:
+        return None
+    failed = len(collections) - len(answered)
+    seen, features = set(), []
+    for fc in answered:
+        for feat in fc.get("features") or []:
+            key = feature_key(feat)
+            if key not in seen:
+                seen.add(key)
+                features.append(feat)
+    if clip is not None and features:
+        with_geom = [f for f in features if f.get("geometry")]
+        kept = {id(f) for f in CommuneClipper(clip).clip(with_geom)}
+        features = [f for f in features if not f.get("geometry") or id(f) in kept]
+    merged = dict(answered[0])
+    merged["features"] = features
+    merged.pop("totalFeatures", None)
+    merged.pop("numberReturned", None)
+    if failed:
+        merged["failed_tiles"] = failed
+    return merged
+
+
+def fan_out(
+    fetch: Callable[[str, Dict[str, Any]], Optional[Dict[str, Any]]],
+    keys: Sequence[str],
+    geom: Any,
+    max_workers: int = 6,
+    budget: int = DEFAULT_URL_BUDGET,
+    max_requests: int = DEFAULT_MAX_REQUESTS,
+    max_depth: int = 4,
+) -> Tuple[Dict[str, Optional[Dict[str, Any]]], int, Dict[str, int]]:
+    """
+    Interroge chaque clé (endpoint) sur chaque tuile de `geom`, en parallèle borné.
+
+    Args:
+        fetch (callable): (clé, géométrie GeoJSON) -> FeatureCollection ou None.
+        keys (list): Endpoints à interroger.
+        geom: Contour exact (shapely ou GeoJSON).
+        max_workers (int): Requêtes simultanées.
+        budget (int): Longueur maximale du JSON de géométrie par requête.
+        max_requests (int): Plafond de requêtes (clés × tuiles) ; le découpage est réduit pour
+            le respecter (au minimum une tuile, donc une requête par clé).
+        max_depth (int): Profondeur maximale du découpage en quadrants.
+
+    Returns:
+        tuple: ({clé: FeatureCollection fusionnée ou None}, nombre de tuiles,
+        {clé: nombre de tuiles en échec} pour les clés incomplètes)
+    """
+    original = as_geometry(geom)
+    depth = max_depth
+    tiles = split_for_url(original, budget, max_depth=depth)
+    while depth > 0 and len(tiles) * len(keys) > max_requests:
+        depth -= 1
+        tiles = split_for_url(original, budget, max_depth=depth)
+    if depth < max_depth:
+        print(f"⚠️ [API_FANOUT] Découpage limité à la profondeur {depth} ({len(tiles)} tuiles, "
+              f"plafond {max_requests} requêtes)")
+    exact = len(tiles) == 1 and tiles[0] == _geojson(original, 6)
+    jobs = [(key, tile) for key in keys for tile in tiles]
+
+    def run(job):
+        key, tile = job
+        try:
+            return fetch(key, tile)
+        except Exception as e:
+            print(f"⚠️ [API_FANOUT] {key}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs) or 1))) as pool:
+        answers = list(pool.map(run, jobs))
+
+    per_key: Dict[str, List[Optional[Dict[str, Any]]]] = {key: [] for key in keys}
+    for (key, _), answer in zip(jobs, answers):
+        per_key[key].append(answer)
+    failed = {key: sum(1 for a in parts if not isinstance(a, dict)) for key, parts in per_key.items()}
+    # Géométrie exacte envoyée : l'API a déjà filtré, inutile de redécouper
+    clip = None if exact else original
+    merged = {key: merge_collections(parts, clip) for key, parts in per_key.items()}
+    return merged, len(tiles), {key: n for key, n in failed.items() if n}
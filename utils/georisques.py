@@ -0,0 +1,189 @@
+# utils/georisques.py
+"""
+Client GeoRisques (API v1) : endpoints interrogés en parallèle sous une échéance
+globale, réponses à l'échelle de la commune mises en cache par code INSEE.
+
+Une partie des catégories ne dépend que de la commune (zonage sismique, radon,
+arrêtés CatNat, TRI, AZI, TIM) : elles sont demandées par code_insee et
+conservées longtemps dans le cache disque. Seules les recherches autour du
+point (cavités, mouvements de terrain, argiles, installations, sites et sols
+pollués...) partent sur le réseau à chaque appel. Passé l'échéance, les
+catégories encore en attente sont rendues vides et signalées indisponibles
+(comme celles en erreur) : le rapport reste partiel plutôt que d'attendre
+chaque timeout, sans confondre « indisponible » et « aucun risque ».
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+GEORISQUES_API_URL = "https://www.georisques.gouv.fr/api/v1"
+CACHE_NAMESPACE = "georisques"
+
+COMMUNE = "commune"
+POINT = "point"
+
+
+class RiskEndpoint(NamedTuple):
+    key: str                     # catégorie dans le dictionnaire de risques (templates, carte)
+    path: str                    # chemin sous /api/v1
+    scope: str                   # COMMUNE (code_insee, en cache) ou POINT (latlon, à chaque appel)
+    rayon: Optional[int] = None  # rayon de recherche (m) des requêtes par point
+
+
+ENDPOINTS: List[RiskEndpoint] = [
+    RiskEndpoint("sismique", "zonage_sismique", COMMUNE),
+    RiskEndpoint("tri_zonage", "tri_zonage", POINT),
+    RiskEndpoint("tri_gaspar", "gaspar/tri", COMMUNE),
+    RiskEndpoint("ssp_casias", "ssp/casias", POINT, 1000),
+    RiskEndpoint("ssp_instructions", "ssp/instructions", POINT, 1000),
+    RiskEndpoint("ssp_conclusions_sis", "ssp/conclusions_sis", POINT, 1000),
+    RiskEndpoint("ssp_conclusions_sup", "ssp/conclusions_sup", POINT, 1000),
+    RiskEndpoint("tim", "gaspar/tim", COMMUNE),
+    RiskEndpoint("azi", "gaspar/azi", COMMUNE),
+    RiskEndpoint("catnat", "gaspar/catnat", COMMUNE),
+    RiskEndpoint("cavites", "cavites", POINT, 1000),
+    RiskEndpoint("mvt", "mvt", POINT, 1000),
+    RiskEndpoint("argiles", "argiles", POINT),
+    RiskEndpoint("radon", "radon", COMMUNE),
+    RiskEndpoint("installations", "installations", POINT, 2000),
+    RiskEndpoint("nucleaire", "installations_nucleaires", POINT, 5000),
+]
+
+
+class GeoRisquesClient:
+    """
+    Usage:
+        client = GeoRisquesClient(http_session, disk_cache, insee_resolver=get_insee_for_point)
+        risques, meta = client.fetch(lat, lon)   # {"sismique": [...], "catnat": [...], ...}
+        meta["unavailable"]                     # catégories en erreur ou hors délai
+
+    Args:
+        session: Session HTTP (requests.Session ou UpstreamClient).
+        cache: DiskCache pour les catégories communales (None : pas de cache).
+        insee_resolver (callable): (lat, lon) -> code INSEE ou None.
+        deadline (float): Échéance globale d'un appel (s).
+        request_timeout (float): Timeout de chaque requête (s).
+        commune_ttl (float): Durée de vie des réponses communales en cache (s).
+        max_workers (int): Requêtes simultanées.
+    """
+
+    def __init__(
+        self,
+        session: Any,
+        cache: Any = None,
+        insee_resolver: Optional[Callable[[float, float], Optional[str]]] = None,
+        deadline: float = 12.0,
+        request_timeout: float = 10.0,
+        commune_ttl: float = 30 * 86400,
+        max_workers: int = 8,
+        endpoints: Optional[List[RiskEndpoint]] = None,
+        base_url: str = GEORISQUES_API_URL,
+    ):
+        self.session = session
+        self.cache = cache
+        self.insee_resolver = insee_resolver
+        self.deadline = deadline
+        self.request_timeout = request_timeout
+        self.commune_ttl = commune_ttl
+        self.max_workers = max_workers
+        self.endpoints = list(endpoints or ENDPOINTS)
+        self.base_url = base_url.rstrip("/")
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "cache_hits": 0, "requests": 0, "errors": 0, "late": 0}
+        self.last_call: Dict[str, Any] = {}
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += n
+
+    def _request(self, endpoint: RiskEndpoint, lat: float, lon: float, insee: Optional[str]) -> list:
+        if endpoint.scope == COMMUNE and insee:
+            params = {"code_insee": insee}
+        else:
+            params = {"latlon": f"{lon},{lat}"}
+            if endpoint.rayon:
+                params["rayon"] = endpoint.rayon
+        self._count("requests")
+        resp = self.session.get(f"{self.base_url}/{endpoint.path}", params=params, timeout=self.request_timeout)
+        if resp.status_code != 200:
+            raise RuntimeError(f"HTTP {resp.status_code}")
+        return resp.json().get("data", []) or []
+
+    def _resolve_insee(self, lat: float, lon: float) -> Optional[str]:
+        if self.insee_resolver is None:
+            return None
+        try:
+            return self.insee_resolver(lat, lon)
+        except Exception as e:
+            print(f"⚠️ [GEORISQUES] Code INSEE introuvable pour {lat},{lon}: {e}")
+            return None
+
+    def fetch(self, lat: float, lon: float, insee: Optional[str] = None) -> Tuple[Dict[str, list], Dict[str, Any]]:
+        """
+        Risques au point (lat, lon), une liste par catégorie.
+
+        Args:
+            insee (str): Code INSEE de la commune s'il est déjà connu (sinon résolu via insee_resolver).
+
+        Returns:
+            tuple: (risques, meta). Une catégorie en erreur ou hors délai a une liste vide et figure
+            dans meta["unavailable"] (détail dans meta["errors"] et meta["late"]) ; meta donne aussi
+            insee, seconds et cached (catégories servies par le cache).
+        """
+        started = time.time()
+        self._count("calls")
+        insee = insee or self._resolve_insee(lat, lon)
+        risques: Dict[str, list] = {e.key: [] for e in self.endpoints}
+
+        commune_eps = [e for e in self.endpoints if e.scope == COMMUNE]
+        cached = {}
+        if insee and self.cache is not None:
+            found = self.cache.get_many(CACHE_NAMESPACE, [f"{insee}:{e.key}" for e in commune_eps])
+            cached = {key.split(":", 1)[1]: value for key, value in found.items()}
+        risques.update(cached)
+        self._count("cache_hits", len(cached))
+
+        pending = [e for e in self.endpoints if e.key not in cached]
+        errors, late, to_cache = [], [], {}
+        if pending:
+            pool = ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(pending))))
+            futures = {pool.submit(self._request, e, lat, lon, insee): e for e in pending}
+            done, not_done = wait(futures, timeout=max(0.0, self.deadline - (time.time() - started)))
+            # Les requêtes en retard ne sont pas attendues : le rapport part avec les catégories reçues
+            pool.shutdown(wait=False, cancel_futures=True)
+            for future in done:
+                endpoint = futures[future]
+                try:
+                    risques[endpoint.key] = future.result()
+                except Exception as e:
+                    errors.append(endpoint.key)
+                    print(f"[GeoRisques {endpoint.key}] Erreur: {e}")
+                    continue
+                if endpoint.scope == COMMUNE and insee:
+                    to_cache[f"{insee}:{endpoint.key}"] = risques[endpoint.key]
+            late = sorted(futures[f].key for f in not_done)
+            self._count("errors", len(errors))
+            self._count("late", len(late))
+            if late:
+                print(f"⏱️ [GEORISQUES] Hors délai ({self.deadline:.0f}s), catégories vides: {', '.join(late)}")
+        if to_cache and self.cache is not None:
+            self.cache.set_many(CACHE_NAMESPACE, to_cache, self.commune_ttl)
+
+        meta = {
+            "insee": insee,
+            "seconds": round(time.time() - started, 3),
+            "cached": sorted(cached),
+            "errors": sorted(errors),
+            "late": late,
+            "unavailable": sorted(set(errors) | set(late)),
+        }
+        with self._lock:
+            # Diagnostic seulement (stats) : les appelants lisent le meta rendu avec les risques
+            self.last_call = meta
+        return risques, meta
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "deadline_s": self.deadline, "last_call": dict(self.last_call)}
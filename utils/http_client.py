@@ -0,0 +1,177 @@
+# utils/http_client.py
+"""
+Client HTTP commun à tous les appels amont (GeoServer, API Carto, PVGIS, Overpass...).
+
+Une seule session requests, avec pour chaque hôte déclaré :
+- un pool de connexions keep-alive dimensionné (pas de poignée de main TCP+TLS par appel) ;
+- un timeout par défaut appliqué aux appels qui n'en donnent pas ;
+- une politique de retry (statuts, backoff, méthodes rejouables) ;
+- un plafond optionnel de requêtes simultanées (API limitées en débit) ;
+- des métriques : nombre d'appels, erreurs, retries, latences (p50/p95/max).
+
+Les hôtes non déclarés utilisent la politique par défaut.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class UpstreamPolicy:
+    """
+    Args:
+        pool_size (int): Connexions keep-alive conservées pour l'hôte.
+        timeout: Timeout par défaut (s), ou (connexion, lecture).
+        retries (int): Nombre de nouvelles tentatives (0 = aucune).
+        backoff (float): Facteur de backoff exponentiel (s).
+        status_forcelist (tuple): Statuts HTTP rejoués.
+        retry_post (bool): Rejouer aussi les POST (requêtes de lecture : WFS CQL, Overpass).
+        max_concurrent (int): Requêtes simultanées maximales vers l'hôte (None = pas de plafond).
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        timeout: Timeout = (5, 30),
+        retries: int = 3,
+        backoff: float = 1.0,
+        status_forcelist: Tuple[int, ...] = (429, 500, 502, 503, 504),
+        retry_post: bool = False,
+        max_concurrent: Optional[int] = None,
+    ):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.status_forcelist = status_forcelist
+        self.retry_post = retry_post
+        self.max_concurrent = max_concurrent
+
+    def retry(self) -> Retry:
+        methods = set(Retry.DEFAULT_ALLOWED_METHODS)
+        if self.retry_post:
+            methods.add("POST")
+        return Retry(
+            total=self.retries,
+            backoff_factor=self.backoff,
+            status_forcelist=self.status_forcelist,
+            allowed_methods=frozenset(methods),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+
+
+class _HostMetrics:
+    def __init__(self, window: int):
+        self.requests = 0
+        self.errors = 0          # exceptions (timeout, connexion...)
+        self.http_errors = 0     # réponses >= 400
+        self.retries = 0
+        self.latencies = deque(maxlen=window)
+
+    def snapshot(self) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1) if ordered else None
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "http_errors": self.http_errors,
+            "retries": self.retries,
+            "latency_ms": {"p50": pct(0.5), "p95": pct(0.95), "max": round(ordered[-1] * 1000, 1) if ordered else None},
+        }
+
+
+class UpstreamClient(requests.Session):
+    """
+    Session requests partagée, configurée hôte par hôte.
+
+    Args:
+        policies (dict): {hôte (netloc): UpstreamPolicy}.
+        default (UpstreamPolicy): Politique des hôtes non déclarés.
+        latency_window (int): Nombre de latences conservées par hôte pour les percentiles.
+
+    Usage:
+        client = UpstreamClient({"apicarto.ign.fr": UpstreamPolicy(pool_size=16)})
+        client.get("https://apicarto.ign.fr/api/cadastre/parcelle", params=...)  # timeout par défaut
+        client.stats()
+    """
+
+    def __init__(
+        self,
+        policies: Optional[Dict[str, UpstreamPolicy]] = None,
+        default: Optional[UpstreamPolicy] = None,
+        latency_window: int = 500,
+    ):
+        super().__init__()
+        self.policies = dict(policies or {})
+        self.default_policy = default or UpstreamPolicy()
+        self.latency_window = latency_window
+        self._metrics: Dict[str, _HostMetrics] = {}
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        for scheme in ("http://", "https://"):
+            self.mount(scheme, self._adapter(self.default_policy))
+            for host, policy in self.policies.items():
+                self.mount(f"{scheme}{host}/", self._adapter(policy))
+        for host, policy in self.policies.items():
+            if policy.max_concurrent:
+                self._semaphores[host] = threading.BoundedSemaphore(policy.max_concurrent)
+
+    @staticmethod
+    def _adapter(policy: UpstreamPolicy) -> HTTPAdapter:
+        return HTTPAdapter(pool_connections=4, pool_maxsize=policy.pool_size, max_retries=policy.retry())
+
+    def policy_for(self, host: str) -> UpstreamPolicy:
+        return self.policies.get(host, self.default_policy)
+
+    def _host_metrics(self, host: str) -> _HostMetrics:
+        with self._lock:
+            metrics = self._metrics.get(host)
+            if metrics is None:
+                metrics = self._metrics[host] = _HostMetrics(self.latency_window)
+            return metrics
+
+    def request(self, method, url, *args, **kwargs):
+        host = urlsplit(url).netloc
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.policy_for(host).timeout
+        metrics = self._host_metrics(host)
+        semaphore = self._semaphores.get(host)
+        start = time.perf_counter()
+        if semaphore is not None:
+            semaphore.acquire()
+        try:
+            resp = super().request(method, url, *args, **kwargs)
+        except Exception:
+            with self._lock:
+                metrics.requests += 1
+                metrics.errors += 1
+                metrics.latencies.append(time.perf_counter() - start)
+            raise
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+        retries = getattr(getattr(resp.raw, "retries", None), "history", ()) or ()
+        with self._lock:
+            metrics.requests += 1
+            metrics.retries += len(retries)
+            if resp.status_code >= 400:
+                metrics.http_errors += 1
+            metrics.latencies.append(time.perf_counter() - start)
+        return resp
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Métriques par hôte (latences sur les derniers appels)."""
+        with self._lock:
+            return {host: m.snapshot() for host, m in sorted(self._metrics.items())}
@@ -0,0 +1,474 @@
+# utils/jobs.py
+"""
+File de travaux persistante (SQLite) pour les rapports longs, exécutés hors
+des workers web.
+
+Une requête HTTP ne fait plus que déposer un travail (`submit`) puis lire son
+avancement : un JobRunner (threads du processus `job_worker.py`, ou du serveur
+local) le réclame avec un bail renouvelé tant qu'il tourne. Chaque élément
+terminé (une commune) est enregistré comme point de reprise avec son résultat
+(JSON compressé zlib) : si le worker meurt, le bail expire, un autre worker
+reprend le travail et ne recalcule que les éléments manquants. Les vues SSE
+relisent ces éléments dans l'ordre d'enregistrement à partir d'un curseur.
+"""
+
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+import zlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set
+
+ACTIVE = ("queued", "running")
+FINISHED = ("done", "failed", "cancelled")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    params_hash TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER,
+    message TEXT,
+    error TEXT,
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created);
+CREATE INDEX IF NOT EXISTS jobs_hash ON jobs(params_hash, created);
+CREATE TABLE IF NOT EXISTS job_items (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result BLOB,
+    error TEXT,
+    created REAL NOT NULL,
+    UNIQUE (job_id, key)
+);
+CREATE INDEX IF NOT EXISTS job_items_job ON job_items(job_id, seq);
+"""
+
+# Paramètres d'exécution (parallélisme...) : sans effet sur le résultat, exclus de l'empreinte
+EXECUTION_PARAMS = frozenset({"workers"})
+
+_JOB_COLUMNS = "id, kind, params, status, total, message, error, worker, lease_until, attempts, created, started, finished"
+
+
+def params_hash(kind: str, params: Dict[str, Any]) -> str:
+    """
+    Empreinte d'un travail : deux soumissions identiques partagent le même travail actif.
+    Les paramètres d'exécution (EXECUTION_PARAMS) n'en font pas partie.
+    """
+    significant = {k: v for k, v in params.items() if k not in EXECUTION_PARAMS}
+    return hashlib.sha1(f"{kind}:{json.dumps(significant, sort_keys=True, default=str)}".encode()).hexdigest()
+
+
+def _pack(value: Any) -> Optional[bytes]:
+    return None if value is None else zlib.compress(json.dumps(value, ensure_ascii=False, default=str).encode())
+
+
+def _unpack(blob: Optional[bytes]) -> Any:
+    return None if blob is None else json.loads(zlib.decompress(blob))
+
+
+class JobCancelled(Exception):
+    """Levée dans un handler quand son travail a été annulé ou son bail perdu."""
+
+
+class JobStore:
+    """
+    Usage:
+        store = JobStore("data/jobs.sqlite")
+        job_id = store.submit("dept_report", {"department": "23"})
+        store.get(job_id)["progress"]                  # {"done": 12, "failed": 0, "total": 256}
+        for item in store.items(job_id, after=0): ...   # points de reprise, dans l'ordre
+
+    Args:
+        db_path (str): Fichier SQLite partagé par les processus web et workers.
+        lease (float): Durée du bail d'un worker sur un travail (s), renouvelé tant qu'il tourne.
+        max_attempts (int): Reprises après bail expiré avant de déclarer le travail en échec.
+    """
+
+    def __init__(self, db_path: str, lease: float = 60.0, max_attempts: int = 3):
+        self.db_path = db_path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _job(self, row: Sequence[Any]) -> Dict[str, Any]:
+        job = dict(zip([c.strip() for c in _JOB_COLUMNS.split(",")], row))
+        job["params"] = json.loads(job["params"])
+        return job
+
+    # ── Soumission / lecture ───────────────────────────────────
+    def submit(self, kind: str, params: Dict[str, Any], dedupe: bool = True) -> str:
+        """
+        Dépose un travail ; avec `dedupe`, rend l'identifiant du travail actif identique s'il existe.
+
+        Returns:
+            str: Identifiant du travail.
+        """
+        digest = params_hash(kind, params)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if dedupe:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE params_hash = ? AND status IN (?, ?) ORDER BY created DESC LIMIT 1",
+                    (digest, *ACTIVE),
+                ).fetchone()
+                if row:
+                    conn.execute("COMMIT")
+                    return row[0]
+            job_id = uuid.uuid4().hex[:16]
+            conn.execute(
+                "INSERT INTO jobs (id, kind, params, params_hash, status, created) VALUES (?, ?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(params, sort_keys=True, default=str), digest, time.time()),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Travail et avancement ({done, failed, total}), ou None s'il est inconnu."""
+        row = self._conn().execute(f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = self._job(row)
+        counts = dict(self._conn().execute(
+            "SELECT status, COUNT(*) FROM job_items WHERE job_id = ? GROUP BY status", (job_id,)
+        ).fetchall())
+        job["progress"] = {"done": counts.get("done", 0), "failed": counts.get("failed", 0), "total": job.pop("total")}
+        return job
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """Travaux les plus récents (sans avancement détaillé)."""
+        where, args = ("WHERE status = ?", (status,)) if status else ("", ())
+        rows = self._conn().execute(
+            f"SELECT {_JOB_COLUMNS} FROM jobs {where} ORDER BY created DESC LIMIT ?", (*args, limit)
+        ).fetchall()
+        return [self._job(r) for r in rows]
+
+    def items(self, job_id: str, after: int = 0, with_results: bool = True) -> List[Dict[str, Any]]:
+        """Éléments enregistrés après le curseur `after` (seq), dans l'ordre d'enregistrement."""
+        column = "result" if with_results else "NULL"
+        rows = self._conn().execute(
+            f"SELECT seq, key, status, {column}, error FROM job_items WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, after),
+        ).fetchall()
+        return [{"seq": seq, "key": key, "status": status, "result": _unpack(result), "error": error}
+                for seq, key, status, result, error in rows]
+
+    def iter_items(self, job_id: str, after: int = 0, status: Optional[str] = None,
+                   batch: int = 50) -> Iterator[Dict[str, Any]]:
+        """Comme `items`, par lots de `batch` lignes : seuls les éléments du lot courant sont en mémoire."""
+        while True:
+            where, args = ("AND status = ?", (status,)) if status else ("", ())
+            rows = self._conn().execute(
+                f"SELECT seq, key, status, result, error FROM job_items WHERE job_id = ? AND seq > ? {where} "
+                "ORDER BY seq LIMIT ?",
+                (job_id, after, *args, batch),
+            ).fetchall()
+            for seq, key, item_status, result, error in rows:
+                yield {"seq": seq, "key": key, "status": item_status, "result": _unpack(result), "error": error}
+            if len(rows) < batch:
+                return
+            after = rows[-1][0]
+
+    def done_keys(self, job_id: str) -> Set[str]:
+        """Éléments déjà réussis (à sauter lors d'une reprise ; les échecs sont retentés)."""
+        rows = self._conn().execute(
+            "SELECT key FROM job_items WHERE job_id = ? AND status = 'done'", (job_id,)
+        ).fetchall()
+        return {r[0] for r in rows}
+
+    def follow(self, job_id: str, after: int = 0, poll_interval: float = 1.0,
+               keepalive: float = 15.0) -> Iterator[Dict[str, Any]]:
+        """
+        Suit un travail jusqu'à sa fin : rend ses éléments au fil de l'eau, puis son état final.
+
+        Args:
+            after (int): Curseur de reprise (seq du dernier élément déjà reçu).
+            keepalive (float): Délai sans nouveauté après lequel un événement "idle" est rendu.
+
+        Returns:
+            iterator: {"type": "item", **élément}, {"type": "message", "job": ...}, {"type": "idle"}
+                puis {"type": "end", "job": ...}.
+        """
+        last_message, last_event = None, time.monotonic()
+        while True:
+            job = self.get(job_id)
+            if job is None:
+                return
+            if job["message"] != last_message:
+                last_message, last_event = job["message"], time.monotonic()
+                yield {"type": "message", "job": job}
+            for item in self.items(job_id, after):
+                after, last_event = item["seq"], time.monotonic()
+                yield {"type": "item", **item}
+            if job["status"] in FINISHED:
+                # Éléments enregistrés entre la lecture du travail et sa fin
+                for item in self.items(job_id, after):
+                    after = item["seq"]
+                    yield {"type": "item", **item}
+                yield {"type": "end", "job": self.get(job_id)}
+                return
+            if time.monotonic() - last_event >= keepalive:
+                last_event = time.monotonic()
+                yield {"type": "idle", "job": job}
+            time.sleep(poll_interval)
+
+    def cancel(self, job_id: str) -> bool:
+        """Annule un travail actif (le handler s'arrête au prochain point de reprise)."""
+        cur = self._conn().execute(
+            "UPDATE jobs SET status = 'cancelled', finished = ?, lease_until = NULL WHERE id = ? AND status IN (?, ?)",
+            (time.time(), job_id, *ACTIVE),
+        )
+        return cur.rowcount > 0
+
+    # ── Côté worker ────────────────────────────────────────────
+    def claim(self, worker: str, kinds: Optional[Sequence[str]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Réclame le plus ancien travail en attente, ou un travail dont le bail a expiré (worker mort).
+
+        Returns:
+            dict: Travail réclamé (status 'running', bail au nom de `worker`), ou None.
+        """
+        now = time.time()
+        kind_filter, kind_args = "", ()
+        if kinds:
+            kind_filter = f"AND kind IN ({','.join('?' * len(kinds))})"
+            kind_args = tuple(kinds)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Travaux abandonnés trop souvent : échec définitif
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', finished = ?, error = 'bail expiré trop souvent' "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            row = conn.execute(
+                f"SELECT id FROM jobs WHERE (status = 'queued' OR (status = 'running' AND lease_until < ?)) "
+                f"{kind_filter} ORDER BY created LIMIT 1",
+                (now, *kind_args),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1, "
+                "started = COALESCE(started, ?) WHERE id = ?",
+                (worker, now + self.lease, now, row[0]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(row[0])
+
+    def heartbeat(self, job_id: str, worker: str) -> bool:
+        """Renouvelle le bail ; False si le travail a été annulé ou repris par un autre worker."""
+        cur = self._conn().execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + self.lease, job_id, worker),
+        )
+        return cur.rowcount > 0
+
+    def update(self, job_id: str, total: Optional[int] = None, message: Optional[str] = None) -> None:
+        if total is not None:
+            self._conn().execute("UPDATE jobs SET total = ? WHERE id = ?", (total, job_id))
+        if message is not None:
+            self._conn().execute("UPDATE jobs SET message = ? WHERE id = ?", (message, job_id))
+
+    def checkpoint(self, job_id: str, key: str, result: Any = None, error: Optional[str] = None) -> int:
+        """
+        Enregistre un élément terminé (remplace une tentative précédente du même élément).
+
+        Returns:
+            int: Position (seq) de l'élément dans le flux du travail.
+        """
+        cur = self._conn().execute(
+            "INSERT OR REPLACE INTO job_items (job_id, key, status, result, error, created) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, key, "failed" if error is not None else "done", _pack(result), error, time.time()),
+        )
+        return cur.lastrowid
+
+    def finish(self, job_id: str, worker: str, status: str = "done", error: Optional[str] = None) -> None:
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, error = ?, finished = ?, lease_until = NULL "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (status, error, time.time(), job_id, worker),
+        )
+
+    def purge(self, older_than: float) -> int:
+        """Supprime les travaux terminés depuis plus de `older_than` secondes (et leurs éléments)."""
+        conn = self._conn()
+        limit = time.time() - older_than
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            ids = [r[0] for r in conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?, ?) AND finished < ?", (*FINISHED, limit)
+            ).fetchall()]
+            for job_id in ids:
+                conn.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return len(ids)
+
+    def stats(self) -> Dict[str, Any]:
+        counts = dict(self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {"path": self.db_path, "jobs": counts}
+
+
+class JobContext:
+    """Vue d'un travail réclamé, passée au handler : paramètres, points de reprise, avancement."""
+
+    def __init__(self, store: JobStore, job: Dict[str, Any], worker: str):
+        self.store = store
+        self.job = job
+        self.id = job["id"]
+        self.params = job["params"]
+        self.worker = worker
+        self.resumed = job["attempts"] > 1
+        self._lost = threading.Event()
+
+    def done_keys(self) -> Set[str]:
+        return self.store.done_keys(self.id)
+
+    def set_total(self, total: int) -> None:
+        self.store.update(self.id, total=total)
+
+    def message(self, text: str) -> None:
+        self.store.update(self.id, message=text)
+
+    def checkpoint(self, key: str, result: Any = None, error: Optional[str] = None) -> None:
+        self.check()
+        self.store.checkpoint(self.id, key, result, error)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._lost.is_set()
+
+    def check(self) -> None:
+        """Lève JobCancelled si le travail a été annulé ou repris ailleurs."""
+        if self._lost.is_set():
+            raise JobCancelled(self.id)
+
+
+class JobRunner:
+    """
+    Usage:
+        runner = JobRunner(store, {"dept_report": run_dept_report}, workers=2)
+        runner.start()          # threads démons (serveur local)
+        runner.run_forever()    # ou bloquant (processus job_worker.py)
+
+    Args:
+        store (JobStore): File partagée.
+        handlers (dict): {kind: handler(JobContext)} ; une exception = travail en échec.
+        workers (int): Travaux exécutés simultanément.
+        poll_interval (float): Attente entre deux réclamations infructueuses (s).
+    """
+
+    def __init__(self, store: JobStore, handlers: Dict[str, Callable[[JobContext], None]],
+                 workers: int = 1, poll_interval: float = 1.0):
+        self.store = store
+        self.handlers = handlers
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._loop, args=(f"{self.name}:{n}",), daemon=True,
+                                      name=f"job-runner-{n}")
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run_forever(self) -> None:
+        self.start()
+        try:
+            while not self._stop.wait(1.0):
+                pass
+        except KeyboardInterrupt:
+            self.stop()
+
+    def run_once(self, worker: Optional[str] = None) -> bool:
+        """Réclame et exécute un travail ; False si la file est vide."""
+        worker = worker or f"{self.name}:once"
+        job = self.store.claim(worker, list(self.handlers))
+        if job is None:
+            return False
+        self._run(job, worker)
+        return True
+
+    def _loop(self, worker: str) -> None:
+        while not self._stop.is_set():
+            try:
+                if not self.run_once(worker):
+                    self._stop.wait(self.poll_interval)
+            except Exception as e:
+                print(f"⚠️ [JOBS] {worker}: {e}")
+                self._stop.wait(self.poll_interval)
+
+    def _run(self, job: Dict[str, Any], worker: str) -> None:
+        ctx = JobContext(self.store, job, worker)
+        stop_beat = threading.Event()
+
+        def beat():
+            while not stop_beat.wait(self.store.lease / 3):
+                if not self.store.heartbeat(ctx.id, worker):
+                    ctx._lost.set()
+                    return
+
+        beater = threading.Thread(target=beat, daemon=True)
+        beater.start()
+        started = time.time()
+        print(f"🚀 [JOBS] {job['kind']} {ctx.id}{' (reprise)' if ctx.resumed else ''}")
+        try:
+            self.handlers[job["kind"]](ctx)
+            self.store.finish(ctx.id, worker, "done")
+            print(f"✅ [JOBS] {job['kind']} {ctx.id} en {time.time() - started:.0f}s")
+        except JobCancelled:
+            print(f"⏹️ [JOBS] {job['kind']} {ctx.id} interrompu")
+        except Exception as e:
+            traceback.print_exc()
+            self.store.finish(ctx.id, worker, "failed", str(e))
+            print(f"❌ [JOBS] {job['kind']} {ctx.id}: {e}")
+        finally:
+            stop_beat.set()
@@ -0,0 +1,201 @@
+# utils/layer_store.py
+"""
+Magasin local des couches GeoServer : SQLite + index spatial R-tree.
+
+Chaque couche est importée une fois depuis le WFS (lecture paginée) et les
+features sont conservées telles que GeoServer les a renvoyées (JSON brut
+compressé) : une requête locale produit exactement la même structure qu'un
+GetFeature (id, geometry, geometry_name, properties).
+
+Les requêtes bbox/intersects passent par le R-tree (emprises) puis par un test
+géométrique exact, comme le BBOX/INTERSECTS de GeoServer. Le rafraîchissement
+est piloté couche par couche par la version de chaque couche (empreinte de sa
+déclaration dans le GetCapabilities, voir wfs_cache.read_layer_versions) : une
+couche n'est réimportée que si elle a changé depuis le dernier import, quelles
+que soient les modifications des autres couches du catalogue.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import shapely
+
+from utils.wfs_cache import geometry_bounds, normalize_crs, parse_bbox
+from utils.wfs_filter import as_geometry, clip_features
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS layers (
+    layer TEXT PRIMARY KEY,
+    crs TEXT NOT NULL,
+    version TEXT,
+    imported_at REAL NOT NULL,
+    feature_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS features (
+    fid INTEGER PRIMARY KEY,
+    layer TEXT NOT NULL,
+    feature_id TEXT,
+    payload BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS features_layer ON features(layer);
+CREATE INDEX IF NOT EXISTS features_id ON features(layer, feature_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS features_rtree USING rtree(fid, minx, maxx, miny, maxy);
+"""
+
+
+class LayerStore:
+    """
+    Args:
+        db_path (str): Fichier SQLite.
+        crs (str): CRS des géométries stockées (les requêtes dans un autre CRS sont refusées).
+
+    Usage:
+        store = LayerStore("data/layers.sqlite")
+        store.import_layer("gpu:postes", stream.pages(), version="123")
+        store.query("gpu:postes", "2.1,46.1,2.2,46.2,EPSG:4326")
+        store.query("gpu:postes", None, geometry=commune_poly)
+    """
+
+    def __init__(self, db_path: str, crs: str = "EPSG:4326"):
+        self.db_path = db_path
+        self.crs = normalize_crs(crs)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    # ── Métadonnées ────────────────────────────────────────────
+    def layer_info(self, layer: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT crs, version, imported_at, feature_count FROM layers WHERE layer = ?", (layer,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"crs": row[0], "version": row[1], "imported_at": row[2], "feature_count": row[3]}
+
+    def layers(self) -> Dict[str, Dict[str, Any]]:
+        rows = self._conn().execute("SELECT layer FROM layers").fetchall()
+        return {r[0]: self.layer_info(r[0]) for r in rows}
+
+    def has_layer(self, layer: str, srsname: str = "EPSG:4326") -> bool:
+        return normalize_crs(srsname) == self.crs and self.layer_info(layer) is not None
+
+    def needs_refresh(self, layer: str, version: Optional[str]) -> bool:
+        """Vrai si la couche est absente ou si la version serveur a changé (version inconnue : non)."""
+        info = self.layer_info(layer)
+        if info is None:
+            return True
+        return version is not None and info["version"] != version
+
+    # ── Import ─────────────────────────────────────────────────
+    def import_layer(self, layer: str, pages: Iterable[List[Dict[str, Any]]], version: Optional[str] = None) -> int:
+        """
+        Remplace le contenu d'une couche. Les pages sont écrites au fil de l'eau
+        dans une seule transaction : en cas d'erreur, l'ancienne version reste en place.
+
+        Returns:
+            int: Nombre de features importées.
+        """
+        count = 0
+        with self._write_lock:
+            conn = self._conn()
+            try:
+                conn.execute("BEGIN")
+                conn.execute(
+                    "DELETE FROM features_rtree WHERE fid IN (SELECT fid FROM features WHERE layer = ?)", (layer,)
+                )
+                conn.execute("DELETE FROM features WHERE layer = ?", (layer,))
+                for page in pages:
+                    for feat in page:
+                        fb = geometry_bounds(feat.get("geometry"))
+                        payload = zlib.compress(json.dumps(feat, separators=(",", ":")).encode("utf-8"))
+                        cur = conn.execute(
+                            "INSERT INTO features (layer, feature_id, payload) VALUES (?, ?, ?)",
+                            (layer, feat.get("id"), payload),
+                        )
+                        if fb is not None:
+                            conn.execute(
+                                "INSERT INTO features_rtree (fid, minx, maxx, miny, maxy) VALUES (?, ?, ?, ?, ?)",
+                                (cur.lastrowid, fb[0], fb[2], fb[1], fb[3]),
+                            )
+                        count += 1
+                conn.execute(
+                    "INSERT OR REPLACE INTO layers (layer, crs, version, imported_at, feature_count) VALUES (?, ?, ?, ?, ?)",
+                    (layer, self.crs, version, time.time(), count),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return count
+
+    def refresh_layer(
+        self,
+        layer: str,
+        pages_factory: Callable[[], Iterable[List[Dict[str, Any]]]],
+        version: Optional[str],
+        force: bool = False,
+    ) -> Optional[int]:
+        """Réimporte la couche si sa version a changé. Retourne le nombre importé, ou None si à jour."""
+        if not force and not self.needs_refresh(layer, version):
+            return None
+        return self.import_layer(layer, pages_factory(), version)
+
+    def drop_layer(self, layer: str) -> None:
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "DELETE FROM features_rtree WHERE fid IN (SELECT fid FROM features WHERE layer = ?)", (layer,)
+                )
+                conn.execute("DELETE FROM features WHERE layer = ?", (layer,))
+                conn.execute("DELETE FROM layers WHERE layer = ?", (layer,))
+
+    # ── Lecture ────────────────────────────────────────────────
+    def get_feature(self, layer: str, feature_id: str) -> Optional[Dict[str, Any]]:
+        """Feature complète par identifiant GeoServer (ex. 'etablissements_eleveurs.42')."""
+        row = self._conn().execute(
+            "SELECT payload FROM features WHERE layer = ? AND feature_id = ?", (layer, feature_id)
+        ).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def query(self, layer: str, bbox: Optional[str] = None, geometry: Any = None) -> List[Dict[str, Any]]:
+        """
+        Features de la couche intersectant la bbox ('minx,miny,maxx,maxy,CRS') et/ou la géométrie.
+
+        Returns:
+            list: Features GeoJSON, même structure que la réponse GeoServer.
+        """
+        clip = as_geometry(geometry) if geometry is not None else None
+        if bbox is not None:
+            bounds, crs = parse_bbox(bbox)
+            if crs != self.crs:
+                raise ValueError(f"CRS {crs} non disponible localement ({self.crs})")
+            box = shapely.box(*bounds)
+            clip = box if clip is None else clip.intersection(box)
+        if clip is None:
+            raise ValueError("bbox ou geometry requis")
+        minx, miny, maxx, maxy = clip.bounds
+        rows = self._conn().execute(
+            "SELECT f.payload FROM features_rtree r JOIN features f ON f.fid = r.fid "
+            "WHERE f.layer = ? AND r.maxx >= ? AND r.minx <= ? AND r.maxy >= ? AND r.miny <= ? "
+            "ORDER BY f.fid",
+            (layer, minx, maxx, miny, maxy),
+        ).fetchall()
+        candidates = [json.loads(zlib.decompress(r[0])) for r in rows]
+        return clip_features(candidates, clip)
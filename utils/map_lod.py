@@ -0,0 +1,295 @@
+# utils/map_lod.py
+"""
+Niveaux de détail (LOD) des polygones envoyés sur la carte Folium.
+
+La carte est d'abord générée avec des géométries simplifiées (niveau grossier),
+ce qui réduit fortement le HTML à analyser par le navigateur. Les niveaux plus
+fins sont conservés côté serveur pour la carte et chargés par le navigateur au
+zoom : chaque couche GeoJson Folium est vidée puis rechargée avec la géométrie
+du niveau demandé (tooltips, popups et styles, attachés à la couche, sont
+conservés).
+
+Les cartes générées sont enregistrées en HTML permanent : les géométries
+d'origine sont donc écrites sur disque à côté du HTML (un JSON par carte), le
+cache mémoire n'en est qu'une copie. Un autre worker, un redémarrage ou
+l'expiration du cache rechargent la carte depuis ce fichier ; si la route ne
+répond pas, le script charge directement le fichier (niveau complet).
+
+La simplification préserve la validité de chaque géométrie
+(simplify(preserve_topology=True)) ; les limites partagées entre polygones
+voisins sont simplifiées indépendamment.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import shapely
+from shapely.geometry import mapping, shape
+
+# (nom, zoom minimal, tolérance en mètres) — du plus grossier au plus fin ; 0 = géométrie d'origine
+DEFAULT_LEVELS: Tuple[Tuple[str, int, float], ...] = (
+    ("coarse", 0, 20.0),
+    ("medium", 14, 4.0),
+    ("full", 16, 0.0),
+)
+METRES_PER_DEGREE = 111_320.0
+_MAP_ID_RE = re.compile(r"[0-9a-f]{32}")
+
+
+def count_vertices(geom: Optional[Dict[str, Any]]) -> int:
+    """Nombre de sommets d'une géométrie GeoJSON."""
+    if not geom:
+        return 0
+
+    def walk(coords):
+        if not coords:
+            return 0
+        if isinstance(coords[0], (int, float)):
+            return 1
+        return sum(walk(c) for c in coords)
+
+    if geom.get("type") == "GeometryCollection":
+        return sum(count_vertices(g) for g in geom.get("geometries", []))
+    return walk(geom.get("coordinates"))
+
+
+def simplify_geometry(geom: Dict[str, Any], tolerance_m: float) -> Dict[str, Any]:
+    """Simplifie une géométrie GeoJSON (EPSG:4326) ; retourne l'originale si la tolérance est nulle ou si le résultat est vide."""
+    if tolerance_m <= 0 or not geom or geom.get("type") in ("Point", "MultiPoint"):
+        return geom
+    try:
+        simplified = shapely.simplify(shape(geom), tolerance_m / METRES_PER_DEGREE, preserve_topology=True)
+    except Exception:
+        return geom
+    if simplified.is_empty:
+        return geom
+    return mapping(simplified)
+
+
+class MapLOD:
+    """
+    Variantes simplifiées des géométries d'une carte.
+
+    Usage:
+        lod = MapLOD()
+        shown = lod.initial(geom)
+        gj = folium.GeoJson(shown, ...)
+        lod.register(gj.get_name(), geom, shown)
+        ...
+        map_obj.get_root().html.add_child(Element(lod.zoom_script("/map_lod")))
+    """
+
+    def __init__(self, levels: Tuple[Tuple[str, int, float], ...] = DEFAULT_LEVELS):
+        self.id = uuid.uuid4().hex
+        self.levels = levels
+        self._full: Dict[str, Dict[str, Any]] = {}
+        self._variants: Dict[str, Dict[str, Dict[str, Any]]] = {name: {} for name, _, _ in levels}
+        self._lock = threading.Lock()
+        self.vertices_full = 0
+        self.vertices_initial = 0
+        self.simplify_seconds = 0.0
+
+    @property
+    def initial_level(self) -> str:
+        return self.levels[0][0]
+
+    def initial(self, geom: Dict[str, Any]) -> Dict[str, Any]:
+        """Géométrie à embarquer dans le HTML (niveau le plus grossier)."""
+        start = time.perf_counter()
+        simplified = simplify_geometry(geom, self.levels[0][2])
+        self.simplify_seconds += time.perf_counter() - start
+        self.vertices_full += count_vertices(geom)
+        self.vertices_initial += count_vertices(simplified)
+        return simplified
+
+    def register(self, element_name: str, geom: Dict[str, Any], shown: Dict[str, Any]) -> None:
+        """Associe la géométrie d'origine (et celle embarquée) à la couche Folium `element_name` (variable JS)."""
+        with self._lock:
+            self._full[element_name] = geom
+            self._variants[self.initial_level][element_name] = shown
+
+    def __len__(self) -> int:
+        return len(self._full)
+
+    def level(self, name: str) -> Dict[str, Dict[str, Any]]:
+        """{nom de couche JS: géométrie} pour un niveau (calculé à la première demande)."""
+        tolerance = next((t for n, _, t in self.levels if n == name), None)
+        if tolerance is None:
+            raise KeyError(name)
+        with self._lock:
+            variants = self._variants[name]
+            if len(variants) < len(self._full):
+                for element_name, geom in self._full.items():
+                    if element_name not in variants:
+                        variants[element_name] = simplify_geometry(geom, tolerance)
+            return variants
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Forme JSON persistée : niveaux et géométries d'origine par couche."""
+        with self._lock:
+            return {"id": self.id, "levels": [list(level) for level in self.levels], "full": dict(self._full)}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "MapLOD":
+        lod = cls(tuple(tuple(level) for level in data.get("levels") or DEFAULT_LEVELS))
+        lod.id = data["id"]
+        lod._full = dict(data.get("full") or {})
+        return lod
+
+    def stats(self) -> Dict[str, Any]:
+        full_bytes = sum(len(json.dumps(g)) for g in self._full.values())
+        initial = self.level(self.initial_level)
+        initial_bytes = sum(len(json.dumps(g)) for g in initial.values())
+        return {
+            "layers": len(self._full),
+            "vertices_full": self.vertices_full,
+            "vertices_initial": self.vertices_initial,
+            "geojson_bytes_full": full_bytes,
+            "geojson_bytes_initial": initial_bytes,
+            "simplify_seconds": round(self.simplify_seconds, 3),
+        }
+
+    def zoom_script(self, url_prefix: str, fallback_url: Optional[str] = None) -> str:
+        """
+        Script qui charge le niveau adapté au zoom et remplace la géométrie de chaque couche.
+
+        Args:
+            url_prefix (str): Route des niveaux (/map_lod).
+            fallback_url (str): Fichier persisté de la carte (LODCache.directory) ; si la route
+                échoue, les niveaux fins sont remplacés par la géométrie complète de ce fichier
+                plutôt que de garder le niveau grossier. Sans réponse, un avertissement s'affiche.
+        """
+        levels = [{"name": n, "minZoom": z} for n, z, _ in self.levels]
+        return """
+<script>
+(function () {
+  var LEVELS = %(levels)s, URL = "%(url)s/%(id)s/", FALLBACK = %(fallback)s, current = "%(initial)s", loaded = {};
+  function getJSON(url) {
+    return fetch(url).then(function (r) { if (!r.ok) { throw new Error(url + ": " + r.status); } return r.json(); });
+  }
+  function loadLevel(name) {
+    return getJSON(URL + name).catch(function (e) {
+      if (!FALLBACK) { throw e; }
+      console.warn("[MAP_LOD] " + e.message + ", géométrie complète depuis " + FALLBACK);
+      return getJSON(FALLBACK).then(function (data) { return data.full; });
+    });
+  }
+  function warn() {
+    if (document.getElementById("map-lod-warning")) { return; }
+    var div = document.createElement("div");
+    div.id = "map-lod-warning";
+    div.style.cssText = "position:fixed;bottom:8px;left:8px;z-index:10000;background:#fff3cd;padding:4px 8px;border:1px solid #c90;font:12px sans-serif";
+    div.textContent = "Géométries détaillées indisponibles : contours simplifiés (~20 m)";
+    document.body.appendChild(div);
+  }
+  function findMap() {
+    for (var k in window) { if (window[k] instanceof L.Map) { return window[k]; } }
+    return null;
+  }
+  function levelFor(zoom) {
+    var name = LEVELS[0].name;
+    LEVELS.forEach(function (l) { if (zoom >= l.minZoom) { name = l.name; } });
+    return name;
+  }
+  function apply(name, geoms) {
+    var t0 = performance.now(), n = 0;
+    Object.keys(geoms).forEach(function (layerName) {
+      var layer = window[layerName];
+      if (layer && layer.clearLayers) { layer.clearLayers(); layer.addData(geoms[layerName]); n++; }
+    });
+    current = name;
+    console.log("🗺️ [MAP_LOD] niveau " + name + ": " + n + " couches en " + Math.round(performance.now() - t0) + " ms");
+  }
+  function update(map) {
+    var name = levelFor(map.getZoom());
+    if (name === current) { return; }
+    if (loaded[name]) { apply(name, loaded[name]); return; }
+    loadLevel(name).then(function (geoms) {
+      loaded[name] = geoms;
+      if (levelFor(map.getZoom()) === name) { apply(name, geoms); }
+    }).catch(function (e) { console.warn("[MAP_LOD]", e); warn(); });
+  }
+  function start() {
+    var map = findMap();
+    if (!map) { return; }
+    map.on("zoomend", function () { update(map); });
+    update(map);
+  }
+  if (document.readyState === "complete") { start(); } else { window.addEventListener("load", start); }
+})();
+</script>
+""" % {"levels": json.dumps(levels), "url": url_prefix.rstrip("/"), "id": self.id, "initial": self.initial_level,
+       "fallback": json.dumps(fallback_url)}
+
+
+class LODCache:
+    """
+    Cache mémoire LRU des MapLOD par identifiant de carte (avec expiration), adossé à un
+    répertoire de fichiers JSON (un par carte) quand `directory` est donné.
+
+    Args:
+        max_maps (int): Cartes gardées en mémoire.
+        ttl (float): Durée de vie en mémoire (s) ; les fichiers n'expirent pas (purge avec les cartes).
+        directory (str): Répertoire des cartes persistées (None : mémoire seule).
+    """
+
+    def __init__(self, max_maps: int = 32, ttl: float = 3600.0, directory: Optional[str] = None):
+        self.max_maps = max_maps
+        self.ttl = ttl
+        self.directory = directory
+        self._maps: "OrderedDict[str, Tuple[float, MapLOD]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.last_stats: Dict[str, Any] = {}
+
+    def path(self, map_id: str) -> Optional[str]:
+        """Fichier de la carte ; None sans répertoire ou pour un identifiant invalide."""
+        if self.directory is None or not _MAP_ID_RE.fullmatch(map_id or ""):
+            return None
+        return os.path.join(self.directory, f"{map_id}.json")
+
+    def _remember(self, lod: MapLOD) -> None:
+        with self._lock:
+            self._maps[lod.id] = (time.time(), lod)
+            self._maps.move_to_end(lod.id)
+            while len(self._maps) > self.max_maps:
+                self._maps.popitem(last=False)
+
+    def put(self, lod: MapLOD) -> None:
+        """Garde la carte en mémoire et l'écrit dans le répertoire (écriture atomique)."""
+        self._remember(lod)
+        path = self.path(lod.id)
+        if path is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(lod.to_dict(), f, separators=(",", ":"))
+            os.replace(tmp, path)
+
+    def get(self, map_id: str) -> Optional[MapLOD]:
+        with self._lock:
+            entry = self._maps.get(map_id)
+            if entry is not None:
+                if time.time() - entry[0] <= self.ttl:
+                    self._maps.move_to_end(map_id)
+                    return entry[1]
+                del self._maps[map_id]
+        path = self.path(map_id)
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            lod = MapLOD.from_dict(json.load(f))
+        self._remember(lod)
+        return lod
+
+    def __len__(self) -> int:
+        return len(self._maps)
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return list(self._maps)
@@ -0,0 +1,85 @@
+# utils/parallel_stream.py
+"""
+Traitement parallèle borné d'une liste de tâches, résultats rendus dans l'ordre
+d'achèvement (flux SSE, rapports par département...).
+
+Au plus `max_workers` tâches sont en vol : une tâche lente ne bloque que son
+propre emplacement. Une tâche en échec est relancée après un délai (backoff)
+sans retenir les autres ; après `retries` nouvelles tentatives, son erreur est
+rendue comme un résultat. Si le consommateur s'arrête (client SSE déconnecté),
+les tâches non démarrées sont annulées.
+"""
+
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+
+class Outcome(NamedTuple):
+    item: Any
+    result: Any = None
+    error: Optional[BaseException] = None
+    attempts: int = 1
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def stream_unordered(
+    func: Callable[[Any], Any],
+    items: Iterable[Any],
+    max_workers: int = 4,
+    retries: int = 1,
+    retry_delay: float = 2.0,
+    on_retry: Optional[Callable[[Any, BaseException, int], None]] = None,
+) -> Iterator[Outcome]:
+    """
+    Applique `func` à chaque élément en parallèle et rend les Outcome au fil de l'eau.
+
+    Args:
+        func (callable): Traitement d'un élément (une exception = échec).
+        items (iterable): Éléments à traiter.
+        max_workers (int): Tâches simultanées.
+        retries (int): Nouvelles tentatives par élément en échec.
+        retry_delay (float): Délai avant la 1re nouvelle tentative (doublé ensuite), en secondes.
+        on_retry (callable): (élément, erreur, tentative suivante), appelé avant chaque relance.
+
+    Returns:
+        iterator: Un Outcome par élément, dans l'ordre d'achèvement.
+    """
+    queue: List[Tuple[Any, int]] = [(item, 1) for item in items]
+    queue.reverse()  # pop() depuis la fin : ordre d'origine conservé
+    delayed: List[Tuple[float, Any, int]] = []  # (heure de relance, élément, tentative)
+    max_workers = max(1, max_workers)
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    running = {}
+    try:
+        while queue or delayed or running:
+            now = time.monotonic()
+            ready = [d for d in delayed if d[0] <= now]
+            for entry in ready:
+                delayed.remove(entry)
+                queue.append((entry[1], entry[2]))
+            while queue and len(running) < max_workers:
+                item, attempt = queue.pop()
+                running[pool.submit(func, item)] = (item, attempt)
+            if not running:
+                time.sleep(max(0.0, min(d[0] for d in delayed) - time.monotonic()))
+                continue
+
+            timeout = max(0.0, min(d[0] for d in delayed) - time.monotonic()) if delayed else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                item, attempt = running.pop(future)
+                error = future.exception()
+                if error is None:
+                    yield Outcome(item, future.result(), None, attempt)
+                elif attempt <= retries:
+                    if on_retry is not None:
+                        on_retry(item, error, attempt + 1)
+                    delayed.append((time.monotonic() + retry_delay * 2 ** (attempt - 1), item, attempt + 1))
+                else:
+                    yield Outcome(item, None, error, attempt)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
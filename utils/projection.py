@@ -0,0 +1,112 @@
+# utils/projection.py
+"""
+Projections WGS84 <-> Lambert-93 par lots.
+
+Les Transformer pyproj sont créés une fois (par thread, un Transformer n'étant
+pas partagé entre threads) et les géométries sont projetées par tableaux
+entiers : shapely.transform passe toutes les coordonnées en un seul tableau
+numpy au lieu d'un rappel Python par coordonnée (shapely.ops.transform).
+
+layer_metrics() calcule d'un coup, pour toute une couche, les colonnes
+area_m2, centroid_l93 et centroid_wgs84 utilisées par les filtres
+(RPG, parkings, friches, toitures...).
+"""
+
+import threading
+from typing import Any, Callable, Dict, Sequence, Tuple
+
+import numpy as np
+import shapely
+from pyproj import Transformer
+from shapely.geometry import shape
+
+WGS84 = "EPSG:4326"
+L93 = "EPSG:2154"
+
+_local = threading.local()
+
+
+def get_transformer(src: str = WGS84, dst: str = L93) -> Transformer:
+    """Transformer (always_xy) mis en cache pour le thread courant."""
+    cache = getattr(_local, "transformers", None)
+    if cache is None:
+        cache = _local.transformers = {}
+    key = (src, dst)
+    tr = cache.get(key)
+    if tr is None:
+        tr = cache[key] = Transformer.from_crs(src, dst, always_xy=True)
+    return tr
+
+
+def transform_func(src: str = WGS84, dst: str = L93) -> Callable:
+    """Fonction (x, y) -> (x', y') pour shapely.ops.transform, sans recréer de Transformer."""
+    return get_transformer(src, dst).transform
+
+
+def project(geometries: Any, src: str = WGS84, dst: str = L93) -> Any:
+    """Projette une géométrie ou un tableau de géométries (None conservés) en un passage numpy."""
+    tr = get_transformer(src, dst)
+
+    def _xy(coords: np.ndarray) -> np.ndarray:
+        x, y = tr.transform(coords[:, 0], coords[:, 1])
+        return np.column_stack((x, y))
+
+    return shapely.transform(geometries, _xy)
+
+
+def project_points(xy: np.ndarray, src: str = WGS84, dst: str = L93) -> np.ndarray:
+    """Projette un tableau (n, 2) de coordonnées."""
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    x, y = get_transformer(src, dst).transform(xy[:, 0], xy[:, 1])
+    return np.column_stack((x, y))
+
+
+def geometry_array(items: Sequence[Any]) -> np.ndarray:
+    """Tableau shapely depuis des features GeoJSON, des géométries GeoJSON ou shapely (None si absente)."""
+    out = np.empty(len(items), dtype=object)
+    for i, item in enumerate(items):
+        if isinstance(item, shapely.Geometry) or item is None:
+            out[i] = item
+            continue
+        geom = item.get("geometry") if item.get("type") == "Feature" or "geometry" in item else item
+        try:
+            out[i] = shape(geom) if geom else None
+        except Exception:
+            out[i] = None
+    return out
+
+
+class LayerMetrics:
+    """
+    Colonnes calculées pour toute une couche (NaN pour les entrées sans géométrie).
+
+    Attributes:
+        geometries: Géométries shapely WGS84.
+        geometries_l93: Mêmes géométries en Lambert-93.
+        area_m2: Surfaces (m²).
+        centroid_l93: Centroïdes Lambert-93, tableau (n, 2).
+        centroid_wgs84: Mêmes centroïdes en (lon, lat), tableau (n, 2).
+    """
+
+    def __init__(self, geometries: np.ndarray):
+        self.geometries = geometries
+        self.geometries_l93 = project(geometries)
+        self.area_m2 = shapely.area(self.geometries_l93)
+        centroids = shapely.centroid(self.geometries_l93)
+        self.centroid_l93 = np.column_stack((shapely.get_x(centroids), shapely.get_y(centroids)))
+        self.centroid_wgs84 = project_points(self.centroid_l93, L93, WGS84) if len(geometries) else self.centroid_l93
+
+    def __len__(self) -> int:
+        return len(self.geometries)
+
+    def centroid(self, i: int) -> Tuple[float, float]:
+        """Centroïde (lon, lat) de la ligne i."""
+        return float(self.centroid_wgs84[i, 0]), float(self.centroid_wgs84[i, 1])
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        return {"area_m2": self.area_m2, "centroid_wgs84": self.centroid_wgs84, "centroid_l93": self.centroid_l93}
+
+
+def layer_metrics(items: Sequence[Any]) -> LayerMetrics:
+    """Surfaces et centroïdes (Lambert-93 et WGS84) d'une couche entière, en un appel vectorisé."""
+    return LayerMetrics(geometry_array(items))
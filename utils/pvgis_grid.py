@@ -0,0 +1,245 @@
+# utils/pvgis_grid.py
+"""
+Productible PV (kWh/kWc/an) sans appel PVGIS par point : grille nationale
+précalculée et interpolation bilinéaire vectorisée.
+
+Le productible spécifique varie lentement dans l'espace : une grille régulière
+(0.1° par défaut) calculée une fois par tools/build_pvgis_grid.py pour quelques
+couples inclinaison/azimut suffit pour annoter des milliers de toitures ou de
+parcelles en un appel. Les appels PVGIS encore nécessaires (hors grille,
+configuration absente) passent par le cache disque, espace "pvgis".
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+
+from utils.dem import bilinear
+from utils.projection import geometry_array
+
+PVGIS_API_URL = "https://re.jrc.ec.europa.eu/api/v5_2/PVcalc"
+CACHE_NAMESPACE = "pvgis"
+# Emprise de la France métropolitaine (lon_min, lat_min, lon_max, lat_max)
+FRANCE_BOUNDS = (-5.2, 41.3, 9.6, 51.1)
+
+Config = Tuple[float, float]  # (inclinaison, azimut) en degrés ; azimut 180 = plein sud
+
+
+def fetch_pvgis_yield(session: Any, lat: float, lon: float, tilt: float, azimuth: float,
+                      timeout: float = 10, url: str = PVGIS_API_URL) -> float:
+    """Productible annuel PVGIS (kWh) d'1 kWc ; lève une exception en cas d'erreur."""
+    params = {
+        "lat": lat,
+        "lon": lon,
+        "peakpower": 1.0,
+        "loss": 14,
+        "angle": tilt,
+        "aspect": 180.0 - azimuth,
+        "outputformat": "json",
+    }
+    resp = session.get(url, params=params, timeout=timeout)
+    resp.raise_for_status()
+    return float(resp.json()["outputs"]["totals"]["fixed"]["E_y"])
+
+
+class PVGISGrid:
+    """
+    Grille régulière de productible : yields[k, i, j] au nœud (lat0 + i*step, lon0 + j*step)
+    pour la configuration configs[k].
+    """
+
+    def __init__(self, lon0: float, lat0: float, step: float, configs: Sequence[Config], yields: np.ndarray):
+        self.lon0, self.lat0, self.step = float(lon0), float(lat0), float(step)
+        self.configs: List[Config] = [(float(t), float(a)) for t, a in configs]
+        self.yields = np.asarray(yields, dtype=np.float32)
+        if self.yields.shape[0] != len(self.configs):
+            raise ValueError("une grille par configuration attendue")
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.yields.shape[1], self.yields.shape[2]
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        nrows, ncols = self.shape
+        return (self.lon0, self.lat0, self.lon0 + (ncols - 1) * self.step, self.lat0 + (nrows - 1) * self.step)
+
+    def config_index(self, tilt: float, azimuth: float) -> Optional[int]:
+        try:
+            return self.configs.index((float(tilt), float(azimuth)))
+        except ValueError:
+            return None
+
+    def lookup(self, lons: Sequence[float], lats: Sequence[float], tilt: float = 30, azimuth: float = 180) -> np.ndarray:
+        """Productibles interpolés (NaN hors grille ou pour une configuration non calculée)."""
+        lons = np.asarray(lons, dtype=float).ravel()
+        lats = np.asarray(lats, dtype=float).ravel()
+        k = self.config_index(tilt, azimuth)
+        if k is None or not len(lons):
+            return np.full(len(lons), np.nan)
+        minx, miny, maxx, maxy = self.bounds
+        eps = 1e-9
+        inside = (lons >= minx - eps) & (lons <= maxx + eps) & (lats >= miny - eps) & (lats <= maxy + eps)
+        out = np.full(len(lons), np.nan)
+        if inside.any():
+            out[inside] = bilinear(self.yields[k], (lats[inside] - self.lat0) / self.step,
+                                   (lons[inside] - self.lon0) / self.step)
+        return out
+
+    def save(self, path: str) -> None:
+        np.savez(path, origin=np.array([self.lon0, self.lat0, self.step]),
+                 configs=np.array(self.configs, dtype=float).reshape(-1, 2), yields=self.yields)
+
+    @classmethod
+    def load(cls, path: str) -> "PVGISGrid":
+        with np.load(path) as data:
+            lon0, lat0, step = data["origin"]
+            return cls(lon0, lat0, step, [tuple(c) for c in data["configs"]], data["yields"])
+
+
+def build_grid(
+    fetch: Callable[[float, float, float, float], Optional[float]],
+    bounds: Tuple[float, float, float, float] = FRANCE_BOUNDS,
+    step: float = 0.1,
+    configs: Sequence[Config] = ((30, 180),),
+    workers: int = 4,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> PVGISGrid:
+    """
+    Calcule une grille en interrogeant `fetch(lat, lon, tilt, azimuth)` à chaque nœud.
+
+    Args:
+        fetch (callable): Productible d'1 kWc ; None ou exception = nœud sans valeur (NaN, ex. en mer).
+        bounds (tuple): (lon_min, lat_min, lon_max, lat_max).
+        step (float): Pas de la grille, en degrés.
+        configs (list): Couples (inclinaison, azimut).
+        workers (int): Appels simultanés.
+        progress (callable): (nœuds traités, total), appelé au fil du calcul.
+    """
+    lon_min, lat_min, lon_max, lat_max = bounds
+    ncols = int(round((lon_max - lon_min) / step)) + 1
+    nrows = int(round((lat_max - lat_min) / step)) + 1
+    yields = np.full((len(configs), nrows, ncols), np.nan, dtype=np.float32)
+    jobs = [(k, i, j) for k in range(len(configs)) for i in range(nrows) for j in range(ncols)]
+
+    def run(job):
+        k, i, j = job
+        tilt, azimuth = configs[k]
+        try:
+            return fetch(round(lat_min + i * step, 6), round(lon_min + j * step, 6), tilt, azimuth)
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for n, (job, value) in enumerate(zip(jobs, pool.map(run, jobs)), 1):
+            if value is not None:
+                yields[job] = value
+            if progress is not None:
+                progress(n, len(jobs))
+    return PVGISGrid(lon_min, lat_min, step, configs, yields)
+
+
+class PVGISYield:
+    """
+    Productible PV : grille précalculée, puis cache disque, puis API PVGIS.
+
+    Usage:
+        pv = PVGISYield("data/pvgis_grid.npz", http_session, disk_cache)
+        kwh_kwc = pv.at(lat, lon, 30, 180)                 # un point (appel PVGIS si hors grille)
+        values = pv.lookup(lons, lats, 30, 180)            # vectorisé, grille seule (NaN sinon)
+
+    Args:
+        grid_path (str): Fichier .npz de la grille ; absent = appels PVGIS (en cache) uniquement.
+        session: Session HTTP (requests.Session ou UpstreamClient).
+        cache: DiskCache des appels PVGIS (None : pas de cache).
+        ttl (float): Durée de vie des réponses PVGIS en cache (s).
+        cache_precision (int): Décimales de lat/lon des appels mis en cache (2 ≈ 1 km).
+    """
+
+    def __init__(self, grid_path: Optional[str], session: Any, cache: Any = None, ttl: float = 365 * 86400,
+                 cache_precision: int = 2, timeout: float = 10, url: str = PVGIS_API_URL):
+        self.grid_path = grid_path
+        self.session = session
+        self.cache = cache
+        self.ttl = ttl
+        self.cache_precision = cache_precision
+        self.timeout = timeout
+        self.url = url
+        self.grid: Optional[PVGISGrid] = None
+        if grid_path:
+            try:
+                self.grid = PVGISGrid.load(grid_path)
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"⚠️ [PVGIS_GRID] Grille illisible ({grid_path}): {e}")
+        self._lock = threading.Lock()
+        self._stats = {"grid": 0, "cache_hits": 0, "api_calls": 0, "api_errors": 0}
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += n
+
+    def lookup(self, lons: Sequence[float], lats: Sequence[float], tilt: float = 30, azimuth: float = 180) -> np.ndarray:
+        """Productibles interpolés sur la grille ; NaN hors grille (aucun appel réseau)."""
+        if self.grid is None:
+            return np.full(len(np.ravel(lons)), np.nan)
+        values = self.grid.lookup(lons, lats, tilt, azimuth)
+        self._count("grid", int(np.isfinite(values).sum()))
+        return values
+
+    def fetch_live(self, lat: float, lon: float, tilt: float, azimuth: float) -> Optional[float]:
+        """Appel PVGIS au point arrondi, mis en cache disque ; None en cas d'erreur."""
+        lat, lon = round(lat, self.cache_precision), round(lon, self.cache_precision)
+        key = f"{lat}:{lon}:{tilt}:{azimuth}"
+        if self.cache is not None:
+            cached = self.cache.get(CACHE_NAMESPACE, key)
+            if cached is not None:
+                self._count("cache_hits")
+                return cached
+        self._count("api_calls")
+        try:
+            value = fetch_pvgis_yield(self.session, lat, lon, tilt, azimuth, timeout=self.timeout, url=self.url)
+        except Exception as e:
+            self._count("api_errors")
+            print(f"Erreur PVGIS: {e}")
+            return None
+        if self.cache is not None:
+            self.cache.set(CACHE_NAMESPACE, key, value, self.ttl)
+        return value
+
+    def at(self, lat: float, lon: float, tilt: float = 30, azimuth: float = 180) -> Optional[float]:
+        """Productible d'1 kWc au point : grille si possible, sinon PVGIS (en cache)."""
+        value = self.lookup([lon], [lat], tilt, azimuth)[0]
+        if np.isfinite(value):
+            return float(value)
+        return self.fetch_live(lat, lon, tilt, azimuth)
+
+    def annotate(self, features: List[Dict[str, Any]], tilt: float = 30, azimuth: float = 180,
+                 prop: str = "productible_kwh_kwc") -> int:
+        """
+        Ajoute le productible interpolé au centroïde de chaque feature (en place, None hors grille).
+
+        Returns:
+            int: Nombre de features annotées avec une valeur.
+        """
+        if not features:
+            return 0
+        geoms = geometry_array(features)
+        centroids = shapely.centroid(geoms)
+        lons, lats = shapely.get_x(centroids), shapely.get_y(centroids)
+        values = self.lookup(lons, lats, tilt, azimuth)
+        for feat, value in zip(features, values):
+            feat.setdefault("properties", {})[prop] = round(float(value), 1) if np.isfinite(value) else None
+        return int(np.isfinite(values).sum())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            grid = None
+            if self.grid is not None:
+                grid = {"path": self.grid_path, "shape": list(self.grid.shape), "step": self.grid.step,
+                        "configs": self.grid.configs}
+            return {**self._stats, "grid_info": grid}
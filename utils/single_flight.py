@@ -0,0 +1,124 @@
+# utils/single_flight.py
+"""
+Regroupement des appels amont identiques en cours (« single-flight »).
+
+Quand plusieurs requêtes (utilisateurs simultanés sur la même commune, pipeline
+départemental qui chevauche une recherche interactive...) déclenchent le même
+appel GeoServer / apicarto / geo.api.gouv.fr au même moment, un seul appel part
+réellement : les suivants attendent son résultat. Chaque appelant en attente
+reçoit sa propre copie (deepcopy) car les appelants modifient souvent les
+features reçues. Rien n'est conservé une fois l'appel terminé : ce n'est pas un
+cache, seulement une mutualisation des appels simultanés.
+"""
+
+import copy
+import hashlib
+import json
+import threading
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+
+def make_key(*parts: Any) -> str:
+    """Clé stable pour des arguments JSON-isables (géométries GeoJSON, bbox, paramètres)."""
+    raw = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    __slots__ = ("event", "result", "error", "followers")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Usage:
+        flight = SingleFlight()
+
+        @flight.wrap("gpu")
+        def fetch_gpu_data(endpoint, geom): ...
+
+        flight.stats()  # {"calls": 12, "upstream": 7, "coalesced": 5, ...}
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, namespace: str, field: str) -> None:
+        ns = self._stats.setdefault(namespace, {"calls": 0, "upstream": 0, "coalesced": 0})
+        ns[field] += 1
+
+    def do(self, namespace: str, key: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Exécute fn(*args, **kwargs), ou attend l'appel identique déjà en cours."""
+        full_key = f"{namespace}:{key}"
+        with self._lock:
+            self._count(namespace, "calls")
+            call = self._calls.get(full_key)
+            leader = call is None
+            if leader:
+                call = self._calls[full_key] = _Call()
+                self._count(namespace, "upstream")
+            else:
+                call.followers += 1
+                self._count(namespace, "coalesced")
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        else:
+            # Copie de référence prise avant de rendre la main : le leader peut
+            # modifier son résultat pendant que les suiveurs copient le leur.
+            with self._lock:
+                self._calls.pop(full_key, None)
+                if call.followers:
+                    call.result = copy.deepcopy(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(full_key, None)
+            call.event.set()
+
+    def wrap(self, namespace: str, key_fn: Optional[Callable[..., str]] = None):
+        """Décorateur : la clé est calculée par key_fn(*args, **kwargs) ou par défaut sur tous les arguments."""
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                key = key_fn(*args, **kwargs) if key_fn else make_key(args, kwargs)
+                return self.do(namespace, key, fn, *args, **kwargs)
+            wrapper.uncoalesced = fn
+            return wrapper
+        return decorator
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_ns = {ns: dict(v) for ns, v in self._stats.items()}
+            in_flight = len(self._calls)
+        calls = sum(v["calls"] for v in per_ns.values())
+        coalesced = sum(v["coalesced"] for v in per_ns.values())
+        return {
+            "calls": calls,
+            "upstream": sum(v["upstream"] for v in per_ns.values()),
+            "coalesced": coalesced,
+            "coalesced_ratio": round(coalesced / calls, 3) if calls else 0.0,
+            "in_flight": in_flight,
+            "namespaces": per_ns,
+        }
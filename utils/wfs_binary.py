@@ -0,0 +1,262 @@
+# utils/wfs_binary.py
+"""
+Transport binaire des couches WFS : FlatGeobuf décodé en colonnes.
+
+Le chemin GeoJSON construit un dict par feature (resp.json()) puis une
+géométrie shapely par feature (shape()). Ici la réponse FlatGeobuf de GeoServer
+(outputFormat=application/flatgeobuf) est lue par GDAL (pyogrio) en une passe :
+géométries WKB -> tableau shapely 2 (from_wkb vectorisé) et un tableau numpy par
+attribut, sans dict intermédiaire. Les traitements travaillent sur les tableaux
+(masques shapely vectorisés) et ne matérialisent en GeoJSON que les lignes retenues.
+
+pyogrio est optionnel (hors requirements.txt : pip install pyogrio==0.7.2) :
+sans lui, ou si GeoServer ne propose pas le format (extension FlatGeobuf
+absente), l'appelant repasse par le GeoJSON (FeatureTable.from_features).
+"""
+
+import io
+import math
+import re
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import shapely
+from shapely.geometry import mapping, shape
+
+FLATGEOBUF_OUTPUT_FORMAT = "application/flatgeobuf"
+FLATGEOBUF_MAGIC = b"fgb\x03"
+_NUMBER_MATCHED_RE = re.compile(rb'numberMatched="(\d+)"')
+
+
+class BinaryFormatUnavailable(ValueError):
+    """Le serveur ne sait pas produire le format binaire demandé."""
+
+
+def binary_decoding_available() -> bool:
+    """Vrai si pyogrio (GDAL) est installé avec le pilote FlatGeobuf."""
+    try:
+        import pyogrio
+    except ImportError:
+        return False
+    return "FlatGeobuf" in pyogrio.list_drivers()
+
+
+class FeatureTable:
+    """
+    Features en colonnes : géométries shapely (ndarray d'objets) et un tableau par attribut.
+
+    Args:
+        geometries: Tableau de géométries shapely (None autorisé).
+        columns (dict): {attribut: tableau de même longueur}.
+        ids: Identifiants des features (optionnel, absents du FlatGeobuf GeoServer).
+        crs (str): CRS des géométries.
+    """
+
+    def __init__(self, geometries, columns: Optional[Dict[str, Any]] = None, ids=None, crs: Optional[str] = None):
+        self.geometries = np.asarray(geometries, dtype=object)
+        self.columns = {k: np.asarray(v) for k, v in (columns or {}).items()}
+        self.ids = None if ids is None else np.asarray(ids, dtype=object)
+        self.crs = crs
+
+    def __len__(self) -> int:
+        return len(self.geometries)
+
+    def column(self, name: str, default: Any = None) -> np.ndarray:
+        """Colonne `name`, ou un tableau rempli de `default` si l'attribut est absent."""
+        if name in self.columns:
+            return self.columns[name]
+        return np.full(len(self), default, dtype=object)
+
+    def take(self, selector) -> "FeatureTable":
+        """Sous-table (masque booléen ou indices)."""
+        return FeatureTable(
+            self.geometries[selector],
+            {k: v[selector] for k, v in self.columns.items()},
+            None if self.ids is None else self.ids[selector],
+            self.crs,
+        )
+
+    def to_features(self) -> List[Dict[str, Any]]:
+        """Features GeoJSON (même structure que le chemin GeoJSON) ; à réserver aux lignes retenues."""
+        names = list(self.columns)
+        values = [_python_values(self.columns[n]) for n in names]
+        features = []
+        for i, geom in enumerate(self.geometries):
+            feature = {
+                "type": "Feature",
+                "geometry": mapping(geom) if geom is not None else None,
+                "properties": {n: v[i] for n, v in zip(names, values)},
+            }
+            if self.ids is not None:
+                feature["id"] = self.ids[i]
+            features.append(feature)
+        return features
+
+    @classmethod
+    def from_features(cls, features: Sequence[Dict[str, Any]], crs: Optional[str] = None) -> "FeatureTable":
+        """Table construite depuis des features GeoJSON (chemin de repli)."""
+        names: Dict[str, None] = {}
+        for feat in features:
+            names.update(dict.fromkeys(feat.get("properties") or {}))
+        columns = {
+            n: np.array([(f.get("properties") or {}).get(n) for f in features], dtype=object) for n in names
+        }
+        geometries = [shape(f["geometry"]) if f.get("geometry") else None for f in features]
+        ids = [f.get("id") for f in features]
+        return cls(geometries, columns, ids if any(i is not None for i in ids) else None, crs)
+
+    @classmethod
+    def concat(cls, tables: Iterable["FeatureTable"]) -> "FeatureTable":
+        tables = [t for t in tables if len(t)]
+        if not tables:
+            return cls([])
+        names = list(dict.fromkeys(n for t in tables for n in t.columns))
+        columns = {}
+        for n in names:
+            parts = [t.column(n) for t in tables]
+            if len({p.dtype for p in parts}) > 1:
+                parts = [p.astype(object) for p in parts]
+            columns[n] = np.concatenate(parts)
+        ids = None
+        if all(t.ids is not None for t in tables):
+            ids = np.concatenate([t.ids for t in tables])
+        return cls(np.concatenate([t.geometries for t in tables]), columns, ids, tables[0].crs)
+
+
+def _python_values(array: np.ndarray) -> List[Any]:
+    values = array.tolist()
+    if array.dtype.kind == "f":
+        values = [None if isinstance(v, float) and math.isnan(v) else v for v in values]
+    return values
+
+
+def decode_flatgeobuf(content: bytes) -> FeatureTable:
+    """
+    Décode un FlatGeobuf en FeatureTable (GDAL via pyogrio, géométries via shapely.from_wkb).
+
+    Raises:
+        ImportError: pyogrio absent.
+        BinaryFormatUnavailable: contenu qui n'est pas du FlatGeobuf.
+    """
+    if not content.startswith(FLATGEOBUF_MAGIC):
+        raise BinaryFormatUnavailable(f"Réponse non FlatGeobuf: {content[:200]!r}")
+    from pyogrio.raw import read
+
+    meta, _fids, wkb, fields = read(io.BytesIO(content))
+    columns = dict(zip(meta["fields"], fields))
+    return FeatureTable(shapely.from_wkb(wkb), columns, crs=meta.get("crs"))
+
+
+class WFSBinaryReader:
+    """
+    Lecture paginée d'une couche WFS au format FlatGeobuf.
+
+    Args:
+        session: Session requests.
+        wfs_url (str): URL du service WFS/OWS.
+        page_size (int): Nombre d'entités par page (paramètre count).
+        timeout (float): Timeout HTTP par page.
+
+    Usage:
+        reader = WFSBinaryReader(session, url)
+        table = reader.read("gpu:PARCELLES_GRAPHIQUES", bbox)
+        hits = table.take(shapely.intersects(table.geometries, point)).to_features()
+
+    Après un premier refus du serveur (format non proposé), `supported` passe à
+    False et les lectures suivantes lèvent BinaryFormatUnavailable sans requête.
+
+    Le FlatGeobuf ne porte pas numberMatched : une page plus courte que `page_size`
+    peut venir d'un plafond serveur (maxFeatures < page_size) et non de la fin de
+    la couche. Le total est alors demandé (resultType=hits) et la lecture continue
+    jusqu'à l'atteindre ; sans total connu, BinaryFormatUnavailable (repli GeoJSON).
+    """
+
+    def __init__(self, session, wfs_url: str, page_size: int = 1000, timeout: float = 30):
+        self.session = session
+        self.wfs_url = wfs_url
+        self.page_size = page_size
+        self.timeout = timeout
+        self.supported: Optional[bool] = None
+
+    def _params(self, layer, bbox, srsname, start_index, extra_params):
+        params = {
+            "service": "WFS",
+            "version": "2.0.0",
+            "request": "GetFeature",
+            "typeNames": layer,
+            "outputFormat": FLATGEOBUF_OUTPUT_FORMAT,
+            "srsName": srsname,
+            "startIndex": start_index,
+            "count": self.page_size,
+        }
+        if bbox:
+            params["bbox"] = bbox
+        params.update(extra_params or {})
+        return params
+
+    def _send(self, params, method):
+        if method.upper() == "POST":
+            resp = self.session.post(self.wfs_url, data=params, timeout=self.timeout)
+        else:
+            resp = self.session.get(self.wfs_url, params=params, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp
+
+    def number_matched(self, layer, bbox=None, srsname="EPSG:4326", extra_params=None, method="GET") -> Optional[int]:
+        """Nombre total d'entités (GetFeature resultType=hits), None si le serveur ne le donne pas."""
+        params = self._params(layer, bbox, srsname, 0, extra_params)
+        for key in ("outputFormat", "startIndex", "count", "propertyName", "sortBy"):
+            params.pop(key, None)
+        params["resultType"] = "hits"
+        try:
+            match = _NUMBER_MATCHED_RE.search(self._send(params, method).content[:4000])
+        except Exception as e:
+            print(f"⚠️ [WFS_BINARY] {layer}: resultType=hits en échec: {e}")
+            return None
+        return int(match.group(1)) if match else None
+
+    def read(
+        self,
+        layer: str,
+        bbox: Optional[str] = None,
+        srsname: str = "EPSG:4326",
+        extra_params: Optional[Dict[str, Any]] = None,
+        method: str = "GET",
+    ) -> FeatureTable:
+        """
+        Toutes les pages de la couche (bbox et paramètres WFS comme WFSFeatureStream).
+
+        Raises:
+            BinaryFormatUnavailable: le serveur ne produit pas de FlatGeobuf, ou la lecture
+                ne peut pas être prouvée complète (page courte sans numberMatched, page vide avant le total).
+        """
+        if self.supported is False:
+            raise BinaryFormatUnavailable(f"{self.wfs_url}: FlatGeobuf non proposé")
+        tables = []
+        start = 0
+        total = None
+        while True:
+            params = self._params(layer, bbox, srsname, start, extra_params)
+            resp = self._send(params, method)
+            try:
+                page = decode_flatgeobuf(resp.content)
+            except BinaryFormatUnavailable:
+                # Exception de service GeoServer : seul un refus du format est définitif
+                if b"format" in resp.content[:2000].lower():
+                    self.supported = False
+                raise
+            self.supported = True
+            tables.append(page)
+            start += len(page)
+            if total is None and len(page) < self.page_size:
+                # Page courte : fin de couche ou plafond par requête du serveur
+                total = self.number_matched(layer, bbox, srsname, extra_params, method)
+                if total is None:
+                    raise BinaryFormatUnavailable(f"{layer}: page courte ({len(page)}) sans numberMatched")
+            if total is not None and start >= total:
+                break
+            if total is not None and not len(page):
+                raise BinaryFormatUnavailable(f"{layer}: {start}/{total} entités lues, page vide")
+        table = FeatureTable.concat(tables)
+        table.crs = table.crs or srsname
+        return table
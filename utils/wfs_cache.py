@@ -0,0 +1,469 @@
+# utils/wfs_cache.py
+"""
+Cache disque des requêtes WFS, aligné sur une grille fixe de tuiles par couche.
+
+Chaque bbox demandée est « accrochée » à une grille (pas fixe par couche et par CRS).
+Les tuiles sont stockées dans SQLite (features GeoJSON compressées + emprises),
+avec un TTL par couche, une éviction LRU et une invalidation lorsque la version
+de la couche change (empreinte de sa déclaration dans le GetCapabilities : une
+modification d'une autre couche du catalogue n'invalide rien). Une bbox
+arbitraire est reconstruite à partir des tuiles en cache ; seules les tuiles
+manquantes sont demandées à GeoServer, une requête par bloc rectangulaire de
+tuiles manquantes. Une réponse tronquée (plafond du serveur atteint) est servie
+mais jamais mise en cache.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from math import floor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Pas de grille par défaut, exprimé dans l'unité du CRS de la bbox
+DEFAULT_TILE_SIZES = {
+    "EPSG:4326": 0.05,     # ~5 km
+    "EPSG:2154": 5000.0,   # 5 km
+}
+
+Bounds = Tuple[float, float, float, float]
+
+
+def normalize_crs(crs: Optional[str]) -> str:
+    """Ramène 'urn:ogc:def:crs:EPSG::4326' ou 'epsg:4326' à 'EPSG:4326'."""
+    if not crs:
+        return "EPSG:4326"
+    match = re.search(r"(\d+)\s*$", crs)
+    return f"EPSG:{match.group(1)}" if match else crs.upper()
+
+
+def parse_bbox(bbox: str) -> Tuple[Bounds, str]:
+    """
+    Décode une bbox WFS 'minx,miny,maxx,maxy[,CRS]'.
+
+    Returns:
+        tuple: ((minx, miny, maxx, maxy), crs normalisé)
+    """
+    parts = [p.strip() for p in str(bbox).split(",")]
+    if len(parts) < 4:
+        raise ValueError(f"bbox invalide: {bbox}")
+    minx, miny, maxx, maxy = (float(p) for p in parts[:4])
+    crs = normalize_crs(",".join(parts[4:]) if len(parts) > 4 else None)
+    return (minx, miny, maxx, maxy), crs
+
+
+def format_bbox(bounds: Bounds, crs: str) -> str:
+    return f"{bounds[0]},{bounds[1]},{bounds[2]},{bounds[3]},{crs}"
+
+
+def geometry_bounds(geom: Optional[Dict[str, Any]]) -> Optional[Bounds]:
+    """Emprise (minx, miny, maxx, maxy) d'une géométrie GeoJSON, sans passer par shapely."""
+    if not geom:
+        return None
+    if geom.get("type") == "GeometryCollection":
+        boxes = [b for b in (geometry_bounds(g) for g in geom.get("geometries", [])) if b]
+        if not boxes:
+            return None
+        return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+                max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+    xs: List[float] = []
+    ys: List[float] = []
+
+    def walk(coords):
+        if not coords:
+            return
+        if isinstance(coords[0], (int, float)):
+            xs.append(coords[0])
+            ys.append(coords[1])
+        else:
+            for c in coords:
+                walk(c)
+
+    walk(geom.get("coordinates"))
+    if not xs:
+        return None
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def bounds_overlap(a: Bounds, b: Bounds) -> bool:
+    """Recouvrement d'emprises (sémantique du filtre BBOX de GeoServer)."""
+    return a[0] <= b[2] and a[2] >= b[0] and a[1] <= b[3] and a[3] >= b[1]
+
+
+def tile_range(bounds: Bounds, size: float) -> Tuple[int, int, int, int]:
+    """Indices (ix0, iy0, ix1, iy1) des tuiles couvrant une emprise."""
+    return (int(floor(bounds[0] / size)), int(floor(bounds[1] / size)),
+            int(floor(bounds[2] / size)), int(floor(bounds[3] / size)))
+
+
+def tile_bounds(ix: int, iy: int, size: float) -> Bounds:
+    return (ix * size, iy * size, (ix + 1) * size, (iy + 1) * size)
+
+
+_FEATURE_TYPE_RE = re.compile(rb"<(?:\w+:)?FeatureType\b.*?</(?:\w+:)?FeatureType>", re.S)
+_NAME_RE = re.compile(rb"<(?:\w+:)?Name>\s*([^<]+?)\s*</(?:\w+:)?Name>")
+
+
+def read_layer_versions(session, wfs_url: str, timeout: float = 10.0) -> Dict[str, str]:
+    """
+    Version de chaque couche publiée, lue dans le GetCapabilities WFS.
+
+    La version d'une couche est l'empreinte de son bloc <FeatureType> (titre, emprise,
+    CRS, mots-clés...) : elle change quand la couche est modifiée ou rechargée, pas
+    quand une autre couche du catalogue l'est (contrairement à l'updateSequence global).
+
+    Returns:
+        dict: {nom de couche: empreinte}
+    """
+    params = {"service": "WFS", "version": "2.0.0", "request": "GetCapabilities"}
+    resp = session.get(wfs_url, params=params, timeout=timeout)
+    try:
+        resp.raise_for_status()
+        body = resp.content
+    finally:
+        resp.close()
+    versions = {}
+    for block in _FEATURE_TYPE_RE.findall(body):
+        name = _NAME_RE.search(block)
+        if name:
+            versions[name.group(1).decode("utf-8", "replace")] = hashlib.blake2b(block, digest_size=8).hexdigest()
+    return versions
+
+
+def missing_blocks(missing: List[Tuple[int, int]]) -> List[Tuple[int, int, int, int]]:
+    """
+    Regroupe des tuiles manquantes en rectangles (ix0, iy0, ix1, iy1) ne contenant
+    que des tuiles manquantes : suites contiguës par ligne, fusionnées avec la ligne
+    suivante quand elles ont la même étendue.
+    """
+    rows: Dict[int, List[int]] = {}
+    for ix, iy in missing:
+        rows.setdefault(iy, []).append(ix)
+    runs = []
+    for iy in sorted(rows):
+        xs = sorted(set(rows[iy]))
+        start = prev = xs[0]
+        for ix in xs[1:] + [None]:
+            if ix is not None and ix == prev + 1:
+                prev = ix
+                continue
+            runs.append((start, iy, prev))
+            if ix is not None:
+                start = prev = ix
+    blocks: List[List[int]] = []
+    open_blocks: Dict[Tuple[int, int], List[int]] = {}   # (ix0, ix1) -> bloc prolongeable
+    for ix0, iy, ix1 in runs:
+        block = open_blocks.get((ix0, ix1))
+        if block is not None and block[3] == iy - 1:
+            block[3] = iy
+        else:
+            block = [ix0, iy, ix1, iy]
+            blocks.append(block)
+            open_blocks[(ix0, ix1)] = block
+    return [tuple(b) for b in blocks]
+
+
+class WFSTileCache:
+    """
+    Cache persistant de tuiles WFS (SQLite) avec TTL par couche et éviction LRU.
+
+    Args:
+        db_path (str): Fichier SQLite du cache.
+        layer_ttls (dict): TTL en secondes par couche. Seules ces couches sont mises en cache.
+        tile_sizes (dict): Pas de grille par couche, ex. {"gpu:x": {"EPSG:4326": 0.25}}.
+        max_tiles (int): Nombre maximal de tuiles conservées (LRU au-delà).
+        max_tiles_per_request (int): Au-delà, la bbox est demandée directement (hors cache).
+        version_provider (callable): layer -> version courante de cette couche (ou None si inconnue).
+        version_check_interval (float): Durée de validité d'une version lue (s).
+        feature_limit (int): Plafond de features par réponse du serveur (maxFeatures) ; une
+            réponse qui l'atteint est considérée tronquée. Une liste rendue par `fetch` avec un
+            attribut `truncated` vrai l'est aussi.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        layer_ttls: Dict[str, float],
+        tile_sizes: Optional[Dict[str, Dict[str, float]]] = None,
+        max_tiles: int = 20000,
+        max_tiles_per_request: int = 100,
+        version_provider: Optional[Callable[[str], Optional[str]]] = None,
+        version_check_interval: float = 300.0,
+        feature_limit: Optional[int] = None,
+    ):
+        self.db_path = db_path
+        self.layer_ttls = dict(layer_ttls)
+        self.tile_sizes = tile_sizes or {}
+        self.max_tiles = max_tiles
+        self.max_tiles_per_request = max_tiles_per_request
+        self.version_provider = version_provider
+        self.version_check_interval = version_check_interval
+        self.feature_limit = feature_limit
+
+        self._lock = threading.Lock()
+        self._versions: Dict[str, Tuple[float, Optional[str]]] = {}
+        self._stats = {
+            "hits": 0, "misses": 0, "stale": 0, "bypass": 0,
+            "upstream_requests": 0, "evictions": 0, "truncated": 0,
+        }
+        self._layer_stats: Dict[str, Dict[str, int]] = {}
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS tiles (
+                layer TEXT NOT NULL, variant TEXT NOT NULL, crs TEXT NOT NULL,
+                size REAL NOT NULL, ix INTEGER NOT NULL, iy INTEGER NOT NULL,
+                version TEXT, created REAL NOT NULL, accessed REAL NOT NULL,
+                nbytes INTEGER NOT NULL, payload BLOB NOT NULL,
+                PRIMARY KEY (layer, variant, crs, size, ix, iy))"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tiles_accessed ON tiles (accessed)")
+        self._conn.commit()
+
+    # ── Configuration ──────────────────────────────────────────
+    def is_cached_layer(self, layer: str) -> bool:
+        return layer in self.layer_ttls
+
+    def tile_size(self, layer: str, crs: str) -> Optional[float]:
+        return self.tile_sizes.get(layer, {}).get(crs) or DEFAULT_TILE_SIZES.get(crs)
+
+    def current_version(self, layer: str) -> Optional[str]:
+        if self.version_provider is None:
+            return None
+        now = time.time()
+        checked = self._versions.get(layer)
+        if checked and now - checked[0] < self.version_check_interval:
+            return checked[1]
+        try:
+            version = self.version_provider(layer)
+        except Exception as e:
+            print(f"⚠️ [WFS_CACHE] Version de {layer} illisible: {e}")
+            version = checked[1] if checked else None
+        self._versions[layer] = (now, version)
+        return version
+
+    # ── Lecture ────────────────────────────────────────────────
+    def get_features(
+        self,
+        layer: str,
+        bbox: str,
+        srsname: str,
+        fetch: Callable[[str], List[Dict[str, Any]]],
+        variant: str = "",
+    ) -> List[Dict[str, Any]]:
+        """
+        Retourne les features de `layer` dans `bbox`, en assemblant les tuiles du cache.
+
+        Args:
+            layer (str): Nom de la couche GeoServer.
+            bbox (str): 'minx,miny,maxx,maxy,CRS'.
+            srsname (str): CRS des géométries retournées.
+            fetch (callable): bbox -> liste de features ; doit lever une exception en cas d'erreur
+                (une erreur n'est jamais mise en cache).
+            variant (str): Discriminant supplémentaire de la clé (ex. liste d'attributs demandés).
+
+        Returns:
+            list: Features GeoJSON dont l'emprise recoupe la bbox demandée.
+        """
+        plan = self._plan(layer, bbox, srsname)
+        if plan is None:
+            return self._bypass(layer, bbox, fetch)
+        bounds, crs, size, wanted = plan
+
+        version = self.current_version(layer)
+        ttl = self.layer_ttls[layer]
+        cached = self._load_tiles(layer, variant, crs, size, wanted, version, ttl)
+        missing = [t for t in wanted if t not in cached]
+
+        with self._lock:
+            layer_stats = self._layer_stats.setdefault(layer, {"hits": 0, "misses": 0})
+            layer_stats["hits"] += len(cached)
+            layer_stats["misses"] += len(missing)
+            self._stats["hits"] += len(cached)
+            self._stats["misses"] += len(missing)
+
+        if missing:
+            cached.update(self._fetch_missing(layer, variant, crs, size, missing, version, fetch))
+
+        # Assemblage : dédoublonnage par id puis filtrage sur l'emprise demandée
+        seen = set()
+        features = []
+        for tile in wanted:
+            for feat, fb in cached.get(tile, ()):
+                key = feat.get("id") or json.dumps(feat, sort_keys=True)
+                if key in seen:
+                    continue
+                seen.add(key)
+                if fb is not None and bounds_overlap(fb, bounds):
+                    features.append(feat)
+        return features
+
+    def _plan(self, layer, bbox, srsname):
+        """(bounds, crs, taille, tuiles) si la requête peut être servie par tuiles, sinon None."""
+        try:
+            bounds, crs = parse_bbox(bbox)
+        except ValueError:
+            return None
+        size = self.tile_size(layer, crs)
+        if not self.is_cached_layer(layer) or size is None or crs != normalize_crs(srsname):
+            # Les emprises sont testées dans le CRS de sortie : il doit être celui de la bbox
+            return None
+        ix0, iy0, ix1, iy1 = tile_range(bounds, size)
+        if (ix1 - ix0 + 1) * (iy1 - iy0 + 1) > self.max_tiles_per_request:
+            return None
+        wanted = [(ix, iy) for ix in range(ix0, ix1 + 1) for iy in range(iy0, iy1 + 1)]
+        return bounds, crs, size, wanted
+
+    def covers(self, layer: str, bbox: str, srsname: str) -> bool:
+        """Vrai si get_features servirait cette requête depuis les tuiles (pas de contournement)."""
+        return self._plan(layer, bbox, srsname) is not None
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, n in increments.items():
+                self._stats[key] += n
+
+    def _bypass(self, layer, bbox, fetch):
+        self._count(bypass=1, upstream_requests=1)
+        return fetch(bbox)
+
+    def _truncated(self, raw) -> bool:
+        if getattr(raw, "truncated", False):
+            return True
+        return self.feature_limit is not None and len(raw or ()) >= self.feature_limit
+
+    def _load_tiles(self, layer, variant, crs, size, wanted, version, ttl):
+        now = time.time()
+        found = {}
+        wanted_set = set(wanted)
+        ix0 = min(t[0] for t in wanted)
+        ix1 = max(t[0] for t in wanted)
+        iy0 = min(t[1] for t in wanted)
+        iy1 = max(t[1] for t in wanted)
+        try:
+            with self._lock:
+                rows = self._conn.execute(
+                    """SELECT ix, iy, version, created, payload FROM tiles
+                       WHERE layer=? AND variant=? AND crs=? AND size=?
+                       AND ix BETWEEN ? AND ? AND iy BETWEEN ? AND ?""",
+                    (layer, variant, crs, size, ix0, ix1, iy0, iy1),
+                ).fetchall()
+                fresh = []
+                for ix, iy, tile_version, created, payload in rows:
+                    if (ix, iy) not in wanted_set:
+                        continue
+                    if now - created > ttl or (version is not None and tile_version != version):
+                        self._stats["stale"] += 1
+                        continue
+                    data = json.loads(zlib.decompress(payload))
+                    found[(ix, iy)] = [
+                        (f, tuple(b) if b else None) for f, b in zip(data["f"], data["b"])
+                    ]
+                    fresh.append((now, layer, variant, crs, size, ix, iy))
+                if fresh:
+                    self._conn.executemany(
+                        """UPDATE tiles SET accessed=? WHERE layer=? AND variant=? AND crs=?
+                           AND size=? AND ix=? AND iy=?""",
+                        fresh,
+                    )
+                    self._conn.commit()
+        except (sqlite3.Error, ValueError, zlib.error) as e:
+            print(f"⚠️ [WFS_CACHE] Lecture impossible ({layer}): {e}")
+            return {}
+        return found
+
+    def _fetch_missing(self, layer, variant, crs, size, missing, version, fetch):
+        # Une requête par bloc rectangulaire de tuiles manquantes (jamais de tuile déjà en cache)
+        tiles = {}
+        for ix0, iy0, ix1, iy1 in missing_blocks(missing):
+            area = (ix0 * size, iy0 * size, (ix1 + 1) * size, (iy1 + 1) * size)
+            self._count(upstream_requests=1)
+            raw = fetch(format_bbox(area, crs))
+
+            block = {(ix, iy): [] for ix in range(ix0, ix1 + 1) for iy in range(iy0, iy1 + 1)}
+            for feat in raw or []:
+                fb = geometry_bounds(feat.get("geometry"))
+                if fb is None:
+                    continue
+                fx0, fy0, fx1, fy1 = tile_range(fb, size)
+                for ix in range(max(fx0, ix0), min(fx1, ix1) + 1):
+                    for iy in range(max(fy0, iy0), min(fy1, iy1) + 1):
+                        block[(ix, iy)].append((feat, fb))
+            if self._truncated(raw):
+                # Réponse plafonnée par le serveur : servie telle quelle, jamais présentée comme complète
+                self._count(truncated=1)
+                print(f"⚠️ [WFS_CACHE] {layer}: réponse tronquée ({len(raw)} features), tuiles non mises en cache")
+            else:
+                self._store_tiles(layer, variant, crs, size, block, version)
+            tiles.update(block)
+        return tiles
+
+    # ── Écriture / éviction ────────────────────────────────────
+    def _store_tiles(self, layer, variant, crs, size, tiles, version):
+        now = time.time()
+        rows = []
+        for (ix, iy), items in tiles.items():
+            payload = zlib.compress(json.dumps(
+                {"f": [f for f, _ in items], "b": [b for _, b in items]}
+            ).encode("utf-8"))
+            rows.append((layer, variant, crs, size, ix, iy, version, now, now, len(payload), payload))
+        try:
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO tiles VALUES (?,?,?,?,?,?,?,?,?,?,?)", rows
+                )
+                count = self._conn.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+                excess = count - self.max_tiles
+                if excess > 0:
+                    self._conn.execute(
+                        """DELETE FROM tiles WHERE rowid IN (
+                           SELECT rowid FROM tiles ORDER BY accessed ASC LIMIT ?)""",
+                        (excess,),
+                    )
+                    self._stats["evictions"] += excess
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ [WFS_CACHE] Écriture impossible ({layer}): {e}")
+
+    def invalidate_layer(self, layer: str) -> int:
+        """Supprime toutes les tuiles d'une couche. Retourne le nombre de tuiles supprimées."""
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM tiles WHERE layer=?", (layer,))
+            self._conn.commit()
+        self._versions.pop(layer, None)
+        return cur.rowcount
+
+    def clear(self) -> int:
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM tiles")
+            self._conn.commit()
+        self._versions.clear()
+        return cur.rowcount
+
+    # ── Statistiques ───────────────────────────────────────────
+    def stats(self) -> Dict[str, Any]:
+        """Compteurs de hits/misses (globaux et par couche) et occupation du cache."""
+        with self._lock:
+            tiles, nbytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM tiles"
+            ).fetchone()
+            counters = dict(self._stats)
+            layers = {k: dict(v) for k, v in self._layer_stats.items()}
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "hit_ratio": round(counters["hits"] / lookups, 3) if lookups else None,
+            "tiles": tiles,
+            "bytes": nbytes,
+            "max_tiles": self.max_tiles,
+            "layers": layers,
+        }
@@ -0,0 +1,179 @@
+# utils/wfs_filter.py
+"""
+Filtrage spatial côté GeoServer : le polygone de recherche (commune, zone...) est
+transmis en CQL_FILTER INTERSECTS au lieu d'une simple bbox, pour que l'index
+spatial du serveur fasse le découpage.
+
+Un polygone de commune dépasse vite la longueur d'URL admise : la géométrie est
+alors élargie puis simplifiée (buffer(t) puis simplify(t), qui couvre toujours
+l'original) jusqu'à tenir dans le budget. Au-delà, la requête part en POST
+(paramètres KVP dans le corps). Quand la géométrie envoyée a été simplifiée, le
+résultat est un sur-ensemble et doit être affiné localement (GeometryFilter.refine).
+"""
+
+import re
+from typing import Any, Dict, Iterable, List
+from urllib.parse import quote_plus
+
+import shapely
+from shapely.geometry import shape
+from shapely.geometry.base import BaseGeometry
+
+from utils.commune_clipper import CommuneClipper
+
+# Limites usuelles : ~8 Ko d'URL côté proxy/Tomcat, corps POST bien plus large
+DEFAULT_GET_BUDGET = 6000
+DEFAULT_POST_BUDGET = 200_000
+
+_GEOM_ELEMENT_RE = re.compile(r"<(?:\w+:)?element\b([^>]*)>")
+_ATTR_RE = re.compile(r'(\w+)="([^"]*)"')
+
+
+def as_geometry(geom: Any) -> BaseGeometry:
+    """Accepte une géométrie shapely ou un dict GeoJSON ; répare si invalide."""
+    g = geom if isinstance(geom, BaseGeometry) else shape(geom)
+    if not g.is_valid:
+        g = shapely.make_valid(g)
+    return g
+
+
+def srid_of(srsname: str) -> int:
+    """'EPSG:4326' / 'urn:ogc:def:crs:EPSG::2154' -> code EPSG."""
+    match = re.search(r"(\d+)\s*$", srsname or "")
+    return int(match.group(1)) if match else 4326
+
+
+def describe_feature_type(session, wfs_url: str, layer: str, timeout: float = 10) -> Dict[str, Any]:
+    """
+    Schéma d'une couche (DescribeFeatureType).
+
+    Returns:
+        dict: {"geometry": nom de l'attribut géométrique ou None, "attributes": [autres attributs]}
+    """
+    resp = session.get(wfs_url, params={
+        "service": "WFS", "version": "2.0.0", "request": "DescribeFeatureType", "typeNames": layer,
+    }, timeout=timeout)
+    resp.raise_for_status()
+    geometry, attributes = None, []
+    for match in _GEOM_ELEMENT_RE.finditer(resp.text):
+        attrs = dict(_ATTR_RE.findall(match.group(1)))
+        name = attrs.get("name")
+        if not name or "type" not in attrs or "substitutionGroup" in attrs:
+            continue  # élément racine de la feature, pas un attribut
+        if attrs["type"].startswith("gml:"):
+            geometry = geometry or name
+        else:
+            attributes.append(name)
+    return {"geometry": geometry, "attributes": attributes}
+
+
+def project_properties(features: List[Dict[str, Any]], names: Iterable[str]) -> List[Dict[str, Any]]:
+    """Ne garde que les propriétés `names` (équivalent local du propertyName WFS)."""
+    keep = set(names)
+    out = []
+    for f in features:
+        g = dict(f)
+        g["properties"] = {k: v for k, v in (f.get("properties") or {}).items() if k in keep}
+        out.append(g)
+    return out
+
+
+def clip_features(features: List[Dict[str, Any]], geom: BaseGeometry) -> List[Dict[str, Any]]:
+    """Garde les features dont la géométrie intersecte `geom` (géométrie préparée, test vectorisé)."""
+    return CommuneClipper(geom).clip(features)
+
+
+class GeometryFilter:
+    """
+    Filtre INTERSECTS prêt à être envoyé à GeoServer.
+
+    Attributes:
+        cql (str): Expression CQL_FILTER.
+        method (str): "GET" si l'URL reste sous le budget, sinon "POST".
+        tolerance (float): Tolérance de simplification appliquée (0 = géométrie exacte).
+        geometry: Géométrie d'origine, pour l'affinage local.
+    """
+
+    def __init__(self, cql: str, method: str, tolerance: float, geometry: BaseGeometry):
+        self.cql = cql
+        self.method = method
+        self.tolerance = tolerance
+        self.geometry = geometry
+        self._clipper = None
+
+    @property
+    def simplified(self) -> bool:
+        return self.tolerance > 0
+
+    def params(self) -> Dict[str, str]:
+        return {"CQL_FILTER": self.cql}
+
+    def refine(self, features: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Retire les faux positifs dus à la simplification (no-op si géométrie exacte)."""
+        if not self.simplified:
+            return features
+        if self._clipper is None:
+            # Préparé une fois, réutilisé pour toutes les pages du flux
+            self._clipper = CommuneClipper(self.geometry)
+        return self._clipper.clip(features)
+
+
+def build_geometry_filter(
+    geom: Any,
+    column: str,
+    srid: int = 4326,
+    get_budget: int = DEFAULT_GET_BUDGET,
+    post_budget: int = DEFAULT_POST_BUDGET,
+    precision: int = 6,
+) -> GeometryFilter:
+    """
+    Construit le CQL INTERSECTS de `geom` sur l'attribut `column`.
+
+    Args:
+        geom: Géométrie shapely ou GeoJSON, dans le CRS `srid`.
+        column (str): Attribut géométrique de la couche.
+        srid (int): Code EPSG de la géométrie (EWKT, reprojetée par GeoServer).
+        get_budget (int): Longueur maximale du filtre encodé pour un GET.
+        post_budget (int): Longueur maximale du filtre pour un POST.
+        precision (int): Décimales conservées dans le WKT.
+
+    Returns:
+        GeometryFilter
+    """
+    original = as_geometry(geom)
+
+    def render(g):
+        wkt = shapely.to_wkt(g, rounding_precision=precision, trim=True)
+        return f"INTERSECTS({column}, SRID={srid};{wkt})"
+
+    def fits(cql, budget):
+        return len(quote_plus(cql)) <= budget
+
+    cql = render(original)
+    if fits(cql, get_budget):
+        return GeometryFilter(cql, "GET", 0.0, original)
+
+    # Élargir puis simplifier : la géométrie obtenue couvre l'originale.
+    # En GET, la tolérance reste faible (≤ 1/100 de l'emprise) pour garder un filtre utile.
+    minx, miny, maxx, maxy = original.bounds
+    span = max(maxx - minx, maxy - miny) or 1e-6
+    tolerance = span / 2000.0
+    while tolerance <= span / 100.0:
+        cql = render(original.buffer(tolerance).simplify(tolerance, preserve_topology=True))
+        if fits(cql, get_budget):
+            return GeometryFilter(cql, "GET", tolerance, original)
+        tolerance *= 2
+
+    # Trop long pour une URL : POST, géométrie exacte si possible
+    cql = render(original)
+    if fits(cql, post_budget):
+        return GeometryFilter(cql, "POST", 0.0, original)
+    tolerance = span / 2000.0
+    for _ in range(12):
+        cql = render(original.buffer(tolerance).simplify(tolerance, preserve_topology=True))
+        if fits(cql, post_budget):
+            return GeometryFilter(cql, "POST", tolerance, original)
+        tolerance *= 2
+
+    cql = render(shapely.box(minx, miny, maxx, maxy))
+    return GeometryFilter(cql, "GET", float("inf"), original)
@@ -0,0 +1,256 @@
+# utils/wfs_stream.py
+"""
+Lecture paginée et en flux des réponses WFS GetFeature (GeoJSON).
+
+Les pages sont demandées avec startIndex/count (WFS 2.0) et chaque page est
+décodée au fil de l'eau : les features sont produites dès qu'elles sont
+complètes dans le flux HTTP, sans jamais charger le corps entier en mémoire.
+Le nombre total d'entités (numberMatched) est relevé au passage, ce qui permet
+de détecter la troncature imposée par le maxFeatures de GeoServer. Les pages
+sont triées (sortBy) quand une clé est fournie : sans ordre, GeoServer ne
+garantit pas que deux pages successives ne se recouvrent pas.
+"""
+
+import codecs
+import json
+import re
+from typing import Any, Dict, Iterator, List, Optional
+
+_METADATA_RE = re.compile(r'"(numberMatched|numberReturned|totalFeatures)"\s*:\s*"?(\d+|unknown)"?')
+# Caractères significatifs hors chaîne (structure) et dans une chaîne (fin, échappement)
+_STRUCTURE_RE = re.compile(r'["{}\[\]]')
+_STRING_RE = re.compile(r'["\\]')
+
+
+class FeatureList(list):
+    """Liste de features ; `truncated` signale une lecture incomplète (erreur en cours de flux, plafond serveur)."""
+
+    def __init__(self, features=(), truncated: bool = False):
+        super().__init__(features)
+        self.truncated = truncated
+
+
+class FeatureArrayParser:
+    """
+    Décodeur incrémental du tableau "features" d'une FeatureCollection GeoJSON.
+
+    On lui fournit le texte par morceaux (feed) ; il retourne les features
+    complètes au fur et à mesure. Les métadonnées placées avant ou après le
+    tableau (numberMatched, numberReturned, totalFeatures) sont conservées.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._state = "seek"      # seek -> items -> tail
+        self._outside = ""        # texte hors du tableau (pour les métadonnées)
+        # Position de reprise dans _buffer : un objet incomplet n'est pas ré-analysé depuis son début
+        self._scan = 0
+        self._depth = 0
+        self._in_string = False
+        self.metadata: Dict[str, Optional[int]] = {}
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        self._buffer += text
+        out: List[Dict[str, Any]] = []
+        if self._state == "seek":
+            match = re.search(r'"features"\s*:\s*\[', self._buffer)
+            if not match:
+                return out
+            self._outside += self._buffer[:match.start()]
+            self._buffer = self._buffer[match.end():]
+            self._state = "items"
+        if self._state == "items":
+            self._scan_items(out)
+        if self._state == "tail":
+            self._outside += self._buffer
+            self._buffer = ""
+        return out
+
+    def _scan_items(self, out: List[Dict[str, Any]]) -> None:
+        """
+        Avance dans le tableau en suivant profondeur et chaînes ; chaque objet n'est décodé
+        qu'une fois, quand son accolade fermante est atteinte.
+        """
+        buf, pos, depth, in_string = self._buffer, self._scan, self._depth, self._in_string
+        start = 0 if depth else None
+        while True:
+            match = (_STRING_RE if in_string else _STRUCTURE_RE).search(buf, pos)
+            if match is None:
+                pos = len(buf)
+                break
+            pos, ch = match.start(), match.group()
+            if in_string:
+                if ch == "\\":
+                    if pos + 1 >= len(buf):
+                        break  # échappement coupé entre deux morceaux : reprendre ici
+                    pos += 2
+                    continue
+                in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch in "{[":
+                if depth == 0:
+                    start = pos
+                depth += 1
+            elif depth == 0:
+                # "]" fermant le tableau features
+                self._state = "tail"
+                self._buffer, self._scan, self._depth, self._in_string = buf[pos + 1:], 0, 0, False
+                return
+            else:
+                depth -= 1
+                if depth == 0:
+                    out.append(json.loads(buf[start:pos + 1]))
+                    start = None
+            pos += 1
+        # Conserver uniquement l'objet en cours (ou rien) et la position atteinte
+        keep = start if start is not None else pos
+        self._buffer, self._scan = buf[keep:], pos - keep
+        self._depth, self._in_string = depth, in_string
+
+    def close(self) -> None:
+        """Analyse les métadonnées une fois le flux terminé."""
+        for key, value in _METADATA_RE.findall(self._outside):
+            self.metadata[key] = None if value == "unknown" else int(value)
+
+
+class WFSFeatureStream:
+    """
+    Itérateur paginé sur une couche WFS GeoServer.
+
+    Args:
+        session: Session requests (ou client compatible .get(..., stream=True)).
+        wfs_url (str): URL du service WFS/OWS.
+        layer (str): Nom de la couche.
+        bbox (str): 'minx,miny,maxx,maxy,CRS' (optionnel).
+        srsname (str): CRS des géométries retournées.
+        page_size (int): Nombre d'entités par page (paramètre count).
+        max_features (int): Plafond global optionnel.
+        extra_params (dict): Paramètres WFS supplémentaires (CQL_FILTER, propertyName...).
+        method (str): "GET" ou "POST" (mêmes paramètres KVP dans le corps, pour les filtres longs).
+        sort_by (str): Attribut de tri des pages (sortBy), idéalement un identifiant unique.
+
+    Usage:
+        stream = WFSFeatureStream(session, url, "gpu:PARCELLES_GRAPHIQUES", bbox)
+        for page in stream.pages():
+            ...  # page = liste bornée de features
+        print(stream.number_matched)
+    """
+
+    def __init__(
+        self,
+        session,
+        wfs_url: str,
+        layer: str,
+        bbox: Optional[str] = None,
+        srsname: str = "EPSG:4326",
+        page_size: int = 1000,
+        timeout: float = 30,
+        max_features: Optional[int] = None,
+        extra_params: Optional[Dict[str, Any]] = None,
+        chunk_size: int = 65536,
+        method: str = "GET",
+        sort_by: Optional[str] = None,
+    ):
+        self.session = session
+        self.wfs_url = wfs_url
+        self.layer = layer
+        self.bbox = bbox
+        self.srsname = srsname
+        self.page_size = page_size
+        self.timeout = timeout
+        self.max_features = max_features
+        self.extra_params = extra_params or {}
+        self.chunk_size = chunk_size
+        self.method = method.upper()
+        self.sort_by = sort_by
+
+        self.number_matched: Optional[int] = None
+        self.number_returned = 0
+        self.pages_fetched = 0
+
+    def _params(self, start_index: int, count: int) -> Dict[str, Any]:
+        params = {
+            "service": "WFS",
+            "version": "2.0.0",
+            "request": "GetFeature",
+            "typeNames": self.layer,
+            "outputFormat": "application/json",
+            "srsName": self.srsname,
+            "startIndex": start_index,
+            "count": count,
+        }
+        if self.bbox:
+            params["bbox"] = self.bbox
+        if self.sort_by:
+            params["sortBy"] = self.sort_by
+        params.update(self.extra_params)
+        return params
+
+    def _iter_page(self, start_index: int, count: int, parser: FeatureArrayParser) -> Iterator[Dict[str, Any]]:
+        params = self._params(start_index, count)
+        if self.method == "POST":
+            resp = self.session.post(self.wfs_url, data=params, timeout=self.timeout, stream=True)
+        else:
+            resp = self.session.get(self.wfs_url, params=params, timeout=self.timeout, stream=True)
+        try:
+            resp.raise_for_status()
+            if "xml" in resp.headers.get("Content-Type", ""):
+                raise ValueError(f"GeoServer error XML:\n{resp.text[:200]}")
+            decoder = codecs.getincrementaldecoder(resp.encoding or "utf-8")(errors="replace")
+            for chunk in resp.iter_content(chunk_size=self.chunk_size):
+                for feature in parser.feed(decoder.decode(chunk)):
+                    yield feature
+            for feature in parser.feed(decoder.decode(b"", final=True)):
+                yield feature
+            parser.close()
+        finally:
+            resp.close()
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        start = 0
+        while True:
+            count = self.page_size
+            if self.max_features is not None:
+                count = min(count, self.max_features - self.number_returned)
+                if count <= 0:
+                    return
+            parser = FeatureArrayParser()
+            in_page = 0
+            for feature in self._iter_page(start, count, parser):
+                in_page += 1
+                self.number_returned += 1
+                yield feature
+            self.pages_fetched += 1
+            if self.number_matched is None:
+                self.number_matched = parser.metadata.get("numberMatched") or parser.metadata.get("totalFeatures")
+            start += in_page
+            if self.number_matched is not None:
+                # Page plus courte que demandé (plafond par requête du serveur) : continuer
+                # tant que le total annoncé n'est pas atteint
+                if start >= self.number_matched or in_page == 0:
+                    return
+            elif in_page < count:
+                return
+
+    def pages(self) -> Iterator[List[Dict[str, Any]]]:
+        """Regroupe le flux par pages (au plus page_size features en mémoire)."""
+        page: List[Dict[str, Any]] = []
+        for feature in self:
+            page.append(feature)
+            if len(page) >= self.page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def collect(self) -> FeatureList:
+        """Toutes les features, marquées `truncated` si le serveur en annonce davantage."""
+        features = FeatureList(self)
+        features.truncated = self.truncated
+        return features
+
+    @property
+    def truncated(self) -> bool:
+        """Vrai si le serveur annonce plus d'entités que celles lues."""
+        return self.number_matched is not None and self.number_returned < self.number_matched